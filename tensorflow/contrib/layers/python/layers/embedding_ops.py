@@ -238,6 +238,10 @@ def fused_safe_embedding_lookup_sparse(embedding_weights,
             array_ops.slice(original_shape, [0], [original_rank - 1])),
         array_ops.gather(original_shape, original_rank - 1)
     ])
+    if sparse_weights is not None:
+      sparse_weights = sparse_tensor.SparseTensor(sparse_ids.indices,
+                                                  sparse_weights.values,
+                                                  sparse_ids.dense_shape)
 
     result = fused_embedding_ops.fused_embedding_lookup_sparse(
       embedding_weights,
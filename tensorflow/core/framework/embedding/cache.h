@@ -0,0 +1,238 @@
+/* Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+==============================================================================*/
+
+#ifndef TENSORFLOW_CORE_FRAMEWORK_EMBEDDING_CACHE_H_
+#define TENSORFLOW_CORE_FRAMEWORK_EMBEDDING_CACHE_H_
+
+#include <algorithm>
+#include <iterator>
+#include <list>
+#include <map>
+#include <unordered_map>
+#include <unordered_set>
+
+#include "tensorflow/core/lib/strings/strcat.h"
+#include "tensorflow/core/platform/mutex.h"
+#include "tensorflow/core/platform/types.h"
+
+namespace tensorflow {
+
+// Ranks the keys of an EmbeddingVar by hotness. Accesses are recorded a
+// batch at a time so that the lock is taken once per lookup op instead of
+// once per key.
+template <class K>
+class BatchCache {
+ public:
+  BatchCache() {}
+  virtual ~BatchCache() {}
+
+  // Records one access for each key in `batch_ids`.
+  virtual void add_to_rank(const K* batch_ids, size_t batch_size) = 0;
+
+  // Pops up to `k_size` of the coldest keys into `evic_ids`, returns the
+  // number of keys actually popped. The `skip_num` keys of `skip_ids`, e.g.
+  // the batch just ranked, stay tracked and are never popped.
+  virtual size_t get_evic_ids(K* evic_ids, size_t k_size,
+                              const K* skip_ids = nullptr,
+                              size_t skip_num = 0) = 0;
+
+  // Stops tracking `id`, e.g. after it has been removed from the EV.
+  virtual void remove(K id) = 0;
+
+  virtual size_t size() = 0;
+
+  virtual std::string DebugString() = 0;
+};
+
+template <class K>
+class LRUCache : public BatchCache<K> {
+ public:
+  LRUCache() {}
+
+  void add_to_rank(const K* batch_ids, size_t batch_size) override {
+    mutex_lock l(mu_);
+    for (size_t i = 0; i < batch_size; ++i) {
+      K id = batch_ids[i];
+      auto it = index_.find(id);
+      if (it != index_.end()) {
+        rank_.splice(rank_.begin(), rank_, it->second);
+      } else {
+        rank_.push_front(id);
+        index_[id] = rank_.begin();
+      }
+    }
+  }
+
+  size_t get_evic_ids(K* evic_ids, size_t k_size,
+                      const K* skip_ids = nullptr,
+                      size_t skip_num = 0) override {
+    std::unordered_set<K> skip(skip_ids, skip_ids + skip_num);
+    mutex_lock l(mu_);
+    size_t true_size = 0;
+    auto it = rank_.end();
+    while (true_size < k_size && it != rank_.begin()) {
+      --it;
+      if (skip.count(*it) != 0) {
+        continue;
+      }
+      index_.erase(*it);
+      evic_ids[true_size++] = *it;
+      it = rank_.erase(it);
+    }
+    return true_size;
+  }
+
+  void remove(K id) override {
+    mutex_lock l(mu_);
+    auto it = index_.find(id);
+    if (it != index_.end()) {
+      rank_.erase(it->second);
+      index_.erase(it);
+    }
+  }
+
+  size_t size() override {
+    mutex_lock l(mu_);
+    return index_.size();
+  }
+
+  std::string DebugString() override {
+    return strings::StrCat("LRUCache size: ", size());
+  }
+
+ private:
+  mutex mu_;
+  // Most recently used key at the front.
+  std::list<K> rank_;
+  std::unordered_map<K, typename std::list<K>::iterator> index_;
+};
+
+template <class K>
+class LFUCache : public BatchCache<K> {
+ public:
+  LFUCache() {}
+
+  // Approximate memory of the cache for each key: its node in the index and
+  // in its frequency bucket.
+  static constexpr size_t BytesPerKey() {
+    return sizeof(K) + sizeof(LFUNode) + 2 * sizeof(void*) +
+           sizeof(K) + 2 * sizeof(void*);
+  }
+
+  void add_to_rank(const K* batch_ids, size_t batch_size) override {
+    mutex_lock l(mu_);
+    for (size_t i = 0; i < batch_size; ++i) {
+      K id = batch_ids[i];
+      auto it = index_.find(id);
+      if (it == index_.end()) {
+        std::list<K>& bucket = freq_table_[1];
+        bucket.push_front(id);
+        index_[id] = LFUNode(1, bucket.begin());
+      } else {
+        LFUNode& node = it->second;
+        auto bucket_it = freq_table_.find(node.freq);
+        bucket_it->second.erase(node.iter);
+        // The next bucket is found from the current one, before it may be
+        // erased.
+        auto next_it = std::next(bucket_it);
+        if (bucket_it->second.empty()) {
+          freq_table_.erase(bucket_it);
+        }
+        node.freq++;
+        if (next_it == freq_table_.end() || next_it->first != node.freq) {
+          next_it = freq_table_.emplace_hint(
+              next_it, node.freq, std::list<K>());
+        }
+        next_it->second.push_front(id);
+        node.iter = next_it->second.begin();
+      }
+    }
+  }
+
+  size_t get_evic_ids(K* evic_ids, size_t k_size,
+                      const K* skip_ids = nullptr,
+                      size_t skip_num = 0) override {
+    std::unordered_set<K> skip(skip_ids, skip_ids + skip_num);
+    mutex_lock l(mu_);
+    size_t true_size = 0;
+    // Only existing buckets are visited, from the least frequent one.
+    for (auto bucket_it = freq_table_.begin();
+         true_size < k_size && bucket_it != freq_table_.end();) {
+      std::list<K>& bucket = bucket_it->second;
+      auto it = bucket.end();
+      while (true_size < k_size && it != bucket.begin()) {
+        --it;
+        if (skip.count(*it) != 0) {
+          continue;
+        }
+        index_.erase(*it);
+        evic_ids[true_size++] = *it;
+        it = bucket.erase(it);
+      }
+      if (bucket.empty()) {
+        bucket_it = freq_table_.erase(bucket_it);
+      } else {
+        ++bucket_it;
+      }
+    }
+    return true_size;
+  }
+
+  void remove(K id) override {
+    mutex_lock l(mu_);
+    auto it = index_.find(id);
+    if (it != index_.end()) {
+      std::list<K>& bucket = freq_table_[it->second.freq];
+      bucket.erase(it->second.iter);
+      if (bucket.empty()) {
+        freq_table_.erase(it->second.freq);
+      }
+      index_.erase(it);
+    }
+  }
+
+  size_t size() override {
+    mutex_lock l(mu_);
+    return index_.size();
+  }
+
+  std::string DebugString() override {
+    mutex_lock l(mu_);
+    size_t min_freq = freq_table_.empty() ? 0 : freq_table_.begin()->first;
+    size_t max_freq = freq_table_.empty() ? 0 : freq_table_.rbegin()->first;
+    return strings::StrCat("LFUCache size: ", index_.size(),
+                           " min_freq: ", min_freq,
+                           " max_freq: ", max_freq);
+  }
+
+ private:
+  struct LFUNode {
+    size_t freq;
+    typename std::list<K>::iterator iter;
+    LFUNode() : freq(0) {}
+    LFUNode(size_t f, typename std::list<K>::iterator it)
+        : freq(f), iter(it) {}
+  };
+
+  mutex mu_;
+  // Keys with the same access count, most recently used at the front, by
+  // ascending access count.
+  std::map<size_t, std::list<K>> freq_table_;
+  std::unordered_map<K, LFUNode> index_;
+};
+
+}  // namespace tensorflow
+
+#endif  // TENSORFLOW_CORE_FRAMEWORK_EMBEDDING_CACHE_H_
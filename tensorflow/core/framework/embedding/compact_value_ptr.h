@@ -0,0 +1,300 @@
+/* Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+==============================================================================*/
+
+#ifndef TENSORFLOW_CORE_FRAMEWORK_EMBEDDING_COMPACT_VALUE_PTR_H_
+#define TENSORFLOW_CORE_FRAMEWORK_EMBEDDING_COMPACT_VALUE_PTR_H_
+
+#include <algorithm>
+#include <cmath>
+#include <unordered_map>
+#include <vector>
+
+#include "tensorflow/core/framework/allocator.h"
+#include "tensorflow/core/framework/embedding/value_ptr.h"
+#include "tensorflow/core/framework/numeric_types.h"
+#include "tensorflow/core/framework/types.pb.h"
+#include "tensorflow/core/lib/random/random.h"
+
+namespace tensorflow {
+
+// Encodes a row of V in the storage dtype of a compact EmbeddingVariable
+// column. DT_HALF and DT_BFLOAT16 rows are plain casts, DT_INT8 rows are
+// prefixed by a float scale (max abs value / 127). Any other dtype stores
+// the row as is.
+//
+// DT_INT8 values are rounded stochastically, up with a probability of their
+// fraction: a row is encoded again after every update, and an update smaller
+// than half the scale would always be lost by rounding to nearest, while it
+// is kept in expectation this way.
+class CompactCodec {
+ public:
+  explicit CompactCodec(DataType dtype = DT_INVALID) : dtype_(dtype) {}
+
+  template <class V>
+  int64 RowBytes(int64 value_len) const {
+    switch (dtype_) {
+      case DT_HALF:
+        return value_len * sizeof(Eigen::half);
+      case DT_BFLOAT16:
+        return value_len * sizeof(bfloat16);
+      case DT_INT8:
+        return sizeof(float) + value_len * sizeof(int8);
+      default:
+        return value_len * sizeof(V);
+    }
+  }
+
+  template <class V>
+  void Encode(const V* src, int64 value_len, char* dst) const {
+    switch (dtype_) {
+      case DT_HALF: {
+        Eigen::half* out = (Eigen::half*)dst;
+        for (int64 i = 0; i < value_len; ++i) {
+          out[i] = Eigen::half(static_cast<float>(src[i]));
+        }
+        break;
+      }
+      case DT_BFLOAT16: {
+        bfloat16* out = (bfloat16*)dst;
+        for (int64 i = 0; i < value_len; ++i) {
+          out[i] = bfloat16(static_cast<float>(src[i]));
+        }
+        break;
+      }
+      case DT_INT8: {
+        float max_abs = 0.0;
+        for (int64 i = 0; i < value_len; ++i) {
+          max_abs = std::max(max_abs, std::fabs(static_cast<float>(src[i])));
+        }
+        float scale = max_abs / 127.0;
+        float inv_scale = scale > 0.0 ? 1.0 / scale : 0.0;
+        memcpy(dst, &scale, sizeof(float));
+        int8* out = (int8*)(dst + sizeof(float));
+        for (int64 i = 0; i < value_len; ++i) {
+          float q = std::floor(
+              static_cast<float>(src[i]) * inv_scale + RoundingNoise());
+          out[i] = static_cast<int8>(std::min(std::max(q, -127.0f), 127.0f));
+        }
+        break;
+      }
+      default:
+        memcpy(dst, src, value_len * sizeof(V));
+    }
+  }
+
+  template <class V>
+  void Decode(const char* src, int64 value_len, V* dst) const {
+    switch (dtype_) {
+      case DT_HALF: {
+        const Eigen::half* in = (const Eigen::half*)src;
+        for (int64 i = 0; i < value_len; ++i) {
+          dst[i] = static_cast<V>(static_cast<float>(in[i]));
+        }
+        break;
+      }
+      case DT_BFLOAT16: {
+        const bfloat16* in = (const bfloat16*)src;
+        for (int64 i = 0; i < value_len; ++i) {
+          dst[i] = static_cast<V>(static_cast<float>(in[i]));
+        }
+        break;
+      }
+      case DT_INT8: {
+        float scale;
+        memcpy(&scale, src, sizeof(float));
+        const int8* in = (const int8*)(src + sizeof(float));
+        for (int64 i = 0; i < value_len; ++i) {
+          dst[i] = static_cast<V>(in[i] * scale);
+        }
+        break;
+      }
+      default:
+        memcpy(dst, src, value_len * sizeof(V));
+    }
+  }
+
+ private:
+  // Uniform in [0, 1), from a thread local xorshift generator.
+  static float RoundingNoise() {
+    static thread_local uint64 state = random::New64() | 1;
+    state ^= state << 13;
+    state ^= state >> 7;
+    state ^= state << 17;
+    return (state >> 40) * (1.0f / (1 << 24));
+  }
+
+  DataType dtype_;
+};
+
+// Thread local pools of row buffers, so that decoding and encoding rows of
+// compact EmbeddingVariables doesn't allocate in the steady state. A buffer
+// may be released by another thread than the one it was allocated by.
+class CompactRowBuffers {
+ public:
+  static char* Allocate(size_t bytes) {
+    std::vector<char*>& free_list = Pool().free_lists[bytes];
+    char* buf;
+    if (free_list.empty()) {
+      buf = (char*)malloc(kHeaderBytes + bytes);
+      memcpy(buf, &bytes, sizeof(size_t));
+    } else {
+      buf = free_list.back();
+      free_list.pop_back();
+    }
+    return buf + kHeaderBytes;
+  }
+
+  static void Release(const void* row) {
+    char* buf = (char*)row - kHeaderBytes;
+    size_t bytes;
+    memcpy(&bytes, buf, sizeof(size_t));
+    std::vector<char*>& free_list = Pool().free_lists[bytes];
+    if (free_list.size() < kMaxFreeRows) {
+      free_list.push_back(buf);
+    } else {
+      free(buf);
+    }
+  }
+
+ private:
+  struct FreeLists {
+    ~FreeLists() {
+      for (auto& it : free_lists) {
+        for (char* buf : it.second) {
+          free(buf);
+        }
+      }
+    }
+    std::unordered_map<size_t, std::vector<char*>> free_lists;
+  };
+
+  static FreeLists& Pool() {
+    static thread_local FreeLists pool;
+    return pool;
+  }
+
+  // Keeps rows aligned as by malloc.
+  static const size_t kHeaderBytes = 16;
+  static const size_t kMaxFreeRows = 64;
+};
+
+// ValuePtr whose columns are stored encoded by a CompactCodec. The embedding
+// columns (index < block_num) use `emb_codec`, the slot columns `slot_codec`.
+//
+// Like DBValuePtr, GetOrAllocate and GetValue return a decoded copy of the
+// row: callers must hand it back with Commit after an update, or Free after
+// a read. Rows are decoded and overwritten under the lock of the ValuePtr,
+// so that a reader never sees the scale of an update with the old values.
+template <class V, class Base>
+class CompactValuePtr : public Base {
+ public:
+  CompactValuePtr(size_t size, int64 block_num, const CompactCodec& emb_codec,
+                  const CompactCodec& slot_codec)
+      : Base(size), block_num_(block_num),
+        emb_codec_(emb_codec), slot_codec_(slot_codec) {}
+
+  V* GetOrAllocate(Allocator* allocator, int64 value_len, const V* default_v,
+                   int emb_index) override {
+    char* row = GetRow(emb_index);
+    if (row == nullptr) {
+      while (this->flag_.test_and_set(std::memory_order_acquire));
+      row = GetRow(emb_index);
+      if (row == nullptr) {
+        const CompactCodec& codec = Codec(emb_index);
+        row = (char*)allocator->AllocateRaw(Allocator::kAllocatorAlignment,
+                                            codec.RowBytes<V>(value_len));
+        codec.Encode(default_v, value_len, row);
+        MetaHeader* meta = (MetaHeader*)this->ptr_;
+        auto metadata = meta->GetColumnBitset();
+        Columns()[emb_index] = row;
+        metadata.set(emb_index);
+        meta->SetColumnBitset(metadata, meta->GetEmbeddingNum() + 1);
+      }
+      this->flag_.clear(std::memory_order_release);
+    }
+    return Decode(row, value_len, emb_index);
+  }
+
+  V* GetValue(int emb_index, int64 value_len) override {
+    char* row = GetRow(emb_index);
+    if (row == nullptr) {
+      return nullptr;
+    }
+    return Decode(row, value_len, emb_index);
+  }
+
+  void Commit(int64 value_len, const V* v, int emb_index) override {
+    char* row = GetRow(emb_index);
+    if (row != nullptr) {
+      const CompactCodec& codec = Codec(emb_index);
+      const int64 row_bytes = codec.RowBytes<V>(value_len);
+      char* encoded = CompactRowBuffers::Allocate(row_bytes);
+      codec.Encode(v, value_len, encoded);
+      while (this->flag_.test_and_set(std::memory_order_acquire));
+      memcpy(row, encoded, row_bytes);
+      this->flag_.clear(std::memory_order_release);
+      CompactRowBuffers::Release(encoded);
+    }
+    Free(v);
+  }
+
+  void Free(const V* v) override {
+    CompactRowBuffers::Release(v);
+  }
+
+  void Destroy(Allocator* allocator, int64 value_len) override {
+    MetaHeader* meta = (MetaHeader*)this->ptr_;
+    auto metadata = meta->GetColumnBitset();
+    for (int i = 0; i < COLUMN_BITSET_SIZE; ++i) {
+      if (metadata.test(i) && Columns()[i] != nullptr) {
+        allocator->DeallocateRaw(Columns()[i]);
+      }
+    }
+  }
+
+ private:
+  char** Columns() {
+    MetaHeader* meta = (MetaHeader*)this->ptr_;
+    return (char**)((int64*)this->ptr_ + meta->GetHeaderSize());
+  }
+
+  char* GetRow(int emb_index) {
+    MetaHeader* meta = (MetaHeader*)this->ptr_;
+    if (!meta->GetColumnBitset().test(emb_index)) {
+      return nullptr;
+    }
+    return Columns()[emb_index];
+  }
+
+  const CompactCodec& Codec(int emb_index) const {
+    return emb_index < block_num_ ? emb_codec_ : slot_codec_;
+  }
+
+  V* Decode(const char* row, int64 value_len, int emb_index) {
+    V* val = (V*)CompactRowBuffers::Allocate(value_len * sizeof(V));
+    while (this->flag_.test_and_set(std::memory_order_acquire));
+    Codec(emb_index).Decode(row, value_len, val);
+    this->flag_.clear(std::memory_order_release);
+    return val;
+  }
+
+  int64 block_num_;
+  CompactCodec emb_codec_;
+  CompactCodec slot_codec_;
+};
+
+}  // namespace tensorflow
+
+#endif  // TENSORFLOW_CORE_FRAMEWORK_EMBEDDING_COMPACT_VALUE_PTR_H_
@@ -3,6 +3,8 @@
 
 #include <cmath>
 #include "tensorflow/core/framework/embedding/config.pb.h"
+#include "tensorflow/core/framework/types.h"
+#include "tensorflow/core/lib/strings/str_util.h"
 
 namespace tensorflow {
 struct EmbeddingConfig {
@@ -21,7 +23,12 @@ struct EmbeddingConfig {
   DataType counter_type;
   embedding::StorageType storage_type;
   std::string storage_path;
+  std::vector<int64> storage_size;
   int64 default_value_dim;
+  int64 max_keys;
+  std::string evict_policy;
+  DataType storage_dtype;
+  DataType slot_storage_dtype;
 
   EmbeddingConfig(int64 emb_index = 0, int64 primary_emb_index = 0,
                   int64 block_num = 1, int slot_num = 1,
@@ -31,7 +38,12 @@ struct EmbeddingConfig {
                   int64 max_element_size = 0, float false_positive_probability = -1.0,
                   DataType counter_type = DT_UINT64, embedding::StorageType storage_type = embedding::DRAM,
                   const std::string& storage_path = "",
-                  int64 default_value_dim = 4096):
+                  int64 default_value_dim = 4096,
+                  const std::vector<int64>& storage_size = {},
+                  int64 max_keys = 0,
+                  const std::string& evict_policy = "lru",
+                  DataType storage_dtype = DT_FLOAT,
+                  DataType slot_storage_dtype = DT_FLOAT):
       emb_index(emb_index),
       primary_emb_index(primary_emb_index),
       block_num(block_num),
@@ -44,7 +56,12 @@ struct EmbeddingConfig {
       counter_type(counter_type),
       storage_type(storage_type),
       storage_path(storage_path),
-      default_value_dim(default_value_dim) {
+      storage_size(storage_size),
+      default_value_dim(default_value_dim),
+      max_keys(max_keys),
+      evict_policy(evict_policy),
+      storage_dtype(storage_dtype),
+      slot_storage_dtype(slot_storage_dtype) {
     if ("normal" == layout) {
       layout_type = LayoutType::NORMAL;
     } else if ("light" == layout) {
@@ -79,7 +96,7 @@ struct EmbeddingConfig {
     return emb_index == primary_emb_index;
   }
 
-  int64 total_num() {
+  int64 total_num() const {
     return block_num * (slot_num + 1);
   }
 
@@ -87,7 +104,7 @@ struct EmbeddingConfig {
     return filter_freq;
   }
 
-  LayoutType get_layout_type() {
+  LayoutType get_layout_type() const {
     return layout_type;
   }
 
@@ -99,6 +116,25 @@ struct EmbeddingConfig {
     return storage_path;
   }
 
+  // Capacity in bytes of the first (fastest) storage tier, 0 if unbounded.
+  int64 get_dram_capacity_bytes() const {
+    return storage_size.empty() ? 0 : storage_size[0];
+  }
+
+  bool is_capacity_evict() const {
+    return max_keys > 0;
+  }
+
+  // Whether the embedding or the slot values are stored in a narrower dtype
+  // than the variable, see CompactValuePtr.
+  bool is_compact() const {
+    return is_compact_type(storage_dtype) || is_compact_type(slot_storage_dtype);
+  }
+
+  static bool is_compact_type(DataType dtype) {
+    return dtype == DT_HALF || dtype == DT_BFLOAT16 || dtype == DT_INT8;
+  }
+
   std::string DebugString() const {
     return strings::StrCat("opname: ", name,
                            " emb_index: ", emb_index,
@@ -111,7 +147,12 @@ struct EmbeddingConfig {
                            " max_freq: ", max_freq,
                            " l2_weight_threshold: ", l2_weight_threshold,
                            " storage_type: ", storage_type,
-                           " storage_path: ", storage_path);
+                           " storage_path: ", storage_path,
+                           " storage_size: ", str_util::Join(storage_size, ","),
+                           " max_keys: ", max_keys,
+                           " evict_policy: ", evict_policy,
+                           " storage_dtype: ", DataTypeString(storage_dtype),
+                           " slot_storage_dtype: ", DataTypeString(slot_storage_dtype));
   }
 };
 
@@ -3,6 +3,8 @@
 
 //#include "tensorflow/core/framework/embedding/embedding_var.h"
 #include "tensorflow/core/framework/embedding/embedding_config.h"
+#include "tensorflow/core/lib/core/threadpool.h"
+#include "tensorflow/core/platform/mutex.h"
 
 namespace tensorflow {
 namespace {
@@ -22,6 +24,16 @@ class EmbeddingFilter {
 
   virtual int64 GetFreq(K key, ValuePtr<V>* value_ptr) = 0;
   virtual int64 GetFreq(K key) = 0;
+
+  // Counting filters keep the frequencies in an array of counters rather
+  // than in the keys, the other filters have no counters.
+  virtual int64 NumCounters() const { return 0; }
+  virtual DataType CounterType() const { return DT_INVALID; }
+  virtual void* Counters() const { return nullptr; }
+  // Halves the counters once for every epoch passed since the last decay,
+  // on `pool` if it is set. The first call only records `epoch`. Returns the
+  // number of halvings.
+  virtual int64 Decay(int64 epoch, thread::ThreadPool* pool) { return 0; }
 };
 
 template<typename K, typename V, typename EV>
@@ -106,7 +118,69 @@ class BloomFilter : public EmbeddingFilter<K, V, EV> {
     return bloom_counter_;
   }
 
+  int64 NumCounters() const override {
+    return config_.num_counter;
+  }
+
+  DataType CounterType() const override {
+    switch (config_.counter_type) {
+      case DT_UINT32:
+      case DT_UINT16:
+      case DT_UINT8:
+        return config_.counter_type;
+      default:
+        return DT_UINT64;
+    }
+  }
+
+  void* Counters() const override {
+    return bloom_counter_;
+  }
+
+  int64 Decay(int64 epoch, thread::ThreadPool* pool) override {
+    mutex_lock l(decay_mu_);
+    if (decay_epoch_ < 0 || epoch <= decay_epoch_) {
+      decay_epoch_ = std::max(decay_epoch_, epoch);
+      return 0;
+    }
+    const int64 shift = epoch - decay_epoch_;
+    decay_epoch_ = epoch;
+    switch (CounterType()) {
+      case DT_UINT32:
+        DecayCounters<uint32>(shift, pool);
+        break;
+      case DT_UINT16:
+        DecayCounters<uint16>(shift, pool);
+        break;
+      case DT_UINT8:
+        DecayCounters<uint8>(shift, pool);
+        break;
+      default:
+        DecayCounters<uint64>(shift, pool);
+    }
+    return shift;
+  }
+
  private:
+  // The counters are halved without blocking the lookups, an increment
+  // racing with the sweep may be lost or escape the halving, which the
+  // filter tolerates like its other approximations.
+  template<typename VBloom>
+  void DecayCounters(int64 shift, thread::ThreadPool* pool) {
+    VBloom* counter = (VBloom*)bloom_counter_;
+    const int64 bits = sizeof(VBloom) * 8;
+    auto halve = [counter, shift, bits] (int64 begin, int64 end) {
+      for (int64 i = begin; i < end; ++i) {
+        counter[i] = shift >= bits ? 0 : counter[i] >> shift;
+      }
+    };
+    if (pool != nullptr) {
+      pool->ParallelFor(config_.num_counter, sizeof(VBloom), halve);
+    } else {
+      halve(0, config_.num_counter);
+    }
+  }
+
   int64 GetBloomFreq(K key) {
     std::vector<int64> hash_val;
     for (int64 i = 0; i < config_.kHashFunc; i++) {
@@ -290,6 +364,8 @@ class BloomFilter : public EmbeddingFilter<K, V, EV> {
   EmbeddingConfig config_;
   EV* ev_;
   std::vector<int64> seeds_;
+  mutex decay_mu_;
+  int64 decay_epoch_ GUARDED_BY(decay_mu_) = -1;
 };
 
 template<typename K, typename V, typename EV>
@@ -27,7 +27,12 @@ limitations under the License.
 #include "tensorflow/core/platform/mutex.h"
 #include "tensorflow/core/platform/types.h"
 
+#include "tensorflow/core/framework/embedding/cache.h"
+#include "tensorflow/core/framework/embedding/compact_value_ptr.h"
+#include "tensorflow/core/framework/embedding/epoch_manager.h"
 #include "tensorflow/core/framework/embedding/kv_interface.h"
+#include "tensorflow/core/framework/embedding/mmap_table.h"
+#include "tensorflow/core/framework/embedding/tiered_kv.h"
 #include "tensorflow/core/framework/embedding/value_ptr.h"
 #include "tensorflow/core/framework/embedding/embedding_filter.h"
 #include "tensorflow/core/framework/embedding/embedding_config.h"
@@ -59,7 +64,9 @@ class EmbeddingVar : public ResourceBase {
       default_value_(nullptr),
       value_len_(0),
       alloc_(nullptr),
-      emb_config_(emb_cfg) {}
+      emb_config_(emb_cfg),
+      own_epoch_manager_(new EpochManager()),
+      epoch_manager_(own_epoch_manager_.get()) {}
 
   Status Init() {
     if (kv_ == nullptr) {
@@ -134,6 +141,9 @@ class EmbeddingVar : public ResourceBase {
     } else {
       return errors::InvalidArgument(name_, ", Unsupport EmbeddingVariable LayoutType.");
     }
+    if (emb_config_.is_compact()) {
+      TF_RETURN_IF_ERROR(InitCompactStorage());
+    }
     filter_ = FilterFactory::CreateFilter<K, V, EmbeddingVar<K, V>>(emb_config_, this);
 
     if (embedding::StorageType::DRAM == emb_config_.get_storage_type()) {
@@ -151,6 +161,12 @@ class EmbeddingVar : public ResourceBase {
       if (!alloc_) {
         return errors::InvalidArgument(name_, ", No registered EV AllocatorFactory.");
       }
+    } else if (embedding::StorageType::DRAM_SSD == emb_config_.get_storage_type() ||
+               embedding::StorageType::MMAP == emb_config_.get_storage_type()) {
+      alloc_ = ev_allocator();
+      if (!alloc_) {
+        return errors::InvalidArgument(name_, ", No registered EV AllocatorFactory.");
+      }
     } else {
       return errors::InvalidArgument(name_, ", Unsupport EmbeddingVariable StorageType.");
     }
@@ -163,6 +179,12 @@ class EmbeddingVar : public ResourceBase {
       default_value_ = TypedAllocator::Allocate<V>(alloc_, default_tensor.NumElements(), AllocationAttributes());
       auto default_tensor_flat = default_tensor.flat<V>();
       memcpy(default_value_, &default_tensor_flat(0), default_tensor.TotalBytes());
+      if (emb_config_.is_capacity_evict() && emb_config_.is_primary()) {
+        TF_RETURN_IF_ERROR(InitCapacityEviction());
+      }
+      if (embedding::StorageType::DRAM_SSD == emb_config_.get_storage_type()) {
+        return InitTieredStorage();
+      }
       return Status::OK();
     }
   }
@@ -170,6 +192,23 @@ class EmbeddingVar : public ResourceBase {
   void SetInitialized() {
     is_initialized_ = true;
   }
+
+  // Slots share the value ptrs of the primary EV, and so its EpochManager.
+  void SetEpochManager(EpochManager* epoch_manager) {
+    epoch_manager_ = epoch_manager;
+  }
+
+  EpochManager* epoch_manager() {
+    return epoch_manager_;
+  }
+
+  // Keeps the value ptrs looked up from this EV and its slots, and the
+  // values returned by GetSnapshot, valid while the guard is alive. Ops must
+  // hold one while they use them, an eviction may remove them meanwhile.
+  EpochGuard GuardValuePtrs() {
+    return EpochGuard(epoch_manager_);
+  }
+
   bool IsInitialized() const {
     return is_initialized_;
   }
@@ -200,14 +239,52 @@ class EmbeddingVar : public ResourceBase {
 
   void LookupOrCreate(K key, V* val, V* default_v)  {
     const V* default_value_ptr = (default_v == nullptr) ? default_value_ : default_v;
+    if (mmap_table_ != nullptr) {
+      LookupMmap(key, val, default_value_ptr);
+      return;
+    }
     filter_->LookupOrCreate(key, val, default_value_ptr);
   }
 
   void LookupOrCreate(K key, V* val, V* default_v, int64 count)  {
     const V* default_value_ptr = (default_v == nullptr) ? default_value_ : default_v;
+    if (mmap_table_ != nullptr) {
+      LookupMmap(key, val, default_value_ptr);
+      return;
+    }
     filter_->LookupOrCreate(key, val, default_value_ptr, count);
   }
 
+  // Serves the EV from the read only table at `prefix` (StorageType::MMAP).
+  // The table is built from the keys imported by `restore_fn` if it doesn't
+  // exist yet, the imported keys are released afterwards.
+  Status ImportMmap(const std::string& prefix,
+                    const std::function<Status()>& restore_fn) {
+    if (!emb_config_.is_primary()) {
+      return errors::FailedPrecondition(name_,
+          ", MMAP EmbeddingVariable is read only and can't have slots.");
+    }
+    if (!MmapTable<K, V>::Exists(prefix)) {
+      TF_RETURN_IF_ERROR(restore_fn());
+      EpochGuard guard(epoch_manager_);
+      std::vector<K> key_list;
+      std::vector<V*> value_list;
+      std::vector<int64> version_list;
+      std::vector<int64> freq_list;
+      GetSnapshot(&key_list, &value_list, &version_list, &freq_list);
+      TF_RETURN_IF_ERROR(
+          MmapTable<K, V>::Write(prefix, key_list, value_list, value_len_));
+      LOG(INFO) << name_ << ", write MmapTable " << prefix
+                << ", size: " << key_list.size();
+      Clear();
+    }
+    std::unique_ptr<MmapTable<K, V>> table(new MmapTable<K, V>());
+    TF_RETURN_IF_ERROR(table->Open(prefix, value_len_));
+    delete mmap_table_;
+    mmap_table_ = table.release();
+    return Status::OK();
+  }
+
   V* LookupOrCreateEmb(ValuePtr<V>* value_ptr, const V* default_v) {
     return value_ptr->GetOrAllocate(alloc_, value_len_, default_v,
         emb_config_.emb_index);
@@ -233,7 +310,8 @@ class EmbeddingVar : public ResourceBase {
   }
 
   int64 Size() const {
-    return kv_->Size();
+    int64 mmap_size = mmap_table_ == nullptr ? 0 : mmap_table_->Size();
+    return kv_->Size() + mmap_size;
   }
 
   int64 MinFreq() {
@@ -244,6 +322,10 @@ class EmbeddingVar : public ResourceBase {
     return emb_config_.steps_to_live;
   }
 
+  bool IsPrimary() const {
+    return emb_config_.is_primary();
+  }
+
   float GetL2WeightThreshold() {
     return emb_config_.l2_weight_threshold;
   }
@@ -265,10 +347,11 @@ class EmbeddingVar : public ResourceBase {
     V* value_buff = (V*)restore_buff.value_buffer;
     int64* version_buff = (int64*)restore_buff.version_buffer;
     int64* freq_buff = (int64*)restore_buff.freq_buffer;
+    EpochGuard guard(epoch_manager_);
     for (auto i = 0; i < key_num; ++i) {
       // this can describe by graph(Mod + DynamicPartition), but memory waste and slow
       if (*(key_buff + i) % bucket_num % partition_num != partition_id) {
-        LOG(INFO) << "skip EV key:" << *(key_buff + i);
+        VLOG(2) << "skip EV key:" << *(key_buff + i);
         continue;
       }
       ValuePtr<V>* value_ptr = nullptr;
@@ -288,17 +371,72 @@ class EmbeddingVar : public ResourceBase {
       V* v = LookupOrCreateEmb(value_ptr, value_buff + i * value_len_);
       value_ptr->Free(v);
     }
+    UpdateCache(key_buff, key_num);
     return Status::OK();
   }
 
+  // Records the accessed keys in the hotness ranking, then moves the coldest
+  // keys to SSD when the DRAM tier is over its capacity (DRAM_SSD storage),
+  // or removes them when the EV holds more than max_keys keys. The accessed
+  // keys themselves are never evicted here, their updates are yet to come.
+  // No-op unless one of them is enabled.
+  void UpdateCache(const K* keys, int64 num) {
+    if (cache_ == nullptr) {
+      return;
+    }
+    cache_->add_to_rank(keys, num);
+    if (tiered_kv_ != nullptr) {
+      tiered_kv_->Eviction(cache_, DramCapacity(), keys, num);
+    } else {
+      CapacityEviction(keys, num);
+    }
+  }
+
+  // The returned values are only valid while the caller holds a guard from
+  // GuardValuePtrs().
   int64 GetSnapshot(std::vector<K>* key_list, std::vector<V* >* value_list,
                     std::vector<int64>* version_list, std::vector<int64>* freq_list) {
+    mutex_lock l(snapshot_mu_);
+    RetireSnapshotBuffers();
     std::vector<ValuePtr<V>* > value_ptr_list;
     std::vector<K> key_list_tmp;
-    kv_->GetSnapshot(&key_list_tmp, &value_ptr_list);
+    // Keys not in DRAM are appended by cold_fn, after the keys in DRAM.
+    std::vector<K> cold_key_list;
+    std::vector<V*> cold_value_list;
+    std::vector<int64> cold_version_list;
+    std::vector<int64> cold_freq_list;
+    if (tiered_kv_ != nullptr) {
+      // Values not in DRAM are decoded into temporary value ptrs, keep a copy
+      // alive until the next snapshot.
+      tiered_kv_->GetSnapshot(&key_list_tmp, &value_ptr_list,
+          [&] (K key, ValuePtr<V>* value_ptr) {
+        V* val = value_ptr->GetValue(emb_config_.emb_index, value_len_);
+        V* primary_val = value_ptr->GetValue(emb_config_.primary_emb_index, value_len_);
+        if (val == nullptr || primary_val == nullptr) {
+          return;
+        }
+        cold_value_list.push_back(CopyToSnapshotBuffer(val));
+        cold_key_list.push_back(key);
+        if (emb_config_.filter_freq != 0) {
+          cold_freq_list.push_back(filter_->GetFreq(key, value_ptr));
+        }
+        if (emb_config_.steps_to_live != 0) {
+          cold_version_list.push_back(value_ptr->GetStep());
+        }
+      });
+    } else {
+      kv_->GetSnapshot(&key_list_tmp, &value_ptr_list);
+    }
     for (int64 i = 0; i < key_list_tmp.size(); ++i) {
       V* val = value_ptr_list[i]->GetValue(emb_config_.emb_index, value_len_);
       V* primary_val = value_ptr_list[i]->GetValue(emb_config_.primary_emb_index, value_len_);
+      if (emb_config_.is_compact()) {
+        // Compact values are decoded into temporary buffers.
+        V* decoded = val;
+        val = primary_val != nullptr ? CopyToSnapshotBuffer(decoded) : nullptr;
+        FreeDecoded(value_ptr_list[i], decoded);
+        FreeDecoded(value_ptr_list[i], primary_val);
+      }
       if (val != nullptr && primary_val != nullptr) {
         value_list->push_back(val);
         key_list->push_back(key_list_tmp[i]);
@@ -312,9 +450,95 @@ class EmbeddingVar : public ResourceBase {
         }
       }
     }
+    key_list->insert(key_list->end(), cold_key_list.begin(), cold_key_list.end());
+    value_list->insert(value_list->end(), cold_value_list.begin(),
+                       cold_value_list.end());
+    version_list->insert(version_list->end(), cold_version_list.begin(),
+                         cold_version_list.end());
+    freq_list->insert(freq_list->end(), cold_freq_list.begin(),
+                      cold_freq_list.end());
+    if (mmap_table_ != nullptr) {
+      // The rows stay valid as long as the table is mapped.
+      for (int64 i = 0; i < mmap_table_->Size(); ++i) {
+        key_list->push_back(mmap_table_->Key(i));
+        value_list->push_back(const_cast<V*>(mmap_table_->Value(i)));
+        if (emb_config_.filter_freq != 0) {
+          freq_list->push_back(emb_config_.filter_freq);
+        }
+        if (emb_config_.steps_to_live != 0) {
+          version_list->push_back(-1);
+        }
+      }
+    }
     return key_list->size();
   }
 
+  // Summarizes the keys held in memory without copying their values. Bucket
+  // i of a histogram counts the values in [2^(i-1), 2^i), bucket 0 counts the
+  // zeros and the last bucket is open ended. The frequency histogram and the
+  // top keys are only filled when a filter tracks the frequency, the age
+  // histogram when steps_to_live tracks the version. Ages are relative to
+  // `global_step`, or to the latest version if it is negative. Keys on SSD or
+  // in a MMAP table are counted by Size() only.
+  void GetStatistics(int64 global_step, int64 num_buckets, int64 top_k,
+                     std::vector<int64>* freq_histogram,
+                     std::vector<int64>* age_histogram,
+                     std::vector<std::pair<int64, K>>* top_keys) {
+    EpochGuard guard(epoch_manager_);
+    std::vector<K> key_list;
+    std::vector<ValuePtr<V>* > value_ptr_list;
+    kv_->GetSnapshot(&key_list, &value_ptr_list);
+    if (emb_config_.filter_freq != 0) {
+      freq_histogram->assign(num_buckets, 0);
+      top_keys->reserve(key_list.size());
+      for (int64 i = 0; i < key_list.size(); ++i) {
+        int64 freq = filter_->GetFreq(key_list[i], value_ptr_list[i]);
+        (*freq_histogram)[HistogramBucket(freq, num_buckets)]++;
+        top_keys->emplace_back(freq, key_list[i]);
+      }
+      top_k = std::min(top_k, (int64)top_keys->size());
+      std::partial_sort(top_keys->begin(), top_keys->begin() + top_k,
+          top_keys->end(),
+          [] (const std::pair<int64, K>& a, const std::pair<int64, K>& b) {
+            return a.first > b.first;
+          });
+      top_keys->resize(top_k);
+    }
+    if (emb_config_.steps_to_live != 0) {
+      std::vector<int64> versions(value_ptr_list.size());
+      int64 latest = global_step;
+      for (int64 i = 0; i < value_ptr_list.size(); ++i) {
+        versions[i] = value_ptr_list[i]->GetStep();
+        latest = std::max(latest, versions[i]);
+      }
+      if (global_step >= 0) {
+        latest = global_step;
+      }
+      age_histogram->assign(num_buckets, 0);
+      for (int64 version : versions) {
+        int64 age = std::max(latest - version, (int64)0);
+        (*age_histogram)[HistogramBucket(age, num_buckets)]++;
+      }
+    }
+  }
+
+  // Approximate bytes held in DRAM/PMEM by the keys of this EV and all its
+  // slots, which share the same ValuePtr.
+  int64 MemoryBytes() {
+    int64 num_keys = tiered_kv_ != nullptr ? tiered_kv_->DramSize()
+                                           : kv_->Size();
+    int64 header_bytes = LayoutType::LIGHT == emb_config_.get_layout_type() ?
+        sizeof(LightHeader) : sizeof(NormalHeader);
+    int64 emb_bytes = CompactCodec(emb_config_.storage_dtype).RowBytes<V>(
+        value_len_);
+    int64 slot_bytes = CompactCodec(emb_config_.slot_storage_dtype)
+        .RowBytes<V>(value_len_);
+    int64 bytes_per_key = header_bytes +
+        sizeof(int64) * emb_config_.total_num() +
+        emb_config_.block_num * (emb_bytes + emb_config_.slot_num * slot_bytes);
+    return num_keys * bytes_per_key;
+  }
+
   Status Destroy(int64 value_len) {
     std::vector<K> key_list;
     std::vector<ValuePtr<V>* > value_ptr_list;
@@ -335,6 +559,7 @@ class EmbeddingVar : public ResourceBase {
   }
 
   Status Shrink() {
+      EpochGuard guard(epoch_manager_);
       std::vector<K> key_list;
       std::vector<ValuePtr<V>* > value_ptr_list;
       kv_->GetSnapshot(&key_list, &value_ptr_list);
@@ -356,6 +581,9 @@ class EmbeddingVar : public ResourceBase {
         //(it.second)->Destroy(value_len_);
         //delete it.second;
         kv_->Remove(it.first);
+        if (cache_ != nullptr) {
+          cache_->remove(it.first);
+        }
       }
     return Status::OK();
   }
@@ -381,6 +609,9 @@ class EmbeddingVar : public ResourceBase {
         (it.second)->Destroy(alloc_, value_len_);
         delete it.second;
         kv_->Remove(it.first);
+        if (cache_ != nullptr) {
+          cache_->remove(it.first);
+        }
       }
     }
     return Status::OK();
@@ -399,6 +630,194 @@ class EmbeddingVar : public ResourceBase {
   }
 
  private:
+  static int64 HistogramBucket(int64 value, int64 num_buckets) {
+    int64 bucket = 0;
+    while (value > 0 && bucket < num_buckets - 1) {
+      value >>= 1;
+      ++bucket;
+    }
+    return bucket;
+  }
+
+  void LookupMmap(K key, V* val, const V* default_value_ptr) {
+    const V* mem_val = mmap_table_->Find(key);
+    memcpy(val, mem_val == nullptr ? default_value_ptr : mem_val,
+           sizeof(V) * value_len_);
+  }
+
+  // Removes and frees all the keys of the in memory kv.
+  void Clear() {
+    std::vector<K> key_list;
+    std::vector<ValuePtr<V>* > value_ptr_list;
+    kv_->GetSnapshot(&key_list, &value_ptr_list);
+    for (int64 i = 0; i < key_list.size(); ++i) {
+      kv_->Remove(key_list[i]);
+      value_ptr_list[i]->Destroy(alloc_, value_len_);
+      delete value_ptr_list[i];
+    }
+    mutex_lock l(snapshot_mu_);
+    RetireSnapshotBuffers();
+  }
+
+  Status InitCompactStorage() {
+    if (embedding::StorageType::DRAM != emb_config_.get_storage_type() &&
+        embedding::StorageType::PMEM != emb_config_.get_storage_type()) {
+      return errors::InvalidArgument(name_,
+          ", compact storage_dtype only supports DRAM and PMEM storage.");
+    }
+    CompactCodec emb_codec(emb_config_.storage_dtype);
+    CompactCodec slot_codec(emb_config_.slot_storage_dtype);
+    int64 block_num = emb_config_.block_num;
+    if (LayoutType::LIGHT == emb_config_.get_layout_type()) {
+      new_value_ptr_fn = [block_num, emb_codec, slot_codec] (size_t size) {
+        return new CompactValuePtr<V, LightValuePtr<V>>(
+            size, block_num, emb_codec, slot_codec);
+      };
+    } else {
+      new_value_ptr_fn = [block_num, emb_codec, slot_codec] (size_t size) {
+        return new CompactValuePtr<V, NormalValuePtr<V>>(
+            size, block_num, emb_codec, slot_codec);
+      };
+    }
+    return Status::OK();
+  }
+
+  // Copy of `val` that stays valid until the next snapshot.
+  V* CopyToSnapshotBuffer(const V* val) {
+    if (val == nullptr) {
+      return nullptr;
+    }
+    V* copy = TypedAllocator::Allocate<V>(alloc_, value_len_, AllocationAttributes());
+    memcpy(copy, val, value_len_ * sizeof(V));
+    snapshot_buffers_.push_back(copy);
+    return copy;
+  }
+
+  void FreeDecoded(ValuePtr<V>* value_ptr, V* val) {
+    if (val != nullptr) {
+      value_ptr->Free(val);
+    }
+  }
+
+  Status InitCapacityEviction() {
+    if (embedding::StorageType::DRAM_SSD == emb_config_.get_storage_type()) {
+      return errors::InvalidArgument(name_,
+          ", max_keys can't be used with DRAM_SSD storage.");
+    }
+    if ("lru" == emb_config_.evict_policy) {
+      cache_ = new LRUCache<K>();
+    } else if ("lfu" == emb_config_.evict_policy) {
+      cache_ = new LFUCache<K>();
+    } else {
+      return errors::InvalidArgument(name_, ", Unsupport evict_policy: ",
+                                     emb_config_.evict_policy);
+    }
+    return Status::OK();
+  }
+
+  // Removes the coldest keys but the `num` ones just looked up until at most
+  // max_keys remain. The value ptrs are released once no op uses them.
+  void CapacityEviction(const K* keys, int64 num) {
+    int64 evict_num = kv_->Size() - emb_config_.max_keys;
+    if (evict_num <= 0) {
+      return;
+    }
+    if (!evict_mu_.try_lock()) {
+      return;
+    }
+    std::vector<K> evic_ids(evict_num);
+    size_t true_size = cache_->get_evic_ids(evic_ids.data(), evict_num,
+                                            keys, num);
+    std::vector<ValuePtr<V>*> evicted;
+    for (size_t i = 0; i < true_size; ++i) {
+      ValuePtr<V>* value_ptr = nullptr;
+      if (kv_->Lookup(evic_ids[i], &value_ptr).ok() &&
+          kv_->Remove(evic_ids[i]).ok()) {
+        evicted.push_back(value_ptr);
+      }
+    }
+    VLOG(2) << name_ << " evicted " << evicted.size()
+            << " keys, size: " << kv_->Size();
+    evict_mu_.unlock();
+    Allocator* alloc = alloc_;
+    int64 value_len = value_len_;
+    epoch_manager_->Retire([evicted, alloc, value_len] () {
+      for (auto value_ptr : evicted) {
+        value_ptr->Destroy(alloc, value_len);
+        delete value_ptr;
+      }
+    });
+  }
+
+  Status InitTieredStorage() {
+    if (emb_config_.is_primary()) {
+      tiered_kv_ = new TieredKV<K, V>(kv_, emb_config_.get_storage_path(),
+                                      epoch_manager_);
+      kv_ = tiered_kv_;
+      tiered_kv_->SetValueAllocator(
+          [this] () { return new_value_ptr_fn(emb_config_.total_num()); },
+          alloc_, value_len_);
+      cache_ = new LFUCache<K>();
+      if (emb_config_.get_dram_capacity_bytes() <= 0) {
+        LOG(WARNING) << name_ << ", storage_size of DRAM is not set, "
+                     << "DRAM_SSD EmbeddingVariable will not use SSD.";
+      }
+    } else {
+      tiered_kv_ = dynamic_cast<TieredKV<K, V>*>(kv_);
+      if (tiered_kv_ == nullptr) {
+        return errors::FailedPrecondition(name_,
+            ", primary EmbeddingVariable of DRAM_SSD storage must be "
+            "initialized before its slots.");
+      }
+    }
+    return Status::OK();
+  }
+
+  // Number of keys the DRAM tier can hold, all slots share the value ptr.
+  // Besides the values, each key costs its ValuePtr with the header and
+  // column pointers, its entry in the open addressing hash map of the DRAM
+  // tier, counted twice as the map is at most 80% full and grows by
+  // doubling, and its entry in the LFU cache.
+  int64 DramCapacity() const {
+    const int64 total_num = emb_config_.total_num();
+    if (value_len_ * total_num <= 0) {
+      return 0;
+    }
+    const int64 header_bytes =
+        LayoutType::LIGHT == emb_config_.get_layout_type() ?
+        sizeof(LightHeader) : sizeof(NormalHeader);
+    const int64 bytes_per_key =
+        value_len_ * sizeof(V) * total_num +
+        sizeof(NormalValuePtr<V>) + header_bytes + sizeof(int64) * total_num +
+        2 * (sizeof(K) + sizeof(ValuePtr<V>*)) +
+        LFUCache<K>::BytesPerKey();
+    return emb_config_.get_dram_capacity_bytes() / bytes_per_key;
+  }
+
+  // Releases the buffers of the previous snapshot once no op uses them.
+  void RetireSnapshotBuffers() {
+    if (snapshot_buffers_.empty()) {
+      return;
+    }
+    std::vector<V*> buffers;
+    buffers.swap(snapshot_buffers_);
+    Allocator* alloc = alloc_;
+    int64 value_len = value_len_;
+    epoch_manager_->Retire([buffers, alloc, value_len] () {
+      for (auto buffer : buffers) {
+        TypedAllocator::Deallocate(alloc, buffer, value_len);
+      }
+    });
+  }
+
+  void FreeSnapshotBuffers() {
+    mutex_lock l(snapshot_mu_);
+    for (auto buffer : snapshot_buffers_) {
+      TypedAllocator::Deallocate(alloc_, buffer, value_len_);
+    }
+    snapshot_buffers_.clear();
+  }
+
   Status LookupOrCreateKeyInternal(K key, ValuePtr<V>** value_ptr, size_t size) {
     Status s = kv_->Lookup(key, value_ptr);
     if (s.ok()) {
@@ -410,6 +829,11 @@ class EmbeddingVar : public ResourceBase {
       s = kv_->Insert(key, *value_ptr);
       if (s.ok()) {
         // Insert Success
+        if (cache_ != nullptr) {
+          // Keys created by apply ops are ranked too, or they would never
+          // be evicted.
+          cache_->add_to_rank(&key, 1);
+        }
         return s;
       } else {
         // Insert Failed, key already exist
@@ -435,6 +859,15 @@ class EmbeddingVar : public ResourceBase {
   EmbeddingFilter<K, V, EmbeddingVar<K, V>>* filter_;
   leveldb::DB* level_db_;
   std::string db_name_;
+  TieredKV<K, V>* tiered_kv_ = nullptr;
+  BatchCache<K>* cache_ = nullptr;
+  // Held while the buffers of a snapshot are filled or retired.
+  mutex snapshot_mu_;
+  std::vector<V*> snapshot_buffers_;
+  mutex evict_mu_;
+  MmapTable<K, V>* mmap_table_ = nullptr;
+  std::unique_ptr<EpochManager> own_epoch_manager_;
+  EpochManager* epoch_manager_;
 
   ~EmbeddingVar() override {
     if (emb_config_.is_primary()) {
@@ -446,7 +879,10 @@ class EmbeddingVar : public ResourceBase {
       }
       Destroy(value_len_);
       delete kv_;
+      delete cache_;
+      delete mmap_table_;
     }
+    FreeSnapshotBuffers();
     TypedAllocator::Deallocate(alloc_, default_value_, value_len_);
   }
   TF_DISALLOW_COPY_AND_ASSIGN(EmbeddingVar);
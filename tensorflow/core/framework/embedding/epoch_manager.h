@@ -0,0 +1,147 @@
+/* Copyright 2022 The TensorFlow Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+==============================================================================*/
+
+#ifndef TENSORFLOW_CORE_FRAMEWORK_EMBEDDING_EPOCH_MANAGER_H_
+#define TENSORFLOW_CORE_FRAMEWORK_EMBEDDING_EPOCH_MANAGER_H_
+
+#include <deque>
+#include <functional>
+#include <map>
+#include <utility>
+#include <vector>
+
+#include "tensorflow/core/platform/macros.h"
+#include "tensorflow/core/platform/mutex.h"
+#include "tensorflow/core/platform/thread_annotations.h"
+#include "tensorflow/core/platform/types.h"
+
+namespace tensorflow {
+
+// Epoch based reclamation of the memory shared by the concurrent ops of an
+// EmbeddingVar and its slots.
+//
+// Ops look up value ptrs without locks and keep using them after the lookup,
+// so a value ptr removed from the kv, e.g. by an eviction, may still be read
+// or updated. Every op holds an EpochGuard while it uses value ptrs. Memory
+// removed from the kv is retired in the current epoch, which is then
+// advanced, and is only released once every op entered in or before that
+// epoch has exited. Ops entered afterwards can't reach the memory anymore.
+class EpochManager {
+ public:
+  EpochManager() : epoch_(0) {}
+
+  ~EpochManager() {
+    for (auto& it : retired_) {
+      it.second();
+    }
+  }
+
+  // Returns the epoch the calling op entered in.
+  int64 Enter() {
+    mutex_lock l(mu_);
+    ++active_[epoch_];
+    return epoch_;
+  }
+
+  void Exit(int64 epoch) {
+    mutex_lock l(mu_);
+    auto it = active_.find(epoch);
+    if (--it->second == 0) {
+      active_.erase(it);
+    }
+  }
+
+  // Must be called after memory has been removed from the kv. Returns the
+  // epoch the memory is retired in.
+  int64 Advance() {
+    mutex_lock l(mu_);
+    return epoch_++;
+  }
+
+  // Whether every op that may use memory retired in `epoch` has exited.
+  bool IsQuiescent(int64 epoch) {
+    mutex_lock l(mu_);
+    return IsQuiescentLocked(epoch);
+  }
+
+  // Calls `release` once the memory removed from the kv before this call is
+  // no longer used, and releases what is no longer used of the memory
+  // retired before.
+  void Retire(std::function<void()> release) {
+    {
+      mutex_lock l(mu_);
+      retired_.emplace_back(epoch_++, std::move(release));
+    }
+    Reclaim();
+  }
+
+  // Releases the retired memory that is no longer used.
+  void Reclaim() {
+    std::vector<std::function<void()>> ready;
+    {
+      mutex_lock l(mu_);
+      while (!retired_.empty() && IsQuiescentLocked(retired_.front().first)) {
+        ready.push_back(std::move(retired_.front().second));
+        retired_.pop_front();
+      }
+    }
+    for (auto& release : ready) {
+      release();
+    }
+  }
+
+ private:
+  bool IsQuiescentLocked(int64 epoch) EXCLUSIVE_LOCKS_REQUIRED(mu_) {
+    return active_.empty() || active_.begin()->first > epoch;
+  }
+
+  mutex mu_;
+  int64 epoch_ GUARDED_BY(mu_);
+  // Number of running ops by the epoch they entered in.
+  std::map<int64, int64> active_ GUARDED_BY(mu_);
+  std::deque<std::pair<int64, std::function<void()>>> retired_
+      GUARDED_BY(mu_);
+
+  TF_DISALLOW_COPY_AND_ASSIGN(EpochManager);
+};
+
+// Keeps the op in an epoch of `manager` during its lifetime, no-op if
+// `manager` is null.
+class EpochGuard {
+ public:
+  explicit EpochGuard(EpochManager* manager)
+      : manager_(manager), epoch_(manager ? manager->Enter() : 0) {}
+
+  EpochGuard(EpochGuard&& other)
+      : manager_(other.manager_), epoch_(other.epoch_) {
+    other.manager_ = nullptr;
+  }
+
+  ~EpochGuard() {
+    if (manager_ != nullptr) {
+      manager_->Exit(epoch_);
+    }
+  }
+
+ private:
+  EpochManager* manager_;
+  int64 epoch_;
+
+  TF_DISALLOW_COPY_AND_ASSIGN(EpochGuard);
+};
+
+}  // namespace tensorflow
+
+#endif  // TENSORFLOW_CORE_FRAMEWORK_EMBEDDING_EPOCH_MANAGER_H_
@@ -0,0 +1,207 @@
+/* Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+==============================================================================*/
+
+#ifndef TENSORFLOW_CORE_FRAMEWORK_EMBEDDING_HOT_KEY_CACHE_H_
+#define TENSORFLOW_CORE_FRAMEWORK_EMBEDDING_HOT_KEY_CACHE_H_
+
+#include <algorithm>
+#include <atomic>
+#include <cstring>
+#include <functional>
+#include <unordered_map>
+#include <vector>
+
+#include "tensorflow/core/framework/resource_mgr.h"
+#include "tensorflow/core/lib/strings/strcat.h"
+#include "tensorflow/core/platform/mutex.h"
+#include "tensorflow/core/platform/types.h"
+
+namespace tensorflow {
+
+// Worker local copy of the hottest rows of a partitioned EmbeddingVariable.
+//
+// Lookups count every id they see; `HotKeys` returns the most frequent ones
+// so that the caller can fetch their values from the PS and publish them with
+// `Update`. Counts are halved on every `HotKeys` call, so the ranking follows
+// the recent traffic. Once there are too many candidates, the coldest half is
+// dropped, so that lookups stay cheap and hot ids keep their counts. The
+// cached values are only served while they are at
+// most `max_staleness` global steps old.
+template <class K, class V>
+class HotKeyCache : public ResourceBase {
+ public:
+  HotKeyCache(int64 capacity, int64 value_len, int64 max_staleness)
+      : capacity_(capacity), value_len_(value_len),
+        max_staleness_(max_staleness), version_(-1),
+        hits_(0), misses_(0) {}
+
+  // Splits `ids` into cached and uncached positions. The values of the hits
+  // are copied to the buffer returned by `allocate_fn(num_hits)`.
+  void Lookup(const K* ids, int64 num, int64 global_step,
+              std::vector<int32>* hit_pos, std::vector<int32>* miss_pos,
+              const std::function<V*(int64)>& allocate_fn) {
+    RecordAccess(ids, num);
+    tf_shared_lock l(mu_);
+    std::vector<int64> rows;
+    bool fresh = version_ >= 0 && global_step - version_ <= max_staleness_;
+    for (int64 i = 0; i < num; ++i) {
+      auto it = fresh ? index_.find(ids[i]) : index_.end();
+      if (it == index_.end()) {
+        miss_pos->push_back(i);
+      } else {
+        hit_pos->push_back(i);
+        rows.push_back(it->second);
+      }
+    }
+    V* out = allocate_fn(rows.size());
+    if (out == nullptr) {
+      return;
+    }
+    for (int64 i = 0; i < rows.size(); ++i) {
+      memcpy(out + i * value_len_, values_.data() + rows[i] * value_len_,
+             value_len_ * sizeof(V));
+    }
+    hits_ += hit_pos->size();
+    misses_ += miss_pos->size();
+  }
+
+  // Returns up to `capacity` of the most accessed ids and decays the counts.
+  void HotKeys(std::vector<K>* keys) {
+    std::vector<std::pair<int64, K>> ranked;
+    {
+      mutex_lock l(count_mu_);
+      ranked.reserve(counts_.size());
+      for (auto& it : counts_) {
+        ranked.emplace_back(it.second, it.first);
+      }
+      Decay();
+    }
+    int64 k = std::min(capacity_, (int64)ranked.size());
+    std::partial_sort(ranked.begin(), ranked.begin() + k, ranked.end(),
+        [] (const std::pair<int64, K>& a, const std::pair<int64, K>& b) {
+          return a.first > b.first;
+        });
+    for (int64 i = 0; i < k; ++i) {
+      keys->push_back(ranked[i].second);
+    }
+  }
+
+  // Replaces the cached rows with `num` rows of `values`, fetched at
+  // `global_step`.
+  void Update(const K* ids, const V* values, int64 num, int64 global_step) {
+    num = std::min(num, capacity_);
+    std::unordered_map<K, int64> index;
+    index.reserve(num);
+    std::vector<V> new_values(values, values + num * value_len_);
+    for (int64 i = 0; i < num; ++i) {
+      index.emplace(ids[i], i);
+    }
+    mutex_lock l(mu_);
+    index_.swap(index);
+    values_.swap(new_values);
+    version_ = global_step;
+  }
+
+  int64 Size() {
+    tf_shared_lock l(mu_);
+    return index_.size();
+  }
+
+  int64 Version() {
+    tf_shared_lock l(mu_);
+    return version_;
+  }
+
+  int64 Hits() const { return hits_; }
+  int64 Misses() const { return misses_; }
+  int64 ValueLen() const { return value_len_; }
+
+  string DebugString() const override {
+    return strings::StrCat("HotKeyCache capacity: ", capacity_,
+                           " hits: ", hits_.load(),
+                           " misses: ", misses_.load());
+  }
+
+ private:
+  void RecordAccess(const K* ids, int64 num) {
+    mutex_lock l(count_mu_);
+    for (int64 i = 0; i < num; ++i) {
+      counts_[ids[i]]++;
+    }
+    // Bound the memory spent on cold candidates.
+    if (counts_.size() > kMaxCandidatesFactor * capacity_) {
+      EvictColdest(kMaxCandidatesFactor * capacity_ / 2);
+    }
+  }
+
+  // Keeps the `num_kept` most accessed candidates. Runs once per
+  // `num_kept` new candidates at most, so its cost is amortized.
+  void EvictColdest(int64 num_kept) EXCLUSIVE_LOCKS_REQUIRED(count_mu_) {
+    std::vector<int64> counts;
+    counts.reserve(counts_.size());
+    for (auto& it : counts_) {
+      counts.push_back(it.second);
+    }
+    int64 num_evicted = counts.size() - num_kept;
+    std::nth_element(counts.begin(), counts.begin() + num_evicted,
+                     counts.end());
+    // Candidates colder than `threshold` are evicted, and as many as needed
+    // of the ones as cold as it.
+    int64 threshold = counts[num_evicted];
+    int64 num_ties = num_evicted -
+        std::count_if(counts.begin(), counts.begin() + num_evicted,
+                      [threshold] (int64 c) { return c < threshold; });
+    for (auto it = counts_.begin(); it != counts_.end();) {
+      if (it->second < threshold ||
+          (it->second == threshold && num_ties-- > 0)) {
+        it = counts_.erase(it);
+      } else {
+        ++it;
+      }
+    }
+  }
+
+  void Decay() EXCLUSIVE_LOCKS_REQUIRED(count_mu_) {
+    for (auto it = counts_.begin(); it != counts_.end();) {
+      it->second >>= 1;
+      if (it->second == 0) {
+        it = counts_.erase(it);
+      } else {
+        ++it;
+      }
+    }
+  }
+
+  static const int64 kMaxCandidatesFactor = 16;
+
+  const int64 capacity_;
+  const int64 value_len_;
+  const int64 max_staleness_;
+
+  mutex mu_;
+  std::unordered_map<K, int64> index_ GUARDED_BY(mu_);
+  std::vector<V> values_ GUARDED_BY(mu_);
+  int64 version_ GUARDED_BY(mu_);
+
+  mutex count_mu_;
+  std::unordered_map<K, int64> counts_ GUARDED_BY(count_mu_);
+
+  std::atomic<int64> hits_;
+  std::atomic<int64> misses_;
+};
+
+}  // namespace tensorflow
+
+#endif  // TENSORFLOW_CORE_FRAMEWORK_EMBEDDING_HOT_KEY_CACHE_H_
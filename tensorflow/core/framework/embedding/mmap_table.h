@@ -0,0 +1,130 @@
+/* Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+==============================================================================*/
+
+#ifndef TENSORFLOW_CORE_FRAMEWORK_EMBEDDING_MMAP_TABLE_H_
+#define TENSORFLOW_CORE_FRAMEWORK_EMBEDDING_MMAP_TABLE_H_
+
+#include <algorithm>
+#include <memory>
+#include <vector>
+
+#include "tensorflow/core/lib/core/errors.h"
+#include "tensorflow/core/lib/core/status.h"
+#include "tensorflow/core/lib/strings/strcat.h"
+#include "tensorflow/core/platform/env.h"
+#include "tensorflow/core/platform/file_system.h"
+
+namespace tensorflow {
+
+// Read only embedding table used by StorageType::MMAP, made of two files:
+// `<prefix>.keys` holds the sorted keys, `<prefix>.values` the rows in the
+// same order. Both are memory mapped, so that processes serving the same
+// checkpoint on a host share the page cache instead of each holding a copy.
+template <class K, class V>
+class MmapTable {
+ public:
+  MmapTable() : keys_(nullptr), values_(nullptr), size_(0), value_len_(0) {}
+
+  static bool Exists(const std::string& prefix) {
+    Env* env = Env::Default();
+    return env->FileExists(KeysFile(prefix)).ok() &&
+           env->FileExists(ValuesFile(prefix)).ok();
+  }
+
+  // Writes `keys` and their `values` (each `value_len` long) as a table.
+  // The files are written aside and renamed, so concurrent writers of the
+  // same table never expose a partial file.
+  static Status Write(const std::string& prefix, const std::vector<K>& keys,
+                      const std::vector<V*>& values, int64 value_len) {
+    std::vector<int64> order(keys.size());
+    for (int64 i = 0; i < order.size(); ++i) {
+      order[i] = i;
+    }
+    std::sort(order.begin(), order.end(), [&keys] (int64 a, int64 b) {
+      return keys[a] < keys[b];
+    });
+    Env* env = Env::Default();
+    const std::string suffix = strings::StrCat(".tmp", env->NowMicros());
+    std::unique_ptr<WritableFile> keys_file;
+    std::unique_ptr<WritableFile> values_file;
+    TF_RETURN_IF_ERROR(env->NewWritableFile(KeysFile(prefix) + suffix,
+                                            &keys_file));
+    TF_RETURN_IF_ERROR(env->NewWritableFile(ValuesFile(prefix) + suffix,
+                                            &values_file));
+    for (int64 i : order) {
+      TF_RETURN_IF_ERROR(keys_file->Append(
+          StringPiece((const char*)&keys[i], sizeof(K))));
+      TF_RETURN_IF_ERROR(values_file->Append(
+          StringPiece((const char*)values[i], value_len * sizeof(V))));
+    }
+    TF_RETURN_IF_ERROR(keys_file->Close());
+    TF_RETURN_IF_ERROR(values_file->Close());
+    // Keys last, Exists() checks both files.
+    TF_RETURN_IF_ERROR(env->RenameFile(ValuesFile(prefix) + suffix,
+                                       ValuesFile(prefix)));
+    return env->RenameFile(KeysFile(prefix) + suffix, KeysFile(prefix));
+  }
+
+  Status Open(const std::string& prefix, int64 value_len) {
+    Env* env = Env::Default();
+    TF_RETURN_IF_ERROR(env->NewReadOnlyMemoryRegionFromFile(
+        KeysFile(prefix), &keys_region_));
+    TF_RETURN_IF_ERROR(env->NewReadOnlyMemoryRegionFromFile(
+        ValuesFile(prefix), &values_region_));
+    size_ = keys_region_->length() / sizeof(K);
+    if (values_region_->length() != size_ * value_len * sizeof(V)) {
+      return errors::DataLoss("Mismatched MmapTable ", prefix, ", ", size_,
+                              " keys and ", values_region_->length(),
+                              " bytes of values with value_len ", value_len);
+    }
+    keys_ = (const K*)keys_region_->data();
+    values_ = (const V*)values_region_->data();
+    value_len_ = value_len;
+    return Status::OK();
+  }
+
+  // Returns the row of `key`, nullptr if it isn't in the table.
+  const V* Find(K key) const {
+    const K* it = std::lower_bound(keys_, keys_ + size_, key);
+    if (it == keys_ + size_ || *it != key) {
+      return nullptr;
+    }
+    return values_ + (it - keys_) * value_len_;
+  }
+
+  int64 Size() const { return size_; }
+  K Key(int64 i) const { return keys_[i]; }
+  const V* Value(int64 i) const { return values_ + i * value_len_; }
+
+ private:
+  static std::string KeysFile(const std::string& prefix) {
+    return prefix + ".keys";
+  }
+
+  static std::string ValuesFile(const std::string& prefix) {
+    return prefix + ".values";
+  }
+
+  std::unique_ptr<ReadOnlyMemoryRegion> keys_region_;
+  std::unique_ptr<ReadOnlyMemoryRegion> values_region_;
+  const K* keys_;
+  const V* values_;
+  int64 size_;
+  int64 value_len_;
+};
+
+}  // namespace tensorflow
+
+#endif  // TENSORFLOW_CORE_FRAMEWORK_EMBEDDING_MMAP_TABLE_H_
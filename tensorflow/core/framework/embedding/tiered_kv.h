@@ -0,0 +1,379 @@
+/* Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+==============================================================================*/
+
+#ifndef TENSORFLOW_CORE_FRAMEWORK_EMBEDDING_TIERED_KV_H_
+#define TENSORFLOW_CORE_FRAMEWORK_EMBEDDING_TIERED_KV_H_
+
+#include <atomic>
+#include <deque>
+#include <functional>
+#include <unordered_map>
+
+#include "leveldb/db.h"
+#include "leveldb/filter_policy.h"
+#include "leveldb/write_batch.h"
+#include "tensorflow/core/framework/embedding/cache.h"
+#include "tensorflow/core/framework/embedding/epoch_manager.h"
+#include "tensorflow/core/framework/embedding/kv_interface.h"
+#include "tensorflow/core/framework/embedding/value_ptr.h"
+#include "tensorflow/core/lib/core/errors.h"
+#include "tensorflow/core/lib/core/status.h"
+#include "tensorflow/core/lib/io/path.h"
+#include "tensorflow/core/platform/env.h"
+#include "tensorflow/core/platform/mutex.h"
+
+namespace tensorflow {
+
+// Two level KV used by StorageType::DRAM_SSD. Hot keys live in the DRAM
+// hash map, cold keys are spilled to a LevelDB instance under storage_path.
+//
+// A key is always in exactly one of three places: the DRAM hash map, the
+// demoted value ptrs waiting to be spilled, or disk. All moves between them
+// hold mu_. A demoted value ptr is removed from DRAM right away but only
+// written to disk and released once every op that may hold it has exited,
+// see EpochManager, so that no gather reads freed memory and no update
+// applied after the write is lost. Looking up a demoted key moves the same
+// value ptr back to DRAM.
+template <class K, class V>
+class TieredKV : public KVInterface<K, V> {
+ public:
+  TieredKV(KVInterface<K, V>* dram_kv, const std::string& storage_path,
+           EpochManager* epoch_manager)
+      : dram_kv_(dram_kv), db_(nullptr), disk_size_(0), demoted_size_(0),
+        epoch_manager_(epoch_manager), alloc_(nullptr), value_len_(0) {
+    Status s = Env::Default()->IsDirectory(storage_path);
+    if (!s.ok()) {
+      LOG(WARNING) << "StoragePath=\"" << storage_path
+                   << "\" is not Directory, message: " << s.ToString()
+                   << ". Try to create dir.";
+      TF_CHECK_OK(Env::Default()->RecursivelyCreateDir(storage_path));
+    }
+    db_name_ = io::JoinPath(storage_path, "tiered_kv_" +
+        std::to_string(Env::Default()->NowMicros()));
+    filter_policy_ = leveldb::NewBloomFilterPolicy(10);
+    leveldb::Options options;
+    options.create_if_missing = true;
+    options.filter_policy = filter_policy_;
+    leveldb::Status st = leveldb::DB::Open(options, db_name_, &db_);
+    if (!st.ok()) {
+      LOG(FATAL) << "Fail to open leveldb: " << st.ToString();
+    } else {
+      VLOG(1) << "Open TieredKV DB Success, db_name: " << db_name_;
+    }
+  }
+
+  ~TieredKV() {
+    for (auto it : demoted_) {
+      it.second.first->Destroy(alloc_, value_len_);
+      delete it.second.first;
+    }
+    delete db_;
+    delete filter_policy_;
+    int64 undeleted_files = 0;
+    int64 undeleted_dirs = 0;
+    TF_CHECK_OK(Env::Default()->DeleteRecursively(
+        db_name_, &undeleted_files, &undeleted_dirs));
+    delete dram_kv_;
+  }
+
+  // Must be called by the primary EmbeddingVar before the first lookup, the
+  // value ptrs promoted from disk are built with `new_value_ptr_fn`.
+  void SetValueAllocator(std::function<ValuePtr<V>*()> new_value_ptr_fn,
+                         Allocator* alloc, int64 value_len) {
+    new_value_ptr_fn_ = new_value_ptr_fn;
+    alloc_ = alloc;
+    value_len_ = value_len;
+  }
+
+  Status Lookup(K key, ValuePtr<V>** value_ptr) override {
+    Status s = dram_kv_->Lookup(key, value_ptr);
+    if (s.ok() || disk_size_ + demoted_size_ == 0) {
+      return s;
+    }
+    // Promote the key back to DRAM.
+    mutex_lock l(mu_);
+    if (dram_kv_->Lookup(key, value_ptr).ok()) {
+      return Status::OK();
+    }
+    auto it = demoted_.find(key);
+    if (it != demoted_.end()) {
+      // Not spilled yet, the value ptr is still up to date.
+      TF_RETURN_IF_ERROR(dram_kv_->Insert(key, it->second.first));
+      *value_ptr = it->second.first;
+      demoted_.erase(it);
+      demoted_size_--;
+      return Status::OK();
+    }
+    std::string value;
+    if (!db_->Get(leveldb::ReadOptions(), KeySlice(key), &value).ok()) {
+      return errors::NotFound(
+          "Unable to find Key: ", key, " in TieredKV.");
+    }
+    ValuePtr<V>* promoted = DecodeValuePtr(value);
+    s = dram_kv_->Insert(key, promoted);
+    if (!s.ok()) {
+      promoted->Destroy(alloc_, value_len_);
+      delete promoted;
+      return dram_kv_->Lookup(key, value_ptr);
+    }
+    leveldb::Status st = db_->Delete(leveldb::WriteOptions(), KeySlice(key));
+    if (!st.ok()) {
+      LOG(FATAL) << "Fail to Delete leveldb: " << db_name_
+                 << ", key: " << key << ", msg: " << st.ToString();
+    }
+    disk_size_--;
+    *value_ptr = promoted;
+    return Status::OK();
+  }
+
+  Status Insert(K key, const ValuePtr<V>* value_ptr) override {
+    return dram_kv_->Insert(key, value_ptr);
+  }
+
+  Status Remove(K key) override {
+    Status s = dram_kv_->Remove(key);
+    if (s.ok() || disk_size_ + demoted_size_ == 0) {
+      return s;
+    }
+    mutex_lock l(mu_);
+    auto it = demoted_.find(key);
+    if (it != demoted_.end()) {
+      ValuePtr<V>* value_ptr = it->second.first;
+      demoted_.erase(it);
+      demoted_size_--;
+      Allocator* alloc = alloc_;
+      int64 value_len = value_len_;
+      epoch_manager_->Retire([value_ptr, alloc, value_len] () {
+        value_ptr->Destroy(alloc, value_len);
+        delete value_ptr;
+      });
+      return Status::OK();
+    }
+    std::string value;
+    if (!db_->Get(leveldb::ReadOptions(), KeySlice(key), &value).ok()) {
+      return errors::NotFound(
+          "Unable to find Key: ", key, " in TieredKV.");
+    }
+    leveldb::Status st = db_->Delete(leveldb::WriteOptions(), KeySlice(key));
+    if (!st.ok()) {
+      return errors::Internal("Fail to Delete leveldb: ", st.ToString());
+    }
+    disk_size_--;
+    return Status::OK();
+  }
+
+  int64 Size() const override {
+    return dram_kv_->Size() + demoted_size_ + disk_size_;
+  }
+
+  int64 DramSize() const {
+    return dram_kv_->Size();
+  }
+
+  // Keys demoted from DRAM, whether spilled to disk or not yet.
+  int64 DiskSize() const {
+    return demoted_size_ + disk_size_;
+  }
+
+  // Only returns the DRAM tier, see the overload below for all the keys.
+  Status GetSnapshot(std::vector<K>* key_list,
+                     std::vector<ValuePtr<V>* >* value_ptr_list) override {
+    return dram_kv_->GetSnapshot(key_list, value_ptr_list);
+  }
+
+  // Returns the DRAM tier in `key_list` and `value_ptr_list`, and calls
+  // `cold_fn` on every other key. The tiers are snapshotted at one point in
+  // time, so that a key moved between them meanwhile is listed exactly once.
+  // The DRAM value ptrs stay valid as long as the caller holds an EpochGuard,
+  // the value ptr passed to `cold_fn` is only valid during the call.
+  Status GetSnapshot(std::vector<K>* key_list,
+                     std::vector<ValuePtr<V>* >* value_ptr_list,
+                     const std::function<void(K, ValuePtr<V>*)>& cold_fn) {
+    leveldb::ReadOptions options;
+    {
+      mutex_lock l(mu_);
+      TF_RETURN_IF_ERROR(dram_kv_->GetSnapshot(key_list, value_ptr_list));
+      for (auto it : demoted_) {
+        cold_fn(it.first, it.second.first);
+      }
+      options.snapshot = db_->GetSnapshot();
+    }
+    leveldb::Iterator* it = db_->NewIterator(options);
+    for (it->SeekToFirst(); it->Valid(); it->Next()) {
+      K key;
+      memcpy(&key, it->key().data(), sizeof(K));
+      ValuePtr<V>* value_ptr = DecodeValuePtr(it->value().ToString());
+      cold_fn(key, value_ptr);
+      value_ptr->Destroy(alloc_, value_len_);
+      delete value_ptr;
+    }
+    Status s = it->status().ok() ? Status::OK() :
+        errors::Internal("Fail to iterate leveldb: ", it->status().ToString());
+    delete it;
+    db_->ReleaseSnapshot(options.snapshot);
+    return s;
+  }
+
+  // Spills the demoted value ptrs no op uses anymore, then demotes the
+  // coldest keys ranked by `cache` until the DRAM tier holds at most
+  // `dram_capacity` keys. The `num` keys just looked up stay in DRAM.
+  // Concurrent calls return immediately.
+  void Eviction(BatchCache<K>* cache, int64 dram_capacity,
+                const K* keys, int64 num) {
+    if (!mu_.try_lock()) {
+      return;
+    }
+    SpillLocked();
+    int64 evict_num = dram_kv_->Size() - dram_capacity;
+    if (dram_capacity > 0 && evict_num > 0) {
+      std::vector<K> evic_ids(evict_num);
+      size_t true_size = cache->get_evic_ids(evic_ids.data(), evict_num,
+                                              keys, num);
+      std::vector<K> demoted;
+      for (size_t i = 0; i < true_size; ++i) {
+        ValuePtr<V>* value_ptr = nullptr;
+        if (!dram_kv_->Lookup(evic_ids[i], &value_ptr).ok()) {
+          continue;
+        }
+        // Findable as demoted before it is gone from DRAM.
+        demoted_[evic_ids[i]] = std::make_pair(value_ptr, kint64max);
+        demoted_size_++;
+        if (dram_kv_->Remove(evic_ids[i]).ok()) {
+          demoted.push_back(evic_ids[i]);
+        } else {
+          demoted_.erase(evic_ids[i]);
+          demoted_size_--;
+        }
+      }
+      int64 epoch = epoch_manager_->Advance();
+      for (K key : demoted) {
+        demoted_[key].second = epoch;
+      }
+      VLOG(2) << "TieredKV demoted " << demoted.size() << " keys, dram size: "
+              << dram_kv_->Size() << ", demoted size: " << demoted_size_
+              << ", disk size: " << disk_size_;
+      demoted_batches_.emplace_back(epoch, std::move(demoted));
+    }
+    mu_.unlock();
+  }
+
+  std::string DebugString() const override {
+    return strings::StrCat("TieredKV dram size: ", dram_kv_->Size(),
+                           " demoted size: ", demoted_size_.load(),
+                           " disk size: ", disk_size_.load(),
+                           " db_name: ", db_name_);
+  }
+
+ private:
+  leveldb::Slice KeySlice(const K& key) const {
+    return leveldb::Slice((const char*)&key, sizeof(K));
+  }
+
+  // Serialized as the header followed by every allocated embedding column.
+  void EncodeValuePtr(ValuePtr<V>* value_ptr, std::string* out) {
+    MetaHeader* meta = (MetaHeader*)value_ptr->GetPtr();
+    auto metadata = meta->GetColumnBitset();
+    V** columns = (V**)((int64*)meta + meta->GetHeaderSize());
+    out->append((const char*)meta, meta->GetHeaderSize() * sizeof(int64));
+    for (int i = 0; i < COLUMN_BITSET_SIZE; ++i) {
+      if (metadata.test(i)) {
+        out->append((const char*)columns[i], value_len_ * sizeof(V));
+      }
+    }
+  }
+
+  ValuePtr<V>* DecodeValuePtr(const std::string& value) {
+    ValuePtr<V>* value_ptr = new_value_ptr_fn_();
+    MetaHeader* meta = (MetaHeader*)value_ptr->GetPtr();
+    size_t header_bytes = meta->GetHeaderSize() * sizeof(int64);
+    memcpy(meta, value.data(), header_bytes);
+    auto metadata = meta->GetColumnBitset();
+    V** columns = (V**)((int64*)meta + meta->GetHeaderSize());
+    const char* data = value.data() + header_bytes;
+    for (int i = 0; i < COLUMN_BITSET_SIZE; ++i) {
+      if (metadata.test(i)) {
+        V* val = TypedAllocator::Allocate<V>(alloc_, value_len_,
+                                             AllocationAttributes());
+        memcpy(val, data, value_len_ * sizeof(V));
+        columns[i] = val;
+        data += value_len_ * sizeof(V);
+      }
+    }
+    return value_ptr;
+  }
+
+  // Writes the demoted value ptrs of the batches no op uses anymore to disk
+  // and releases them. Keys promoted back to DRAM meanwhile are skipped.
+  void SpillLocked() EXCLUSIVE_LOCKS_REQUIRED(mu_) {
+    leveldb::WriteBatch batch;
+    std::vector<ValuePtr<V>*> spilled;
+    while (!demoted_batches_.empty() &&
+           epoch_manager_->IsQuiescent(demoted_batches_.front().first)) {
+      const int64 epoch = demoted_batches_.front().first;
+      for (K key : demoted_batches_.front().second) {
+        auto it = demoted_.find(key);
+        if (it == demoted_.end() || it->second.second != epoch) {
+          continue;
+        }
+        std::string value;
+        EncodeValuePtr(it->second.first, &value);
+        batch.Put(KeySlice(key), value);
+        spilled.push_back(it->second.first);
+        demoted_.erase(it);
+      }
+      demoted_batches_.pop_front();
+    }
+    if (spilled.empty()) {
+      return;
+    }
+    leveldb::Status st = db_->Write(leveldb::WriteOptions(), &batch);
+    if (!st.ok()) {
+      LOG(FATAL) << "Fail to Write leveldb: " << db_name_
+                 << ", msg: " << st.ToString();
+    }
+    disk_size_ += spilled.size();
+    demoted_size_ -= spilled.size();
+    for (auto value_ptr : spilled) {
+      value_ptr->Destroy(alloc_, value_len_);
+      delete value_ptr;
+    }
+  }
+
+ private:
+  KVInterface<K, V>* dram_kv_;
+  leveldb::DB* db_;
+  const leveldb::FilterPolicy* filter_policy_;
+  std::string db_name_;
+  std::atomic<int64> disk_size_;
+  std::atomic<int64> demoted_size_;
+  EpochManager* epoch_manager_;
+
+  std::function<ValuePtr<V>*()> new_value_ptr_fn_;
+  Allocator* alloc_;
+  int64 value_len_;
+
+  // Serializes the moves between DRAM, demoted_ and disk.
+  mutex mu_;
+  // Demoted keys not spilled yet, with their value ptr and the epoch they
+  // were demoted in.
+  std::unordered_map<K, std::pair<ValuePtr<V>*, int64>> demoted_
+      GUARDED_BY(mu_);
+  std::deque<std::pair<int64, std::vector<K>>> demoted_batches_
+      GUARDED_BY(mu_);
+};
+
+}  // namespace tensorflow
+
+#endif  // TENSORFLOW_CORE_FRAMEWORK_EMBEDDING_TIERED_KV_H_
@@ -227,6 +227,12 @@ class ValuePtr {
     LOG(FATAL) << "Unsupport FreqCounter in subclass of ValuePtrBase";
   }
 
+  // Raw header and embedding pointers, used when moving a value ptr
+  // between storage tiers.
+  void* GetPtr() const {
+    return ptr_;
+  }
+
  protected:
   void* ptr_;
   std::atomic_flag flag_ = ATOMIC_FLAG_INIT;
@@ -15,6 +15,9 @@ limitations under the License.
 
 #include "tensorflow/core/framework/hash_table/bloom_filter_strategy.h"
 
+#include "tensorflow/core/platform/mem.h"
+#include "tensorflow/core/platform/prefetch.h"
+
 namespace tensorflow {
 
 namespace {
@@ -84,20 +87,35 @@ BloomFilterAdmitStrategy::BloomFilterAdmitStrategy(int64 minimum_frequency,
                                                    DataType dtype,
                                                    const TensorShape& shape,
                                                    int64 slice_offset,
-                                                   int64 max_slice_size)
+                                                   int64 max_slice_size,
+                                                   bool blocked)
   : minimum_frequency_(minimum_frequency), 
     num_hash_func_(num_hash_func),
     dtype_(dtype),
     shape_(shape),
     slice_offset_(slice_offset),
     max_slice_size_(max_slice_size),
-    bucket_(nullptr) {
+    bucket_(nullptr),
+    blocked_(blocked),
+    decay_epoch_(-1) {
   segment_size_ = shape_.dim_size(1);
-  bucket_ = new int8[shape.num_elements() * DataTypeSize(dtype)] {};
+  const size_t bytes = shape.num_elements() * DataTypeSize(dtype);
+  bucket_ = static_cast<int8*>(port::AlignedMalloc(
+      std::max(bytes, static_cast<size_t>(1)), kBlockBytes));
+  std::memset(bucket_, 0, bytes);
+  counters_per_block_ = kBlockBytes / DataTypeSize(dtype);
+  num_blocks_ = 1;
+  if (blocked_) {
+    CHECK(segment_size_ % counters_per_block_ == 0)
+        << "segment size of blocked BloomFilter should be a multiple of "
+        << counters_per_block_;
+    num_blocks_ = segment_size_ / counters_per_block_;
+  }
   LOG(INFO) << "segment size: " << segment_size_
       << ", slice: " << shape_.dim_size(0)
       << ", slice_offset: " << slice_offset_
-      << ", max_slice_size: " << max_slice_size_;
+      << ", max_slice_size: " << max_slice_size_
+      << ", blocked: " << blocked_;
   GenerateSeeds();
   switch (dtype) {
     case DT_UINT8:
@@ -117,7 +135,7 @@ BloomFilterAdmitStrategy::BloomFilterAdmitStrategy(int64 minimum_frequency,
 
 BloomFilterAdmitStrategy::~BloomFilterAdmitStrategy() {
   if (bucket_) {
-    delete[] bucket_;
+    port::AlignedFree(bucket_);
   }
 }
 
@@ -133,30 +151,136 @@ bool BloomFilterAdmitStrategy::AdmitInternal(int64 key, int64 counting) {
   //auto t = ScopedTimer("AdmitInternal");
   CHECK(seeds_.size() > 0) << "BloomFilter not initialized";
   CHECK(counting > 0) << "counting should be larger than zero";
+  std::vector<int64> positions(num_hash_func_);
+  Probe(key, positions.data());
+  mutex_lock lock(mu_);
+  return UpdateLocked(positions.data(), counting);
+}
+
+void BloomFilterAdmitStrategy::AdmitBatch(const int64* keys,
+                                          const int64* freqs, int64 size,
+                                          bool* admitted) {
+  CHECK(seeds_.size() > 0) << "BloomFilter not initialized";
+  std::vector<int64> positions(size * num_hash_func_);
+  const int64 type_size = DataTypeSize(dtype_);
+  for (int64 i = 0; i < size; ++i) {
+    int64* key_positions = positions.data() + i * num_hash_func_;
+    Probe(keys[i], key_positions);
+    // Only one cache line is fetched for a blocked BloomFilter.
+    const int64 num_prefetch = blocked_ ? 1 : num_hash_func_;
+    for (int64 j = 0; j < num_prefetch; ++j) {
+      port::prefetch<port::PREFETCH_HINT_T0>(
+          bucket_ + key_positions[j] * type_size);
+    }
+  }
+  mutex_lock lock(mu_);
+  for (int64 i = 0; i < size; ++i) {
+    CHECK(freqs[i] > 0) << "counting should be larger than zero";
+    admitted[i] = UpdateLocked(positions.data() + i * num_hash_func_,
+                               freqs[i]);
+  }
+}
+
+void BloomFilterAdmitStrategy::Probe(int64 key, int64* positions) {
   int64 id = (uint64_t)key % max_slice_size_ - slice_offset_;
   CHECK(id >= 0) << "invalid key slice: key=" << key <<  ",max_slice_size="
       << max_slice_size_ << ",slice_offset=" << slice_offset_;
-  std::vector<uint64_t> hash_vals;
-  hash_vals.reserve(seeds_.size());
-  std::transform(seeds_.begin(), seeds_.end(), std::back_inserter(hash_vals),
-                 [this, key](int64 seed) {
-    return DefaultHashFunc(key, seed) % segment_size_;
-  });
-  mutex_lock lock(mu_);
+  CHECK(id < shape_.dim_size(0)) << "invalid key slice: key=" << key;
+  const int64 base = id * segment_size_;
+  if (!blocked_) {
+    for (int64 i = 0; i < num_hash_func_; ++i) {
+      positions[i] = base + DefaultHashFunc(key, seeds_[i]) % segment_size_;
+    }
+    return;
+  }
+  // Double hashing within the block selected by the first hash.
+  const uint64_t block = DefaultHashFunc(key, seeds_[0]) % num_blocks_;
+  const uint64_t h = DefaultHashFunc(key, seeds_.back() + 1);
+  const uint64_t h1 = h & 0xFFFFFFFFULL;
+  const uint64_t h2 = (h >> 32) | 1;
+  const int64 block_base = base + block * counters_per_block_;
+  for (int64 i = 0; i < num_hash_func_; ++i) {
+    positions[i] = block_base + (h1 + i * h2) % counters_per_block_;
+  }
+}
+
+bool BloomFilterAdmitStrategy::UpdateLocked(const int64* positions,
+                                            int64 counting) {
+  switch (dtype_) {
+    case DT_UINT8:
+      return UpdateLocked<uint8>(positions, counting);
+    case DT_UINT16:
+      return UpdateLocked<uint16>(positions, counting);
+    case DT_UINT32:
+      return UpdateLocked<uint32>(positions, counting);
+    default:
+      LOG(FATAL) << "Not support data type " << dtype_;
+      return false;
+  }
+}
+
+template <typename T>
+bool BloomFilterAdmitStrategy::UpdateLocked(const int64* positions,
+                                            int64 counting) {
+  T* counters = reinterpret_cast<T*>(bucket_);
   bool result = true;
-  for (auto& index : hash_vals) {
-    int64 k = id*segment_size_+index;
-    CHECK(k < shape_.num_elements()) << "invalid k=" << k;
-    int64 v= counting + Read(k);
-    int64 update =  std::min(max_freq_, v);
+  for (int64 i = 0; i < num_hash_func_; ++i) {
+    T* counter = counters + positions[i];
+    int64 update = std::min(max_freq_, counting + static_cast<int64>(*counter));
     if (update < minimum_frequency_) {
       result = false;
     }
-    Write(update, k);
+    *counter = static_cast<T>(update);
   }
   return result;
 }
 
+int64 BloomFilterAdmitStrategy::Decay(int64 epoch, thread::ThreadPool* pool) {
+  mutex_lock lock(mu_);
+  if (decay_epoch_ < 0 || epoch <= decay_epoch_) {
+    decay_epoch_ = std::max(decay_epoch_, epoch);
+    return 0;
+  }
+  const int64 shift = epoch - decay_epoch_;
+  decay_epoch_ = epoch;
+  switch (dtype_) {
+    case DT_UINT8:
+      DecayLocked<uint8>(shift, pool);
+      break;
+    case DT_UINT16:
+      DecayLocked<uint16>(shift, pool);
+      break;
+    case DT_UINT32:
+      DecayLocked<uint32>(shift, pool);
+      break;
+    default:
+      LOG(FATAL) << "Not support data type " << dtype_;
+  }
+  return shift;
+}
+
+template <typename T>
+void BloomFilterAdmitStrategy::DecayLocked(int64 shift,
+                                           thread::ThreadPool* pool) {
+  T* counters = reinterpret_cast<T*>(bucket_);
+  const int64 bits = sizeof(T) * 8;
+  auto halve = [counters, shift, bits] (int64 begin, int64 end) {
+    for (int64 i = begin; i < end; ++i) {
+      counters[i] = shift >= bits ? 0 : counters[i] >> shift;
+    }
+  };
+  // Every slice is a unit of work.
+  auto halve_slices = [this, &halve] (int64 begin, int64 end) {
+    halve(begin * segment_size_, end * segment_size_);
+  };
+  const int64 num_slices = shape_.dim_size(0);
+  if (pool != nullptr) {
+    pool->ParallelFor(num_slices, segment_size_ * sizeof(T), halve_slices);
+  } else {
+    halve_slices(0, num_slices);
+  }
+}
+
 void BloomFilterAdmitStrategy::GenerateSeeds() {
   seeds_.clear();
   seeds_.reserve(num_hash_func_);
@@ -17,9 +17,12 @@ limitations under the License.
 #define TENSORFLOW_FRAMEWORK_HASH_TABLE_BLOOM_FILTER_STRATEGY_H_
 
 #include "tensorflow/core/framework/hash_table/hash_table.h"
+#include "tensorflow/core/lib/core/threadpool.h"
 
 namespace tensorflow {
 
+// A counting Bloom filter. If `blocked`, all counters of a key are in one
+// block of a cache line, so that a probe touches only one cache line.
 class BloomFilterAdmitStrategy : public HashTableAdmitStrategy {
  public:
   BloomFilterAdmitStrategy(int64 minimum_frequency,
@@ -27,51 +30,37 @@ class BloomFilterAdmitStrategy : public HashTableAdmitStrategy {
                            DataType dtype,
                            const TensorShape& shape,
                            int64 slice_offset = 0,
-                           int64 max_slice_size = 1);
+                           int64 max_slice_size = 1,
+                           bool blocked = false);
   virtual ~BloomFilterAdmitStrategy();
   bool Admit(int64 key) override;
   bool Admit(int64 key, int64 freq) override;
+  // Hashes all keys and prefetches their counters before updating them
+  // under one lock.
+  void AdmitBatch(const int64* keys, const int64* freqs, int64 size,
+                  bool* admitted) override;
+  // Halves the counters once for every epoch passed since the last decay,
+  // sweeping the slices in parallel on `pool` if it is set. The first call
+  // only records `epoch`. Returns the number of halvings.
+  int64 Decay(int64 epoch, thread::ThreadPool* pool = nullptr);
+  bool blocked() const { return blocked_; }
   std::vector<int8> Snapshot();
   void Restore(int64 src_beg, int64 src_length, int64 dst_beg,
                int64 dst_length, const std::vector<int8>& src);
+
+  static constexpr int64 kBlockBytes = 64;
+
  private:
   void GenerateSeeds();
   bool AdmitInternal(int64 key, int64 counting);
+  // Computes the indices of the `num_hash_func_` counters of a key.
+  void Probe(int64 key, int64* positions);
+  bool UpdateLocked(const int64* positions, int64 counting);
+  template <typename T>
+  bool UpdateLocked(const int64* positions, int64 counting);
+  template <typename T>
+  void DecayLocked(int64 shift, thread::ThreadPool* pool);
   uint64_t DefaultHashFunc(int64 key, int64 seed);
-  int64 Read(int64 k) {
-    int64 val = 0;
-    switch (dtype_) {
-      case DT_UINT8:
-        val = *(reinterpret_cast<uint8*>(bucket_) + k);
-        break;
-      case DT_UINT16:
-        val = *(reinterpret_cast<uint16*>(bucket_) + k);
-        break;
-      case DT_UINT32:
-        val = *(reinterpret_cast<uint32*>(bucket_) + k);
-        break;
-      default:
-        LOG(FATAL) << "Not support data type " << dtype_;
-        break;
-    }
-    return val;
-  }
-  void Write(int64 val, int64 k)  {
-    switch (dtype_) {
-      case DT_UINT8:
-        *(reinterpret_cast<uint8*>(bucket_) + k) = static_cast<uint8>(val);
-        break;
-      case DT_UINT16:
-        *(reinterpret_cast<uint16*>(bucket_) + k) = static_cast<uint16>(val);
-        break;
-      case DT_UINT32:
-        *(reinterpret_cast<uint32*>(bucket_) + k) = static_cast<uint32>(val);
-        break;
-      default:
-        LOG(FATAL) << "Not support data type " << dtype_;
-        break;
-    }
-  }
   int64 minimum_frequency_;
   int64 num_hash_func_;
   DataType dtype_;
@@ -82,6 +71,10 @@ class BloomFilterAdmitStrategy : public HashTableAdmitStrategy {
   int64 segment_size_;
   std::vector<int64> seeds_;
   int64 max_freq_;
+  bool blocked_;
+  int64 counters_per_block_;
+  int64 num_blocks_;
+  int64 decay_epoch_;
   mutex mu_;
   constexpr static int64 kDefaultFrequency = 1;
 };
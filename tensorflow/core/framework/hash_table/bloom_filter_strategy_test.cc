@@ -56,4 +56,53 @@ TEST(BloomFilterAdmitStrategy, Simple) {
   }
 }
 
+TEST(BloomFilterAdmitStrategy, Blocked) {
+  std::vector<int64> keys = { 101, 202, -3003, -11111111, 99999999 };
+  for (auto& key : keys) {
+    BloomFilterAdmitStrategy bf(10, 3, DT_UINT16, {1, 1024}, 0, 1, true);
+    for (int64 k = 0; k < 9; ++k) {
+      EXPECT_FALSE(bf.Admit(key));
+    }
+    EXPECT_TRUE(bf.Admit(key));
+  }
+}
+
+TEST(BloomFilterAdmitStrategy, AdmitBatch) {
+  for (bool blocked : {false, true}) {
+    // a batch is admitted as if its keys are admitted in order
+    std::vector<int64> keys = { 7, 8, 7, 9, 7 };
+    std::vector<int64> freqs = { 1, 1, 1, 2, 1 };
+    BloomFilterAdmitStrategy bf(3, 4, DT_UINT8, {1, 1024}, 0, 1, blocked);
+    BloomFilterAdmitStrategy expected_bf(3, 4, DT_UINT8, {1, 1024}, 0, 1,
+                                         blocked);
+    bool admitted[5];
+    for (int64 k = 0; k < 2; ++k) {
+      bf.AdmitBatch(keys.data(), freqs.data(), keys.size(), admitted);
+      for (size_t i = 0; i < keys.size(); ++i) {
+        EXPECT_EQ(expected_bf.Admit(keys[i], freqs[i]), admitted[i]);
+      }
+    }
+    EXPECT_EQ(expected_bf.Snapshot(), bf.Snapshot());
+  }
+}
+
+TEST(BloomFilterAdmitStrategy, Decay) {
+  int64 key = 12345;
+  BloomFilterAdmitStrategy bf(4, 3, DT_UINT8, {2, 1024}, 0, 2);
+  // the first decay only records the epoch
+  EXPECT_EQ(0, bf.Decay(5));
+  EXPECT_FALSE(bf.Admit(key, 3));
+  EXPECT_EQ(0, bf.Decay(5));
+  EXPECT_EQ(1, bf.Decay(6));
+  // 3 is halved to 1
+  EXPECT_FALSE(bf.Admit(key, 2));
+  EXPECT_TRUE(bf.Admit(key, 1));
+  // stale epochs are ignored
+  EXPECT_EQ(0, bf.Decay(4));
+  thread::ThreadPool pool(Env::Default(), "decay", 2);
+  EXPECT_EQ(10, bf.Decay(16, &pool));
+  std::vector<int8> zeros(2 * 1024, 0);
+  EXPECT_EQ(zeros, bf.Snapshot());
+}
+
 }  //namespace tensorflow
@@ -73,9 +73,8 @@ void HashTable::IdsAllocator::GetIds(int64 count, IdsContainer* ids) {
   if (count <= 0) return;
   if (free_list_.empty()) {
     ids->region_list_.emplace_back();
-    ids->region_list_.back().start = counter_;
-    counter_ += count;
-    ids->region_list_.back().end = counter_;
+    ids->region_list_.back().start = counter_->fetch_add(count);
+    ids->region_list_.back().end = ids->region_list_.back().start + count;
     return;
   }
   int64 from_list = count <= free_list_.size() ? count : free_list_.size();
@@ -86,14 +85,13 @@ void HashTable::IdsAllocator::GetIds(int64 count, IdsContainer* ids) {
   int64 left = count - from_list;
   if (left <= 0) return;
   ids->region_list_.emplace_back();
-  ids->region_list_.back().start = counter_;
-  counter_ += left;
-  ids->region_list_.back().end = counter_;
+  ids->region_list_.back().start = counter_->fetch_add(left);
+  ids->region_list_.back().end = ids->region_list_.back().start + left;
 }
 
 void HashTable::IdsAllocator::GetId(int64* id) {
   if (free_list_.empty()) {
-    *id = counter_++;
+    *id = counter_->fetch_add(1);
     return;
   }
   *id = free_list_.front();
@@ -102,17 +100,25 @@ void HashTable::IdsAllocator::GetId(int64* id) {
 
 void HashTable::IdsAllocator::Clear() {
   free_list_.clear();
-  counter_ = 0;
 }
 
 HashTable::HashTable(int num_worker_threads, bool concurrent_read,
-    int slice_size, int id_block_size)
+    int slice_size, int id_block_size, bool sharded_ids)
   : slice_size_(slice_size), id_block_size_(id_block_size),
+    ids_allocator_(&id_counter_), sharded_ids_(sharded_ids),
     size_(slice_size), concurrent_read_(concurrent_read) {
   num_tables_ = num_worker_threads;
-  LOG(INFO) << "HashTable table splits: " << num_tables_;
+  LOG(INFO) << "HashTable table splits: " << num_tables_
+            << ", sharded ids: " << sharded_ids_;
   table_locks_.resize(num_tables_);
   ids_container_.resize(num_tables_);
+  if (sharded_ids_) {
+    ids_locks_.resize(num_tables_);
+    sharded_ids_allocators_.reserve(num_tables_);
+    for (int64 i = 0; i < num_tables_; ++i) {
+      sharded_ids_allocators_.emplace_back(&id_counter_);
+    }
+  }
   static char print_once = [] {
     LOG(INFO) << "HashTable preserved dense hash map key: " <<
         kPreseverdEmptyKey << " and " << kPreseverdEmptyKey + 1;
@@ -304,6 +310,7 @@ void HashTable::GetIdsSimpleForConcurrentRead(
   int64 new_id_size = 0;
   int64 sizex = 0;
   int64 cur_idx;
+  std::vector<int64> missing;
   {
     tf_shared_lock rlock(table_locks_[table_idx]);
     for (int64 i = 0; i < partition_threads; ++i) {
@@ -317,27 +324,39 @@ void HashTable::GetIdsSimpleForConcurrentRead(
           ids[cur_idx] = iter->second;
           sizex = std::max(sizex, ids[cur_idx]);
         } else {
-          // do admit
-          int32_t freq = (freqs == nullptr) ? 1 : freqs[cur_idx];
-          if (admit_strategy == nullptr ||
-              admit_strategy->Admit(keys[cur_idx], freq)) {
-            ids[cur_idx] = new_id_list;
-            new_id_list = cur_idx;
-            ++new_id_size;
-          } else {
-            ids[cur_idx] = kNotAdmitted;
-          }
+          missing.push_back(cur_idx);
         }
       }
     }
   }
+  // do admit, in a batch so that the admit strategy can hash all keys
+  // before touching its counters
+  std::unique_ptr<bool[]> admitted;
+  if (admit_strategy != nullptr && !missing.empty()) {
+    std::vector<int64> missing_keys(missing.size());
+    std::vector<int64> missing_freqs(missing.size());
+    for (size_t i = 0; i < missing.size(); ++i) {
+      missing_keys[i] = keys[missing[i]];
+      missing_freqs[i] = (freqs == nullptr) ? 1 : freqs[missing[i]];
+    }
+    admitted.reset(new bool[missing.size()]);
+    admit_strategy->AdmitBatch(missing_keys.data(), missing_freqs.data(),
+                               missing.size(), admitted.get());
+  }
+  for (size_t i = 0; i < missing.size(); ++i) {
+    cur_idx = missing[i];
+    if (admitted == nullptr || admitted[i]) {
+      ids[cur_idx] = new_id_list;
+      new_id_list = cur_idx;
+      ++new_id_size;
+    } else {
+      ids[cur_idx] = kNotAdmitted;
+    }
+  }
   // do alloc ids
   if (new_id_list != -1) {
     mutex_lock wlock(table_locks_[table_idx]);
-    {
-      mutex_lock lock(update_mu_);
-      ids_allocator_.GetIds(new_id_size, &ids_container_[table_idx]);
-    }
+    AllocIds(table_idx, new_id_size);
     while (new_id_list != -1) {
       cur_idx = new_id_list;
       new_id_list = ids[new_id_list];
@@ -388,8 +407,7 @@ void HashTable::GetIdsSimpleForExclusiveAccess(
         }
         // do alloc ids
         if (!ids_container_[table_idx].GetNext(&ids[cur_idx])) {
-          mutex_lock lock(update_mu_);
-          ids_allocator_.GetIds(kPreAllocIds, &ids_container_[table_idx]);
+          AllocIds(table_idx, kPreAllocIds);
           CHECK(ids_container_[table_idx].GetNext(&ids[cur_idx]));
         }
         tables_[table_idx][keys[cur_idx]] = ids[cur_idx];
@@ -431,6 +449,35 @@ void HashTable::Resize(int64 size, std::function<void(Status)> done) {
   });
 }
 
+void HashTable::AllocIds(int64 table_idx, int64 count) {
+  if (sharded_ids_) {
+    mutex_lock lock(ids_locks_[table_idx]);
+    sharded_ids_allocators_[table_idx].GetIds(
+        count, &ids_container_[table_idx]);
+  } else {
+    mutex_lock lock(update_mu_);
+    ids_allocator_.GetIds(count, &ids_container_[table_idx]);
+  }
+}
+
+void HashTable::AllocId(int64 table_idx, int64* id) {
+  if (sharded_ids_) {
+    mutex_lock lock(ids_locks_[table_idx]);
+    sharded_ids_allocators_[table_idx].GetId(id);
+  } else {
+    ids_allocator_.GetId(id);
+  }
+}
+
+void HashTable::FreeId(int64 table_idx, int64 id) {
+  if (sharded_ids_) {
+    mutex_lock lock(ids_locks_[table_idx]);
+    sharded_ids_allocators_[table_idx].FreeId(id);
+  } else {
+    ids_allocator_.FreeId(id);
+  }
+}
+
 void HashTable::AddTask(std::function<void()> task) {
   bool run;
   {
@@ -477,7 +524,7 @@ void HashTable::DeleteKeysSimple(
     for (int64 i = 0; i < size; ++i) {
       int64 table_idx =  KeyToTableIdx(keys + i);
       if (tables_[table_idx].erase(keys[i]) && ids[i] != kNotAdmitted) {
-        ids_allocator_.FreeId(ids[i]);
+        FreeId(table_idx, ids[i]);
       }
     }
   }
@@ -511,7 +558,12 @@ void HashTable::Clear(const std::function<void(Status)>& done) {
       ids_allocator_.Clear();
       for (int64 i = 0; i < num_tables_; ++i) {
         ids_container_[i].Clear();
+        if (sharded_ids_) {
+          mutex_lock ids_lock(ids_locks_[i]);
+          sharded_ids_allocators_[i].Clear();
+        }
       }
+      id_counter_ = 0;
       size_ = 0;
     }
     done(Status::OK());
@@ -549,6 +601,118 @@ void HashTable::Snapshot(std::vector<int64>* keys,
   }
 }
 
+void HashTable::Snapshot(int64 begin, int64 end,
+                         std::vector<int64>* keys,
+                         std::vector<int64>* ids) {
+  mutex_lock lock(update_mu_);
+  int64 size = size_;
+  for (int64 i = begin; i < end; ++i) {
+    auto& table = tables_[i % num_tables_];
+    for (auto iter = table.begin(); iter != table.end(); ++iter) {
+      if (iter->second < size) {
+        keys->push_back(iter->first);
+        ids->push_back(iter->second);
+      }
+    }
+  }
+}
+
+void HashTable::Scan(int64* cursor, int64 max_rows,
+                     int64 key_min, int64 key_max,
+                     std::vector<int64>* keys,
+                     std::vector<int64>* ids) {
+  if (cursor[0] == 0 && cursor[1] == 0 && cursor[2] == 0) {
+    // Probing the keys of the range is cheaper than walking the buckets.
+    uint64 num_buckets = 0;
+    for (int64 i = 0; i < num_tables_; ++i) {
+      tf_shared_lock table_lock(table_locks_[i]);
+      num_buckets += tables_[i].bucket_count();
+    }
+    if (key_min <= key_max &&
+        static_cast<uint64>(key_max) - static_cast<uint64>(key_min) <
+            num_buckets) {
+      cursor[2] = kScanKeys;
+    }
+  }
+  if (cursor[2] == kScanKeys) {
+    ScanKeys(cursor, max_rows, key_min, key_max, keys, ids);
+  } else {
+    ScanBuckets(cursor, max_rows, key_min, key_max, keys, ids);
+  }
+}
+
+void HashTable::ScanKeys(int64* cursor, int64 max_rows,
+                         int64 key_min, int64 key_max,
+                         std::vector<int64>* keys,
+                         std::vector<int64>* ids) {
+  int64 size = size_;
+  int64 offset = cursor[1];
+  while (keys->size() < max_rows) {
+    int64 key = key_min + offset;
+    int64 table_idx = KeyToTableIdx(&key);
+    {
+      tf_shared_lock table_lock(table_locks_[table_idx]);
+      mutex_lock lock(update_mu_);
+      auto iter = tables_[table_idx].find(key);
+      if (iter != tables_[table_idx].end() && iter->second != kNotAdmitted &&
+          iter->second < size) {
+        keys->push_back(key);
+        ids->push_back(iter->second);
+      }
+    }
+    if (key == key_max) {
+      cursor[0] = -1;
+      cursor[1] = 0;
+      cursor[2] = 0;
+      return;
+    }
+    ++offset;
+  }
+  cursor[1] = offset;
+}
+
+void HashTable::ScanBuckets(int64* cursor, int64 max_rows,
+                            int64 key_min, int64 key_max,
+                            std::vector<int64>* keys,
+                            std::vector<int64>* ids) {
+  int64 table_idx = cursor[0];
+  if (table_idx >= 0 && table_idx < num_tables_) {
+    int64 size = size_;
+    tf_shared_lock table_lock(table_locks_[table_idx]);
+    mutex_lock lock(update_mu_);
+    auto& table = tables_[table_idx];
+    int64 num_buckets = table.bucket_count();
+    int64 bucket = cursor[1];
+    if (cursor[2] != num_buckets) {
+      // Resized since the previous page, every key may have moved.
+      VLOG_IF(1, bucket > 0) << "Internal table " << table_idx
+                             << " resized during scan, rescanning it.";
+      bucket = 0;
+    }
+    // Buckets are in one array, the cursor is an index into it.
+    const auto* buckets = table.end().pos - num_buckets;
+    for (; bucket < num_buckets && keys->size() < max_rows; ++bucket) {
+      int64 key = buckets[bucket].first;
+      int64 id = buckets[bucket].second;
+      if (key != kPreseverdEmptyKey && key != kPreseverdEmptyKey + 1 &&
+          id != kNotAdmitted && id < size &&
+          key >= key_min && key <= key_max) {
+        keys->push_back(key);
+        ids->push_back(id);
+      }
+    }
+    if (bucket < num_buckets) {
+      cursor[1] = bucket;
+      cursor[2] = num_buckets;
+      return;
+    }
+  }
+  ++table_idx;
+  cursor[0] = (table_idx > 0 && table_idx < num_tables_) ? table_idx : -1;
+  cursor[1] = 0;
+  cursor[2] = 0;
+}
+
 int64 HashTable::GetIdsWithoutResize(int64* keys, int64* ids, int64 size) {
   mutex_lock lock(update_mu_);
   for (int64 i = 0; i < size; i++) {
@@ -558,7 +722,7 @@ int64 HashTable::GetIdsWithoutResize(int64* keys, int64* ids, int64 size) {
       ids[i] = iter->second;
     } else {
       int64 new_id;
-      ids_allocator_.GetId(&new_id);
+      AllocId(table_idx, &new_id);
       size_++;
       tables_[table_idx][keys[i]] = new_id;
       ids[i] = new_id;
@@ -664,7 +828,7 @@ void CoalescedHashTable::ClearMatchedKeys(
         ids.push_back(iter->second);
         iter = tables_[i].erase(iter);
         if (ids.back() != kNotAdmitted) {
-          ids_allocator_.FreeId(ids.back());
+          FreeId(i, ids.back());
         }
       } else {
         ++iter;
@@ -37,12 +37,23 @@ class HashTableAdmitStrategy {
   virtual ~HashTableAdmitStrategy() {}
   virtual bool Admit(int64 key) = 0;
   virtual bool Admit(int64 key, int64 freq) { return Admit(key); }
+  // Admits a batch of keys in order, `admitted[i]` is the result of keys[i].
+  virtual void AdmitBatch(const int64* keys, const int64* freqs, int64 size,
+                          bool* admitted) {
+    for (int64 i = 0; i < size; ++i) {
+      admitted[i] = Admit(keys[i], freqs[i]);
+    }
+  }
 };
 
 class HashTable {
  public:
+  // If `sharded_ids` is true, every internal table allocates and recycles
+  // ids under its own lock instead of the lock of the whole hash table, so
+  // that concurrent lookups on different internal tables never contend.
   explicit HashTable(int num_worker_threads, bool concurrent_read,
-      int slice_size = kSliceSize, int id_block_size = kIdBlockSize);
+      int slice_size = kSliceSize, int id_block_size = kIdBlockSize,
+      bool sharded_ids = false);
   virtual ~HashTable();
   void AddTensible(TensibleVariable* tensor, std::function<void(Status)> done);
   void GetIds(
@@ -58,15 +69,40 @@ class HashTable {
       const std::function<void(Status)>& done);
   std::vector<std::pair<int64, int64>> Snapshot();
   void Snapshot(std::vector<int64>* keys, std::vector<int64>* ids);
+  // Snapshots the keys in the internal tables [begin, end), wrapping around
+  // the number of tables, for scanning the table incrementally.
+  void Snapshot(int64 begin, int64 end,
+                std::vector<int64>* keys, std::vector<int64>* ids);
   int64 GetIdsWithoutResize(int64* keys, int64* ids, int64 size);
+  // Scans at most `max_rows` admitted keys in [key_min, key_max] from
+  // `cursor`, and advances it. The cursor has 3 elements, it starts from
+  // {0, 0, 0} and is {-1, 0, 0} when the scan is done.
+  //
+  // Ranges of fewer keys than the buckets of all internal tables are scanned
+  // by looking up each key, the cursor is then {0, offset of the next key,
+  // kScanKeys}. Otherwise the buckets of one internal table at a time are
+  // walked, the cursor is {internal table, next bucket, number of buckets}.
+  //
+  // Each page holds the lock of one internal table only. Keys present during
+  // the whole scan are scanned exactly once, unless their internal table is
+  // resized by inserts between two pages of it: the table is then scanned
+  // again from its first bucket, and its keys may be scanned twice. Keys
+  // inserted or deleted during the scan may be missed.
+  void Scan(int64* cursor, int64 max_rows, int64 key_min, int64 key_max,
+            std::vector<int64>* keys, std::vector<int64>* ids);
 
   int64 Size() { return size_; }
 
+  int64 NumTables() const { return num_tables_; }
+
   void Clear(const std::function<void(Status)>& done);
 
   const std::vector<TensibleVariable*>& Tensibles() { return tensors_; }
 
   static constexpr int kNotAdmitted = -1;
+  static constexpr int64 kScanKeys = -1;
+  static constexpr int kSliceSize = 64 << 10;
+  static constexpr int kIdBlockSize = 65536;
 
  protected:
   void PartitionKeys(
@@ -91,6 +127,20 @@ class HashTable {
       std::function<void(Status)> done);
   void Resize(int64 size, std::function<void(Status)> done);
 
+  void ScanKeys(int64* cursor, int64 max_rows, int64 key_min, int64 key_max,
+                std::vector<int64>* keys, std::vector<int64>* ids);
+  void ScanBuckets(int64* cursor, int64 max_rows,
+                   int64 key_min, int64 key_max,
+                   std::vector<int64>* keys, std::vector<int64>* ids);
+
+  // Reserves at least `count` ids for the internal table `table_idx`.
+  void AllocIds(int64 table_idx, int64 count);
+  // Allocates a single id for the internal table `table_idx`, requires
+  // update_mu_.
+  void AllocId(int64 table_idx, int64* id);
+  // Recycles an id of the internal table `table_idx`, requires update_mu_.
+  void FreeId(int64 table_idx, int64 id);
+
   void AddTask(std::function<void()> task);
   void RunNext();
   void ClearAllTask();
@@ -100,9 +150,6 @@ class HashTable {
     return (hasher(*key) >> 54) % num_tables_;
   }
 
-  static constexpr int kSliceSize = 64 << 10;
-  static constexpr int kIdBlockSize = 65536;
-
   int slice_size_;
   int id_block_size_;
 
@@ -134,8 +181,11 @@ class HashTable {
   };
   std::vector<IdsContainer> ids_container_;
 
+  // Allocates new ids from the free list first, then from the id counter
+  // shared by all allocators of the hash table.
   class IdsAllocator {
    public:
+    explicit IdsAllocator(std::atomic<int64>* counter) : counter_(counter) {}
     void GetIds(int64 count, IdsContainer* ids);
     inline void GetId(int64* id);
     inline void FreeId(int64 id) {
@@ -145,11 +195,18 @@ class HashTable {
 
    private:
     std::deque<int64> free_list_;
-    std::atomic<int64> counter_ = {0};
+    std::atomic<int64>* counter_;
   };
+  std::atomic<int64> id_counter_ = {0};
   mutex update_mu_;
   IdsAllocator ids_allocator_;
 
+  // Used instead of ids_allocator_ if sharded_ids_ is true, one allocator
+  // guarded by one lock for every internal table.
+  const bool sharded_ids_;
+  mutable std::vector<mutex> ids_locks_;
+  std::vector<IdsAllocator> sharded_ids_allocators_;
+
   mutex task_mu_;
   std::queue<std::function<void()>> tasks_;
   std::atomic<int64> size_;
@@ -162,8 +219,11 @@ class HashTable {
 class CoalescedHashTable : public HashTable {
  public:
   explicit CoalescedHashTable(int num_worker_threads, bool concurrent_read,
-                              const std::vector<string>& children)
-    : HashTable(num_worker_threads, concurrent_read), children_(children) {
+                              const std::vector<string>& children,
+                              bool sharded_ids = false)
+    : HashTable(num_worker_threads, concurrent_read, kSliceSize, kIdBlockSize,
+                sharded_ids),
+      children_(children) {
     for (size_t i = 0; i < children.size(); ++i) {
       index_map_[children[i]] = static_cast<int64>(i);
     }
@@ -189,10 +249,12 @@ class CoalescedHashTable : public HashTable {
 class HashTableResource : public ResourceBase {
  public:
   HashTableResource(int num_worker_threads, bool concurrent_read,
-                    const std::vector<string>& children) :
+                    const std::vector<string>& children,
+                    bool sharded_ids = false) :
       internal_(nullptr), initialized_(false),
       num_worker_threads_(num_worker_threads),
       concurrent_read_(concurrent_read),
+      sharded_ids_(sharded_ids),
       children_(children) { }
 
   ~HashTableResource() {
@@ -210,10 +272,12 @@ class HashTableResource : public ResourceBase {
       return errors::FailedPrecondition("HashTable has been initialized");
     }
     if (children_.empty()) {
-      internal_ = new HashTable(num_worker_threads_, concurrent_read_);
+      internal_ = new HashTable(num_worker_threads_, concurrent_read_,
+                                HashTable::kSliceSize, HashTable::kIdBlockSize,
+                                sharded_ids_);
     } else {
       internal_ = new CoalescedHashTable(num_worker_threads_, concurrent_read_,
-                                         children_);
+                                         children_, sharded_ids_);
     }
     return Status::OK();
   }
@@ -238,6 +302,7 @@ class HashTableResource : public ResourceBase {
   bool initialized_;
   int num_worker_threads_;
   bool concurrent_read_;
+  bool sharded_ids_;
   std::vector<string> children_;
 };
 
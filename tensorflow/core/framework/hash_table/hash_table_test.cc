@@ -13,12 +13,18 @@ See the License for the specific language governing permissions and
 limitations under the License.
 ==============================================================================*/
 
+#include <algorithm>
+#include <set>
 #include <utility>
+#include <vector>
 
 #include "tensorflow/core/framework/hash_table/hash_table.h"
 #include "tensorflow/core/framework/tensor_testutil.h"
+#include "tensorflow/core/lib/core/blocking_counter.h"
 #include "tensorflow/core/lib/core/status_test_util.h"
+#include "tensorflow/core/lib/core/threadpool.h"
 #include "tensorflow/core/platform/test.h"
+#include "tensorflow/core/platform/test_benchmark.h"
 
 #include "gmock/gmock.h"
 
@@ -96,6 +102,196 @@ TEST(HashTable, Simple) {
   }
 }
 
+TEST(HashTable, ShardedIds) {
+  Status rst_status;
+  auto consumer = [&](Status st) {
+    rst_status = st;
+  };
+  HashTable ht(4, true, 7, 3, true);
+  thread::ThreadPool pool(Env::Default(), "lookup", 4);
+  std::vector<std::vector<int64>> ids(4, std::vector<int64>(100));
+  {
+    BlockingCounter counter(4);
+    for (int t = 0; t < 4; ++t) {
+      pool.Schedule([&ht, &ids, &counter, t] {
+        std::vector<int64> keys(100);
+        for (int64 i = 0; i < 100; ++i) {
+          keys[i] = t * 100 + i;
+        }
+        ht.GetIds(keys.data(), nullptr, ids[t].data(), 100, nullptr, nullptr,
+                  [](Status st) { TF_CHECK_OK(st); });
+        counter.DecrementCount();
+      });
+    }
+    counter.Wait();
+  }
+  std::set<int64> unique_ids;
+  for (int t = 0; t < 4; ++t) {
+    unique_ids.insert(ids[t].begin(), ids[t].end());
+  }
+  EXPECT_EQ(400, unique_ids.size());
+  EXPECT_EQ(0, *unique_ids.begin());
+  EXPECT_EQ(399, *unique_ids.rbegin());
+
+  {
+    int64 keys[4] = {399, 0, 150, 399};
+    int64 result[4];
+    ht.GetIds(keys, nullptr, result, 4, nullptr, nullptr, consumer, false);
+    TF_ASSERT_OK(rst_status);
+    EXPECT_EQ(ids[3][99], result[0]);
+    EXPECT_EQ(ids[0][0], result[1]);
+    EXPECT_EQ(ids[1][50], result[2]);
+    EXPECT_EQ(ids[3][99], result[3]);
+  }
+
+  {
+    int64 keys[1] = {150};
+    int64 deleted[1] = {ids[1][50]};
+    ht.DeleteKeysSimple(keys, deleted, 1, consumer);
+    TF_ASSERT_OK(rst_status);
+    unique_ids.erase(deleted[0]);
+    int64 new_keys[2] = {150, 400};
+    int64 result[2];
+    ht.GetIds(new_keys, nullptr, result, 2, nullptr, nullptr, consumer, false);
+    TF_ASSERT_OK(rst_status);
+    EXPECT_NE(result[0], result[1]);
+    EXPECT_EQ(0, unique_ids.count(result[0]));
+    EXPECT_EQ(0, unique_ids.count(result[1]));
+  }
+}
+
+TEST(HashTable, Scan) {
+  Status rst_status;
+  auto consumer = [&](Status st) {
+    rst_status = st;
+  };
+  HashTable ht(4, true, 7, 3);
+  std::vector<int64> keys(100);
+  std::vector<int64> ids(100);
+  for (int64 i = 0; i < 100; ++i) {
+    keys[i] = i;
+  }
+  ht.GetIds(keys.data(), nullptr, ids.data(), 100, nullptr, nullptr,
+            consumer, false);
+  TF_ASSERT_OK(rst_status);
+
+  int64 cursor[3] = {0, 0, 0};
+  std::set<int64> scanned;
+  int64 pages = 0;
+  while (cursor[0] >= 0) {
+    std::vector<int64> page_keys;
+    std::vector<int64> page_ids;
+    ht.Scan(cursor, 16, 0, kint64max, &page_keys, &page_ids);
+    EXPECT_LE(page_keys.size(), 16);
+    ASSERT_EQ(page_keys.size(), page_ids.size());
+    for (size_t i = 0; i < page_keys.size(); ++i) {
+      EXPECT_EQ(ids[page_keys[i]], page_ids[i]);
+      scanned.insert(page_keys[i]);
+    }
+    ++pages;
+  }
+  EXPECT_EQ(100, scanned.size());
+  EXPECT_GE(pages, 7);
+  EXPECT_EQ(0, cursor[1]);
+
+  // A small range is scanned by looking up its keys.
+  cursor[0] = 0;
+  std::vector<int64> range_keys;
+  std::vector<int64> range_ids;
+  ht.Scan(cursor, 4, 10, 19, &range_keys, &range_ids);
+  EXPECT_EQ(HashTable::kScanKeys, cursor[2]);
+  EXPECT_EQ(4, cursor[1]);
+  ht.Scan(cursor, 100, 10, 19, &range_keys, &range_ids);
+  EXPECT_EQ(-1, cursor[0]);
+  std::sort(range_keys.begin(), range_keys.end());
+  ASSERT_EQ(10, range_keys.size());
+  for (int64 i = 0; i < 10; ++i) {
+    EXPECT_EQ(10 + i, range_keys[i]);
+  }
+}
+
+TEST(HashTable, ScanWhileResized) {
+  Status rst_status;
+  auto consumer = [&](Status st) {
+    rst_status = st;
+  };
+  HashTable ht(1, true, 7, 3);
+  std::vector<int64> keys(200);
+  std::vector<int64> ids(200);
+  for (int64 i = 0; i < 200; ++i) {
+    keys[i] = i;
+  }
+  ht.GetIds(keys.data(), nullptr, ids.data(), 100, nullptr, nullptr,
+            consumer, false);
+  TF_ASSERT_OK(rst_status);
+
+  int64 cursor[3] = {0, 0, 0};
+  std::set<int64> scanned;
+  std::vector<int64> page_keys;
+  std::vector<int64> page_ids;
+  ht.Scan(cursor, 10, 0, kint64max, &page_keys, &page_ids);
+  // Grows the only internal table between two pages.
+  ht.GetIds(keys.data() + 100, nullptr, ids.data() + 100, 100, nullptr,
+            nullptr, consumer, false);
+  TF_ASSERT_OK(rst_status);
+  scanned.insert(page_keys.begin(), page_keys.end());
+  while (cursor[0] >= 0) {
+    page_keys.clear();
+    page_ids.clear();
+    ht.Scan(cursor, 10, 0, kint64max, &page_keys, &page_ids);
+    scanned.insert(page_keys.begin(), page_keys.end());
+  }
+  for (int64 i = 0; i < 100; ++i) {
+    EXPECT_EQ(1, scanned.count(i));
+  }
+}
+
+namespace {
+
+constexpr int64 kBenchmarkBatchSize = 1024;
+
+// Every thread looks up batches of keys on the same hash table, half of the
+// keys are hot keys shared by all threads, the others are new to the table.
+void BM_HashTableGetIds(int iters, int num_threads, int sharded_ids) {
+  testing::StopTiming();
+  testing::UseRealTime();
+  HashTable ht(64, true, HashTable::kSliceSize, HashTable::kIdBlockSize,
+               sharded_ids != 0);
+  thread::ThreadPool pool(Env::Default(), "lookup", num_threads);
+  BlockingCounter counter(num_threads);
+  testing::StartTiming();
+  for (int t = 0; t < num_threads; ++t) {
+    pool.Schedule([&ht, &counter, t, iters, num_threads] {
+      std::vector<int64> keys(kBenchmarkBatchSize);
+      std::vector<int64> ids(kBenchmarkBatchSize);
+      for (int64 i = 0; i < iters; ++i) {
+        const int64 offset = (i * num_threads + t + 1) * kBenchmarkBatchSize;
+        for (int64 j = 0; j < kBenchmarkBatchSize; ++j) {
+          keys[j] = j % 2 == 0 ? j : offset + j;
+        }
+        ht.GetIds(keys.data(), nullptr, ids.data(), kBenchmarkBatchSize,
+                  nullptr, nullptr, [](Status st) { TF_CHECK_OK(st); });
+      }
+      counter.DecrementCount();
+    });
+  }
+  counter.Wait();
+  testing::StopTiming();
+  testing::ItemsProcessed(static_cast<int64>(iters) * num_threads *
+                          kBenchmarkBatchSize);
+}
+
+BENCHMARK(BM_HashTableGetIds)
+    ->ArgPair(1, 0)->ArgPair(1, 1)
+    ->ArgPair(2, 0)->ArgPair(2, 1)
+    ->ArgPair(4, 0)->ArgPair(4, 1)
+    ->ArgPair(8, 0)->ArgPair(8, 1)
+    ->ArgPair(16, 0)->ArgPair(16, 1)
+    ->ArgPair(32, 0)->ArgPair(32, 1)
+    ->ArgPair(64, 0)->ArgPair(64, 1);
+
+}  // namespace
+
 }  // namespace tensorflow
 
 
@@ -0,0 +1,294 @@
+/* Copyright 2022 The TensorFlow Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+==============================================================================*/
+#include "tensorflow/core/common_runtime/metrics.h"
+#include "tensorflow/core/framework/dataset.h"
+#include "tensorflow/core/framework/partial_tensor_shape.h"
+#include "tensorflow/core/framework/tensor.h"
+#include "tensorflow/core/kernels/data/name_utils.h"
+#include "tensorflow/core/lib/io/buffered_inputstream.h"
+#include "tensorflow/core/lib/io/random_inputstream.h"
+#include "tensorflow/core/lib/io/record_reader.h"
+
+namespace tensorflow {
+namespace data {
+namespace {
+
+// Datasets reading the records of an uncompressed file starting within the
+// byte range [start, end), so adjacent slices of a file never share or lose a
+// record. For TFRecord files `start` must be aligned to a record, text lines
+// are aligned by skipping the line across `start`. A negative `end` reads
+// until the end of the file.
+
+constexpr char kTextLineSliceDataset[] = "TextLineSlice";
+constexpr char kTFRecordSliceDataset[] = "TFRecordSlice";
+constexpr char kFileName[] = "filename";
+constexpr char kStart[] = "start";
+constexpr char kEnd[] = "end";
+constexpr char kBufferSize[] = "buffer_size";
+constexpr char kCurrentPos[] = "current_pos";
+constexpr char kReachedEnd[] = "reached_end";
+constexpr int64 kDefaultBufferSize = 256 * 1024;
+
+class FileSliceDatasetOp : public DatasetOpKernel {
+ public:
+  FileSliceDatasetOp(OpKernelConstruction* ctx, const char* dataset_type,
+                     bool tf_record)
+      : DatasetOpKernel(ctx),
+        dataset_type_(dataset_type),
+        tf_record_(tf_record) {}
+
+ protected:
+  void MakeDataset(OpKernelContext* ctx, DatasetBase** output) override {
+    tstring filename;
+    OP_REQUIRES_OK(ctx,
+                   ParseScalarArgument<tstring>(ctx, kFileName, &filename));
+    int64 start = 0;
+    OP_REQUIRES_OK(ctx, ParseScalarArgument<int64>(ctx, kStart, &start));
+    OP_REQUIRES(ctx, start >= 0,
+                errors::InvalidArgument("`start` must be >= 0 not ", start));
+    int64 end = -1;
+    OP_REQUIRES_OK(ctx, ParseScalarArgument<int64>(ctx, kEnd, &end));
+    int64 buffer_size = -1;
+    OP_REQUIRES_OK(ctx,
+                   ParseScalarArgument<int64>(ctx, kBufferSize, &buffer_size));
+    OP_REQUIRES(
+        ctx, buffer_size >= 0,
+        errors::InvalidArgument("`buffer_size` must be >= 0 (0 == default)"));
+    if (buffer_size == 0) {
+      buffer_size = kDefaultBufferSize;
+    }
+    *output = new Dataset(ctx, dataset_type_, tf_record_, filename, start, end,
+                          buffer_size);
+  }
+
+ private:
+  class Dataset;
+  const char* const dataset_type_;
+  const bool tf_record_;
+};
+
+class FileSliceDatasetOp::Dataset : public DatasetBase {
+ public:
+  Dataset(OpKernelContext* ctx, const char* dataset_type, bool tf_record,
+          const string& filename, int64 start, int64 end, int64 buffer_size)
+      : DatasetBase(DatasetContext(ctx)),
+        dataset_type_(dataset_type),
+        tf_record_(tf_record),
+        filename_(filename),
+        start_(start),
+        end_(end),
+        buffer_size_(buffer_size) {}
+
+  std::unique_ptr<IteratorBase> MakeIteratorInternal(
+      const string& prefix) const override {
+    return absl::make_unique<Iterator>(Iterator::Params{
+        this, name_utils::IteratorPrefix(dataset_type_, prefix)});
+  }
+
+  const DataTypeVector& output_dtypes() const override {
+    static DataTypeVector* dtypes = new DataTypeVector({DT_STRING});
+    return *dtypes;
+  }
+
+  const std::vector<PartialTensorShape>& output_shapes() const override {
+    static std::vector<PartialTensorShape>* shapes =
+        new std::vector<PartialTensorShape>({{}});
+    return *shapes;
+  }
+
+  string DebugString() const override {
+    return name_utils::DatasetDebugString(dataset_type_);
+  }
+
+  Status CheckExternalState() const override { return Status::OK(); }
+
+ protected:
+  Status AsGraphDefInternal(SerializationContext* ctx,
+                            DatasetGraphDefBuilder* b,
+                            Node** output) const override {
+    Node* filename = nullptr;
+    Node* start = nullptr;
+    Node* end = nullptr;
+    Node* buffer_size = nullptr;
+    TF_RETURN_IF_ERROR(b->AddScalar(filename_, &filename));
+    TF_RETURN_IF_ERROR(b->AddScalar(start_, &start));
+    TF_RETURN_IF_ERROR(b->AddScalar(end_, &end));
+    TF_RETURN_IF_ERROR(b->AddScalar(buffer_size_, &buffer_size));
+    TF_RETURN_IF_ERROR(
+        b->AddDataset(this, {filename, start, end, buffer_size}, output));
+    return Status::OK();
+  }
+
+ private:
+  class Iterator : public DatasetIterator<Dataset> {
+   public:
+    explicit Iterator(const Params& params)
+        : DatasetIterator<Dataset>(params) {}
+
+    Status GetNextInternal(IteratorContext* ctx,
+                           std::vector<Tensor>* out_tensors,
+                           bool* end_of_sequence) override {
+      mutex_lock l(mu_);
+      if (!reached_end_ && !file_) {
+        TF_RETURN_IF_ERROR(SetupStreamsLocked(ctx->env(), dataset()->start_,
+                                              /*align=*/true));
+      }
+      if (!reached_end_) {
+        string record;
+        Status s;
+        if (dataset()->end_ >= 0 && TellLocked() >= dataset()->end_) {
+          s = errors::OutOfRange("end of slice");
+        } else if (dataset()->tf_record_) {
+          s = record_reader_->ReadRecord(&record);
+        } else {
+          s = buffered_input_stream_->ReadLine(&record);
+        }
+        if (s.ok()) {
+          metrics::RecordTFDataBytesRead(
+              name_utils::OpName(dataset()->dataset_type_), record.size());
+          out_tensors->emplace_back(ctx->allocator({}), DT_STRING,
+                                    TensorShape({}));
+          out_tensors->back().scalar<tstring>()() = std::move(record);
+          *end_of_sequence = false;
+          return Status::OK();
+        }
+        if (!errors::IsOutOfRange(s)) {
+          return s;
+        }
+        ResetStreamsLocked();
+        reached_end_ = true;
+      }
+      *end_of_sequence = true;
+      return Status::OK();
+    }
+
+   protected:
+    std::shared_ptr<model::Node> CreateNode(
+        IteratorContext* ctx, model::Node::Args args) const override {
+      return model::MakeSourceNode(std::move(args));
+    }
+
+    Status SaveInternal(IteratorStateWriter* writer) override {
+      mutex_lock l(mu_);
+      if (reached_end_) {
+        TF_RETURN_IF_ERROR(writer->WriteScalar(full_name(kReachedEnd), ""));
+      }
+      if (file_) {
+        TF_RETURN_IF_ERROR(
+            writer->WriteScalar(full_name(kCurrentPos), TellLocked()));
+      }
+      return Status::OK();
+    }
+
+    Status RestoreInternal(IteratorContext* ctx,
+                           IteratorStateReader* reader) override {
+      mutex_lock l(mu_);
+      ResetStreamsLocked();
+      reached_end_ = reader->Contains(full_name(kReachedEnd));
+      if (reader->Contains(full_name(kCurrentPos))) {
+        int64 current_pos;
+        TF_RETURN_IF_ERROR(
+            reader->ReadScalar(full_name(kCurrentPos), &current_pos));
+        TF_RETURN_IF_ERROR(SetupStreamsLocked(ctx->env(), current_pos,
+                                              /*align=*/false));
+      }
+      return Status::OK();
+    }
+
+   private:
+    // Opens the file and positions the reader at byte `pos`, or at the first
+    // line starting at or after `pos` if `align` is true.
+    Status SetupStreamsLocked(Env* env, int64 pos, bool align)
+        EXCLUSIVE_LOCKS_REQUIRED(mu_) {
+      TF_RETURN_IF_ERROR(env->NewRandomAccessFile(dataset()->filename_, &file_));
+      if (dataset()->tf_record_) {
+        io::RecordReaderOptions options;
+        options.buffer_size = dataset()->buffer_size_;
+        record_reader_ =
+            absl::make_unique<io::SequentialRecordReader>(file_.get(), options);
+        return record_reader_->SeekOffset(pos);
+      }
+      input_stream_ =
+          absl::make_unique<io::RandomAccessInputStream>(file_.get(), false);
+      buffered_input_stream_ = absl::make_unique<io::BufferedInputStream>(
+          input_stream_.get(), dataset()->buffer_size_, false);
+      if (!align || pos == 0) {
+        Status s = buffered_input_stream_->Seek(pos);
+        // A slice starting at the end of the file is simply empty.
+        return errors::IsOutOfRange(s) ? Status::OK() : s;
+      }
+      // The line across `pos` belongs to the previous slice, it ends at the
+      // first newline from `pos - 1` on.
+      Status s = buffered_input_stream_->Seek(pos - 1);
+      if (s.ok()) {
+        string skipped;
+        s = buffered_input_stream_->ReadLine(&skipped);
+      }
+      return errors::IsOutOfRange(s) ? Status::OK() : s;
+    }
+
+    int64 TellLocked() EXCLUSIVE_LOCKS_REQUIRED(mu_) {
+      if (record_reader_) {
+        return record_reader_->TellOffset();
+      }
+      return buffered_input_stream_->Tell();
+    }
+
+    // Resets all reader streams.
+    void ResetStreamsLocked() EXCLUSIVE_LOCKS_REQUIRED(mu_) {
+      record_reader_.reset();
+      buffered_input_stream_.reset();
+      input_stream_.reset();
+      file_.reset();
+    }
+
+    mutex mu_;
+    std::unique_ptr<io::SequentialRecordReader> record_reader_ GUARDED_BY(mu_);
+    std::unique_ptr<io::RandomAccessInputStream> input_stream_ GUARDED_BY(mu_);
+    std::unique_ptr<io::BufferedInputStream> buffered_input_stream_
+        GUARDED_BY(mu_);
+    bool reached_end_ GUARDED_BY(mu_) = false;
+    std::unique_ptr<RandomAccessFile> file_
+        GUARDED_BY(mu_);  // must outlive the streams
+  };
+
+  const char* const dataset_type_;
+  const bool tf_record_;
+  const tstring filename_;
+  const int64 start_;
+  const int64 end_;
+  const int64 buffer_size_;
+};
+
+class TextLineSliceDatasetOp : public FileSliceDatasetOp {
+ public:
+  explicit TextLineSliceDatasetOp(OpKernelConstruction* ctx)
+      : FileSliceDatasetOp(ctx, kTextLineSliceDataset, false) {}
+};
+
+class TFRecordSliceDatasetOp : public FileSliceDatasetOp {
+ public:
+  explicit TFRecordSliceDatasetOp(OpKernelConstruction* ctx)
+      : FileSliceDatasetOp(ctx, kTFRecordSliceDataset, true) {}
+};
+
+REGISTER_KERNEL_BUILDER(Name("TextLineSliceDataset").Device(DEVICE_CPU),
+                        TextLineSliceDatasetOp);
+REGISTER_KERNEL_BUILDER(Name("TFRecordSliceDataset").Device(DEVICE_CPU),
+                        TFRecordSliceDatasetOp);
+
+}  // namespace
+}  // namespace data
+}  // namespace tensorflow
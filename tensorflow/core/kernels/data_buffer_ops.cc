@@ -230,4 +230,71 @@ REGISTER_KERNEL_BUILDER(
     DataBufferSizeOp);
 #endif  // TENSORFLOW_USE_SYCL
 
+class DataBufferSetCapacityOp : public DataBufferOp {
+ public:
+  explicit DataBufferSetCapacityOp(OpKernelConstruction* ctx)
+      : DataBufferOp(ctx) {}
+
+  void ComputeWithDataBuffer(OpKernelContext* ctx, DataBuffer* buf) override {
+    const Tensor& capacity = ctx->input(0);
+    OP_REQUIRES(ctx, TensorShapeUtils::IsScalar(capacity.shape()),
+                errors::InvalidArgument("capacity must be a scalar"));
+    OP_REQUIRES_OK(ctx, buf->SetCapacity(capacity.scalar<int64>()()));
+  }
+};
+
+REGISTER_KERNEL_BUILDER(Name("DataBufferSetCapacity").Device(DEVICE_CPU),
+                        DataBufferSetCapacityOp);
+#if GOOGLE_CUDA
+REGISTER_KERNEL_BUILDER(
+    Name("DataBufferSetCapacity").HostMemory("capacity").Device(DEVICE_GPU),
+    DataBufferSetCapacityOp);
+#endif  // GOOGLE_CUDA
+#ifdef TENSORFLOW_USE_SYCL
+REGISTER_KERNEL_BUILDER(
+    Name("DataBufferSetCapacity").HostMemory("capacity").Device(DEVICE_SYCL),
+    DataBufferSetCapacityOp);
+#endif  // TENSORFLOW_USE_SYCL
+
+class DataBufferStatsOp : public DataBufferOp {
+ public:
+  explicit DataBufferStatsOp(OpKernelConstruction* ctx) : DataBufferOp(ctx) {}
+
+  void ComputeWithDataBuffer(OpKernelContext* ctx, DataBuffer* buf) override {
+    int64 stats[DataBuffer::kNumStats];
+    buf->GetStats(stats);
+    for (int i = 0; i < DataBuffer::kNumStats; ++i) {
+      Tensor* output = nullptr;
+      OP_REQUIRES_OK(ctx, ctx->allocate_output(i, TensorShape({}), &output));
+      output->scalar<int64>()() = stats[i];
+    }
+  }
+};
+
+#define REGISTER_DATA_BUFFER_STATS(device)                             \
+  REGISTER_KERNEL_BUILDER(Name("DataBufferStats")                      \
+                              .HostMemory("capacity")                  \
+                              .HostMemory("size")                      \
+                              .HostMemory("put_wait_micros")           \
+                              .HostMemory("take_wait_micros")          \
+                              .HostMemory("num_puts")                  \
+                              .HostMemory("num_takes")                 \
+                              .HostMemory("num_full_puts")             \
+                              .HostMemory("num_empty_takes")           \
+                              .HostMemory("bytes_put")                 \
+                              .HostMemory("size_micros")               \
+                              .HostMemory("elapsed_micros")            \
+                              .Device(device),                         \
+                          DataBufferStatsOp)
+
+REGISTER_KERNEL_BUILDER(Name("DataBufferStats").Device(DEVICE_CPU),
+                        DataBufferStatsOp);
+#if GOOGLE_CUDA
+REGISTER_DATA_BUFFER_STATS(DEVICE_GPU);
+#endif  // GOOGLE_CUDA
+#ifdef TENSORFLOW_USE_SYCL
+REGISTER_DATA_BUFFER_STATS(DEVICE_SYCL);
+#endif  // TENSORFLOW_USE_SYCL
+#undef REGISTER_DATA_BUFFER_STATS
+
 }  // namespace tensorflow
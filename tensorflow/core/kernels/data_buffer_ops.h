@@ -75,17 +75,41 @@ namespace tensorflow {
 
 class DataBuffer : public ResourceBase {
  public:
+  // Statistics of the buffer, see GetStats.
+  enum Stat {
+    kCapacity = 0,
+    kSize,
+    kPutWaitMicros,
+    kTakeWaitMicros,
+    kNumPuts,
+    kNumTakes,
+    kNumFullPuts,
+    kNumEmptyTakes,
+    kBytesPut,
+    kSizeMicros,
+    kElapsedMicros,
+    kNumStats
+  };
+
   explicit DataBuffer(int64 capacity)
-      : capacity_(capacity), is_cancelled_(false), is_closed_(false) {}
+      : capacity_(capacity), is_cancelled_(false), is_closed_(false),
+        created_micros_(Env::Default()->NowMicros()),
+        size_changed_micros_(created_micros_) {}
 
   ~DataBuffer() { Cancel(); }
 
   Status Put(const std::vector<Tensor>& record, int64 timeout_millis) {
     std::unique_lock<std::mutex> lock(mu_);
 
+    const bool is_full = buffer_.size() >= capacity_ && !is_cancelled_;
+    const uint64 wait_start = is_full ? Env::Default()->NowMicros() : 0;
     bool should_retry = !put_cv_.wait_for(
         lock, std::chrono::milliseconds(timeout_millis),
         [this]() { return buffer_.size() < capacity_ || is_cancelled_; });
+    if (is_full) {
+      put_wait_micros_ += Env::Default()->NowMicros() - wait_start;
+      ++num_full_puts_;
+    }
     if (should_retry) {
       lock.unlock();
       LOG(WARNING) << "Prefetching was ignored since timeout.";
@@ -97,6 +121,11 @@ class DataBuffer : public ResourceBase {
       return Status(errors::Cancelled("Session was closed."));
     }
 
+    for (const Tensor& t : record) {
+      bytes_put_ += t.TotalBytes();
+    }
+    ++num_puts_;
+    AccumulateSizeLocked(Env::Default()->NowMicros());
     buffer_.push_back(std::move(record));
 
     lock.unlock();
@@ -108,7 +137,13 @@ class DataBuffer : public ResourceBase {
   Status Take(std::vector<Tensor>* record) {
     std::unique_lock<std::mutex> lock(mu_);
 
+    const bool is_empty = buffer_.empty() && !is_cancelled_;
+    const uint64 wait_start = is_empty ? Env::Default()->NowMicros() : 0;
     take_cv_.wait(lock, [this]() { return !buffer_.empty() || is_cancelled_; });
+    if (is_empty) {
+      take_wait_micros_ += Env::Default()->NowMicros() - wait_start;
+      ++num_empty_takes_;
+    }
 
     if (TF_PREDICT_FALSE(is_closed_ && buffer_.empty())) {
       lock.unlock();
@@ -120,8 +155,10 @@ class DataBuffer : public ResourceBase {
       return Status(errors::Cancelled("Session was closed."));
     }
 
+    AccumulateSizeLocked(Env::Default()->NowMicros());
     *record = std::move(buffer_.front());
     buffer_.pop_front();
+    ++num_takes_;
 
     lock.unlock();
     put_cv_.notify_all();
@@ -158,6 +195,43 @@ class DataBuffer : public ResourceBase {
     return Status::OK();
   }
 
+  // Changes the capacity, records already in the buffer are kept even if
+  // there are more than the new capacity.
+  Status SetCapacity(int64 capacity) {
+    if (capacity < 1) {
+      return errors::InvalidArgument("capacity must be >= 1, not ", capacity);
+    }
+    std::unique_lock<std::mutex> lock(mu_);
+    capacity_ = capacity;
+
+    lock.unlock();
+    put_cv_.notify_all();
+    return Status::OK();
+  }
+
+  // Gets the capacity, the size and the cumulative statistics of the buffer
+  // since it was created, indexed by Stat: the microseconds producers waited
+  // for a full buffer, the microseconds consumers waited for an empty buffer,
+  // the numbers of records put and taken, the numbers of puts finding a full
+  // buffer and takes finding an empty buffer, the bytes of records put, the
+  // integral of the size over microseconds and the elapsed microseconds.
+  void GetStats(int64* stats) {
+    std::unique_lock<std::mutex> lock(mu_);
+    const uint64 now = Env::Default()->NowMicros();
+    AccumulateSizeLocked(now);
+    stats[kCapacity] = static_cast<int64>(capacity_);
+    stats[kSize] = static_cast<int64>(buffer_.size());
+    stats[kPutWaitMicros] = put_wait_micros_;
+    stats[kTakeWaitMicros] = take_wait_micros_;
+    stats[kNumPuts] = num_puts_;
+    stats[kNumTakes] = num_takes_;
+    stats[kNumFullPuts] = num_full_puts_;
+    stats[kNumEmptyTakes] = num_empty_takes_;
+    stats[kBytesPut] = bytes_put_;
+    stats[kSizeMicros] = size_micros_;
+    stats[kElapsedMicros] = now - created_micros_;
+  }
+
   string DebugString() TF_RESOURCE_DEBUG_STRING_CONST override {
     return strings::StrCat("DataBuffer(capacity=", capacity_, ")");
   }
@@ -189,6 +263,21 @@ class DataBuffer : public ResourceBase {
   std::condition_variable take_cv_;
   std::condition_variable put_cv_;
   std::shared_ptr<thread::ThreadPool> threads_;
+  int64 put_wait_micros_ = 0;
+  int64 take_wait_micros_ = 0;
+  int64 num_puts_ = 0;
+  int64 num_takes_ = 0;
+  int64 bytes_put_ = 0;
+  int64 num_full_puts_ = 0;
+  int64 num_empty_takes_ = 0;
+  int64 size_micros_ = 0;
+  const uint64 created_micros_;
+  uint64 size_changed_micros_;
+
+  void AccumulateSizeLocked(uint64 now) {
+    size_micros_ += buffer_.size() * (now - size_changed_micros_);
+    size_changed_micros_ = now;
+  }
 };
 }
 
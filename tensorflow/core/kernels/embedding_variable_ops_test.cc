@@ -29,6 +29,7 @@
 #include "tensorflow/core/util/tensor_slice_reader_cache.h"
 
 #include <sys/resource.h>
+#include "tensorflow/core/framework/embedding/hot_key_cache.h"
 #include "tensorflow/core/framework/embedding/kv_interface.h"
 #include "tensorflow/core/kernels/kv_variable_ops.h"
 #ifdef TENSORFLOW_USE_JEMALLOC
@@ -98,6 +99,14 @@ std::vector<string> AllTensorKeys(BundleReader* reader) {
   return ret;
 }
 
+Status ReadTensor(BundleReader* reader, const string& key, Tensor* val) {
+  DataType dtype;
+  TensorShape shape;
+  TF_RETURN_IF_ERROR(reader->LookupDtypeAndShape(key, &dtype, &shape));
+  *val = Tensor(dtype, shape);
+  return reader->Lookup(key, val);
+}
+
 TEST(TensorBundleTest, TestEVShrinkL2) {
   int64 value_size = 3;
   int64 insert_num = 5;
@@ -559,6 +568,140 @@ void multi_insertion(EmbeddingVar<int64, float>* variable, int64 value_size){
   }
 }
 
+TEST(EmbeddingVariableTest, TestEVExportParallel) {
+  int64 value_size = 32;
+  Tensor value(DT_FLOAT, TensorShape({value_size}));
+  test::FillValues<float>(&value, std::vector<float>(value_size, 9.0));
+
+  EmbeddingVar<int64, float>* variable
+    = new EmbeddingVar<int64, float>("EmbeddingVar",
+        new DenseHashMap<int64, float>(), EmbeddingConfig(0, 0, 1, 1, "", 5));
+  variable->Init(value);
+
+  // Several sorting shards and 8MB chunks of values.
+  int64 ev_size = 200000;
+  for (int64 i = 0; i < ev_size; i++) {
+    ValuePtr<float>* value_ptr = nullptr;
+    variable->LookupOrCreateKey(i, &value_ptr);
+    typename TTypes<float>::Flat vflat = variable->flat(value_ptr);
+    vflat(0) = i;
+  }
+
+  thread::ThreadPool pool(Env::Default(), "ev_save", 4);
+  std::vector<thread::ThreadPool*> pools = {nullptr, &pool};
+  std::vector<string> prefixes = {Prefix("serial"), Prefix("parallel")};
+  for (int i = 0; i < 2; i++) {
+    Tensor part_offset_tensor(DT_INT32, TensorShape({kSavedPartitionNum + 1}));
+    BundleWriter writer(Env::Default(), prefixes[i]);
+    TF_ASSERT_OK(DumpEmbeddingValues(variable, "var/part_0", &writer,
+                                     &part_offset_tensor, pools[i]));
+    TF_ASSERT_OK(writer.Finish());
+  }
+
+  BundleReader serial_reader(Env::Default(), prefixes[0]);
+  BundleReader parallel_reader(Env::Default(), prefixes[1]);
+  TF_ASSERT_OK(serial_reader.status());
+  TF_ASSERT_OK(parallel_reader.status());
+  for (const string& key : {"var/part_0-partition_offset", "var/part_0-keys",
+                            "var/part_0-values", "var/part_0-versions"}) {
+    Tensor serial_val;
+    Tensor parallel_val;
+    TF_ASSERT_OK(ReadTensor(&serial_reader, key, &serial_val));
+    TF_ASSERT_OK(ReadTensor(&parallel_reader, key, &parallel_val));
+    EXPECT_EQ(serial_val.shape(), parallel_val.shape());
+    EXPECT_EQ(serial_val.tensor_data(), parallel_val.tensor_data());
+  }
+
+  Tensor keys;
+  Tensor values;
+  TF_ASSERT_OK(ReadTensor(&parallel_reader, "var/part_0-keys", &keys));
+  TF_ASSERT_OK(ReadTensor(&parallel_reader, "var/part_0-values", &values));
+  ASSERT_EQ(ev_size, keys.NumElements());
+  auto keys_flat = keys.flat<int64>();
+  auto values_matrix = values.matrix<float>();
+  for (int64 i = 0; i < ev_size; i++) {
+    EXPECT_EQ((float)keys_flat(i), values_matrix(i, 0));
+    if (i > 0) {
+      EXPECT_LE(keys_flat(i - 1) % kSavedPartitionNum,
+                keys_flat(i) % kSavedPartitionNum);
+    }
+  }
+}
+
+TEST(EmbeddingVariableTest, TestEVRestoreRepartition) {
+  int64 value_size = 32;
+  Tensor value(DT_FLOAT, TensorShape({value_size}));
+  test::FillValues<float>(&value, std::vector<float>(value_size, 9.0));
+
+  // Two saved partitions restored into three.
+  int64 ev_size = 200000;
+  for (int64 p = 0; p < 2; p++) {
+    EmbeddingVar<int64, float>* variable
+      = new EmbeddingVar<int64, float>("EmbeddingVar",
+          new DenseHashMap<int64, float>(), EmbeddingConfig(0, 0, 1, 1, "", 5));
+    variable->Init(value);
+    for (int64 i = p; i < ev_size; i += 2) {
+      ValuePtr<float>* value_ptr = nullptr;
+      variable->LookupOrCreateKey(i, &value_ptr, i);
+      typename TTypes<float>::Flat vflat = variable->flat(value_ptr);
+      vflat(0) = i;
+    }
+    Tensor part_offset_tensor(DT_INT32, TensorShape({kSavedPartitionNum + 1}));
+    BundleWriter writer(Env::Default(), Prefix(strings::StrCat("repart", p)));
+    TF_ASSERT_OK(DumpEmbeddingValues(variable, "var/part_0", &writer,
+                                     &part_offset_tensor));
+    TF_ASSERT_OK(writer.Finish());
+    variable->Unref();
+  }
+
+  std::vector<EVSavedPart> parts(2);
+  std::vector<std::unique_ptr<BundleReader>> readers;
+  for (int64 p = 0; p < 2; p++) {
+    readers.emplace_back(new BundleReader(Env::Default(),
+                                          Prefix(strings::StrCat("repart", p))));
+    BundleReader* reader = readers.back().get();
+    TF_ASSERT_OK(reader->status());
+    EVSavedPart& part = parts[p];
+    part.value_len = value_size;
+    TF_ASSERT_OK(reader->GetTensorInfo("var/part_0-keys", &part.keys.size,
+                                       &part.keys.file, &part.keys.offset));
+    TF_ASSERT_OK(reader->GetTensorInfo("var/part_0-values", &part.values.size,
+                                       &part.values.file, &part.values.offset));
+    TF_ASSERT_OK(reader->GetTensorInfo("var/part_0-versions",
+        &part.versions.size, &part.versions.file, &part.versions.offset));
+    Tensor part_offset;
+    TF_ASSERT_OK(ReadTensor(reader, "var/part_0-partition_offset", &part_offset));
+    auto part_offset_flat = part_offset.flat<int32>();
+    part.part_offset.assign(part_offset_flat.data(),
+                            part_offset_flat.data() + part_offset_flat.size());
+  }
+
+  thread::ThreadPool pool(Env::Default(), "ev_restore", 4);
+  int64 total_size = 0;
+  int partition_num = 3;
+  for (int partition_id = 0; partition_id < partition_num; partition_id++) {
+    EmbeddingVar<int64, float>* variable
+      = new EmbeddingVar<int64, float>("EmbeddingVar",
+          new DenseHashMap<int64, float>(), EmbeddingConfig(0, 0, 1, 1, "", 5));
+    variable->Init(value);
+    TF_ASSERT_OK(EVRestoreSavedParts(variable, parts, partition_id,
+                                     partition_num, &pool));
+    std::vector<int64> keys;
+    std::vector<float*> values;
+    std::vector<int64> versions;
+    std::vector<int64> freqs;
+    variable->GetSnapshot(&keys, &values, &versions, &freqs);
+    for (int64 i = 0; i < keys.size(); i++) {
+      EXPECT_EQ(partition_id, keys[i] % kSavedPartitionNum % partition_num);
+      EXPECT_EQ((float)keys[i], values[i][0]);
+      EXPECT_EQ(keys[i], versions[i]);
+    }
+    total_size += variable->Size();
+    variable->Unref();
+  }
+  EXPECT_EQ(ev_size, total_size);
+}
+
 TEST(EmbeddingVariableTest, TestMultiInsertion) {
   int64 value_size = 128;
   Tensor value(DT_FLOAT, TensorShape({value_size}));
@@ -1250,5 +1393,91 @@ TEST(EmbeddingVariableTest, TestEVStorageType_DRAM) {
   LOG(INFO) << "size:" << variable->Size();
 }
 
+TEST(EmbeddingVariableTest, TestEpochManager) {
+  EpochManager epoch_manager;
+  bool released = false;
+  {
+    EpochGuard guard(&epoch_manager);
+    epoch_manager.Retire([&released] () { released = true; });
+    epoch_manager.Reclaim();
+    ASSERT_FALSE(released);
+  }
+  // Ops entered after the memory was retired don't delay its release.
+  EpochGuard guard(&epoch_manager);
+  epoch_manager.Reclaim();
+  ASSERT_TRUE(released);
+}
+
+TEST(EmbeddingVariableTest, TestEVStorageType_DRAM_SSD_HeldValuePtr) {
+  int64 value_size = 4;
+  Tensor value(DT_FLOAT, TensorShape({value_size}));
+  test::FillValues<float>(&value, std::vector<float>(value_size, 1.0));
+  float* fill_v = (float*)malloc(value_size * sizeof(float));
+  // Room for 3 keys in DRAM, all slots included.
+  int64 dram_bytes = 3 * value_size * sizeof(float) * 2;
+  EmbeddingVar<int64, float>* variable
+    = new EmbeddingVar<int64, float>("EmbeddingVar",
+        new DenseHashMap<int64, float>(),
+          EmbeddingConfig(/*emb_index = */0, /*primary_emb_index = */0,
+                          /*block_num = */1, /*slot_num = */1,
+                          /*name = */"", /*steps_to_live = */0,
+                          /*filter_freq = */0, /*max_freq = */999999,
+                          /*l2_weight_threshold = */-1.0, /*layout = */"normal",
+                          /*max_element_size = */0, /*false_positive_probability = */-1.0,
+                          /*counter_type = */DT_UINT64, /*storage_type = */embedding::DRAM_SSD,
+                          /*storage_path = */io::JoinPath(testing::TmpDir(), "tiered_ev"),
+                          /*default_value_dim = */1, /*storage_size = */{dram_bytes}));
+  TF_CHECK_OK(variable->Init(value, 1));
+
+  int64 hot_keys[] = {1, 2, 3};
+  for (int i = 0; i < 2; ++i) {
+    for (int64 k : hot_keys) {
+      variable->LookupOrCreate(k, fill_v, nullptr);
+    }
+    variable->UpdateCache(hot_keys, 3);
+  }
+  {
+    auto guard = variable->GuardValuePtrs();
+    ValuePtr<float>* value_ptr = nullptr;
+    TF_CHECK_OK(variable->LookupOrCreateKey(0, &value_ptr));
+    // Key 0 is the coldest and is demoted while the value ptr is held.
+    variable->UpdateCache(hot_keys, 3);
+    typename TTypes<float>::Flat vflat = variable->flat(value_ptr);
+    vflat += vflat.constant(1.0);
+  }
+  // Spills the value ptrs demoted above, now that no op holds them.
+  variable->UpdateCache(hot_keys, 1);
+  ASSERT_EQ(variable->Size(), 4);
+  variable->LookupOrCreate(0, fill_v, nullptr);
+  for (int64 i = 0; i < value_size; ++i) {
+    ASSERT_EQ(fill_v[i], 2.0);
+  }
+  free(fill_v);
+  variable->Unref();
+}
+
+TEST(EmbeddingVariableTest, TestHotKeyCacheKeepsHotIds) {
+  HotKeyCache<int64, float>* cache = new HotKeyCache<int64, float>(4, 1, 1);
+  std::vector<int32> hit_pos, miss_pos;
+  auto allocate_fn = [] (int64 num) -> float* { return nullptr; };
+  int64 hot_ids[] = {1, 2, 3, 4};
+  for (int i = 0; i < 8; ++i) {
+    cache->Lookup(hot_ids, 4, 0, &hit_pos, &miss_pos, allocate_fn);
+  }
+  // A stream of many distinct cold ids, far more than the candidates kept.
+  std::vector<int64> cold_ids(16);
+  for (int64 i = 0; i < 10000; ++i) {
+    for (int64 j = 0; j < 16; ++j) {
+      cold_ids[j] = 100 + i * 16 + j;
+    }
+    cache->Lookup(cold_ids.data(), 16, 0, &hit_pos, &miss_pos, allocate_fn);
+  }
+  std::vector<int64> keys;
+  cache->HotKeys(&keys);
+  std::sort(keys.begin(), keys.end());
+  ASSERT_EQ(keys, std::vector<int64>({1, 2, 3, 4}));
+  cache->Unref();
+}
+
 } // namespace
 } // namespace tensorflow
@@ -34,7 +34,8 @@ class FusedEmbeddingSparsePostLookUpGradOpTest : public OpsTestBase {
  protected:
   void MakeOpAndSetDevice(Device device, int num_partitions, DataType dtype,
                           const std::string& combiner, const float max_norm,
-                          const int default_id) {
+                          const int default_id,
+                          const bool use_weights = false) {
     if (device == Device::GPU) {
       SetDevice(DEVICE_GPU,
                 std::unique_ptr<tensorflow::Device>(DeviceFactory::NewDevice(
@@ -54,6 +55,8 @@ class FusedEmbeddingSparsePostLookUpGradOpTest : public OpsTestBase {
                      .Input(FakeInput(DT_INT64))
                      .Input(FakeInput(DT_INT32))
                      .Input(FakeInput(DT_INT32))
+                     .Input(FakeInput(DataTypeVector(
+                         use_weights ? num_partitions : 0, DT_FLOAT)))
                      .Finalize(node_def()));
     TF_EXPECT_OK(InitOp());
   }
@@ -239,5 +242,54 @@ TEST_F(FusedEmbeddingSparsePostLookUpGradOpTest,
   }
 }
 
+TEST_F(FusedEmbeddingSparsePostLookUpGradOpTest,
+       Partition2_Sqrtn_Weights_CPU) {
+  const int nnz = 3;
+  const int batch_size = 2;
+  const int emb_vector_dim = 2;
+
+  MakeOpAndSetDevice(Device::CPU, 2, DT_FLOAT, "sqrtn", -1.0, -1, true);
+
+  // top_grad
+  AddInputFromArray<float>(TensorShape({batch_size, emb_vector_dim}),
+                           {1.0, 2.0, 3.0, 4.0});
+
+  // emb_shards
+  AddInputFromArray<float>(TensorShape({2, emb_vector_dim}),
+                           {1.0, 1.0, 2.0, 2.0});
+  AddInputFromArray<float>(TensorShape({1, emb_vector_dim}), {4.0, 4.0});
+
+  // partitioned_indices
+  AddInputFromArray<int64>(TensorShape({2, 2}), {0, 0, 1, 0});
+  AddInputFromArray<int64>(TensorShape({1, 2}), {0, 1});
+
+  // feature_nums
+  AddInputFromArray<int>(TensorShape({batch_size}), {2, 1});
+
+  // row_empty_and_invalid_flags
+  AddInputFromArray<int>(TensorShape({batch_size + nnz}), {0, 0, 1, 1, 1});
+
+  // partitioned_weights
+  AddInputFromArray<float>(TensorShape({2}), {1.0, 3.0});
+  AddInputFromArray<float>(TensorShape({1}), {3.0});
+
+  TF_ASSERT_OK(RunOpKernel());
+
+  {
+    Tensor grad_shards_1(allocator(), DT_FLOAT,
+                         TensorShape({2, emb_vector_dim}));
+    test::FillValues<float>(&grad_shards_1,
+                            {0.31622777, 0.63245553, 3.0, 4.0});
+    test::ExpectTensorNear<float>(grad_shards_1, *GetOutput(0), 1e-4);
+  }
+
+  {
+    Tensor grad_shards_2(allocator(), DT_FLOAT,
+                         TensorShape({1, emb_vector_dim}));
+    test::FillValues<float>(&grad_shards_2, {0.9486833, 1.8973666});
+    test::ExpectTensorNear<float>(grad_shards_2, *GetOutput(1), 1e-4);
+  }
+}
+
 }  // namespace
-}  // namespace tensorflow
\ No newline at end of file
+}  // namespace tensorflow
@@ -0,0 +1,344 @@
+#include <cmath>
+#include <string>
+#include <vector>
+
+#include "tensorflow/core/framework/op_kernel.h"
+#include "tensorflow/core/framework/tensor.h"
+#include "tensorflow/core/util/work_sharder.h"
+
+namespace tensorflow {
+
+namespace {
+
+enum Combiner { Mean, Sum, Sqrtn };
+
+Combiner CombinerFromString(const std::string& combiner) {
+  if (combiner == "sqrtn") {
+    return Sqrtn;
+  } else if (combiner == "mean") {
+    return Mean;
+  }
+  return Sum;
+}
+
+// Factor applied to the sum of the embeddings of a row. Without weights,
+// weight_sum and weight_square_sum are both the feature number of the row.
+inline float CombineScale(const Combiner combiner, const float weight_sum,
+                          const float weight_square_sum) {
+  if (combiner == Mean) {
+    return weight_sum > 0.0f ? 1.0f / weight_sum : 0.0f;
+  } else if (combiner == Sqrtn) {
+    return weight_square_sum > 0.0f ? 1.0f / std::sqrt(weight_square_sum)
+                                    : 0.0f;
+  }
+  return 1.0f;
+}
+
+// Returns the factor to clip an embedding to max_norm, 1.0 if it isn't
+// clipped.
+inline float ClipScale(const float* emb, const int64 emb_vec_size,
+                       const float max_norm) {
+  if (max_norm < 0.0f) {
+    return 1.0f;
+  }
+  float l2_sum = 0.0f;
+  for (int64 d = 0; d < emb_vec_size; d++) {
+    l2_sum += emb[d] * emb[d];
+  }
+  const float l2_norm = std::sqrt(l2_sum);
+  return l2_norm > max_norm ? max_norm / l2_norm : 1.0f;
+}
+
+// Sums the weights and squared weights of every row, over all partitions.
+void SumUpWeights(const OpInputList& partitioned_indices,
+                  const OpInputList& partitioned_weights,
+                  const int64 batch_size, std::vector<float>* weight_sums,
+                  std::vector<float>* weight_square_sums) {
+  weight_sums->assign(batch_size, 0.0f);
+  weight_square_sums->assign(batch_size, 0.0f);
+  for (int i = 0; i < partitioned_indices.size(); i++) {
+    const int64* indices = partitioned_indices[i].flat<int64>().data();
+    const float* weights = partitioned_weights[i].flat<float>().data();
+    const int64 sub_nnz = partitioned_indices[i].dim_size(0);
+    for (int64 j = 0; j < sub_nnz; j++) {
+      (*weight_sums)[indices[2 * j]] += weights[j];
+      (*weight_square_sums)[indices[2 * j]] += weights[j] * weights[j];
+    }
+  }
+}
+
+}  // namespace
+
+class FusedEmbeddingSparsePostLookUpCPU : public OpKernel {
+ public:
+  explicit FusedEmbeddingSparsePostLookUpCPU(OpKernelConstruction* ctx)
+      : OpKernel(ctx) {
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("num_partitions", &num_partitions_));
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("partition_axis", &partition_axis_));
+    std::string combiner;
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("combiner", &combiner));
+    combiner_ = CombinerFromString(combiner);
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("max_norm", &max_norm_));
+    int temp_default_id;
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("default_id", &temp_default_id));
+    default_id_ = int64(temp_default_id);
+  }
+
+  void Compute(OpKernelContext* ctx) override {
+    OpInputList emb_shards;
+    OP_REQUIRES_OK(ctx, ctx->input_list("emb_shards", &emb_shards));
+
+    OpInputList partitioned_indices;
+    OP_REQUIRES_OK(
+        ctx, ctx->input_list("partitioned_indices", &partitioned_indices));
+
+    OpInputList partitioned_weights;
+    OP_REQUIRES_OK(
+        ctx, ctx->input_list("partitioned_weights", &partitioned_weights));
+    const bool use_weights = partitioned_weights.size() > 0;
+    OP_REQUIRES(ctx, !use_weights || partitioned_weights.size() == num_partitions_,
+                errors::InvalidArgument(
+                    "partitioned_weights should be empty or have ",
+                    num_partitions_, " tensors"));
+
+    Tensor const* dense_shape_tensor = nullptr;
+    OP_REQUIRES_OK(ctx, ctx->input("sp_dense_shape", &dense_shape_tensor));
+
+    Tensor const* row_empty_and_invalid_flags = nullptr;
+    OP_REQUIRES_OK(ctx, ctx->input("row_empty_and_invalid_flags",
+                                   &row_empty_and_invalid_flags));
+    const int* row_emptiness_flag =
+        row_empty_and_invalid_flags->flat<int>().data();
+
+    const int64 emb_vec_size = emb_shards[0].shape().dim_size(1);
+    const int64 batch_size = dense_shape_tensor->flat<int64>().data()[0];
+
+    for (int i = 0; i < num_partitions_; i++) {
+      OP_REQUIRES(
+          ctx,
+          emb_shards[i].dim_size(0) == partitioned_indices[i].dim_size(0),
+          errors::InvalidArgument(
+              "emb_shard and partitioned_indice dosn't have the same length"));
+      OP_REQUIRES(
+          ctx,
+          !use_weights || partitioned_weights[i].NumElements() ==
+                              partitioned_indices[i].dim_size(0),
+          errors::InvalidArgument("partitioned_weight and partitioned_indice "
+                                  "dosn't have the same length"));
+    }
+
+    Tensor* emb_vectors_tensor = nullptr;
+    OP_REQUIRES_OK(
+        ctx, ctx->allocate_output(0, TensorShape({batch_size, emb_vec_size}),
+                                  &emb_vectors_tensor));
+    float* emb_vectors = emb_vectors_tensor->flat<float>().data();
+    Tensor* feature_nums_tensor = nullptr;
+    OP_REQUIRES_OK(ctx, ctx->allocate_output(1, TensorShape({batch_size}),
+                                             &feature_nums_tensor));
+    int* feature_nums = feature_nums_tensor->flat<int>().data();
+
+    // 1. group the entries of all partitions by row, so that every row can
+    // be summed up by one thread without atomics.
+    std::vector<int64> row_offsets(batch_size + 1, 0);
+    for (int i = 0; i < num_partitions_; i++) {
+      const int64* indices = partitioned_indices[i].flat<int64>().data();
+      const int64 sub_nnz = partitioned_indices[i].dim_size(0);
+      for (int64 j = 0; j < sub_nnz; j++) {
+        const int64 row_in_batch = indices[2 * j];
+        OP_REQUIRES(ctx, row_in_batch >= 0 && row_in_batch < batch_size,
+                    errors::InvalidArgument(
+                        "row ", row_in_batch,
+                        " of partitioned_indices is out of range [0, ",
+                        batch_size, ")"));
+        row_offsets[row_in_batch + 1]++;
+      }
+    }
+    for (int64 row = 0; row < batch_size; row++) {
+      feature_nums[row] = row_offsets[row + 1];
+      row_offsets[row + 1] += row_offsets[row];
+    }
+    std::vector<std::pair<int, int64>> row_entries(row_offsets[batch_size]);
+    {
+      std::vector<int64> cursors(row_offsets.begin(), row_offsets.end() - 1);
+      for (int i = 0; i < num_partitions_; i++) {
+        const int64* indices = partitioned_indices[i].flat<int64>().data();
+        const int64 sub_nnz = partitioned_indices[i].dim_size(0);
+        for (int64 j = 0; j < sub_nnz; j++) {
+          row_entries[cursors[indices[2 * j]]++] = std::make_pair(i, j);
+        }
+      }
+    }
+
+    // 2. sum up emb values of every row and apply the combiner
+    const bool set_empty_row_zero = default_id_ >= 0;
+    auto combine = [&](int64 start, int64 limit) {
+      for (int64 row = start; row < limit; row++) {
+        float* emb_vector = emb_vectors + row * emb_vec_size;
+        std::fill(emb_vector, emb_vector + emb_vec_size, 0.0f);
+        if (set_empty_row_zero && row_emptiness_flag[row]) {
+          continue;
+        }
+        float weight_sum = 0.0f;
+        float weight_square_sum = 0.0f;
+        for (int64 k = row_offsets[row]; k < row_offsets[row + 1]; k++) {
+          const int i = row_entries[k].first;
+          const int64 j = row_entries[k].second;
+          const float* emb =
+              emb_shards[i].flat<float>().data() + j * emb_vec_size;
+          float scale = ClipScale(emb, emb_vec_size, max_norm_);
+          if (use_weights) {
+            const float weight = partitioned_weights[i].flat<float>()(j);
+            weight_sum += weight;
+            weight_square_sum += weight * weight;
+            scale *= weight;
+          }
+          for (int64 d = 0; d < emb_vec_size; d++) {
+            emb_vector[d] += emb[d] * scale;
+          }
+        }
+        if (!use_weights) {
+          weight_sum = weight_square_sum = feature_nums[row];
+        }
+        const float combine_scale =
+            CombineScale(combiner_, weight_sum, weight_square_sum);
+        for (int64 d = 0; d < emb_vec_size; d++) {
+          emb_vector[d] *= combine_scale;
+        }
+      }
+    };
+    auto worker_threads = ctx->device()->tensorflow_cpu_worker_threads();
+    const int64 avg_entries =
+        batch_size > 0 ? row_offsets[batch_size] / batch_size + 1 : 1;
+    Shard(worker_threads->num_threads, worker_threads->workers, batch_size,
+          avg_entries * emb_vec_size * 4, combine);
+  }
+
+ private:
+  int num_partitions_;
+  int partition_axis_;
+  Combiner combiner_;
+  float max_norm_;
+  int64 default_id_;
+};
+
+REGISTER_KERNEL_BUILDER(Name("FusedEmbeddingSparsePostLookUp")
+                            .Device(DEVICE_CPU),
+                        FusedEmbeddingSparsePostLookUpCPU);
+
+class FusedEmbeddingSparsePostLookUpGradCPU : public OpKernel {
+ public:
+  explicit FusedEmbeddingSparsePostLookUpGradCPU(OpKernelConstruction* ctx)
+      : OpKernel(ctx) {
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("num_partitions", &num_partitions_));
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("partition_axis", &partition_axis_));
+    std::string combiner;
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("combiner", &combiner));
+    combiner_ = CombinerFromString(combiner);
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("max_norm", &max_norm_));
+    int temp_default_id;
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("default_id", &temp_default_id));
+    default_id_ = int64(temp_default_id);
+  }
+
+  void Compute(OpKernelContext* ctx) override {
+    Tensor const* top_grad_tensor = nullptr;
+    OP_REQUIRES_OK(ctx, ctx->input("top_grad", &top_grad_tensor));
+    const float* top_grad = top_grad_tensor->flat<float>().data();
+
+    OpInputList emb_shards;
+    OP_REQUIRES_OK(ctx, ctx->input_list("emb_shards", &emb_shards));
+
+    OpInputList partitioned_indices;
+    OP_REQUIRES_OK(
+        ctx, ctx->input_list("partitioned_indices", &partitioned_indices));
+
+    OpInputList partitioned_weights;
+    OP_REQUIRES_OK(
+        ctx, ctx->input_list("partitioned_weights", &partitioned_weights));
+    const bool use_weights = partitioned_weights.size() > 0;
+    OP_REQUIRES(ctx, !use_weights || partitioned_weights.size() == num_partitions_,
+                errors::InvalidArgument(
+                    "partitioned_weights should be empty or have ",
+                    num_partitions_, " tensors"));
+
+    Tensor const* feature_nums_tensor = nullptr;
+    OP_REQUIRES_OK(ctx, ctx->input("feature_nums", &feature_nums_tensor));
+    const int* feature_nums = feature_nums_tensor->flat<int>().data();
+
+    Tensor const* row_empty_and_invalid_flags = nullptr;
+    OP_REQUIRES_OK(ctx, ctx->input("row_empty_and_invalid_flags",
+                                   &row_empty_and_invalid_flags));
+    const int* row_emptiness_flag =
+        row_empty_and_invalid_flags->flat<int>().data();
+
+    OpOutputList grad_shards;
+    OP_REQUIRES_OK(ctx, ctx->output_list("grad_shards", &grad_shards));
+
+    const int64 batch_size = top_grad_tensor->shape().dim_size(0);
+    const int64 emb_vec_size = emb_shards[0].shape().dim_size(1);
+    const bool set_empty_row_zero = default_id_ >= 0;
+
+    std::vector<float> weight_sums;
+    std::vector<float> weight_square_sums;
+    if (use_weights) {
+      SumUpWeights(partitioned_indices, partitioned_weights, batch_size,
+                   &weight_sums, &weight_square_sums);
+    }
+
+    auto worker_threads = ctx->device()->tensorflow_cpu_worker_threads();
+    for (int i = 0; i < num_partitions_; i++) {
+      const int64 sub_nnz = partitioned_indices[i].shape().dim_size(0);
+      const int64* indices = partitioned_indices[i].flat<int64>().data();
+      const float* emb_shard = emb_shards[i].flat<float>().data();
+      const float* weights =
+          use_weights ? partitioned_weights[i].flat<float>().data() : nullptr;
+
+      Tensor* grad_shard_tensor;
+      OP_REQUIRES_OK(
+          ctx, grad_shards.allocate(i, TensorShape({sub_nnz, emb_vec_size}),
+                                    &grad_shard_tensor));
+      float* grad_shard = grad_shard_tensor->flat<float>().data();
+
+      auto distribute = [&](int64 start, int64 limit) {
+        for (int64 j = start; j < limit; j++) {
+          const int64 row_in_batch = indices[2 * j];
+          float* grad = grad_shard + j * emb_vec_size;
+          if (set_empty_row_zero && row_emptiness_flag[row_in_batch]) {
+            std::fill(grad, grad + emb_vec_size, 0.0f);
+            continue;
+          }
+          float scale;
+          if (use_weights) {
+            scale = weights[j] * CombineScale(combiner_,
+                                              weight_sums[row_in_batch],
+                                              weight_square_sums[row_in_batch]);
+          } else {
+            scale = CombineScale(combiner_, feature_nums[row_in_batch],
+                                 feature_nums[row_in_batch]);
+          }
+          scale *= ClipScale(emb_shard + j * emb_vec_size, emb_vec_size,
+                             max_norm_);
+          const float* row_grad = top_grad + row_in_batch * emb_vec_size;
+          for (int64 d = 0; d < emb_vec_size; d++) {
+            grad[d] = row_grad[d] * scale;
+          }
+        }
+      };
+      Shard(worker_threads->num_threads, worker_threads->workers, sub_nnz,
+            emb_vec_size * 4, distribute);
+    }
+  }
+
+ private:
+  int num_partitions_;
+  int partition_axis_;
+  Combiner combiner_;
+  float max_norm_;
+  int64 default_id_;
+};
+
+REGISTER_KERNEL_BUILDER(Name("FusedEmbeddingSparsePostLookUpGrad")
+                            .Device(DEVICE_CPU),
+                        FusedEmbeddingSparsePostLookUpGradCPU);
+
+}  // namespace tensorflow
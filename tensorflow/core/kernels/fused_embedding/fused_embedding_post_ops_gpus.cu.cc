@@ -118,6 +118,10 @@ class FusedEmbeddingSparsePostLookUpGPU : public OpKernel {
     int temp_default_id;
     OP_REQUIRES_OK(ctx, ctx->GetAttr("default_id", &temp_default_id));
     default_id_ = int64_t(temp_default_id);
+    DataTypeVector weights_types;
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("Tweights", &weights_types));
+    OP_REQUIRES(ctx, weights_types.empty(),
+                errors::Unimplemented("sparse weights are only supported on CPU"));
   }
 
   void Compute(OpKernelContext* ctx) override {
@@ -234,6 +238,10 @@ class FusedEmbeddingSparsePostLookUpGradGPU : public OpKernel {
     int temp_default_id;
     OP_REQUIRES_OK(ctx, ctx->GetAttr("default_id", &temp_default_id));
     default_id_ = int64_t(temp_default_id);
+    DataTypeVector weights_types;
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("Tweights", &weights_types));
+    OP_REQUIRES(ctx, weights_types.empty(),
+                errors::Unimplemented("sparse weights are only supported on CPU"));
   }
 
   void Compute(OpKernelContext* ctx) override {
@@ -33,7 +33,8 @@ class FusedEmbeddingSparsePostLookUpOpTest : public OpsTestBase {
  protected:
   void MakeOpAndSetDevice(Device device, int num_partitions, DataType dtype,
                           const std::string& combiner, const float max_norm,
-                          const int default_id) {
+                          const int default_id,
+                          const bool use_weights = false) {
     if (device == Device::GPU) {
       SetDevice(DEVICE_GPU,
                 std::unique_ptr<tensorflow::Device>(DeviceFactory::NewDevice(
@@ -53,6 +54,8 @@ class FusedEmbeddingSparsePostLookUpOpTest : public OpsTestBase {
                      .Input(FakeInput(DT_INT64))
                      .Input(FakeInput(DT_INT32))
                      .Input(FakeInput(DT_INT64))
+                     .Input(FakeInput(DataTypeVector(
+                         use_weights ? num_partitions : 0, DT_FLOAT)))
                      .Finalize(node_def()));
     TF_EXPECT_OK(InitOp());
   }
@@ -209,5 +212,52 @@ TEST_F(FusedEmbeddingSparsePostLookUpOpTest, Partition2_Sum_Default_0) {
   }
 }
 
+TEST_F(FusedEmbeddingSparsePostLookUpOpTest, Partition2_Mean_Weights_CPU) {
+  const int nnz = 3;
+  const int batch_size = 2;
+  const int emb_vector_dim = 2;
+  const int entries = 2;
+
+  MakeOpAndSetDevice(Device::CPU, 2, DT_FLOAT, "mean", -1.0, -1, true);
+
+  // emb_shards
+  AddInputFromArray<float>(TensorShape({2, emb_vector_dim}),
+                           {1.0, 1.0, 2.0, 2.0});
+  AddInputFromArray<float>(TensorShape({1, emb_vector_dim}), {4.0, 4.0});
+
+  // partitioned_indices
+  AddInputFromArray<int64>(TensorShape({2, 2}), {0, 0, 1, 0});
+  AddInputFromArray<int64>(TensorShape({1, 2}), {0, 1});
+
+  // sp_dense_shape
+  AddInputFromArray<int64>(TensorShape({2}), {batch_size, entries});
+
+  // row_empty_and_invalid_flags
+  AddInputFromArray<int>(TensorShape({batch_size + nnz}), {0, 0, 1, 1, 1});
+
+  // partitioned_values
+  AddInputFromArray<int64>(TensorShape({2}), {0, 1});
+  AddInputFromArray<int64>(TensorShape({1}), {0});
+
+  // partitioned_weights
+  AddInputFromArray<float>(TensorShape({2}), {1.0, 3.0});
+  AddInputFromArray<float>(TensorShape({1}), {3.0});
+
+  TF_ASSERT_OK(RunOpKernel());
+
+  {
+    Tensor expected_emb_vectors(allocator(), DT_FLOAT,
+                                TensorShape({batch_size, emb_vector_dim}));
+    test::FillValues<float>(&expected_emb_vectors, {3.25, 3.25, 2.0, 2.0});
+    test::ExpectTensorNear<float>(expected_emb_vectors, *GetOutput(0), 1e-4);
+  }
+  {
+    Tensor feature_nums_expected(allocator(), DT_INT32,
+                                 TensorShape({batch_size}));
+    test::FillValues<int>(&feature_nums_expected, {2, 1});
+    test::ExpectTensorEqual<int32>(feature_nums_expected, *GetOutput(1));
+  }
+}
+
 }  // namespace
-}  // namespace tensorflow
\ No newline at end of file
+}  // namespace tensorflow
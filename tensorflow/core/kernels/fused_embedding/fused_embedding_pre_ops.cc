@@ -0,0 +1,262 @@
+#include <algorithm>
+#include <string>
+#include <vector>
+
+#include "tensorflow/core/framework/op_kernel.h"
+#include "tensorflow/core/framework/tensor.h"
+#include "tensorflow/core/util/work_sharder.h"
+
+namespace tensorflow {
+
+namespace {
+
+enum PartitionStrategy { kDiv, kMod, kModEv };
+
+// floormod and floordiv, as python does when embedding_lookup partitions
+// the ids.
+inline int64 FloorMod(int64 x, int64 y) {
+  int64 r = x % y;
+  return (r != 0 && (r < 0) != (y < 0)) ? r + y : r;
+}
+
+inline int64 FloorDiv(int64 x, int64 y) { return (x - FloorMod(x, y)) / y; }
+
+}  // namespace
+
+class FusedEmbeddingSparsePreLookUpCPU : public OpKernel {
+ public:
+  explicit FusedEmbeddingSparsePreLookUpCPU(OpKernelConstruction* ctx)
+      : OpKernel(ctx) {
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("num_partitions", &num_partitions_));
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("partition_axis", &partition_axis_));
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("fill_empty_row", &fill_empty_row_));
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("prune_invalid_id", &prune_invalid_id_));
+    int temp_default_id;
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("default_id", &temp_default_id));
+    default_id_ = int64(temp_default_id);
+    std::string partition_strategy;
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("partition_strategy", &partition_strategy));
+    if (partition_strategy == "mod") {
+      partition_strategy_ = kMod;
+    } else if (partition_strategy == "mod_ev") {
+      partition_strategy_ = kModEv;
+    } else {
+      partition_strategy_ = kDiv;
+    }
+    DataTypeVector weights_types;
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("Tweights", &weights_types));
+    OP_REQUIRES(ctx, weights_types.size() <= 1,
+                errors::InvalidArgument(
+                    "sp_weights_values should have at most one tensor"));
+    use_weights_ = !weights_types.empty();
+  }
+
+  void Compute(OpKernelContext* ctx) override {
+    const int64 default_id = default_id_ >= 0 ? default_id_ : 0;
+
+    // 1. bind inputs
+    Tensor const* values_tensor = nullptr;
+    OP_REQUIRES_OK(ctx, ctx->input("sp_values", &values_tensor));
+    const int64 nnz = values_tensor->shape().dim_size(0);
+    const int64* values = values_tensor->flat<int64>().data();
+
+    Tensor const* indices_tensor = nullptr;
+    OP_REQUIRES_OK(ctx, ctx->input("sp_indices", &indices_tensor));
+    OP_REQUIRES(ctx, indices_tensor->shape().dim_size(0) == nnz,
+                errors::InvalidArgument(
+                    "sp_indices and sp_values should have the same length"));
+    const int64* indices = indices_tensor->flat<int64>().data();
+
+    Tensor const* dense_shape = nullptr;
+    OP_REQUIRES_OK(ctx, ctx->input("sp_dense_shape", &dense_shape));
+    const int64 batch_size = dense_shape->flat<int64>().data()[0];
+
+    const float* weights = nullptr;
+    if (use_weights_) {
+      OpInputList weights_list;
+      OP_REQUIRES_OK(ctx, ctx->input_list("sp_weights_values", &weights_list));
+      OP_REQUIRES(ctx, weights_list[0].NumElements() == nnz,
+                  errors::InvalidArgument(
+                      "sp_weights_values and sp_values should have the same "
+                      "length"));
+      weights = weights_list[0].flat<float>().data();
+    }
+
+    OpInputList partition_shapes;
+    OP_REQUIRES_OK(ctx, ctx->input_list("partition_shapes", &partition_shapes));
+    std::vector<int64> partition_sizes_accumulate;
+    for (const Tensor& shape : partition_shapes) {
+      OP_REQUIRES(ctx, shape.dims() <= 2,
+                  errors::InvalidArgument(
+                      "input partition_shapes must all less than rank 2"));
+      const int64 accu = partition_sizes_accumulate.empty()
+                             ? shape.flat<int64>().data()[0]
+                             : shape.flat<int64>().data()[0] +
+                                   partition_sizes_accumulate.back();
+      partition_sizes_accumulate.push_back(accu);
+    }
+
+    // 2. set flags, the first batch_size ones are the emptiness of the rows,
+    // the others the validness of the ids.
+    Tensor* all_flags = nullptr;
+    OP_REQUIRES_OK(
+        ctx, ctx->allocate_output(2 * num_partitions_,
+                                  TensorShape{batch_size + nnz}, &all_flags));
+    int* row_emptiness_flag = all_flags->flat<int>().data();
+    int* valid_id_flag = row_emptiness_flag + batch_size;
+    std::fill(row_emptiness_flag, row_emptiness_flag + batch_size + nnz, 1);
+    for (int64 i = 0; i < nnz; i++) {
+      const int64 row_in_batch = indices[2 * i];
+      OP_REQUIRES(ctx, row_in_batch >= 0 && row_in_batch < batch_size,
+                  errors::InvalidArgument("row ", row_in_batch,
+                                          " of sp_indices is out of range [0, ",
+                                          batch_size, ")"));
+      if (prune_invalid_id_ && values[i] < 0) {
+        valid_id_flag[i] = 0;
+      } else {
+        row_emptiness_flag[row_in_batch] = 0;
+      }
+    }
+
+    // 3. the entries to look up: positions of the valid ids in sp_values,
+    // followed by -1 - row for every empty row to fill.
+    std::vector<int64> entries;
+    entries.reserve(nnz + (fill_empty_row_ ? batch_size : 0));
+    for (int64 i = 0; i < nnz; i++) {
+      if (valid_id_flag[i]) {
+        entries.push_back(i);
+      }
+    }
+    if (fill_empty_row_) {
+      for (int64 row = 0; row < batch_size; row++) {
+        if (row_emptiness_flag[row]) {
+          entries.push_back(-1 - row);
+        }
+      }
+    }
+    const int64 new_nnz = entries.size();
+
+    // 4. assign the entries to partitions
+    std::vector<int> partition_of(new_nnz, 0);
+    std::vector<int64> sub_values(new_nnz);
+    auto worker_threads = ctx->device()->tensorflow_cpu_worker_threads();
+    auto assign = [&](int64 start, int64 limit) {
+      for (int64 k = start; k < limit; k++) {
+        const int64 value =
+            entries[k] >= 0 ? values[entries[k]] : default_id;
+        if (num_partitions_ == 1) {
+          sub_values[k] = value;
+        } else if (partition_strategy_ == kMod) {
+          partition_of[k] = FloorMod(value, num_partitions_);
+          sub_values[k] = FloorDiv(value, num_partitions_);
+        } else if (partition_strategy_ == kModEv) {
+          partition_of[k] = FloorMod(FloorMod(value, 1000), num_partitions_);
+          sub_values[k] = value;
+        } else {
+          // ids out of the partition shapes are dropped, as on GPU.
+          const int p = std::upper_bound(partition_sizes_accumulate.begin(),
+                                         partition_sizes_accumulate.end(),
+                                         value) -
+                        partition_sizes_accumulate.begin();
+          partition_of[k] = p;
+          sub_values[k] =
+              p == 0 ? value : value - partition_sizes_accumulate[p - 1];
+        }
+      }
+    };
+    Shard(worker_threads->num_threads, worker_threads->workers, new_nnz, 20,
+          assign);
+
+    std::vector<int64> partition_offsets(num_partitions_ + 1, 0);
+    for (int64 k = 0; k < new_nnz; k++) {
+      if (partition_of[k] < num_partitions_) {
+        partition_offsets[partition_of[k] + 1]++;
+      }
+    }
+    for (int i = 0; i < num_partitions_; i++) {
+      partition_offsets[i + 1] += partition_offsets[i];
+    }
+    std::vector<int64> order(partition_offsets[num_partitions_]);
+    {
+      std::vector<int64> cursors(partition_offsets.begin(),
+                                 partition_offsets.end() - 1);
+      for (int64 k = 0; k < new_nnz; k++) {
+        if (partition_of[k] < num_partitions_) {
+          order[cursors[partition_of[k]]++] = k;
+        }
+      }
+    }
+
+    // 5. set output, every partition is sorted by id and copied in parallel.
+    OpOutputList partitioned_values;
+    OP_REQUIRES_OK(ctx,
+                   ctx->output_list("partitioned_values", &partitioned_values));
+    OpOutputList partitioned_indices;
+    OP_REQUIRES_OK(
+        ctx, ctx->output_list("partitioned_indices", &partitioned_indices));
+    OpOutputList partitioned_weights;
+    OP_REQUIRES_OK(
+        ctx, ctx->output_list("partitioned_weights", &partitioned_weights));
+    std::vector<Tensor*> values_out(num_partitions_);
+    std::vector<Tensor*> indices_out(num_partitions_);
+    std::vector<Tensor*> weights_out(num_partitions_);
+    for (int i = 0; i < num_partitions_; i++) {
+      const int64 size = partition_offsets[i + 1] - partition_offsets[i];
+      OP_REQUIRES_OK(ctx, partitioned_values.allocate(i, TensorShape({size}),
+                                                      &values_out[i]));
+      OP_REQUIRES_OK(ctx, partitioned_indices.allocate(
+                              i, TensorShape({size, 2}), &indices_out[i]));
+      OP_REQUIRES_OK(ctx, partitioned_weights.allocate(
+                              i, TensorShape({use_weights_ ? size : 0}),
+                              &weights_out[i]));
+    }
+
+    auto fill = [&](int64 start, int64 limit) {
+      for (int64 i = start; i < limit; i++) {
+        auto first = order.begin() + partition_offsets[i];
+        auto last = order.begin() + partition_offsets[i + 1];
+        if (num_partitions_ > 1) {
+          std::stable_sort(first, last, [&sub_values](int64 a, int64 b) {
+            return sub_values[a] < sub_values[b];
+          });
+        }
+        int64* value_data = values_out[i]->flat<int64>().data();
+        int64* indice_data = indices_out[i]->flat<int64>().data();
+        float* weight_data =
+            use_weights_ ? weights_out[i]->flat<float>().data() : nullptr;
+        for (auto it = first; it != last; ++it, ++value_data) {
+          const int64 entry = entries[*it];
+          *value_data = sub_values[*it];
+          if (entry >= 0) {
+            *indice_data++ = indices[2 * entry];
+            *indice_data++ = indices[2 * entry + 1];
+          } else {
+            // always set entry id to 0 for a filled row
+            *indice_data++ = -1 - entry;
+            *indice_data++ = 0;
+          }
+          if (weight_data != nullptr) {
+            *weight_data++ = entry >= 0 ? weights[entry] : 1.0f;
+          }
+        }
+      }
+    };
+    Shard(worker_threads->num_threads, worker_threads->workers, num_partitions_,
+          std::max(new_nnz, int64(1)) * 50, fill);
+  }
+
+ private:
+  int num_partitions_;
+  int partition_axis_;
+  bool fill_empty_row_;
+  bool prune_invalid_id_;
+  int64 default_id_;
+  PartitionStrategy partition_strategy_;
+  bool use_weights_;
+};
+
+REGISTER_KERNEL_BUILDER(Name("FusedEmbeddingSparsePreLookUp")
+                            .Device(DEVICE_CPU),
+                        FusedEmbeddingSparsePreLookUpCPU);
+
+}  // namespace tensorflow
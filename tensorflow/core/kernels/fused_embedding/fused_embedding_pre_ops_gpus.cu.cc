@@ -145,6 +145,15 @@ class FusedEmbeddingSparsePreLookUpGPU : public OpKernel {
     int temp_default_id;
     OP_REQUIRES_OK(ctx, ctx->GetAttr("default_id", &temp_default_id));
     default_id_ = int64_t(temp_default_id);
+    std::string partition_strategy;
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("partition_strategy", &partition_strategy));
+    OP_REQUIRES(ctx, partition_strategy == "div",
+                errors::Unimplemented("partition_strategy ", partition_strategy,
+                                      " is only supported on CPU"));
+    DataTypeVector weights_types;
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("Tweights", &weights_types));
+    OP_REQUIRES(ctx, weights_types.empty(),
+                errors::Unimplemented("sparse weights are only supported on CPU"));
   }
 
   void Compute(OpKernelContext* ctx) override {
@@ -498,6 +507,15 @@ class FusedEmbeddingSparsePreLookUpGPU : public OpKernel {
         sub_start_offset = elements_offset_per_partition_[i];
       }
     }
+
+    OpOutputList partitioned_weights;
+    OP_REQUIRES_OK(
+        ctx, ctx->output_list("partitioned_weights", &partitioned_weights));
+    for (int i = 0; i < num_partitions_; i++) {
+      Tensor* unused;
+      OP_REQUIRES_OK(ctx,
+                     partitioned_weights.allocate(i, TensorShape({0}), &unused));
+    }
     // Op kernel execution done
   }
 
@@ -35,7 +35,9 @@ class FusedEmbeddingSparsePreLookUpOpTest : public OpsTestBase {
  protected:
   void MakeOpAndSetDevice(Device device, const int num_partitions,
                           const bool fill_empty_row,
-                          const bool prune_invalid_id, const int default_id) {
+                          const bool prune_invalid_id, const int default_id,
+                          const std::string& partition_strategy = "div",
+                          const bool use_weights = false) {
     if (device == Device::GPU) {
       SetDevice(DEVICE_GPU,
                 std::unique_ptr<tensorflow::Device>(DeviceFactory::NewDevice(
@@ -49,10 +51,13 @@ class FusedEmbeddingSparsePreLookUpOpTest : public OpsTestBase {
                      .Attr("fill_empty_row", fill_empty_row)
                      .Attr("prune_invalid_id", prune_invalid_id)
                      .Attr("default_id", default_id)
+                     .Attr("partition_strategy", partition_strategy)
                      .Input(FakeInput(num_partitions, DT_INT64))
                      .Input(FakeInput(DT_INT64))
                      .Input(FakeInput(DT_INT64))
                      .Input(FakeInput(DT_INT64))
+                     .Input(FakeInput(use_weights ? DataTypeVector({DT_FLOAT})
+                                                  : DataTypeVector()))
                      .Finalize(node_def()));
     TF_EXPECT_OK(InitOp());
   }
@@ -348,5 +353,110 @@ TEST_F(FusedEmbeddingSparsePreLookUpOpTest,
   }
 }
 
+TEST_F(FusedEmbeddingSparsePreLookUpOpTest,
+       Partition2_Mod_Fill_Empty_Prune_Invalid_Weights_CPU) {
+  MakeOpAndSetDevice(Device::CPU, 2, true, true, -1, "mod", true);
+  // partition_shapes 0
+  AddInputFromArray<int64>(TensorShape({2}), {5, 8});
+  // partition_shapes 1
+  AddInputFromArray<int64>(TensorShape({2}), {5, 8});
+
+  // sp_values
+  AddInputFromArray<int64>(TensorShape({10}),
+                           {0, 4, 3, -2, 5, -3, -4, 9, -6, 2});
+
+  // sp_indices
+  AddInputFromArray<int64>(
+      TensorShape({10, 2}),
+      {0, 0, 0, 4, 1, 2, 3, 0, 3, 4, 4, 0, 5, 2, 6, 0, 6, 1, 6, 7});
+
+  // sp_dense_shape
+  AddInputFromArray<int64>(TensorShape({2}), {7, 8});
+
+  // sp_weights_values
+  AddInputFromArray<float>(TensorShape({10}),
+                           {1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0});
+
+  TF_ASSERT_OK(RunOpKernel());
+
+  {
+    Tensor expected_values(allocator(), DT_INT64, TensorShape({6}));
+    test::FillValues<int64>(&expected_values, {0, 0, 0, 0, 1, 2});
+    test::ExpectTensorEqual<int64>(expected_values, *GetOutput(0));
+
+    Tensor expected_indices(allocator(), DT_INT64, TensorShape({6, 2}));
+    test::FillValues<int64>(&expected_indices,
+                            {0, 0, 2, 0, 4, 0, 5, 0, 6, 7, 0, 4});
+    test::ExpectTensorEqual<int64>(expected_indices, *GetOutput(2));
+
+    Tensor expected_weights(allocator(), DT_FLOAT, TensorShape({6}));
+    test::FillValues<float>(&expected_weights,
+                            {1.0, 1.0, 1.0, 1.0, 10.0, 2.0});
+    test::ExpectTensorEqual<float>(expected_weights, *GetOutput(5));
+  }
+
+  {
+    Tensor expected_values(allocator(), DT_INT64, TensorShape({3}));
+    test::FillValues<int64>(&expected_values, {1, 2, 4});
+    test::ExpectTensorEqual<int64>(expected_values, *GetOutput(1));
+
+    Tensor expected_indices(allocator(), DT_INT64, TensorShape({3, 2}));
+    test::FillValues<int64>(&expected_indices, {1, 2, 3, 4, 6, 0});
+    test::ExpectTensorEqual<int64>(expected_indices, *GetOutput(3));
+
+    Tensor expected_weights(allocator(), DT_FLOAT, TensorShape({3}));
+    test::FillValues<float>(&expected_weights, {3.0, 5.0, 8.0});
+    test::ExpectTensorEqual<float>(expected_weights, *GetOutput(6));
+  }
+}
+
+TEST_F(FusedEmbeddingSparsePreLookUpOpTest, Partition3_ModEv_CPU) {
+  MakeOpAndSetDevice(Device::CPU, 3, false, false, -1, "mod_ev");
+  // partition_shapes, not used by mod_ev
+  AddInputFromArray<int64>(TensorShape({2}), {1, 1});
+  AddInputFromArray<int64>(TensorShape({2}), {1, 1});
+  AddInputFromArray<int64>(TensorShape({2}), {1, 1});
+
+  // sp_values
+  AddInputFromArray<int64>(TensorShape({5}), {1001, 5, 2002, 7, -1});
+
+  // sp_indices
+  AddInputFromArray<int64>(TensorShape({5, 2}),
+                           {0, 0, 1, 0, 2, 0, 3, 0, 4, 0});
+
+  // sp_dense_shape
+  AddInputFromArray<int64>(TensorShape({2}), {5, 4});
+
+  TF_ASSERT_OK(RunOpKernel());
+
+  {
+    Tensor expected_values(allocator(), DT_INT64, TensorShape({1}));
+    test::FillValues<int64>(&expected_values, {-1});
+    test::ExpectTensorEqual<int64>(expected_values, *GetOutput(0));
+    Tensor expected_indices(allocator(), DT_INT64, TensorShape({1, 2}));
+    test::FillValues<int64>(&expected_indices, {4, 0});
+    test::ExpectTensorEqual<int64>(expected_indices, *GetOutput(3));
+  }
+
+  {
+    Tensor expected_values(allocator(), DT_INT64, TensorShape({2}));
+    test::FillValues<int64>(&expected_values, {7, 1001});
+    test::ExpectTensorEqual<int64>(expected_values, *GetOutput(1));
+    Tensor expected_indices(allocator(), DT_INT64, TensorShape({2, 2}));
+    test::FillValues<int64>(&expected_indices, {3, 0, 0, 0});
+    test::ExpectTensorEqual<int64>(expected_indices, *GetOutput(4));
+  }
+
+  {
+    Tensor expected_values(allocator(), DT_INT64, TensorShape({2}));
+    test::FillValues<int64>(&expected_values, {5, 2002});
+    test::ExpectTensorEqual<int64>(expected_values, *GetOutput(2));
+    Tensor expected_indices(allocator(), DT_INT64, TensorShape({2, 2}));
+    test::FillValues<int64>(&expected_indices, {1, 0, 2, 0});
+    test::ExpectTensorEqual<int64>(expected_indices, *GetOutput(5));
+  }
+  EXPECT_EQ(0, GetOutput(7)->NumElements());
+}
+
 }  // namespace
-}  // namespace tensorflow
\ No newline at end of file
+}  // namespace tensorflow
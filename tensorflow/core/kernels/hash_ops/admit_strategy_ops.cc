@@ -46,6 +46,7 @@ class BloomFilterInitializeOp : public OpKernel {
     OP_REQUIRES_OK(context, context->GetAttr("dtype", &dtype_));
     OP_REQUIRES_OK(context, context->GetAttr("shape", &shape_));
     OP_REQUIRES_OK(context, context->GetAttr("initialized", &initialized_));
+    OP_REQUIRES_OK(context, context->GetAttr("blocked", &blocked_));
     CHECK(shape_.dims() == 2) << "Invalid shape, must be 2-dimensional";
   }
   void Compute(OpKernelContext* ctx) override {
@@ -62,7 +63,7 @@ class BloomFilterInitializeOp : public OpKernel {
     resource->CreateInternal(
         new BloomFilterAdmitStrategy(
           min_frequency_, num_hash_func_, dtype_, shape_, 
-          slice_offset_, max_slice_size_));
+          slice_offset_, max_slice_size_, blocked_));
     resource->SetInitialized(initialized_);
   }
  private:
@@ -73,6 +74,7 @@ class BloomFilterInitializeOp : public OpKernel {
   DataType dtype_;
   TensorShape shape_;
   bool initialized_;
+  bool blocked_;
 };
 
 class BloomFilterIsInitializedOp : public OpKernel {
@@ -115,30 +117,54 @@ class BloomFilterAdmitOp : public AsyncOpKernel {
     Tensor* output_tensor = nullptr;
     OP_REQUIRES_OK_ASYNC(
         ctx, ctx->allocate_output(0, freqs_tensor.shape(), &output_tensor), done);
-    auto keys = keys_tensor.flat<int64>();
-    auto output = output_tensor->flat<bool>();
-    for (size_t i = 0; i < freqs_tensor.NumElements(); ++i) {
+    const int64 size = freqs_tensor.NumElements();
+    std::vector<int64> freqs(size);
+    for (int64 i = 0; i < size; ++i) {
       switch(freqs_tensor.dtype()) {
         case DT_UINT8:
-          output(i) = strategy->Admit(keys(i), static_cast<int64>(
-                  freqs_tensor.flat<uint8>()(i)));
+          freqs[i] = static_cast<int64>(freqs_tensor.flat<uint8>()(i));
           break;
         case DT_UINT16:
-          output(i) = strategy->Admit(keys(i), static_cast<int64>(
-                  freqs_tensor.flat<uint16>()(i)));
+          freqs[i] = static_cast<int64>(freqs_tensor.flat<uint16>()(i));
           break;
         case DT_UINT32:
-          output(i) = strategy->Admit(keys(i), static_cast<int64>(
-                  freqs_tensor.flat<uint32>()(i)));
+          freqs[i] = static_cast<int64>(freqs_tensor.flat<uint32>()(i));
           break;
         default:
           LOG(FATAL) << "Unknown data type " << freqs_tensor.dtype();
       }
     }
+    strategy->AdmitBatch(keys_tensor.flat<int64>().data(), freqs.data(), size,
+                         output_tensor->flat<bool>().data());
     done();
   }
 };
 
+class BloomFilterDecayOp : public OpKernel {
+ public:
+  explicit BloomFilterDecayOp(OpKernelConstruction* context)
+    : OpKernel(context) {
+    OP_REQUIRES_OK(context, context->GetAttr("decay_steps", &decay_steps_));
+  }
+  void Compute(OpKernelContext* ctx) override {
+    HashTableAdmitStrategyResource* resource;
+    OP_REQUIRES_OK(ctx, LookupResource(ctx, HandleFromInput(ctx, 0), &resource));
+    core::ScopedUnref s(resource);
+    BloomFilterAdmitStrategy* strategy =
+        dynamic_cast<BloomFilterAdmitStrategy*>(resource->Internal());
+    OP_REQUIRES(ctx, strategy != nullptr,
+                errors::FailedPrecondition(
+                    "BloomFilterAdmitStrategy not initialized."));
+    OP_REQUIRES(ctx, TensorShapeUtils::IsScalar(ctx->input(1).shape()),
+                errors::InvalidArgument("global_step should be a scalar"));
+    const int64 global_step = ctx->input(1).scalar<int64>()();
+    strategy->Decay(global_step / decay_steps_,
+        ctx->device()->tensorflow_cpu_worker_threads()->workers);
+  }
+ private:
+  int64 decay_steps_;
+};
+
 REGISTER_KERNEL_BUILDER(Name("BloomFilterAdmitStrategyOp")                    \
                             .Device(DEVICE_CPU),                              \
                         BloomFilterAdmitStrategyOp);
@@ -151,5 +177,8 @@ REGISTER_KERNEL_BUILDER(Name("BloomFilterIsInitializedOp")                    \
 REGISTER_KERNEL_BUILDER(Name("BloomFilterAdmitOp")                            \
                             .Device(DEVICE_CPU),                              \
                         BloomFilterAdmitOp);
+REGISTER_KERNEL_BUILDER(Name("BloomFilterDecayOp")                            \
+                            .Device(DEVICE_CPU),                              \
+                        BloomFilterDecayOp);
 
 }  // namespace tensorflow
@@ -0,0 +1,248 @@
+/* Copyright 2022 The TensorFlow Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+==============================================================================*/
+
+#include "tensorflow/core/framework/hash_table/hash_table.h"
+#include "tensorflow/core/framework/hash_table/status_collector.h"
+#include "tensorflow/core/framework/hash_table/tensible_variable.h"
+#include "tensorflow/core/framework/op_kernel.h"
+#include "tensorflow/core/framework/register_types.h"
+#include "tensorflow/core/framework/tensor.h"
+
+namespace tensorflow {
+
+namespace {
+
+constexpr int64 kFilterBlockSize = 64 << 10;
+
+}  // namespace
+
+// Filters a hash table by a predicate on a tensible variable of it, e.g. a
+// slot recording the update step of every id. The ids are scanned in
+// parallel without calling back into a function, and the matched keys are
+// deleted from the hash table. Outputs the number of deleted keys.
+//
+// If `num_shards` is positive, only `num_shards` internal tables starting
+// from `cursor` are scanned, and the cursor of the next scan is output, so
+// that the hash table can be filtered incrementally.
+template <typename T>
+class HashTableNativeFilterOp : public AsyncOpKernel {
+ public:
+  explicit HashTableNativeFilterOp(OpKernelConstruction* ctx)
+    : AsyncOpKernel(ctx) {
+  }
+
+  void ComputeAsync(OpKernelContext* ctx, DoneCallback done) override {
+    HashTableResource* resource;
+    OP_REQUIRES_OK_ASYNC(
+        ctx, LookupResource(ctx, HandleFromInput(ctx, 0), &resource), done);
+    core::ScopedUnref s(resource);
+    HashTable* table = resource->Internal();
+    OP_REQUIRES_ASYNC(
+        ctx, table != nullptr,
+        errors::FailedPrecondition("HashTable is not initialized"), done);
+    TensibleVariableResource* variable_resource;
+    OP_REQUIRES_OK_ASYNC(
+        ctx, LookupResource(ctx, HandleFromInput(ctx, 1), &variable_resource),
+        done);
+    core::ScopedUnref sv(variable_resource);
+    TensibleVariable* variable = variable_resource->Internal();
+    OP_REQUIRES_ASYNC(
+        ctx, variable != nullptr,
+        errors::FailedPrecondition("TensibleVariable is not initialized"), done);
+    OP_REQUIRES_ASYNC(
+        ctx, DataTypeToEnum<T>::value == variable->dtype(),
+        errors::FailedPrecondition("TensibleVariable dtype mismatch"), done);
+    std::function<bool(const T*)> predicate;
+    OP_REQUIRES_OK_ASYNC(ctx, MakePredicate(ctx, variable, &predicate), done);
+    const Tensor* cursor_tensor;
+    OP_REQUIRES_OK_ASYNC(ctx, ctx->input("cursor", &cursor_tensor), done);
+    const Tensor* num_shards_tensor;
+    OP_REQUIRES_OK_ASYNC(
+        ctx, ctx->input("num_shards", &num_shards_tensor), done);
+    OP_REQUIRES_ASYNC(
+        ctx, TensorShapeUtils::IsScalar(cursor_tensor->shape()) &&
+             TensorShapeUtils::IsScalar(num_shards_tensor->shape()),
+        errors::InvalidArgument("cursor and num_shards should be scalars"),
+        done);
+    const int64 cursor = cursor_tensor->scalar<int64>()();
+    const int64 num_shards = num_shards_tensor->scalar<int64>()();
+    Tensor* num_removed = nullptr;
+    OP_REQUIRES_OK_ASYNC(
+        ctx, ctx->allocate_output(0, TensorShape({}), &num_removed), done);
+    num_removed->scalar<int64>()() = 0;
+    Tensor* next_cursor = nullptr;
+    OP_REQUIRES_OK_ASYNC(
+        ctx, ctx->allocate_output(1, TensorShape({}), &next_cursor), done);
+
+    std::vector<int64>* keys = new std::vector<int64>();
+    std::vector<int64>* ids = new std::vector<int64>();
+    const int64 num_tables = table->NumTables();
+    if (num_shards > 0 && num_shards < num_tables) {
+      const int64 begin = (cursor % num_tables + num_tables) % num_tables;
+      table->Snapshot(begin, begin + num_shards, keys, ids);
+      next_cursor->scalar<int64>()() = (begin + num_shards) % num_tables;
+    } else {
+      table->Snapshot(keys, ids);
+      next_cursor->scalar<int64>()() = cursor;
+    }
+    if (keys->empty()) {
+      delete keys;
+      delete ids;
+      done();
+      return;
+    }
+    std::vector<char>* removed = new std::vector<char>(keys->size(), 0);
+    auto scan = [variable, ids, removed, predicate] (
+        int64 offset, int64 size) -> Status {
+      tf_shared_lock rlock(*(variable->GetRWLock()));
+      const int64 max_id = variable->Size();
+      for (int64 i = offset; i < offset + size; ++i) {
+        const int64 id = (*ids)[i];
+        if (id != HashTable::kNotAdmitted && id >= 0 && id < max_id) {
+          (*removed)[i] = predicate(variable->GetSlice<T>(id));
+        }
+      }
+      return Status::OK();
+    };
+    resource->Ref();
+    variable_resource->Ref();
+    auto scan_done = [ctx, done, resource, variable_resource, table, keys,
+                      ids, removed, num_removed] (Status st) {
+      auto cleanup = [ctx, done, resource, variable_resource, keys, ids] (
+          Status st) {
+        delete keys;
+        delete ids;
+        resource->Unref();
+        variable_resource->Unref();
+        OP_REQUIRES_OK_ASYNC(ctx, st, done);
+        done();
+      };
+      if (!st.ok()) {
+        delete removed;
+        cleanup(st);
+        return;
+      }
+      int64 size = 0;
+      for (size_t i = 0; i < keys->size(); ++i) {
+        if ((*removed)[i]) {
+          (*keys)[size] = (*keys)[i];
+          (*ids)[size] = (*ids)[i];
+          ++size;
+        }
+      }
+      delete removed;
+      num_removed->scalar<int64>()() = size;
+      if (size == 0) {
+        cleanup(Status::OK());
+        return;
+      }
+      table->DeleteKeysSimple(keys->data(), ids->data(), size, cleanup);
+    };
+    ParrellRun(keys->size(), kFilterBlockSize, *ctx->runner(), scan,
+               scan_done);
+  }
+
+ protected:
+  // Makes the predicate on the slice of an id, true if the id is removed.
+  virtual Status MakePredicate(
+      OpKernelContext* ctx, TensibleVariable* variable,
+      std::function<bool(const T*)>* predicate) = 0;
+};
+
+// Removes ids not updated in the last `filter_interval_steps` steps.
+class HashTableGlobalStepFilterOp : public HashTableNativeFilterOp<int64> {
+ public:
+  explicit HashTableGlobalStepFilterOp(OpKernelConstruction* ctx)
+    : HashTableNativeFilterOp<int64>(ctx) {
+  }
+
+ protected:
+  Status MakePredicate(
+      OpKernelContext* ctx, TensibleVariable* variable,
+      std::function<bool(const int64*)>* predicate) override {
+    if (!TensorShapeUtils::IsScalar(ctx->input(2).shape()) ||
+        !TensorShapeUtils::IsScalar(ctx->input(3).shape())) {
+      return errors::InvalidArgument(
+          "global_step and filter_interval_steps should be scalars");
+    }
+    const int64 global_step = ctx->input(2).scalar<int64>()();
+    const int64 interval = ctx->input(3).scalar<int64>()();
+    *predicate = [global_step, interval] (const int64* update_step) {
+      return global_step - 1 - *update_step >= interval;
+    };
+    return Status::OK();
+  }
+};
+
+// Removes ids whose half squared L2 norm of weight is below `threshold`.
+class HashTableL2WeightFilterOp : public HashTableNativeFilterOp<float> {
+ public:
+  explicit HashTableL2WeightFilterOp(OpKernelConstruction* ctx)
+    : HashTableNativeFilterOp<float>(ctx) {
+  }
+
+ protected:
+  Status MakePredicate(
+      OpKernelContext* ctx, TensibleVariable* variable,
+      std::function<bool(const float*)>* predicate) override {
+    if (!TensorShapeUtils::IsScalar(ctx->input(2).shape())) {
+      return errors::InvalidArgument("threshold should be a scalar");
+    }
+    const float threshold = ctx->input(2).scalar<float>()();
+    const int64 dim = variable->SliceSize() / sizeof(float);
+    *predicate = [threshold, dim] (const float* weight) {
+      float l2_weight = 0;
+      for (int64 i = 0; i < dim; ++i) {
+        l2_weight += weight[i] * weight[i];
+      }
+      return l2_weight * 0.5f < threshold;
+    };
+    return Status::OK();
+  }
+};
+
+// Removes ids looked up fewer than `threshold` times.
+class HashTableFrequencyFilterOp : public HashTableNativeFilterOp<int64> {
+ public:
+  explicit HashTableFrequencyFilterOp(OpKernelConstruction* ctx)
+    : HashTableNativeFilterOp<int64>(ctx) {
+  }
+
+ protected:
+  Status MakePredicate(
+      OpKernelContext* ctx, TensibleVariable* variable,
+      std::function<bool(const int64*)>* predicate) override {
+    if (!TensorShapeUtils::IsScalar(ctx->input(2).shape())) {
+      return errors::InvalidArgument("threshold should be a scalar");
+    }
+    const int64 threshold = ctx->input(2).scalar<int64>()();
+    *predicate = [threshold] (const int64* frequency) {
+      return *frequency < threshold;
+    };
+    return Status::OK();
+  }
+};
+
+REGISTER_KERNEL_BUILDER(
+    Name("HashTableGlobalStepFilterOp").Device(DEVICE_CPU),
+    HashTableGlobalStepFilterOp);
+REGISTER_KERNEL_BUILDER(
+    Name("HashTableL2WeightFilterOp").Device(DEVICE_CPU),
+    HashTableL2WeightFilterOp);
+REGISTER_KERNEL_BUILDER(
+    Name("HashTableFrequencyFilterOp").Device(DEVICE_CPU),
+    HashTableFrequencyFilterOp);
+
+}  // namespace tensorflow
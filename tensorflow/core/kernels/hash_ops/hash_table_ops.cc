@@ -39,6 +39,7 @@ class HashTableInitializeOp : public OpKernel {
     OP_REQUIRES_OK(context, context->GetAttr("initialized", &initialized_));
     OP_REQUIRES_OK(context, context->GetAttr("concurrent_read", &concurrent_read_));
     OP_REQUIRES_OK(context, context->GetAttr("children", &children_));
+    OP_REQUIRES_OK(context, context->GetAttr("sharded_ids", &sharded_ids_));
   }
 
   void Compute(OpKernelContext* ctx) override {
@@ -52,7 +53,7 @@ class HashTableInitializeOp : public OpKernel {
             ctx, HandleFromInput(ctx, 0), &resource,
             [ctx, num_threads, this](HashTableResource** ptr) {
               *ptr = new HashTableResource(
-                  num_threads, concurrent_read_, children_);
+                  num_threads, concurrent_read_, children_, sharded_ids_);
               return Status::OK();
             }));
     core::ScopedUnref s(resource);
@@ -64,6 +65,7 @@ class HashTableInitializeOp : public OpKernel {
   bool initialized_;
   bool concurrent_read_;
   std::vector<string> children_;
+  bool sharded_ids_;
 };
 
 class HashTableLookupOp : public AsyncOpKernel {
@@ -335,6 +337,67 @@ class HashTableSnapshotOp : public AsyncOpKernel {
   }
 };
 
+class HashTableScanOp : public AsyncOpKernel {
+ public:
+  explicit HashTableScanOp(OpKernelConstruction* context)
+    : AsyncOpKernel(context) {
+  }
+
+  void ComputeAsync(OpKernelContext* ctx, DoneCallback done) override {
+    HashTableResource* resource;
+    OP_REQUIRES_OK_ASYNC(
+        ctx, LookupResource(ctx, HandleFromInput(ctx, 0), &resource), done);
+    core::ScopedUnref s(resource);
+    HashTable* table = resource->Internal();
+    OP_REQUIRES_ASYNC(
+        ctx, table != nullptr,
+        errors::FailedPrecondition("HashTable is not initialized"), done);
+    const Tensor& cursor_tensor = ctx->input(1);
+    OP_REQUIRES_ASYNC(
+        ctx, TensorShapeUtils::IsVector(cursor_tensor.shape()) &&
+             cursor_tensor.NumElements() == 3,
+        errors::InvalidArgument("cursor should be a vector of 3 elements"),
+        done);
+    for (int i = 2; i < 5; ++i) {
+      OP_REQUIRES_ASYNC(
+          ctx, TensorShapeUtils::IsScalar(ctx->input(i).shape()),
+          errors::InvalidArgument(
+              "max_rows, key_min and key_max should be scalars"), done);
+    }
+    const int64 max_rows = ctx->input(2).scalar<int64>()();
+    OP_REQUIRES_ASYNC(
+        ctx, max_rows > 0,
+        errors::InvalidArgument("max_rows should be positive: ", max_rows),
+        done);
+    int64 cursor[3] = {cursor_tensor.vec<int64>()(0),
+                       cursor_tensor.vec<int64>()(1),
+                       cursor_tensor.vec<int64>()(2)};
+    std::vector<int64> keys;
+    std::vector<int64> ids;
+    table->Scan(cursor, max_rows, ctx->input(3).scalar<int64>()(),
+                ctx->input(4).scalar<int64>()(), &keys, &ids);
+    Tensor* output_keys = nullptr;
+    Tensor* output_ids = nullptr;
+    Tensor* next_cursor = nullptr;
+    OP_REQUIRES_OK_ASYNC(
+        ctx, ctx->allocate_output(
+            0, TensorShape({static_cast<int64>(keys.size())}), &output_keys),
+        done);
+    OP_REQUIRES_OK_ASYNC(
+        ctx, ctx->allocate_output(
+            1, TensorShape({static_cast<int64>(ids.size())}), &output_ids),
+        done);
+    OP_REQUIRES_OK_ASYNC(
+        ctx, ctx->allocate_output(2, TensorShape({3}), &next_cursor), done);
+    std::copy(keys.begin(), keys.end(), output_keys->flat<int64>().data());
+    std::copy(ids.begin(), ids.end(), output_ids->flat<int64>().data());
+    next_cursor->vec<int64>()(0) = cursor[0];
+    next_cursor->vec<int64>()(1) = cursor[1];
+    next_cursor->vec<int64>()(2) = cursor[2];
+    done();
+  }
+};
+
 class HashTableSizeOp : public AsyncOpKernel {
  public:
   explicit HashTableSizeOp(OpKernelConstruction* context)
@@ -379,6 +442,9 @@ REGISTER_KERNEL_BUILDER(
 REGISTER_KERNEL_BUILDER(
     Name("HashTableSnapshotOp").Device(DEVICE_CPU),
     HashTableSnapshotOp);
+REGISTER_KERNEL_BUILDER(
+    Name("HashTableScanOp").Device(DEVICE_CPU),
+    HashTableScanOp);
 REGISTER_KERNEL_BUILDER(
     Name("HashTableSizeOp").Device(DEVICE_CPU),
     HashTableSizeOp);
@@ -227,7 +227,11 @@ class IncrEVValueDumpIterator : public  DumpIterator<T> {
     }
     ValuePtr<T>* value_ptr = NULL;
     TF_CHECK_OK(emb_var_->LookupOrCreateKey(*keys_iter_, &value_ptr));
-    return emb_var_->flat(value_ptr)(col_idx_++);
+    T* val = emb_var_->LookupOrCreateEmb(value_ptr,
+                                         emb_var_->GetDefaultValuePtr());
+    T ret = val[col_idx_++];
+    value_ptr->Free(val);
+    return ret;
   }
 
  private:
@@ -407,6 +411,7 @@ class IndicesIncrRecorder: public ResourceBase {
       EmbeddingVar<K, V>* emb_var, BundleWriter* writer,
       OpKernelContext* context) {
     mutex_lock l(mu_);
+    auto guard = emb_var->GuardValuePtrs();
     size_t bytes_limit = 8 << 20;
     char* dump_buffer = (char*)malloc(sizeof(char) * bytes_limit);
 
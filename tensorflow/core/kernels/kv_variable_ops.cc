@@ -19,8 +19,10 @@ limitations under the License.
 #define EIGEN_USE_GPU
 #endif
 
+#include "tensorflow/core/common_runtime/input_colocation_exemption_registry.h"
 #include "tensorflow/core/framework/bounds_check.h"
 #include "tensorflow/core/framework/embedding/config.pb.h"
+#include "tensorflow/core/framework/embedding/hot_key_cache.h"
 #include "tensorflow/core/framework/op_kernel.h"
 #include "tensorflow/core/framework/register_types.h"
 #include "tensorflow/core/framework/resource_mgr.h"
@@ -32,6 +34,10 @@ limitations under the License.
 #include "tensorflow/core/kernels/training_op_helpers.h"
 #include "tensorflow/core/kernels/variable_ops.h"
 #include "tensorflow/core/lib/core/errors.h"
+#include "tensorflow/core/lib/hash/hash.h"
+#include "tensorflow/core/lib/io/path.h"
+#include "tensorflow/core/lib/strings/str_util.h"
+#include "tensorflow/core/lib/strings/strcat.h"
 #include "tensorflow/core/platform/mem.h"
 #include "tensorflow/core/platform/mutex.h"
 #include "tensorflow/core/platform/types.h"
@@ -147,6 +153,11 @@ class InitializeKvVariableOp : public OpKernel {
     storage_type_ = static_cast<embedding::StorageType>(storage_type);
 
     OP_REQUIRES_OK(c, c->GetAttr("storage_path", &storage_path_));
+    OP_REQUIRES_OK(c, c->GetAttr("storage_size", &storage_size_));
+    OP_REQUIRES_OK(c, c->GetAttr("max_keys", &max_keys_));
+    OP_REQUIRES_OK(c, c->GetAttr("evict_policy", &evict_policy_));
+    OP_REQUIRES_OK(c, c->GetAttr("storage_dtype", &storage_dtype_));
+    OP_REQUIRES_OK(c, c->GetAttr("slot_storage_dtype", &slot_storage_dtype_));
 
     if (filter_freq_ < 0) {
       LOG(INFO) << "filter_freq < 0 is invalid, feature filter is disabled.";
@@ -201,7 +212,9 @@ class InitializeKvVariableOp : public OpKernel {
                                          steps_to_live_, filter_freq_, max_freq_,
                                          l2_weight_threshold_, layout_,
                                          max_element_size_, false_positive_probability_,
-                                         counter_type_, storage_type_, storage_path_, default_value_dim_));
+                                         counter_type_, storage_type_, storage_path_, default_value_dim_,
+                                         storage_size_, max_keys_, evict_policy_,
+                                         storage_dtype_, slot_storage_dtype_));
             return (*ptr)->Init(default_values, default_value_dim_);
             }));
     } else {
@@ -222,7 +235,10 @@ class InitializeKvVariableOp : public OpKernel {
                                         steps_to_live_, filter_freq_, max_freq_,
                                         l2_weight_threshold_, layout_,
                                         max_element_size_, false_positive_probability_,
-                                        counter_type_, storage_type_, storage_path_));
+                                        counter_type_, storage_type_, storage_path_,
+                                        default_value_dim_, storage_size_,
+                                        max_keys_, evict_policy_,
+                                        storage_dtype_, slot_storage_dtype_));
             return (*ptr)->Init();
            }));
 
@@ -238,7 +254,10 @@ class InitializeKvVariableOp : public OpKernel {
                                          block_num_, slotnum, opname,
                                          steps_to_live_, 0,
                                          max_freq_, l2_weight_threshold_,
-                                         layout_, 0, -1.0, counter_type_, storage_type_, storage_path_, default_value_dim_));
+                                         layout_, 0, -1.0, counter_type_, storage_type_, storage_path_, default_value_dim_,
+                                         storage_size_, max_keys_, evict_policy_,
+                                         storage_dtype_, slot_storage_dtype_));
+             (*ptr)->SetEpochManager(primary_variable->epoch_manager());
              return (*ptr)->Init(default_values, default_value_dim_);
             }));
       primary_variable->SetSlotNum(slotnum);
@@ -268,7 +287,12 @@ class InitializeKvVariableOp : public OpKernel {
   float false_positive_probability_;
   embedding::StorageType storage_type_;
   std::string storage_path_;
+  std::vector<int64> storage_size_;
   int64 default_value_dim_;
+  int64 max_keys_;
+  std::string evict_policy_;
+  DataType storage_dtype_;
+  DataType slot_storage_dtype_;
 };
 
 #define REGISTER_KERNELS(ktype, vtype)                               \
@@ -327,6 +351,7 @@ class KvResourceGatherOp : public OpKernel {
     EmbeddingVar<TKey, TValue>* ev = nullptr;
     OP_REQUIRES_OK(c, LookupResource(c, HandleFromInput(c, 0), &ev));
     core::ScopedUnref unref_me(ev);
+    auto guard = ev->GuardValuePtrs();
     const Tensor& indices = c->input(1);
     const int64 N = indices.NumElements();
 
@@ -382,6 +407,7 @@ class KvResourceGatherOp : public OpKernel {
         Shard(worker_threads->num_threads, worker_threads->workers, indices_size,
             slice_bytes, do_work);
       }
+      ev->UpdateCache(&indices_flat(0), indices_size);
     }
   }
 
@@ -425,6 +451,7 @@ class KvResourceGatherV1Op : public OpKernel {
     EmbeddingVar<TKey, TValue>* ev = nullptr;
     OP_REQUIRES_OK(c, LookupResource(c, HandleFromInput(c, 0), &ev));
     core::ScopedUnref unref_me(ev);
+    auto guard = ev->GuardValuePtrs();
 
     const Tensor& indices = c->input(1);
     const int64 N = indices.NumElements();
@@ -465,6 +492,7 @@ class KvResourceGatherV1Op : public OpKernel {
       auto worker_threads = c->device()->tensorflow_cpu_worker_threads();
       Shard(worker_threads->num_threads, worker_threads->workers, indices_size,
           slice_bytes, do_work);
+      ev->UpdateCache(&indices_flat(0), indices_size);
     }
   }
 
@@ -496,6 +524,112 @@ TF_CALL_double(REGISTER_GATHER_CPU);
 #undef REGISTER_GATHER_CPU
 #undef REGISTER_GATHER_ALL_INDICES
 #undef REGISTER_GATHER_FULL
+
+template <typename TKey, typename TValue>
+class KvResourceGroupGatherOp : public OpKernel {
+ public:
+  explicit KvResourceGroupGatherOp(OpKernelConstruction* c) : OpKernel(c) {
+    OP_REQUIRES_OK(c, c->GetAttr("N", &num_tables_));
+  }
+
+  void Compute(OpKernelContext* c) override {
+    OpInputList indices_list;
+    OP_REQUIRES_OK(c, c->input_list("indices", &indices_list));
+    OpInputList counts_list;
+    OP_REQUIRES_OK(c, c->input_list("counts", &counts_list));
+    OpOutputList out_list;
+    OP_REQUIRES_OK(c, c->output_list("outputs", &out_list));
+
+    std::vector<EmbeddingVar<TKey, TValue>*> evs(num_tables_, nullptr);
+    std::vector<std::unique_ptr<core::ScopedUnref>> unrefs;
+    std::vector<EpochGuard> guards;
+    guards.reserve(num_tables_);
+    std::vector<TValue*> out_bases(num_tables_, nullptr);
+    // offsets[i] is the position of the first id of table i in the
+    // concatenation of all the indices, so that a single Shard covers
+    // every table.
+    std::vector<int64> offsets(num_tables_ + 1, 0);
+    int64 max_value_len = 0;
+    for (int i = 0; i < num_tables_; ++i) {
+      OP_REQUIRES_OK(c, LookupResource(c, HandleFromInput(c, i), &evs[i]));
+      unrefs.emplace_back(new core::ScopedUnref(evs[i]));
+      guards.push_back(evs[i]->GuardValuePtrs());
+      const Tensor& indices = indices_list[i];
+      OP_REQUIRES(c, counts_list[i].NumElements() == indices.NumElements(),
+          errors::InvalidArgument(
+              "counts[", i, "] should have the same size as indices[", i,
+              "]: ", counts_list[i].NumElements(), " vs ",
+              indices.NumElements()));
+      TensorShape result_shape = indices.shape();
+      result_shape.AddDim(evs[i]->ValueLen());
+      Tensor* out = nullptr;
+      OP_REQUIRES_OK(c, out_list.allocate(i, result_shape, &out));
+      out_bases[i] = out->flat<TValue>().data();
+      offsets[i + 1] = offsets[i] + indices.NumElements();
+      max_value_len = std::max(max_value_len, evs[i]->ValueLen());
+    }
+    const int64 total_size = offsets[num_tables_];
+    if (total_size == 0) {
+      return;
+    }
+
+    auto do_work = [&evs, &indices_list, &counts_list, &out_bases,
+                    &offsets] (int64 start, int64 limit) {
+      int table = std::upper_bound(offsets.begin(), offsets.end(), start) -
+                  offsets.begin() - 1;
+      for (int64 i = start; i < limit; ++i) {
+        while (i >= offsets[table + 1]) {
+          ++table;
+        }
+        EmbeddingVar<TKey, TValue>* ev = evs[table];
+        const int64 j = i - offsets[table];
+        const TKey key = indices_list[table].flat<TKey>()(j);
+        TValue* default_v = ev->GetDefaultValuePtr() +
+            (key % ev->GetDefaultValueDim()) * ev->ValueLen();
+        ev->LookupOrCreate(key, out_bases[table] + j * ev->ValueLen(),
+            default_v, counts_list[table].flat<int32>()(j));
+      }
+    };
+    auto worker_threads = c->device()->tensorflow_cpu_worker_threads();
+    Shard(worker_threads->num_threads, worker_threads->workers, total_size,
+        max_value_len * sizeof(TValue), do_work);
+
+    for (int i = 0; i < num_tables_; ++i) {
+      const int64 size = indices_list[i].NumElements();
+      if (size > 0) {
+        evs[i]->UpdateCache(indices_list[i].flat<TKey>().data(), size);
+      }
+    }
+  }
+
+ private:
+  int num_tables_;
+};
+
+#define REGISTER_GROUP_GATHER_FULL(dev, ktype, vtype)             \
+  REGISTER_KERNEL_BUILDER(Name("KvResourceGroupGather")           \
+                              .Device(DEVICE_##dev)               \
+                              .HostMemory("resources")            \
+                              .HostMemory("indices")              \
+                              .HostMemory("counts")               \
+                              .HostMemory("outputs")              \
+                              .TypeConstraint<vtype>("dtype")     \
+                              .TypeConstraint<ktype>("Tkeys"),    \
+                          KvResourceGroupGatherOp<ktype, vtype>)
+
+#define REGISTER_GROUP_GATHER_ALL_INDICES(dev, type) \
+  REGISTER_GROUP_GATHER_FULL(dev, int32, type);      \
+  REGISTER_GROUP_GATHER_FULL(dev, int64, type)
+
+#define REGISTER_GROUP_GATHER_CPU(type) \
+  REGISTER_GROUP_GATHER_ALL_INDICES(CPU, type)
+
+TF_CALL_float(REGISTER_GROUP_GATHER_CPU);
+TF_CALL_double(REGISTER_GROUP_GATHER_CPU);
+
+#undef REGISTER_GROUP_GATHER_CPU
+#undef REGISTER_GROUP_GATHER_ALL_INDICES
+#undef REGISTER_GROUP_GATHER_FULL
 /*
 // Op that outputs tensors of all keys and all values.
 template <typename TKey, typename TValue>
@@ -611,6 +745,11 @@ class KvResourceImportV2Op: public OpKernel {
     storage_type_ = static_cast<embedding::StorageType>(storage_type);
 
     OP_REQUIRES_OK(c, c->GetAttr("storage_path", &storage_path_));
+    OP_REQUIRES_OK(c, c->GetAttr("storage_size", &storage_size_));
+    OP_REQUIRES_OK(c, c->GetAttr("max_keys", &max_keys_));
+    OP_REQUIRES_OK(c, c->GetAttr("evict_policy", &evict_policy_));
+    OP_REQUIRES_OK(c, c->GetAttr("storage_dtype", &storage_dtype_));
+    OP_REQUIRES_OK(c, c->GetAttr("slot_storage_dtype", &slot_storage_dtype_));
   }
 
   void Compute(OpKernelContext* context) override {
@@ -650,7 +789,9 @@ class KvResourceImportV2Op: public OpKernel {
                                          steps_to_live_, filter_freq_,
                                          max_freq_, l2_weight_threshold_,
                                          layout_,  max_element_size_, false_positive_probability_,
-                                         counter_type_, storage_type_, storage_path_, default_value_dim_));
+                                         counter_type_, storage_type_, storage_path_, default_value_dim_,
+                                         storage_size_, max_keys_, evict_policy_,
+                                         storage_dtype_, slot_storage_dtype_));
              return (*ptr)->Init(default_values, default_value_dim_);
             }));
     } else {
@@ -671,7 +812,10 @@ class KvResourceImportV2Op: public OpKernel {
                                         steps_to_live_, filter_freq_,
                                         max_freq_, l2_weight_threshold_,
                                         layout_,  max_element_size_, false_positive_probability_,
-                                        counter_type_, storage_type_, storage_path_));
+                                        counter_type_, storage_type_, storage_path_,
+                                        default_value_dim_, storage_size_,
+                                        max_keys_, evict_policy_,
+                                        storage_dtype_, slot_storage_dtype_));
             return (*ptr)->Init();
            }));
 
@@ -686,7 +830,10 @@ class KvResourceImportV2Op: public OpKernel {
                          EmbeddingConfig(emb_index_ + block_num_ * slot_index_, emb_index_,
                                          block_num_, slotnum, opname,
                                          steps_to_live_, 0, max_freq_, l2_weight_threshold_,
-                                         layout_, 0, -1.0, counter_type_, storage_type_, storage_path_, default_value_dim_));
+                                         layout_, 0, -1.0, counter_type_, storage_type_, storage_path_, default_value_dim_,
+                                         storage_size_, max_keys_, evict_policy_,
+                                         storage_dtype_, slot_storage_dtype_));
+             (*ptr)->SetEpochManager(primary_variable->epoch_manager());
              return (*ptr)->Init(default_values, default_value_dim_);
             }));
       primary_variable->SetSlotNum(slotnum);
@@ -694,6 +841,26 @@ class KvResourceImportV2Op: public OpKernel {
     }
     core::ScopedUnref unref_me(ev);
 
+    if (embedding::StorageType::MMAP == storage_type_) {
+      // One table per checkpoint and partition, shared by every process
+      // restoring it on this host.
+      std::string table_name = strings::StrCat(
+          str_util::StringReplace(name_string, "/", "_", true), "-",
+          partition_id_, "-", partition_num_, "-",
+          Hash64(file_name_string));
+      OP_REQUIRES_OK(context, ev->ImportMmap(
+          io::JoinPath(storage_path_, table_name),
+          [this, ev, name_string, file_name_string, context] () {
+            BundleReader reader(Env::Default(), file_name_string);
+            TF_RETURN_IF_ERROR(reader.status());
+            return EVRestoreDynamically(ev, name_string, partition_id_,
+                partition_num_, context, &reader, "-partition_offset",
+                "-keys", "-values", "-versions", "-freqs");
+          }));
+      ev->SetInitialized();
+      return;
+    }
+
     BundleReader reader(Env::Default(), file_name_string);
     OP_REQUIRES_OK(context, reader.status());
 
@@ -724,7 +891,12 @@ class KvResourceImportV2Op: public OpKernel {
   int64 max_freq_;
   embedding::StorageType storage_type_;
   std::string storage_path_;
+  std::vector<int64> storage_size_;
   int64 default_value_dim_;
+  int64 max_keys_;
+  std::string evict_policy_;
+  DataType storage_dtype_;
+  DataType slot_storage_dtype_;
 };
 
 #define REGISTER_KERNELS(ktype, vtype)                         \
@@ -818,6 +990,7 @@ class KvResourceExportOp : public OpKernel {
     EmbeddingVar<TKey, TValue> *ev = nullptr;
     OP_REQUIRES_OK(ctx, LookupResource(ctx, HandleFromInput(ctx, 0), &ev));
     core::ScopedUnref unref_me(ev);
+    auto guard = ev->GuardValuePtrs();
     std::vector<TKey> tot_key_list;
     std::vector<TValue *> tot_valueptr_list;
     std::vector<int64> tot_version_list;
@@ -875,6 +1048,116 @@ REGISTER_KERNELS_ALL_INDEX(float);
 #undef REGISTER_KERNELS_ALL_INDEX
 #undef REGISTER_KERNELS
 
+template <typename TKey, typename TValue>
+class KvResourceStatisticsOp : public OpKernel {
+ public:
+  explicit KvResourceStatisticsOp(OpKernelConstruction* c) : OpKernel(c) {
+    OP_REQUIRES_OK(c, c->GetAttr("top_k", &top_k_));
+    OP_REQUIRES_OK(c, c->GetAttr("num_buckets", &num_buckets_));
+    OP_REQUIRES(c, top_k_ >= 0,
+        errors::InvalidArgument("top_k must >= 0, ", top_k_));
+    OP_REQUIRES(c, num_buckets_ > 0,
+        errors::InvalidArgument("num_buckets must > 0, ", num_buckets_));
+  }
+
+  void Compute(OpKernelContext* ctx) override {
+    EmbeddingVar<TKey, TValue>* ev = nullptr;
+    OP_REQUIRES_OK(ctx, LookupResource(ctx, HandleFromInput(ctx, 0), &ev));
+    core::ScopedUnref unref_me(ev);
+    const int64 global_step = ctx->input(1).scalar<int64>()();
+
+    std::vector<int64> freq_histogram;
+    std::vector<int64> age_histogram;
+    std::vector<std::pair<int64, TKey>> top_keys;
+    ev->GetStatistics(global_step, num_buckets_, top_k_,
+                      &freq_histogram, &age_histogram, &top_keys);
+
+    Tensor* output = nullptr;
+    OP_REQUIRES_OK(ctx, ctx->allocate_output(0, TensorShape({}), &output));
+    output->scalar<int64>()() = ev->Size();
+    OP_REQUIRES_OK(ctx, ctx->allocate_output(1, TensorShape({}), &output));
+    output->scalar<int64>()() = ev->MemoryBytes();
+    OutputVector(ctx, 2, freq_histogram);
+    OutputVector(ctx, 5, age_histogram);
+
+    const int64 k = top_keys.size();
+    Tensor* keys_output = nullptr;
+    Tensor* freqs_output = nullptr;
+    OP_REQUIRES_OK(ctx, ctx->allocate_output(3, TensorShape({k}),
+                                             &keys_output));
+    OP_REQUIRES_OK(ctx, ctx->allocate_output(4, TensorShape({k}),
+                                             &freqs_output));
+    auto keys_flat = keys_output->flat<TKey>();
+    auto freqs_flat = freqs_output->flat<int64>();
+    for (int64 i = 0; i < k; ++i) {
+      freqs_flat(i) = top_keys[i].first;
+      keys_flat(i) = top_keys[i].second;
+    }
+  }
+
+ private:
+  void OutputVector(OpKernelContext* ctx, int index,
+                    const std::vector<int64>& vec) {
+    Tensor* output = nullptr;
+    OP_REQUIRES_OK(ctx, ctx->allocate_output(index,
+        TensorShape({static_cast<int64>(vec.size())}), &output));
+    std::copy(vec.begin(), vec.end(), output->flat<int64>().data());
+  }
+
+  int64 top_k_;
+  int64 num_buckets_;
+};
+
+#define REGISTER_KERNELS(ktype, vtype)                         \
+  REGISTER_KERNEL_BUILDER(Name("KvResourceStatistics")         \
+                            .Device(DEVICE_CPU)                \
+                            .TypeConstraint<ktype>("Tkeys")    \
+                            .TypeConstraint<vtype>("dtype"),   \
+                          KvResourceStatisticsOp<ktype, vtype>);
+#define REGISTER_KERNELS_ALL_INDEX(type)                       \
+  REGISTER_KERNELS(int32, type)                                \
+  REGISTER_KERNELS(int64, type)
+
+REGISTER_KERNELS_ALL_INDEX(float);
+
+#undef REGISTER_KERNELS_ALL_INDEX
+#undef REGISTER_KERNELS
+
+template <typename TKey, typename TValue>
+class KvResourceFilterDecayOp : public OpKernel {
+ public:
+  explicit KvResourceFilterDecayOp(OpKernelConstruction* c) : OpKernel(c) {
+    OP_REQUIRES_OK(c, c->GetAttr("decay_steps", &decay_steps_));
+  }
+
+  void Compute(OpKernelContext* ctx) override {
+    EmbeddingVar<TKey, TValue>* ev = nullptr;
+    OP_REQUIRES_OK(ctx, LookupResource(ctx, HandleFromInput(ctx, 0), &ev));
+    core::ScopedUnref unref_me(ev);
+    const int64 global_step = ctx->input(1).scalar<int64>()();
+    ev->GetFilter()->Decay(global_step / decay_steps_,
+        ctx->device()->tensorflow_cpu_worker_threads()->workers);
+  }
+
+ private:
+  int64 decay_steps_;
+};
+
+#define REGISTER_KERNELS(ktype, vtype)                         \
+  REGISTER_KERNEL_BUILDER(Name("KvResourceFilterDecay")        \
+                            .Device(DEVICE_CPU)                \
+                            .TypeConstraint<ktype>("Tkeys")    \
+                            .TypeConstraint<vtype>("dtype"),   \
+                          KvResourceFilterDecayOp<ktype, vtype>);
+#define REGISTER_KERNELS_ALL_INDEX(type)                       \
+  REGISTER_KERNELS(int32, type)                                \
+  REGISTER_KERNELS(int64, type)
+
+REGISTER_KERNELS_ALL_INDEX(float);
+
+#undef REGISTER_KERNELS_ALL_INDEX
+#undef REGISTER_KERNELS
+
 /*
 // Op that outputs tensors of all keys and all values.
 template <typename T, typename TIndex>
@@ -909,5 +1192,213 @@ TF_CALL_QUANTIZED_TYPES(REGISTER_KERNELS_ALL_INDEX);
 #undef REGISTER_KERNELS_ALL_INDEX
 #undef REGISTER_KERNELS
 */
-}  // namespace tensorflow
 
+#define REGISTER_KV_HOT_CACHE_HANDLE(ktype, vtype)                     \
+  REGISTER_KERNEL_BUILDER(Name("KvHotCacheHandleOp")                   \
+                          .Device(DEVICE_CPU)                          \
+                          .TypeConstraint<ktype>("Tkeys")              \
+                          .TypeConstraint<vtype>("dtype"),             \
+                          ResourceHandleOp<HotKeyCache<ktype, vtype>>);
+REGISTER_KV_HOT_CACHE_HANDLE(int32, float)
+REGISTER_KV_HOT_CACHE_HANDLE(int64, float)
+#undef REGISTER_KV_HOT_CACHE_HANDLE
+
+template <typename TKey, typename TValue>
+class KvHotCacheCreateOp : public OpKernel {
+ public:
+  explicit KvHotCacheCreateOp(OpKernelConstruction* c) : OpKernel(c) {
+    OP_REQUIRES_OK(c, c->GetAttr("capacity", &capacity_));
+    OP_REQUIRES_OK(c, c->GetAttr("value_len", &value_len_));
+    OP_REQUIRES_OK(c, c->GetAttr("max_staleness", &max_staleness_));
+    OP_REQUIRES(c, capacity_ > 0,
+        errors::InvalidArgument("capacity must > 0, ", capacity_));
+    OP_REQUIRES(c, max_staleness_ >= 0,
+        errors::InvalidArgument("max_staleness must >= 0, ", max_staleness_));
+  }
+
+  void Compute(OpKernelContext* ctx) override {
+    auto cache = new HotKeyCache<TKey, TValue>(
+        capacity_, value_len_, max_staleness_);
+    Status s = CreateResource(ctx, HandleFromInput(ctx, 0), cache);
+    if (!s.ok() && s.code() != error::ALREADY_EXISTS) {
+      OP_REQUIRES(ctx, false, s);
+    }
+  }
+
+ private:
+  int64 capacity_;
+  int64 value_len_;
+  int64 max_staleness_;
+};
+
+template <typename TKey, typename TValue>
+class KvHotCacheIsInitializedOp : public OpKernel {
+ public:
+  explicit KvHotCacheIsInitializedOp(OpKernelConstruction* c) : OpKernel(c) {}
+
+  void Compute(OpKernelContext* ctx) override {
+    Tensor* output = nullptr;
+    OP_REQUIRES_OK(ctx, ctx->allocate_output(0, TensorShape({}), &output));
+    HotKeyCache<TKey, TValue>* cache = nullptr;
+    bool found = LookupResource(ctx, HandleFromInput(ctx, 0), &cache).ok();
+    if (found) {
+      cache->Unref();
+    }
+    output->flat<bool>()(0) = found;
+  }
+};
+
+template <typename TKey, typename TValue>
+class KvHotCacheLookupOp : public OpKernel {
+ public:
+  explicit KvHotCacheLookupOp(OpKernelConstruction* c) : OpKernel(c) {}
+
+  void Compute(OpKernelContext* ctx) override {
+    HotKeyCache<TKey, TValue>* cache = nullptr;
+    OP_REQUIRES_OK(ctx, LookupResource(ctx, HandleFromInput(ctx, 0), &cache));
+    core::ScopedUnref unref_me(cache);
+    const Tensor& ids = ctx->input(1);
+    const int64 global_step = ctx->input(2).scalar<int64>()();
+    auto ids_flat = ids.flat<TKey>();
+
+    std::vector<int32> hit_pos;
+    std::vector<int32> miss_pos;
+    Tensor* hit_values = nullptr;
+    Status allocate_status;
+    cache->Lookup(ids_flat.data(), ids_flat.size(), global_step,
+        &hit_pos, &miss_pos,
+        [ctx, cache, &hit_values, &allocate_status] (int64 num_hits) {
+          allocate_status = ctx->allocate_output(1,
+              TensorShape({num_hits, cache->ValueLen()}), &hit_values);
+          return allocate_status.ok() ?
+              hit_values->flat<TValue>().data() : nullptr;
+        });
+    OP_REQUIRES_OK(ctx, allocate_status);
+    OP_REQUIRES_OK(ctx, OutputPositions(ctx, 0, hit_pos));
+    OP_REQUIRES_OK(ctx, OutputPositions(ctx, 2, miss_pos));
+  }
+
+ private:
+  Status OutputPositions(OpKernelContext* ctx, int index,
+                         const std::vector<int32>& pos) {
+    Tensor* output = nullptr;
+    TF_RETURN_IF_ERROR(ctx->allocate_output(index,
+        TensorShape({static_cast<int64>(pos.size())}), &output));
+    std::copy(pos.begin(), pos.end(), output->flat<int32>().data());
+    return Status::OK();
+  }
+};
+
+template <typename TKey, typename TValue>
+class KvHotCacheHotKeysOp : public OpKernel {
+ public:
+  explicit KvHotCacheHotKeysOp(OpKernelConstruction* c) : OpKernel(c) {}
+
+  void Compute(OpKernelContext* ctx) override {
+    HotKeyCache<TKey, TValue>* cache = nullptr;
+    OP_REQUIRES_OK(ctx, LookupResource(ctx, HandleFromInput(ctx, 0), &cache));
+    core::ScopedUnref unref_me(cache);
+    std::vector<TKey> keys;
+    cache->HotKeys(&keys);
+    Tensor* output = nullptr;
+    OP_REQUIRES_OK(ctx, ctx->allocate_output(0,
+        TensorShape({static_cast<int64>(keys.size())}), &output));
+    std::copy(keys.begin(), keys.end(), output->flat<TKey>().data());
+  }
+};
+
+template <typename TKey, typename TValue>
+class KvHotCacheUpdateOp : public OpKernel {
+ public:
+  explicit KvHotCacheUpdateOp(OpKernelConstruction* c) : OpKernel(c) {}
+
+  void Compute(OpKernelContext* ctx) override {
+    HotKeyCache<TKey, TValue>* cache = nullptr;
+    OP_REQUIRES_OK(ctx, LookupResource(ctx, HandleFromInput(ctx, 0), &cache));
+    core::ScopedUnref unref_me(cache);
+    const Tensor& ids = ctx->input(1);
+    const Tensor& values = ctx->input(2);
+    const int64 global_step = ctx->input(3).scalar<int64>()();
+    const int64 num = ids.NumElements();
+    OP_REQUIRES(ctx, values.NumElements() == num * cache->ValueLen(),
+        errors::InvalidArgument(
+            "values should have ", num * cache->ValueLen(),
+            " elements, got ", values.NumElements()));
+    cache->Update(ids.flat<TKey>().data(), values.flat<TValue>().data(),
+                  num, global_step);
+  }
+};
+
+template <typename TKey, typename TValue>
+class KvHotCacheStatsOp : public OpKernel {
+ public:
+  explicit KvHotCacheStatsOp(OpKernelConstruction* c) : OpKernel(c) {}
+
+  void Compute(OpKernelContext* ctx) override {
+    HotKeyCache<TKey, TValue>* cache = nullptr;
+    OP_REQUIRES_OK(ctx, LookupResource(ctx, HandleFromInput(ctx, 0), &cache));
+    core::ScopedUnref unref_me(cache);
+    int64 stats[] = {cache->Hits(), cache->Misses(),
+                     cache->Size(), cache->Version()};
+    for (int i = 0; i < 4; ++i) {
+      Tensor* output = nullptr;
+      OP_REQUIRES_OK(ctx, ctx->allocate_output(i, TensorShape({}), &output));
+      output->scalar<int64>()() = stats[i];
+    }
+  }
+};
+
+// The cached rows are already on the worker, only the gradient needs the
+// variable handle.
+class KvResourceCachedGatherOp : public OpKernel {
+ public:
+  explicit KvResourceCachedGatherOp(OpKernelConstruction* c) : OpKernel(c) {}
+
+  void Compute(OpKernelContext* ctx) override {
+    ctx->set_output(0, ctx->input(2));
+  }
+};
+
+REGISTER_INPUT_COLOCATION_EXEMPTION("KvResourceCachedGather");
+
+#define REGISTER_KERNELS(ktype, vtype)                                \
+  REGISTER_KERNEL_BUILDER(Name("KvHotCacheCreate")                    \
+                          .Device(DEVICE_CPU)                         \
+                          .TypeConstraint<ktype>("Tkeys")             \
+                          .TypeConstraint<vtype>("dtype"),            \
+                          KvHotCacheCreateOp<ktype, vtype>);          \
+  REGISTER_KERNEL_BUILDER(Name("KvHotCacheIsInitialized")             \
+                          .Device(DEVICE_CPU)                         \
+                          .TypeConstraint<ktype>("Tkeys")             \
+                          .TypeConstraint<vtype>("dtype"),            \
+                          KvHotCacheIsInitializedOp<ktype, vtype>);   \
+  REGISTER_KERNEL_BUILDER(Name("KvHotCacheLookup")                    \
+                          .Device(DEVICE_CPU)                         \
+                          .TypeConstraint<ktype>("Tkeys")             \
+                          .TypeConstraint<vtype>("dtype"),            \
+                          KvHotCacheLookupOp<ktype, vtype>);          \
+  REGISTER_KERNEL_BUILDER(Name("KvHotCacheHotKeys")                   \
+                          .Device(DEVICE_CPU)                         \
+                          .TypeConstraint<ktype>("Tkeys")             \
+                          .TypeConstraint<vtype>("dtype"),            \
+                          KvHotCacheHotKeysOp<ktype, vtype>);         \
+  REGISTER_KERNEL_BUILDER(Name("KvHotCacheUpdate")                    \
+                          .Device(DEVICE_CPU)                         \
+                          .TypeConstraint<ktype>("Tkeys")             \
+                          .TypeConstraint<vtype>("dtype"),            \
+                          KvHotCacheUpdateOp<ktype, vtype>);          \
+  REGISTER_KERNEL_BUILDER(Name("KvHotCacheStats")                     \
+                          .Device(DEVICE_CPU)                         \
+                          .TypeConstraint<ktype>("Tkeys")             \
+                          .TypeConstraint<vtype>("dtype"),            \
+                          KvHotCacheStatsOp<ktype, vtype>);           \
+  REGISTER_KERNEL_BUILDER(Name("KvResourceCachedGather")              \
+                          .Device(DEVICE_CPU)                         \
+                          .TypeConstraint<ktype>("Tkeys")             \
+                          .TypeConstraint<vtype>("dtype"),            \
+                          KvResourceCachedGatherOp);
+REGISTER_KERNELS(int32, float)
+REGISTER_KERNELS(int64, float)
+#undef REGISTER_KERNELS
+
+}  // namespace tensorflow
@@ -16,6 +16,8 @@ limitations under the License.
 #ifndef TENSORFLOW_KERNELS_KV_VARIABLE_OPS_H_
 #define TENSORFLOW_KERNELS_KV_VARIABLE_OPS_H_
 
+#include <atomic>
+
 #include "tensorflow/core/framework/allocator.h"
 #include "tensorflow/core/framework/bounds_check.h"
 #include "tensorflow/core/framework/embedding/embedding_var.h"
@@ -25,6 +27,8 @@ limitations under the License.
 #include "tensorflow/core/framework/register_types.h"
 #include "tensorflow/core/framework/resource_mgr.h"
 #include "tensorflow/core/lib/core/errors.h"
+#include "tensorflow/core/lib/core/notification.h"
+#include "tensorflow/core/lib/core/threadpool.h"
 #include "tensorflow/core/platform/macros.h"
 #include "tensorflow/core/platform/mutex.h"
 #include "tensorflow/core/platform/types.h"
@@ -145,123 +149,228 @@ Status GetInputEmbeddingVar(OpKernelContext* ctx, int input,
   }
 }
 
+// Writes `num_rows` rows of `row_len` elements as the tensor `tensor_name`.
+// `fill_fn(start, end, out)` copies rows [start, end) to `out`. Chunks of at
+// most `bytes_limit` are filled in parallel on `pool`, and each chunk is
+// appended to the bundle while the next one is being filled.
+template <class T>
+Status SaveRowsWithFixedBuffer(const string& tensor_name, BundleWriter* writer,
+    size_t bytes_limit, int64 num_rows, int64 row_len,
+    const TensorShape& dump_tensor_shape,
+    const std::function<void(int64, int64, T*)>& fill_fn,
+    thread::ThreadPool* pool) {
+  TF_RETURN_IF_ERROR(writer->AddTensorHeader(tensor_name,
+      DataTypeToEnum<T>::v(), dump_tensor_shape));
+  const int64 row_bytes = std::max(row_len, (int64)1) * sizeof(T);
+  const int64 rows_per_chunk = std::max((int64)(bytes_limit / row_bytes),
+                                        (int64)1);
+  const int64 num_chunks = std::max(
+      (num_rows + rows_per_chunk - 1) / rows_per_chunk, (int64)1);
+  std::unique_ptr<char[]> buffers[2];
+  buffers[0].reset(new char[rows_per_chunk * row_bytes]);
+  if (num_chunks > 1) {
+    buffers[1].reset(new char[rows_per_chunk * row_bytes]);
+  }
+
+  Status write_status;
+  std::unique_ptr<Notification> write_done;
+  int64 total_bytes = 0;
+  int64 chunk_bytes = 0;
+  for (int64 c = 0; c < num_chunks; ++c) {
+    const int64 start = c * rows_per_chunk;
+    const int64 end = std::min(start + rows_per_chunk, num_rows);
+    T* out = (T*)buffers[c % 2].get();
+    if (pool != nullptr) {
+      pool->ParallelFor(end - start, row_len * sizeof(T),
+          [start, out, row_len, &fill_fn] (int64 s, int64 e) {
+            fill_fn(start + s, start + e, out + s * row_len);
+          });
+    } else {
+      fill_fn(start, end, out);
+    }
+    chunk_bytes = (end - start) * row_len * sizeof(T);
+    total_bytes += chunk_bytes;
+    if (num_chunks == 1) {
+      return writer->AddCompeleteData((char*)out, chunk_bytes);
+    }
+    // Appends are sequential, wait for the previous chunk first.
+    if (write_done != nullptr) {
+      write_done->WaitForNotification();
+      TF_RETURN_IF_ERROR(write_status);
+    }
+    write_done.reset(new Notification());
+    Notification* done = write_done.get();
+    auto write_fn = [writer, out, chunk_bytes, done, &write_status] () {
+      write_status = writer->AppendSegmentData((char*)out, chunk_bytes);
+      done->Notify();
+    };
+    if (pool != nullptr && c + 1 < num_chunks) {
+      pool->Schedule(write_fn);
+    } else {
+      write_fn();
+    }
+  }
+  write_done->WaitForNotification();
+  TF_RETURN_IF_ERROR(write_status);
+  writer->EndSegmentData(total_bytes, chunk_bytes);
+  return Status::OK();
+}
+
+template <class T>
+Status SaveFilterCounters(const string& tensor_name, BundleWriter* writer,
+                          const void* counters, int64 num_counters,
+                          thread::ThreadPool* pool) {
+  const T* src = (const T*)counters;
+  return SaveRowsWithFixedBuffer<T>(
+      tensor_name, writer, 8 << 20, num_counters, 1,
+      TensorShape({num_counters}),
+      [src] (int64 start, int64 end, T* out) {
+        memcpy(out, src + start, (end - start) * sizeof(T));
+      }, pool);
+}
+
+// Saves the counters of the counting filter of a primary EV, in their own
+// type, so that the admission goes on after a restore.
 template <class K, class V>
-Status DumpEmbeddingValues(EmbeddingVar<K, V>* ev, const string& tensor_key, BundleWriter* writer, Tensor* part_offset_tensor) {
+Status DumpFilterCounters(EmbeddingVar<K, V>* ev, const string& tensor_key,
+                          BundleWriter* writer, thread::ThreadPool* pool) {
+  auto filter = ev->GetFilter();
+  const int64 num_counters = filter->NumCounters();
+  if (!ev->IsPrimary() || num_counters == 0) {
+    return Status::OK();
+  }
+  const string tensor_name = tensor_key + "-filter_counters";
+  switch (filter->CounterType()) {
+    case DT_UINT8:
+      return SaveFilterCounters<uint8>(tensor_name, writer,
+          filter->Counters(), num_counters, pool);
+    case DT_UINT16:
+      return SaveFilterCounters<uint16>(tensor_name, writer,
+          filter->Counters(), num_counters, pool);
+    case DT_UINT32:
+      return SaveFilterCounters<uint32>(tensor_name, writer,
+          filter->Counters(), num_counters, pool);
+    default:
+      return SaveFilterCounters<uint64>(tensor_name, writer,
+          filter->Counters(), num_counters, pool);
+  }
+}
+
+// Saves the EV as kSavedPartitionNum pieces ordered by `key %
+// kSavedPartitionNum`, so that it can be restored with another partition
+// number. The rows are streamed from the EV in chunks instead of being
+// copied as a whole; sorting and copying run on `pool` if it is set.
+template <class K, class V>
+Status DumpEmbeddingValues(EmbeddingVar<K, V>* ev, const string& tensor_key,
+                           BundleWriter* writer, Tensor* part_offset_tensor,
+                           thread::ThreadPool* pool = nullptr) {
   std::vector<K> tot_key_list;
   std::vector<V* > tot_valueptr_list;
   std::vector<int64> tot_version_list;
   std::vector<int64> tot_freq_list;
+  auto guard = ev->GuardValuePtrs();
   int64 total_size = ev->GetSnapshot(&tot_key_list, &tot_valueptr_list, &tot_version_list, &tot_freq_list);
   VLOG(1) << "EV:" << tensor_key << ", save size:" << total_size;
 
-  std::vector<std::vector<K> > key_list_parts;
-  std::vector<std::vector<V* > > valueptr_list_parts;
-  std::vector<std::vector<int64 > > version_list_parts;
-  std::vector<std::vector<int64 > > freq_list_parts;
-
-  std::vector<K> partitioned_tot_key_list;
-  std::vector<V* > partitioned_tot_valueptr_list;
-  std::vector<int64> partitioned_tot_version_list;
-  std::vector<int64> partitioned_tot_freq_list;
-
-  key_list_parts.resize(kSavedPartitionNum);
-  valueptr_list_parts.resize(kSavedPartitionNum);
-  version_list_parts.resize(kSavedPartitionNum);
-  freq_list_parts.resize(kSavedPartitionNum);
-  //partitioned_tot_key_list.resize(tot_key_list.size());
-  //partitioned_tot_valueptr_list.resize(tot_valueptr_list.size());
-
-  // save the ev with kSavedPartitionNum piece of tensor so that we can dynamically load ev with changed partition number
-  for (size_t i = 0; i < tot_key_list.size(); i++) {
-    for (int partid = 0; partid < kSavedPartitionNum; partid++) {
-      if (tot_key_list[i] % kSavedPartitionNum == partid) {
-        key_list_parts[partid].push_back(tot_key_list[i]);
-        valueptr_list_parts[partid].push_back(tot_valueptr_list[i]);
-        break;
-      }
-    }
+  // Stable counting sort of the keys by piece: every shard counts its keys
+  // per piece, then scatters them after the keys of the preceding shards.
+  // Keys with a negative piece are not saved.
+  const int64 kMinShardSize = 1 << 16;
+  int64 num_shards = 1;
+  if (pool != nullptr) {
+    num_shards = std::max(std::min((int64)pool->NumThreads(),
+                                   total_size / kMinShardSize), (int64)1);
   }
-  for (size_t i = 0; i < tot_version_list.size(); i++) {
-    for (int partid = 0; partid < kSavedPartitionNum; partid++) {
-      if (tot_key_list[i] % kSavedPartitionNum == partid) {
-        version_list_parts[partid].push_back(tot_version_list[i]);
-        break;
-      }
+  const int64 shard_size = (total_size + num_shards - 1) / num_shards;
+  std::vector<std::vector<int64>> shard_counts(num_shards,
+      std::vector<int64>(kSavedPartitionNum, 0));
+  auto run_shards = [pool, num_shards] (
+      const std::function<void(int64, int64)>& fn) {
+    if (pool != nullptr && num_shards > 1) {
+      // One unit of work per shard.
+      pool->ParallelFor(num_shards, kint64max / num_shards, fn);
+    } else {
+      fn(0, num_shards);
     }
-  }
-  for (size_t i = 0; i < tot_freq_list.size(); i++) {
-    for (int partid = 0; partid < kSavedPartitionNum; partid++) {
-      if (tot_key_list[i] % kSavedPartitionNum == partid) {
-        freq_list_parts[partid].push_back(tot_freq_list[i]);
-        break;
+  };
+  run_shards([&] (int64 first, int64 last) {
+    for (int64 s = first; s < last; ++s) {
+      int64 end = std::min((s + 1) * shard_size, total_size);
+      for (int64 i = s * shard_size; i < end; ++i) {
+        int64 partid = tot_key_list[i] % kSavedPartitionNum;
+        if (partid >= 0) {
+          shard_counts[s][partid]++;
+        }
       }
     }
-  }
-  // LOG(INFO) << "EV:" << tensor_key << ", key_list_parts:" << key_list_parts.size();
+  });
 
   auto part_offset_flat = part_offset_tensor->flat<int32>();
   part_offset_flat(0) = 0;
-  int ptsize = 0;
+  int64 offset = 0;
   for (int partid = 0; partid < kSavedPartitionNum; partid++) {
-    std::vector<K>& key_list = key_list_parts[partid];
-    std::vector<V* >& valueptr_list = valueptr_list_parts[partid];
-    std::vector<int64>& version_list = version_list_parts[partid];
-    std::vector<int64>& freq_list = freq_list_parts[partid];
-
-    ptsize += key_list.size();
-    for (int inpid = 0; inpid < key_list.size(); inpid++) {
-      partitioned_tot_key_list.push_back(key_list[inpid]);
-      partitioned_tot_valueptr_list.push_back(valueptr_list[inpid]);
-    }
-    for (int inpid = 0; inpid < version_list.size(); inpid++) {
-      partitioned_tot_version_list.push_back(version_list[inpid]);
+    for (int64 s = 0; s < num_shards; ++s) {
+      int64 count = shard_counts[s][partid];
+      shard_counts[s][partid] = offset;
+      offset += count;
     }
-    for (int inpid = 0; inpid < freq_list.size(); inpid++) {
-      partitioned_tot_freq_list.push_back(freq_list[inpid]);
-    }
-
-    part_offset_flat(partid + 1) = part_offset_flat(partid) + key_list.size();
+    part_offset_flat(partid + 1) = offset;
   }
+  const int64 ptsize = offset;
+  std::vector<int64> order(ptsize);
+  run_shards([&] (int64 first, int64 last) {
+    for (int64 s = first; s < last; ++s) {
+      int64 end = std::min((s + 1) * shard_size, total_size);
+      for (int64 i = s * shard_size; i < end; ++i) {
+        int64 partid = tot_key_list[i] % kSavedPartitionNum;
+        if (partid >= 0) {
+          order[shard_counts[s][partid]++] = i;
+        }
+      }
+    }
+  });
   writer->Add(tensor_key + "-partition_offset", *part_offset_tensor);
-
-
-  VLOG(1) << "EV before partition:" << tensor_key << ", keysize:" <<  tot_key_list.size() << ", valueptr size:" << tot_valueptr_list.size();
-  VLOG(1) << "EV after partition:" << tensor_key << ", ptsize:" << ptsize << ", keysize:" <<  partitioned_tot_key_list.size() << ", valueptr size:" << partitioned_tot_valueptr_list.size();
+  VLOG(1) << "EV after partition:" << tensor_key << ", ptsize:" << ptsize
+          << ", keysize:" << tot_key_list.size();
 
   size_t bytes_limit = 8 << 20;
-  char* dump_buffer = (char*)malloc(sizeof(char) * bytes_limit);
-  Status st;
-  EVKeyDumpIterator<K> ev_key_dump_iter(partitioned_tot_key_list);
-  st = SaveTensorWithFixedBuffer(tensor_key + "-keys", writer, dump_buffer, bytes_limit, &ev_key_dump_iter, TensorShape({partitioned_tot_key_list.size()}));
-  if (!st.ok()) {
-    free(dump_buffer);
-    return st;
-  }
-
-  EVValueDumpIterator<K, V> ev_value_dump_iter(ev, partitioned_tot_valueptr_list);
-  st = SaveTensorWithFixedBuffer(tensor_key + "-values", writer, dump_buffer, bytes_limit, &ev_value_dump_iter, TensorShape({partitioned_tot_key_list.size(), ev->ValueLen()}));
-  if (!st.ok()) {
-    free(dump_buffer);
-    return st;
-  }
-
-  EVVersionDumpIterator<int64> ev_version_dump_iter(partitioned_tot_version_list);
-  st = SaveTensorWithFixedBuffer(tensor_key + "-versions", writer, dump_buffer, bytes_limit, &ev_version_dump_iter, TensorShape({partitioned_tot_version_list.size()}));
-  if (!st.ok()) {
-    free(dump_buffer);
-    return st;
-  }
-
-  EVFreqDumpIterator<int64> ev_freq_dump_iter(partitioned_tot_freq_list);
-  st = SaveTensorWithFixedBuffer(tensor_key + "-freqs", writer, dump_buffer, bytes_limit, &ev_freq_dump_iter, TensorShape({partitioned_tot_freq_list.size()}));
-  if (!st.ok()) {
-    free(dump_buffer);
-    return st;
-  }
-
-  free(dump_buffer);
-
-  return Status::OK();
+  const int64 value_len = ev->ValueLen();
+  TF_RETURN_IF_ERROR(SaveRowsWithFixedBuffer<K>(
+      tensor_key + "-keys", writer, bytes_limit, ptsize, 1,
+      TensorShape({ptsize}),
+      [&order, &tot_key_list] (int64 start, int64 end, K* out) {
+        for (int64 i = start; i < end; ++i) {
+          out[i - start] = tot_key_list[order[i]];
+        }
+      }, pool));
+
+  TF_RETURN_IF_ERROR(SaveRowsWithFixedBuffer<V>(
+      tensor_key + "-values", writer, bytes_limit, ptsize, value_len,
+      TensorShape({ptsize, value_len}),
+      [&order, &tot_valueptr_list, value_len] (int64 start, int64 end,
+                                               V* out) {
+        for (int64 i = start; i < end; ++i) {
+          memcpy(out + (i - start) * value_len, tot_valueptr_list[order[i]],
+                 value_len * sizeof(V));
+        }
+      }, pool));
+
+  // Versions and freqs are only saved when the EV tracks them.
+  auto save_int64_list = [&] (const string& suffix,
+                              const std::vector<int64>& list) {
+    const int64 list_size = list.empty() ? 0 : ptsize;
+    return SaveRowsWithFixedBuffer<int64>(
+        tensor_key + suffix, writer, bytes_limit, list_size, 1,
+        TensorShape({list_size}),
+        [&order, &list] (int64 start, int64 end, int64* out) {
+          for (int64 i = start; i < end; ++i) {
+            out[i - start] = list[order[i]];
+          }
+        }, pool);
+  };
+  TF_RETURN_IF_ERROR(save_int64_list("-versions", tot_version_list));
+  TF_RETURN_IF_ERROR(save_int64_list("-freqs", tot_freq_list));
+  return DumpFilterCounters(ev, tensor_key, writer, pool);
 }
 
 template<typename K, typename V>
@@ -456,6 +565,208 @@ Status RestoreValue(EmbeddingVar<K, V>* ev, BundleReader* reader, std::string te
   return Status::OK();
 }
 
+// A saved EV tensor, read with positional reads so that the restore threads
+// can share it.
+struct EVSavedTensor {
+  std::unique_ptr<RandomAccessFile> file;
+  int64 offset = 0;
+  int64 size = 0;
+
+  Status Read(int64 pos, int64 bytes, char* dst) const {
+    StringPiece result;
+    TF_RETURN_IF_ERROR(file->Read(offset + pos, bytes, &result, dst));
+    if (result.size() != bytes) {
+      return errors::DataLoss("Requested ", bytes, " bytes but read ",
+                              result.size(), " bytes.");
+    }
+    if (result.data() != dst) {
+      memcpy(dst, result.data(), bytes);
+    }
+    return Status::OK();
+  }
+};
+
+// Keys, values, versions and freqs saved by one partition of an EV, see
+// DumpEmbeddingValues.
+struct EVSavedPart {
+  EVSavedTensor keys;
+  EVSavedTensor values;
+  EVSavedTensor versions;
+  EVSavedTensor freqs;
+  int64 value_len = 0;
+  std::vector<int32> part_offset;
+};
+
+// Imports the pieces `i % partition_num == partition_id` of every saved part
+// into `ev`. Only the keys of these pieces are read, each exactly once. The
+// reads are split in tasks of at most one buffer, run by up to NumThreads()
+// workers of `pool` with their own RestoreBuffer, which bounds the memory.
+template<typename K, typename V>
+Status EVRestoreSavedParts(EmbeddingVar<K, V>* ev,
+                           const std::vector<EVSavedPart>& parts,
+                           int partition_id, int partition_num,
+                           thread::ThreadPool* pool) {
+  struct Task {
+    int64 part;
+    int64 start;
+    int64 num;
+  };
+  const size_t buffer_size = 8 << 20;
+  std::vector<Task> tasks;
+  for (int64 p = 0; p < parts.size(); p++) {
+    const EVSavedPart& part = parts[p];
+    const int64 max_task_keys = std::min(
+        std::min(buffer_size / sizeof(K), buffer_size / sizeof(int64)),
+        buffer_size / (sizeof(V) * std::max(part.value_len, (int64)1)));
+    // Adjacent pieces are read together.
+    int64 start = 0;
+    int64 end = 0;
+    for (int i = partition_id; i < kSavedPartitionNum; i += partition_num) {
+      if (part.part_offset[i] != end) {
+        start = part.part_offset[i];
+      }
+      end = part.part_offset[i + 1];
+      bool last = i + partition_num >= kSavedPartitionNum ||
+                  part.part_offset[i + partition_num] != end;
+      for (; last && start < end; start += max_task_keys) {
+        tasks.push_back({p, start, std::min(max_task_keys, end - start)});
+      }
+    }
+  }
+
+  std::atomic<int64> next_task(0);
+  mutex mu;
+  Status status;
+  auto worker = [&] (int64 unused_begin, int64 unused_end) {
+    RestoreBuffer restore_buff;
+    restore_buff.key_buffer = new char[buffer_size];
+    restore_buff.value_buffer = new char[buffer_size];
+    restore_buff.version_buffer = new char[buffer_size];
+    restore_buff.freq_buffer = new char[buffer_size];
+    for (int64 t = next_task++; t < tasks.size(); t = next_task++) {
+      const Task& task = tasks[t];
+      const EVSavedPart& part = parts[task.part];
+      const int64 value_unit_bytes = sizeof(V) * part.value_len;
+      Status s = part.keys.Read(task.start * sizeof(K), task.num * sizeof(K),
+                                restore_buff.key_buffer);
+      if (s.ok()) {
+        s = part.values.Read(task.start * value_unit_bytes,
+                             task.num * value_unit_bytes,
+                             restore_buff.value_buffer);
+      }
+      if (s.ok() && part.versions.size > 0) {
+        s = part.versions.Read(task.start * sizeof(int64),
+                               task.num * sizeof(int64),
+                               restore_buff.version_buffer);
+      } else {
+        memset(restore_buff.version_buffer, -1, sizeof(int64) * task.num);
+      }
+      if (s.ok() && part.freqs.size > 0) {
+        s = part.freqs.Read(task.start * sizeof(int64),
+                            task.num * sizeof(int64),
+                            restore_buff.freq_buffer);
+      } else {
+        int64* freq_tmp = (int64*)restore_buff.freq_buffer;
+        for (int64 i = 0; i < task.num; i++) {
+          freq_tmp[i] = ev->MinFreq();
+        }
+      }
+      if (s.ok()) {
+        s = ev->Import(restore_buff, task.num, kSavedPartitionNum,
+                       partition_id, partition_num);
+      }
+      if (!s.ok()) {
+        mutex_lock l(mu);
+        status.Update(s);
+        next_task = tasks.size();
+      }
+    }
+  };
+  int64 num_workers = 1;
+  if (pool != nullptr) {
+    num_workers = std::min((int64)pool->NumThreads(), (int64)tasks.size());
+  }
+  if (num_workers > 1) {
+    // One unit of work per worker.
+    pool->ParallelFor(num_workers, kint64max / num_workers, worker);
+  } else {
+    worker(0, 1);
+  }
+  return status;
+}
+
+template <class T>
+Status MergeFilterCounters(const EVSavedTensor& saved, int64 num_counters,
+                           void* counters) {
+  T* dst = (T*)counters;
+  const int64 chunk = (8 << 20) / sizeof(T);
+  std::unique_ptr<T[]> buffer(new T[std::min(chunk, num_counters)]);
+  for (int64 start = 0; start < num_counters; start += chunk) {
+    const int64 num = std::min(chunk, num_counters - start);
+    TF_RETURN_IF_ERROR(saved.Read(start * sizeof(T), num * sizeof(T),
+                                  (char*)buffer.get()));
+    for (int64 i = 0; i < num; ++i) {
+      dst[start + i] = std::max(dst[start + i], buffer[i]);
+    }
+  }
+  return Status::OK();
+}
+
+// Restores the counters of the counting filter of a primary EV saved by
+// DumpFilterCounters as `tensor_names`. The saved counters of several
+// partitions are merged by their maximum, which still never undercounts a
+// key. Counters missing or saved with another filter config are skipped.
+template<typename K, typename V>
+Status RestoreFilterCounters(EmbeddingVar<K, V>* ev, BundleReader* reader,
+                             const std::vector<string>& tensor_names) {
+  auto filter = ev->GetFilter();
+  const int64 num_counters = filter->NumCounters();
+  if (!ev->IsPrimary() || num_counters == 0) {
+    return Status::OK();
+  }
+  for (const string& tensor_name : tensor_names) {
+    const string counters_name = tensor_name + "-filter_counters";
+    DataType dtype;
+    TensorShape shape;
+    Status st = reader->LookupDtypeAndShape(counters_name, &dtype, &shape);
+    if (!st.ok()) {
+      VLOG(1) << "EV filter counters " << counters_name << " not found";
+      continue;
+    }
+    if (dtype != filter->CounterType() ||
+        shape != TensorShape({num_counters})) {
+      LOG(WARNING) << "EV filter counters " << counters_name
+                   << " are skipped, saved as " << DataTypeString(dtype)
+                   << shape.DebugString() << " but the filter has "
+                   << num_counters << " counters of "
+                   << DataTypeString(filter->CounterType());
+      continue;
+    }
+    EVSavedTensor saved;
+    TF_RETURN_IF_ERROR(reader->GetTensorInfo(counters_name, &saved.size,
+                                             &saved.file, &saved.offset));
+    switch (dtype) {
+      case DT_UINT8:
+        st = MergeFilterCounters<uint8>(saved, num_counters,
+                                        filter->Counters());
+        break;
+      case DT_UINT16:
+        st = MergeFilterCounters<uint16>(saved, num_counters,
+                                         filter->Counters());
+        break;
+      case DT_UINT32:
+        st = MergeFilterCounters<uint32>(saved, num_counters,
+                                         filter->Counters());
+        break;
+      default:
+        st = MergeFilterCounters<uint64>(saved, num_counters,
+                                         filter->Counters());
+    }
+    TF_RETURN_IF_ERROR(st);
+  }
+  return Status::OK();
+}
+
 template<typename K, typename V>
 Status EVRestoreDynamically(EmbeddingVar<K, V>* ev, std::string name_string, int partition_id, int partition_num,
           OpKernelContext* context, BundleReader* reader, std::string part_offset_tensor_suffix,
@@ -467,6 +778,9 @@ Status EVRestoreDynamically(EmbeddingVar<K, V>* ev, std::string name_string, int
     if (name_string.find(part_str) == std::string::npos) {
       // no partition
       Status s = RestoreValue(ev, reader, name_string + key_suffix, name_string + value_suffix, name_string + version_suffix, name_string + freq_suffix);
+      if (s.ok()) {
+        s = RestoreFilterCounters(ev, reader, {name_string});
+      }
       if (!s.ok()) {
         LOG(FATAL) <<  "EV restoring fail:" << s.ToString();
       }
@@ -515,40 +829,21 @@ Status EVRestoreDynamically(EmbeddingVar<K, V>* ev, std::string name_string, int
         LOG(FATAL) <<  "EV restoring fail:" << s.ToString();
       }
     } else {
-
-       // first find out which sub parts we should load
-      bool filter_flag = true;
-      std::vector<int> loaded_parts;
-      for (int i = 0; i < kSavedPartitionNum; i++) {
-        if (i % partition_num == partition_id) {
-          loaded_parts.push_back(i);
-        }
-      }
-
-      // then  we use primary  partition number to compose with sub partition number
-
       VLOG(1) << "new form:" << name_string << ", partition_id:" << partition_id << ", partition_num:" << partition_num;
 
-      int orig_partnum = 0;
-      size_t buffer_size = 8 << 20;
-      RestoreBuffer restore_buff;
-      restore_buff.key_buffer = new char[buffer_size];
-      restore_buff.value_buffer = new char[buffer_size];
-      restore_buff.version_buffer = new char[buffer_size];
-      restore_buff.freq_buffer = new char[buffer_size];
-
-      for (;  ; orig_partnum++) {
+      std::vector<EVSavedPart> parts;
+      std::vector<string> part_names;
+      for (int orig_partnum = 0;  ; orig_partnum++) {
         string part_id = std::to_string(orig_partnum);
         string pre_subname = name_string.substr(0, name_string.find(part_str));
         string post_subname = name_string.substr(name_string.find(part_str) + part_str.size() + curr_partid_str.size());
         string tensor_name = pre_subname + part_str + part_id + post_subname;
 
-        // first check whether is  old ckpt form
         string tensor_key = tensor_name + key_suffix;
         string tensor_value = tensor_name + value_suffix;
         string tensor_version = tensor_name + version_suffix;
         string tensor_freq = tensor_name + freq_suffix;
-        TensorShape key_shape, value_shape, version_shape, freq_shape;
+        TensorShape key_shape, value_shape, version_shape;
         Status st = reader->LookupTensorShape(tensor_key, &key_shape);
         if (!st.ok()) {
           VLOG(1) << "ev part " << tensor_key << " not exist, reach the end of restoring";
@@ -562,35 +857,29 @@ Status EVRestoreDynamically(EmbeddingVar<K, V>* ev, std::string name_string, int
         if (!st.ok()) {
           break;
         }
-        st = reader->LookupTensorShape(tensor_freq, &freq_shape);
-        if (!st.ok()) {
-          if (st.code() == error::NOT_FOUND) {
-            freq_shape = version_shape;
-          }else {
-            return st;
-          }
-        }
 
-        reader->LookupHeader(tensor_key, sizeof(K) * key_shape.dim_size(0));
-        if (!st.ok()) {
-          break;
+        parts.emplace_back();
+        part_names.push_back(tensor_name);
+        EVSavedPart& part = parts.back();
+        part.value_len = value_shape.dim_size(1);
+        st = reader->GetTensorInfo(tensor_key, &part.keys.size, &part.keys.file, &part.keys.offset);
+        if (st.ok()) {
+          st = reader->GetTensorInfo(tensor_value, &part.values.size, &part.values.file, &part.values.offset);
         }
-        st = reader->LookupHeader(tensor_value, sizeof(V) * value_shape.dim_size(0) * value_shape.dim_size(1));
-        if (!st.ok()) {
-          break;
+        if (st.ok()) {
+          st = reader->GetTensorInfo(tensor_version, &part.versions.size, &part.versions.file, &part.versions.offset);
         }
-        st = reader->LookupHeader(tensor_version, sizeof(int64) * version_shape.dim_size(0));
-        if (!st.ok()) {
-          break;
-        }
-        st = reader->LookupHeader(tensor_freq, sizeof(int64) * freq_shape.dim_size(0));
-        if (!st.ok()) {
+        if (st.ok()) {
+          st = reader->GetTensorInfo(tensor_freq, &part.freqs.size, &part.freqs.file, &part.freqs.offset);
           if (st.code() == error::NOT_FOUND) {
-            filter_flag = false;
-          }else {
-            return st;
+            part.freqs.size = 0;
+            st = Status::OK();
           }
         }
+        if (!st.ok()) {
+          LOG(FATAL) <<  "EV restoring fail:" << st.ToString();
+        }
+
         TensorShape part_offset_shape;
         DataType part_offset_type;
         string offset_tensor_name = tensor_name + part_offset_tensor_suffix;
@@ -609,64 +898,21 @@ Status EVRestoreDynamically(EmbeddingVar<K, V>* ev, std::string name_string, int
           LOG(FATAL) <<  "EV restoring fail:" << st.ToString();
         }
         auto part_offset_flat = part_offset_tensor.flat<int32>();
+        part.part_offset.assign(part_offset_flat.data(),
+                                part_offset_flat.data() + part_offset_flat.size());
+      }
 
-
-        for (size_t i = 0; i < loaded_parts.size(); i++) {
-
-          int subpart_id = loaded_parts[i];
-          int subpart_offset = part_offset_flat(subpart_id);
-
-          size_t value_unit_bytes = sizeof(V) *  value_shape.dim_size(1);
-          int64 tot_key_num = part_offset_flat(subpart_id + 1) - subpart_offset;
-          int64 key_part_offset = subpart_offset * sizeof(K);
-          int64 value_part_offset = subpart_offset *  value_unit_bytes;
-          int64 version_part_offset = subpart_offset * sizeof(int64);
-          int64 freq_part_offset = subpart_offset * sizeof(int64);
-
-          VLOG(1) <<  "dynamically load ev : " << name_string <<  ", subpartid:" << loaded_parts[i] << ", subpart_offset:" << subpart_offset <<  ", partition_id:" << partition_id << ", partition_num:" << partition_num << ", keynum:" << tot_key_num;
-
-          int64 tot_key_bytes_read(0), tot_value_bytes_read(0), tot_version_bytes_read(0), tot_freq_bytes_read(0);
-          size_t key_bytes_read = 0, value_bytes_read = 0, version_bytes_read = 0, freq_bytes_read = 0;
-          while(tot_key_num > 0) {
-            size_t read_key_num = std::min(std::min(buffer_size / sizeof(K), buffer_size / value_unit_bytes), buffer_size / sizeof(int64));
-            read_key_num = std::min((int64)read_key_num, tot_key_num);
-            reader->LookupSegmentOffset(tensor_key, key_part_offset + tot_key_bytes_read, read_key_num * sizeof(K),  restore_buff.key_buffer, key_bytes_read);
-
-            reader->LookupSegmentOffset(tensor_value, value_part_offset + tot_value_bytes_read, read_key_num * value_unit_bytes, restore_buff.value_buffer, value_bytes_read);
-
-            reader->LookupSegmentOffset(tensor_version, version_part_offset + tot_version_bytes_read, read_key_num * sizeof(int64) , restore_buff.version_buffer, version_bytes_read);
-            if (version_bytes_read == 0) {
-               memset(restore_buff.version_buffer, -1, sizeof(int64) * read_key_num);
-            }
-            if (filter_flag) {
-              reader->LookupSegmentOffset(tensor_freq, freq_part_offset + tot_freq_bytes_read,read_key_num * sizeof(int64), restore_buff.freq_buffer, freq_bytes_read);
-              if (freq_bytes_read == 0) {
-                int64 *freq_tmp = (int64 *)restore_buff.freq_buffer;
-                for (int64 i = 0; i < read_key_num; i++) {
-                  freq_tmp[i] = ev->MinFreq();
-                }
-              }
-            } else {
-              int64 *freq_tmp = (int64 *)restore_buff.freq_buffer;
-              for (int64 i = 0; i < read_key_num; i++) {
-                freq_tmp[i] = ev->MinFreq();
-              }
-            }
-            if (key_bytes_read > 0) {
-              read_key_num = key_bytes_read / sizeof(K);
-              VLOG(2) << "restore, read_key_num:" << read_key_num;
-              st = ev->Import(restore_buff, read_key_num, kSavedPartitionNum, partition_id, partition_num);
-              if (!st.ok()) {
-                LOG(FATAL) <<  "EV restoring fail:" << st.ToString();
-              }
-            }
-            tot_key_num -= read_key_num;
-            tot_key_bytes_read += key_bytes_read;
-            tot_value_bytes_read += value_bytes_read;
-            tot_version_bytes_read += version_bytes_read;
-            tot_freq_bytes_read += freq_bytes_read;
-          }
+      Status s = EVRestoreSavedParts(ev, parts, partition_id, partition_num,
+          context->device()->tensorflow_cpu_worker_threads()->workers);
+      if (s.ok()) {
+        // The counters of the same partition are restored as they are.
+        if ((int)parts.size() == partition_num) {
+          part_names = {name_string};
         }
+        s = RestoreFilterCounters(ev, reader, part_names);
+      }
+      if (!s.ok()) {
+        LOG(FATAL) <<  "EV restoring fail:" << s.ToString();
       }
     }
     return Status::OK();
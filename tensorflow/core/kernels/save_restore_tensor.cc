@@ -256,6 +256,7 @@ Status SaveBloomFilter(
     tensor_slice_proto->set_hash_slice_begin(slice_beg);
     tensor_slice_proto->set_hash_slice_length(slice_length);
     tensor_slice_proto->set_hash_slice_size(slice_size);
+    tensor_slice_proto->set_hash_slice_blocked(strategy->blocked());
     std::string xname = checkpoint::EncodeTensorNameSlice(
         name, slice);
     SegmentBundleWriter segment_writer(
@@ -289,6 +290,13 @@ Status RestoreBloomFilter(
         slice_beg >= slice.hash_slice_begin() + slice.hash_slice_length()) {
       continue;
     }
+    if (slice.hash_slice_blocked() != strategy->blocked()) {
+      return errors::FailedPrecondition(
+          "Cannot restore BloomFilter ", name, ": the checkpoint is ",
+          slice.hash_slice_blocked() ? "blocked" : "not blocked",
+          " but the BloomFilter is ",
+          strategy->blocked() ? "blocked" : "not blocked");
+    }
     std::unique_ptr<SegmentBundleReader> bundle_reader;
     std::string xname = checkpoint::EncodeTensorNameSlice(
         name, TensorSlice(slice));
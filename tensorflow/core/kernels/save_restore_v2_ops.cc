@@ -130,7 +130,8 @@ class SaveV2 : public OpKernel {
       OP_REQUIRES_OK(context, variable->Shrink());
     else
       OP_REQUIRES_OK(context, variable->Shrink(global_step_scalar));
-    OP_REQUIRES_OK(context, DumpEmbeddingValues(variable, tensor_name, &writer, &part_offset_tensor));
+    OP_REQUIRES_OK(context, DumpEmbeddingValues(variable, tensor_name, &writer, &part_offset_tensor,
+        context->device()->tensorflow_cpu_worker_threads()->workers));
   }
 
   void Compute(OpKernelContext* context) override {
@@ -407,6 +408,7 @@ class RestoreBloomFilterOp : public AsyncOpKernel {
     Status st = RestoreBloomFilter(
         reader.get(), strategy, tensor_name_flat, slice.start(0),
         slice.length(0), shape.dim_size(0));
+    OP_REQUIRES_OK_ASYNC(context, st, done);
     resource->SetInitialized(true);
     done();
   }
@@ -53,22 +53,26 @@ mutex* GetTrainingEmbeddingVariableMutex(OpKernelContext* ctx, int input,
   return ctx->input_ref_mutex(input);
 }
 
-// Utility structure that releases a sequence of borrowed mutexes when it is
-// deleted.
+// Utility structure that releases a sequence of borrowed mutexes and the
+// epoch guards of the variables when it is deleted.
 template<typename K, typename V>
 struct EmbeddingVariableInputLockHolder {
  public:
   EmbeddingVariableInputLockHolder(std::vector<EmbeddingVar<K, V>*> vars,
-                          std::unique_ptr<std::vector<mutex_lock>> locks)
-      : vars_(std::move(vars)), locks_(std::move(locks)) {}
+                          std::unique_ptr<std::vector<mutex_lock>> locks,
+                          std::vector<EpochGuard> guards = {})
+      : vars_(std::move(vars)), locks_(std::move(locks)),
+        guards_(std::move(guards)) {}
 
   EmbeddingVariableInputLockHolder(EmbeddingVariableInputLockHolder&& other)
-      : vars_(std::move(other.vars_)), locks_(std::move(other.locks_)) {}
+      : vars_(std::move(other.vars_)), locks_(std::move(other.locks_)),
+        guards_(std::move(other.guards_)) {}
 
   ~EmbeddingVariableInputLockHolder() {
-    // Release the locks before unreffing the Vars, because each lock
-    // is potentially borrowed from a Var in vars_.
+    // Release the locks and the guards before unreffing the Vars, because
+    // each of them is potentially borrowed from a Var in vars_.
     locks_.reset();
+    guards_.clear();
     for (EmbeddingVar<K, V>* var : vars_) {
       var->Unref();
     }
@@ -79,21 +83,37 @@ struct EmbeddingVariableInputLockHolder {
   // NOTE: Use a `std::unique_ptr` instead of moving in a vector directly,
   // because a `std::vector<mutex_lock>` is not movable on all platforms.
   std::unique_ptr<std::vector<mutex_lock>> locks_;
+  std::vector<EpochGuard> guards_;
 };
 
+// The value ptrs of the variables stay valid until the returned holder is
+// deleted, even if `do_lock` is false, see EmbeddingVar::GuardValuePtrs.
 template<typename K, typename V>
 EmbeddingVariableInputLockHolder<K, V> MaybeLockEmbeddingVariableInputMutexesInOrder(
     OpKernelContext* ctx, bool do_lock, const std::vector<int>& input_ids) {
+  std::vector<EmbeddingVar<K, V>*> vars;
+  std::vector<EpochGuard> guards;
   if (!do_lock) {
-    return EmbeddingVariableInputLockHolder<K, V>({}, {});
+    for (auto input : input_ids) {
+      EmbeddingVar<K, V>* var = nullptr;
+      if (ctx->input_dtype(input) == DT_RESOURCE &&
+          LookupResource(ctx, HandleFromInput(ctx, input), &var).ok()) {
+        guards.push_back(var->GuardValuePtrs());
+        vars.push_back(var);
+      }
+    }
+    return EmbeddingVariableInputLockHolder<K, V>(
+        std::move(vars), {}, std::move(guards));
   }
-  std::vector<EmbeddingVar<K, V>*> vars;
   std::vector<mutex*> mutexes;
   std::vector<int> acquire_order;
   for (auto input : input_ids) {
     EmbeddingVar<K, V>* var;
     mutex* mutex = GetTrainingEmbeddingVariableMutex(ctx, input, &var);
-    if (var) vars.push_back(var);
+    if (var) {
+      guards.push_back(var->GuardValuePtrs());
+      vars.push_back(var);
+    }
     // Only lock each mutex once if duplicates exist (n^2 but n is 2 or 3).
     if (std::find(mutexes.begin(), mutexes.end(), mutex) == mutexes.end()) {
       acquire_order.push_back(mutexes.size());
@@ -115,7 +135,8 @@ EmbeddingVariableInputLockHolder<K, V> MaybeLockEmbeddingVariableInputMutexesInO
       locks->emplace_back(*mu);
     }
   }
-  return EmbeddingVariableInputLockHolder<K, V>(std::move(vars), std::move(locks));
+  return EmbeddingVariableInputLockHolder<K, V>(
+      std::move(vars), std::move(locks), std::move(guards));
 }
 
 }  // end namespace tensorflow
@@ -13,11 +13,14 @@ See the License for the specific language governing permissions and
 limitations under the License.
 ==============================================================================*/
 
+#include <algorithm>
 #include <chrono>
 #include <cstddef>
 #include <deque>
 #include <mutex>
 #include <numeric>
+#include <unordered_map>
+#include <unordered_set>
 #include <vector>
 
 #define EIGEN_USE_THREADS
@@ -103,22 +106,97 @@ class WorkQueue : public ResourceBase {
     return Status::OK();
   }
 
-  Status Take(Tensor* output) {
+  Status Take(Tensor* output, const string& client, bool adaptive) {
     std::unique_lock<std::mutex> lock(mu_);
 
-    take_cv_.wait(lock, [this]() { return !queue_.empty() || is_closed_; });
+    WaitForWorksLocked(client, &lock);
 
     if (TF_PREDICT_FALSE(queue_.empty() && is_closed_)) {
       return Status(errors::OutOfRange(
           strings::StrCat("All works in work queue ", name_, " are taken.")));
     }
 
-    output->scalar<string>().setConstant(std::move(queue_.front()));
-    queue_.pop_front();
+    if (adaptive) {
+      UpdateRateLocked(client);
+    }
+    output->scalar<string>().setConstant(PopLocked(client, adaptive));
+
+    return Status::OK();
+  }
+
+  Status TakeMany(OpKernelContext* ctx, const string& client,
+                  int64 num_consumed, int64 num_works, bool adaptive,
+                  Tensor** output) {
+    std::unique_lock<std::mutex> lock(mu_);
+    Lease& lease = leases_[client];
+    lease.last_take_micros = Env::Default()->NowMicros();
+    AckLocked(&lease.works, num_consumed);
+
+    WaitForWorksLocked(client, &lock);
+
+    if (TF_PREDICT_FALSE(queue_.empty() && is_closed_)) {
+      return Status(errors::OutOfRange(
+          strings::StrCat("All works in work queue ", name_, " are taken.")));
+    }
+
+    if (adaptive) {
+      UpdateRateLocked(client);
+    }
+    std::vector<string> taken;
+    while (static_cast<int64>(taken.size()) < num_works && !queue_.empty()) {
+      taken.push_back(PopLocked(client, adaptive));
+      lease.works.push_back(taken.back());
+    }
+    TF_RETURN_IF_ERROR(ctx->allocate_output(
+        0, TensorShape({static_cast<int64>(taken.size())}), output));
+    for (size_t i = 0; i < taken.size(); ++i) {
+      (*output)->flat<string>()(i) = std::move(taken[i]);
+    }
 
     return Status::OK();
   }
 
+  // Registers locality hints of a client. Works local to the client are
+  // preferred when it takes works.
+  void RegisterLocality(const string& client,
+                        const std::vector<string>& hints) {
+    if (hints.empty()) {
+      return;
+    }
+    std::unique_lock<std::mutex> lock(mu_);
+    if (localities_.count(client) > 0) {
+      return;
+    }
+    Locality& locality = localities_[client];
+    for (const string& hint : hints) {
+      if (hint.find('/') == string::npos) {
+        locality.tokens.insert(hint);
+      } else {
+        locality.prefixes.push_back(hint);
+      }
+    }
+  }
+
+  Status GiveBack(const string& client, int64 num_consumed) {
+    std::unique_lock<std::mutex> lock(mu_);
+    auto it = leases_.find(client);
+    if (it == leases_.end()) {
+      return Status::OK();
+    }
+    AckLocked(&it->second.works, num_consumed);
+    LOG(INFO) << "Work queue " << name_ << " got " << it->second.works.size()
+              << " unconsumed works back from " << client << ".";
+    // Unconsumed works are put to the front to be taken first.
+    queue_.insert(queue_.begin(),
+                  std::make_move_iterator(it->second.works.begin()),
+                  std::make_move_iterator(it->second.works.end()));
+    leases_.erase(it);
+
+    lock.unlock();
+    take_cv_.notify_all();
+    return Status::OK();
+  }
+
   Status GetSize(Tensor* size) {
     std::unique_lock<std::mutex> lock(mu_);
     size->scalar<int64>().setConstant(static_cast<int64>(queue_.size()));
@@ -131,6 +209,7 @@ class WorkQueue : public ResourceBase {
     std::unique_lock<std::mutex> lock(mu_);
 
     queue_.clear();
+    leases_.clear();
     for (int64 i = 0; i < num_works; ++i) {
       queue_.push_back(restorable.flat<string>()(i));
     }
@@ -143,10 +222,24 @@ class WorkQueue : public ResourceBase {
   Status Save(OpKernelContext* ctx, Tensor** saveable) {
     std::unique_lock<std::mutex> lock(mu_);
 
-    TF_RETURN_IF_ERROR(ctx->allocate_output(
-        0, TensorShape({static_cast<int64>(queue_.size())}), saveable));
-    for (size_t i = 0; i < queue_.size(); ++i) {
-      (*saveable)->flat<string>()(i) = queue_[i];
+    // Leased works are not acknowledged yet, so they are saved before the
+    // remaining works to be taken first after restoring. Works consumed
+    // since the last acknowledgement of their client are saved as well, so
+    // works are consumed at least once across restores.
+    int64 num_works = static_cast<int64>(queue_.size());
+    for (const auto& lease : leases_) {
+      num_works += static_cast<int64>(lease.second.works.size());
+    }
+    TF_RETURN_IF_ERROR(
+        ctx->allocate_output(0, TensorShape({num_works}), saveable));
+    int64 i = 0;
+    for (const auto& lease : leases_) {
+      for (const string& work : lease.second.works) {
+        (*saveable)->flat<string>()(i++) = work;
+      }
+    }
+    for (const string& work : queue_) {
+      (*saveable)->flat<string>()(i++) = work;
     }
 
     return Status::OK();
@@ -184,9 +277,233 @@ class WorkQueue : public ResourceBase {
   }
 
  private:
+  // Works taken by a client but not acknowledged yet.
+  struct Lease {
+    std::deque<string> works;
+    uint64 last_take_micros = 0;
+  };
+
+  // Waits until there are works to take or the queue is closed. Works
+  // leased to clients that took nothing within kLeaseTimeoutMicros, e.g.
+  // crashed ones, are put back meanwhile. The lease of the waiting client
+  // is kept alive.
+  void WaitForWorksLocked(const string& client,
+                          std::unique_lock<std::mutex>* lock) {
+    while (true) {
+      auto lease = leases_.find(client);
+      if (lease != leases_.end()) {
+        lease->second.last_take_micros = Env::Default()->NowMicros();
+      }
+      ReclaimLeasesLocked();
+      if (!queue_.empty() || is_closed_) {
+        return;
+      }
+      take_cv_.wait_for(*lock, std::chrono::seconds(kLeaseCheckSecs));
+    }
+  }
+
+  void ReclaimLeasesLocked() {
+    const uint64 now = Env::Default()->NowMicros();
+    for (auto it = leases_.begin(); it != leases_.end();) {
+      if (now <= it->second.last_take_micros + kLeaseTimeoutMicros) {
+        ++it;
+        continue;
+      }
+      if (!it->second.works.empty()) {
+        LOG(WARNING) << "Work queue " << name_ << " took "
+                     << it->second.works.size() << " works back from "
+                     << it->first << " after its lease timed out.";
+        queue_.insert(queue_.begin(),
+                      std::make_move_iterator(it->second.works.begin()),
+                      std::make_move_iterator(it->second.works.end()));
+      }
+      it = leases_.erase(it);
+    }
+  }
+
+  struct ClientStats {
+    uint64 last_take_micros = 0;
+    int64 last_num_slices = 0;
+    // Slices consumed per second.
+    double rate = 0.0;
+  };
+
+  // Parses a slice in format `path?start=<start>&end=<end>`.
+  static bool ParseSlice(const string& work, StringPiece* path, int64* start,
+                         int64* end) {
+    const size_t start_pos = work.rfind("?start=");
+    if (start_pos == string::npos) {
+      return false;
+    }
+    const size_t end_pos = work.find("&end=", start_pos);
+    if (end_pos == string::npos) {
+      return false;
+    }
+    *path = StringPiece(work.data(), start_pos);
+    const size_t start_offset = start_pos + strlen("?start=");
+    const size_t end_offset = end_pos + strlen("&end=");
+    return strings::safe_strto64(
+               StringPiece(work.data() + start_offset, end_pos - start_offset),
+               start) &&
+           strings::safe_strto64(
+               StringPiece(work.data() + end_offset, work.size() - end_offset),
+               end);
+  }
+
+  // Updates consumption rate of a client, assuming slices taken by its last
+  // request are consumed now. Other clients that took nothing within
+  // kClientExpiryMicros are forgotten, so that clients gone, e.g. restarted
+  // with a new uuid, no longer shrink the chunks.
+  void UpdateRateLocked(const string& client) {
+    const uint64 now = Env::Default()->NowMicros();
+    for (auto it = clients_.begin(); it != clients_.end();) {
+      if (it->first != client &&
+          now > it->second.last_take_micros + kClientExpiryMicros) {
+        it = clients_.erase(it);
+      } else {
+        ++it;
+      }
+    }
+    ClientStats& stats = clients_[client];
+    if (stats.last_take_micros > 0 && now > stats.last_take_micros) {
+      const double rate =
+          stats.last_num_slices * 1e6 / (now - stats.last_take_micros);
+      stats.rate = stats.rate > 0 ? 0.5 * (stats.rate + rate) : rate;
+    }
+    stats.last_take_micros = now;
+    stats.last_num_slices = 0;
+  }
+
+  // Number of slices to hand out to a client for adaptive slicing. Half of
+  // the remaining slices are shared by all clients in proportion to their
+  // consumption rates, so chunks are large early and shrink to single slices
+  // as the queue drains.
+  int64 ChunkSizeLocked(const string& client) {
+    const ClientStats& stats = clients_[client];
+    double total_rate = 0.0;
+    int64 num_rated = 0;
+    for (const auto& other : clients_) {
+      if (other.second.rate > 0) {
+        total_rate += other.second.rate;
+        ++num_rated;
+      }
+    }
+    double chunk =
+        (queue_.size() + 1) / (2.0 * static_cast<double>(clients_.size()));
+    if (stats.rate > 0) {
+      chunk *= stats.rate * num_rated / total_rate;
+    }
+    return std::max(static_cast<int64>(chunk), static_cast<int64>(1));
+  }
+
+  // Locality hints of a client. A work is local to the client if its path
+  // starts with one of `prefixes`, or one of its components separated by
+  // '/' or ':' is in `tokens`, e.g. a host name or a cached file name.
+  struct Locality {
+    std::unordered_set<string> tokens;
+    std::vector<string> prefixes;
+  };
+
+  static bool IsLocal(const Locality& locality, StringPiece path) {
+    for (const string& prefix : locality.prefixes) {
+      if (str_util::StartsWith(path, prefix)) {
+        return true;
+      }
+    }
+    size_t begin = 0;
+    while (begin <= path.size()) {
+      size_t end = begin;
+      while (end < path.size() && path[end] != '/' && path[end] != ':') {
+        ++end;
+      }
+      if (end > begin &&
+          locality.tokens.count(string(path.substr(begin, end - begin))) > 0) {
+        return true;
+      }
+      begin = end + 1;
+    }
+    return false;
+  }
+
+  // Finds the first work local to a client within the first
+  // kLocalityWindow works, or the first work if none. Works far behind are
+  // not preferred, so that works local to no one are still taken in order,
+  // and the clients stay balanced.
+  std::deque<string>::iterator FindLocalLocked(const string& client) {
+    auto locality = localities_.find(client);
+    if (locality == localities_.end()) {
+      return queue_.begin();
+    }
+    auto it = queue_.begin();
+    for (int64 i = 0; i < kLocalityWindow && it != queue_.end(); ++i, ++it) {
+      StringPiece path(*it);
+      path = path.substr(0, path.find('?'));
+      if (IsLocal(locality->second, path)) {
+        return it;
+      }
+    }
+    return queue_.begin();
+  }
+
+  // Pops a work from the queue, preferring works local to the client. For
+  // adaptive slicing, following slices contiguous to it are merged into one
+  // work.
+  string PopLocked(const string& client, bool adaptive) {
+    auto it = FindLocalLocked(client);
+    string work = std::move(*it);
+    it = queue_.erase(it);
+    if (!adaptive) {
+      return work;
+    }
+
+    const int64 chunk = ChunkSizeLocked(client);
+    StringPiece path;
+    int64 start, end;
+    int64 num_slices = 1;
+    if (ParseSlice(work, &path, &start, &end)) {
+      StringPiece next_path;
+      int64 next_start, next_end;
+      while (num_slices < chunk && it != queue_.end() &&
+             ParseSlice(*it, &next_path, &next_start, &next_end) &&
+             next_path == path && next_start == end) {
+        end = next_end;
+        it = queue_.erase(it);
+        ++num_slices;
+      }
+      if (num_slices > 1) {
+        work = strings::StrCat(path, "?start=", start, "&end=", end);
+      }
+    }
+    clients_[client].last_num_slices += num_slices;
+    return work;
+  }
+
+  // Drops the first `num_consumed` works leased to a client.
+  void AckLocked(std::deque<string>* lease, int64 num_consumed) {
+    if (num_consumed > static_cast<int64>(lease->size())) {
+      LOG(WARNING) << "Work queue " << name_ << " acknowledged "
+                   << num_consumed << " works but only " << lease->size()
+                   << " works leased.";
+      num_consumed = lease->size();
+    }
+    if (num_consumed > 0) {
+      lease->erase(lease->begin(), lease->begin() + num_consumed);
+    }
+  }
+
   // TODO(yuanman.ym): Use memory efficient data structure, e.g. HAT-trie,
   // to implement the string queue. (See https://github.com/Tessil/hat-trie)
   std::deque<string> queue_;
+  // Works taken by each client but not acknowledged yet.
+  std::unordered_map<string, Lease> leases_;
+  static constexpr uint64 kLeaseTimeoutMicros = 30 * 60 * 1000000ULL;
+  static constexpr int64 kLeaseCheckSecs = 60;
+  // Consumption statistics of each client for adaptive slicing.
+  std::unordered_map<string, ClientStats> clients_;
+  static constexpr uint64 kClientExpiryMicros = 10 * 60 * 1000000ULL;
+  // Locality hints of each client.
+  std::unordered_map<string, Locality> localities_;
+  static constexpr int64 kLocalityWindow = 1024;
   string name_;
   bool is_closed_;
   std::mutex mu_;
@@ -305,6 +622,9 @@ class WorkQueueTakeOp : public AsyncOpKernel {
  public:
   explicit WorkQueueTakeOp(OpKernelConstruction* ctx) : AsyncOpKernel(ctx) {
     OP_REQUIRES_OK(ctx, ctx->GetAttr("num_clients", &num_clients_));
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("client", &client_));
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("adaptive", &adaptive_));
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("locality", &locality_));
   }
 
   void ComputeAsync(OpKernelContext* ctx,
@@ -313,22 +633,91 @@ class WorkQueueTakeOp : public AsyncOpKernel {
     OP_REQUIRES_OK(ctx,
                    LookupResource(ctx, HandleFromInput(ctx, 0), &work_queue));
     core::ScopedUnref scoped_list(work_queue);
+    work_queue->RegisterLocality(client_, locality_);
     work_queue->Schedule(num_clients_, [this, ctx, done, work_queue]() {
       Tensor* work;
       OP_REQUIRES_OK_ASYNC(ctx, ctx->allocate_output(0, TensorShape({}), &work),
                            done);
-      OP_REQUIRES_OK_ASYNC(ctx, work_queue->Take(work), done);
+      OP_REQUIRES_OK_ASYNC(ctx, work_queue->Take(work, client_, adaptive_),
+                           done);
       done();
     });
   }
 
  private:
   int64 num_clients_;
+  string client_;
+  bool adaptive_;
+  std::vector<string> locality_;
 };
 
 REGISTER_KERNEL_BUILDER(Name("WorkQueueTake").Device(DEVICE_CPU),
                         WorkQueueTakeOp);
 
+class WorkQueueTakeManyOp : public AsyncOpKernel {
+ public:
+  explicit WorkQueueTakeManyOp(OpKernelConstruction* ctx)
+      : AsyncOpKernel(ctx) {
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("client", &client_));
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("num_works", &num_works_));
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("num_clients", &num_clients_));
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("adaptive", &adaptive_));
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("locality", &locality_));
+  }
+
+  void ComputeAsync(OpKernelContext* ctx,
+                    AsyncOpKernel::DoneCallback done) override {
+    WorkQueue* work_queue;
+    OP_REQUIRES_OK_ASYNC(
+        ctx, LookupResource(ctx, HandleFromInput(ctx, 0), &work_queue), done);
+    core::ScopedUnref scoped_list(work_queue);
+    work_queue->RegisterLocality(client_, locality_);
+    const int64 num_consumed = ctx->input(1).scalar<int64>()();
+    work_queue->Schedule(
+        num_clients_, [this, ctx, done, work_queue, num_consumed]() {
+          Tensor* works;
+          OP_REQUIRES_OK_ASYNC(ctx,
+                               work_queue->TakeMany(ctx, client_, num_consumed,
+                                                    num_works_, adaptive_,
+                                                    &works),
+                               done);
+          done();
+        });
+  }
+
+ private:
+  string client_;
+  int64 num_works_;
+  int64 num_clients_;
+  bool adaptive_;
+  std::vector<string> locality_;
+};
+
+REGISTER_KERNEL_BUILDER(Name("WorkQueueTakeMany").Device(DEVICE_CPU),
+                        WorkQueueTakeManyOp);
+
+class WorkQueueGiveBackOp : public OpKernel {
+ public:
+  explicit WorkQueueGiveBackOp(OpKernelConstruction* ctx) : OpKernel(ctx) {
+    OP_REQUIRES_OK(ctx, ctx->GetAttr("client", &client_));
+  }
+
+  void Compute(OpKernelContext* ctx) override {
+    WorkQueue* work_queue;
+    OP_REQUIRES_OK(ctx,
+                   LookupResource(ctx, HandleFromInput(ctx, 0), &work_queue));
+    core::ScopedUnref scoped_list(work_queue);
+    const int64 num_consumed = ctx->input(1).scalar<int64>()();
+    OP_REQUIRES_OK(ctx, work_queue->GiveBack(client_, num_consumed));
+  }
+
+ private:
+  string client_;
+};
+
+REGISTER_KERNEL_BUILDER(Name("WorkQueueGiveBack").Device(DEVICE_CPU),
+                        WorkQueueGiveBackOp);
+
 class SaveLocalWorkOp : public OpKernel {
  public:
   explicit SaveLocalWorkOp(OpKernelConstruction* ctx) : OpKernel(ctx) {
@@ -68,4 +68,35 @@ REGISTER_OP("DataBufferSize")
     .SetShapeFn(shape_inference::ScalarShape)
     .SetIsStateful();
 
+REGISTER_OP("DataBufferSetCapacity")
+    .Input("capacity: int64")
+    .Attr("container: string = ''")
+    .Attr("shared_name: string = ''")
+    .Attr("shared_capacity: int >= 1 = 1")
+    .SetShapeFn(shape_inference::NoOutputs)
+    .SetIsStateful();
+
+REGISTER_OP("DataBufferStats")
+    .Output("capacity: int64")
+    .Output("size: int64")
+    .Output("put_wait_micros: int64")
+    .Output("take_wait_micros: int64")
+    .Output("num_puts: int64")
+    .Output("num_takes: int64")
+    .Output("num_full_puts: int64")
+    .Output("num_empty_takes: int64")
+    .Output("bytes_put: int64")
+    .Output("size_micros: int64")
+    .Output("elapsed_micros: int64")
+    .Attr("container: string = ''")
+    .Attr("shared_name: string = ''")
+    .Attr("shared_capacity: int >= 1 = 1")
+    .SetShapeFn([](shape_inference::InferenceContext* c) {
+      for (int i = 0; i < c->num_outputs(); ++i) {
+        c->set_output(i, c->Scalar());
+      }
+      return Status::OK();
+    })
+    .SetIsStateful();
+
 }
\ No newline at end of file
@@ -869,6 +869,38 @@ REGISTER_OP("MultiDeviceIteratorFromStringHandle")
     .Attr("output_shapes: list(shape) >= 0 = []")
     .SetShapeFn(shape_inference::ScalarShape);
 
+REGISTER_OP("TextLineSliceDataset")
+    .Input("filename: string")
+    .Input("start: int64")
+    .Input("end: int64")
+    .Input("buffer_size: int64")
+    .Output("handle: variant")
+    .SetIsStateful()  // Source dataset ops must be marked stateful to inhibit
+                      // constant folding.
+    .SetShapeFn([](shape_inference::InferenceContext* c) {
+      shape_inference::ShapeHandle unused;
+      for (int i = 0; i < 4; ++i) {
+        TF_RETURN_IF_ERROR(c->WithRank(c->input(i), 0, &unused));
+      }
+      return shape_inference::ScalarShape(c);
+    });
+
+REGISTER_OP("TFRecordSliceDataset")
+    .Input("filename: string")
+    .Input("start: int64")
+    .Input("end: int64")
+    .Input("buffer_size: int64")
+    .Output("handle: variant")
+    .SetIsStateful()  // Source dataset ops must be marked stateful to inhibit
+                      // constant folding.
+    .SetShapeFn([](shape_inference::InferenceContext* c) {
+      shape_inference::ShapeHandle unused;
+      for (int i = 0; i < 4; ++i) {
+        TF_RETURN_IF_ERROR(c->WithRank(c->input(i), 0, &unused));
+      }
+      return shape_inference::ScalarShape(c);
+    });
+
 REGISTER_OP("IOKafkaDataset")
     .Input("topics: string")
     .Input("servers: string")
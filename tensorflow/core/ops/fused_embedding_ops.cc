@@ -70,13 +70,17 @@ REGISTER_OP("FusedEmbeddingSparsePreLookUp")
     .Attr("fill_empty_row: bool = false")
     .Attr("prune_invalid_id: bool = false")
     .Attr("default_id: int = -1")
+    .Attr("partition_strategy: {'div', 'mod', 'mod_ev'} = 'div'")
+    .Attr("Tweights: list({float}) >= 0 = []")
     .Input("partition_shapes: num_partitions * int64")
     .Input("sp_values: int64")
     .Input("sp_indices: int64")
     .Input("sp_dense_shape: int64")
+    .Input("sp_weights_values: Tweights")  // optional, at most one tensor
     .Output("partitioned_values: num_partitions * int64")
     .Output("partitioned_indices: num_partitions * int64")
     .Output("row_empty_and_invalid_flags: int32")
+    .Output("partitioned_weights: num_partitions * float")
     .SetShapeFn([](InferenceContext* ctx) {
       int num_partitions;
       TF_RETURN_IF_ERROR(ctx->GetAttr("num_partitions", &num_partitions));
@@ -113,6 +117,10 @@ REGISTER_OP("FusedEmbeddingSparsePreLookUp")
         ctx->set_output(i + num_partitions, indices_result_shape);
       }
       ctx->set_output(2 * num_partitions, ctx->MakeShape({ctx->UnknownDim()}));
+      for (int i = 0; i < num_partitions; i++) {
+        ctx->set_output(2 * num_partitions + 1 + i,
+                        ctx->MakeShape({ctx->UnknownDim()}));
+      }
 
       return Status::OK();
     });
@@ -123,6 +131,11 @@ REGISTER_OP("FusedEmbeddingSparsePreLookUp")
 // then sort, re-calculate and assign the embedding indices to the corresponding partition. Several Gather ops
 // usually should be appended after this op to gather embedding shards from multiple partitioned embedding
 // variables. This op has no gradient function.
+// partition_strategy 'div' splits the ids by the sizes in partition_shapes, 'mod' assigns id to partition
+// id % num_partitions with local id id / num_partitions, and 'mod_ev' assigns id to partition
+// id % 1000 % num_partitions without changing it, as done for partitioned EmbeddingVariables.
+// If sp_weights_values is given, partitioned_weights holds the weights of partitioned_values (1.0 for
+// filled empty rows), otherwise it is empty.
 //     )doc");
 
 REGISTER_OP("FusedEmbeddingSparsePostLookUp")
@@ -143,6 +156,9 @@ REGISTER_OP("FusedEmbeddingSparsePostLookUp")
                                                        // actually directly port
                                                        // to python grad op
                                                        // output
+    .Attr("Tweights: list({float}) >= 0 = []")
+    .Input("partitioned_weights: Tweights")  // optional, empty or
+                                             // num_partitions tensors
     .Output("emb_vectors: T")
     .Output("feature_nums: int32")
     .SetShapeFn([](InferenceContext* ctx) {
@@ -181,7 +197,8 @@ REGISTER_OP("FusedEmbeddingSparsePostLookUp")
 // FusedEmbeddingSparsePreLookUp, FusedEmbeddingSparsePostLookUp should be used together.
 // There should be several Gather ops before this op. The Gather ops gather embedding shards from
 // embedding variable and this op glue them together, then apply combiner and max_morm according to
-// embedding indices.
+// embedding indices. If partitioned_weights is given, the embeddings are weighted and the combiner
+// uses the sum of weights (mean) or of squared weights (sqrtn) of each row.
 //     )doc");
 
 REGISTER_OP("FusedEmbeddingSparsePostLookUpGrad")
@@ -198,6 +215,9 @@ REGISTER_OP("FusedEmbeddingSparsePostLookUpGrad")
     .Input("partitioned_indices: num_partitions * int64")
     .Input("feature_nums: int32")
     .Input("row_empty_and_invalid_flags: int32")
+    .Attr("Tweights: list({float}) >= 0 = []")
+    .Input("partitioned_weights: Tweights")  // optional, empty or
+                                             // num_partitions tensors
     .Output("grad_shards: num_partitions * T")
     .SetShapeFn([](InferenceContext* ctx) {
       int num_partitions;
@@ -18,6 +18,7 @@ limitations under the License.
 #include "tensorflow/core/framework/op.h"
 #include "tensorflow/core/framework/shape_inference.h"
 
+using ::tensorflow::shape_inference::DimensionHandle;
 using ::tensorflow::shape_inference::InferenceContext;
 using ::tensorflow::shape_inference::ShapeAndType;
 using ::tensorflow::shape_inference::ShapeHandle;
@@ -61,6 +62,7 @@ REGISTER_OP("HashTableInitializeOp")
     .Attr("initialized: bool")
     .Attr("concurrent_read: bool = true")
     .Attr("children: list(string) = []")
+    .Attr("sharded_ids: bool = false")
     .SetIsStateful()
     .SetShapeFn(shape_inference::NoOutputs);
 
@@ -82,6 +84,52 @@ REGISTER_OP("HashTableFilterOp")
     .SetIsStateful()
     .SetShapeFn(shape_inference::NoOutputs);
 
+REGISTER_OP("HashTableGlobalStepFilterOp")
+    .Input("hashtable: resource")
+    .Input("update_step: resource")
+    .Input("global_step: int64")
+    .Input("filter_interval_steps: int64")
+    .Input("cursor: int64")
+    .Input("num_shards: int64")
+    .Output("num_removed: int64")
+    .Output("next_cursor: int64")
+    .SetIsStateful()
+    .SetShapeFn([](InferenceContext* c) {
+      c->set_output(0, c->Scalar());
+      c->set_output(1, c->Scalar());
+      return Status::OK();
+    });
+
+REGISTER_OP("HashTableL2WeightFilterOp")
+    .Input("hashtable: resource")
+    .Input("weight: resource")
+    .Input("threshold: float")
+    .Input("cursor: int64")
+    .Input("num_shards: int64")
+    .Output("num_removed: int64")
+    .Output("next_cursor: int64")
+    .SetIsStateful()
+    .SetShapeFn([](InferenceContext* c) {
+      c->set_output(0, c->Scalar());
+      c->set_output(1, c->Scalar());
+      return Status::OK();
+    });
+
+REGISTER_OP("HashTableFrequencyFilterOp")
+    .Input("hashtable: resource")
+    .Input("frequency: resource")
+    .Input("threshold: int64")
+    .Input("cursor: int64")
+    .Input("num_shards: int64")
+    .Output("num_removed: int64")
+    .Output("next_cursor: int64")
+    .SetIsStateful()
+    .SetShapeFn([](InferenceContext* c) {
+      c->set_output(0, c->Scalar());
+      c->set_output(1, c->Scalar());
+      return Status::OK();
+    });
+
 REGISTER_OP("HashTableLookupWithAdmitOp")
     .Input("hashtable: resource")
     .Input("keys: int64")
@@ -330,6 +378,33 @@ REGISTER_OP("HashTableSnapshotOp")
       return Status::OK();
     });
 
+// Scans the next page of at most `max_rows` keys in [key_min, key_max] and
+// their ids from `cursor`, see HashTable::Scan.
+REGISTER_OP("HashTableScanOp")
+    .Input("hashtable: resource")
+    .Input("cursor: int64")
+    .Input("max_rows: int64")
+    .Input("key_min: int64")
+    .Input("key_max: int64")
+    .Output("keys: int64")
+    .Output("ids: int64")
+    .Output("next_cursor: int64")
+    .SetIsStateful()
+    .SetShapeFn([](InferenceContext* c) {
+      ShapeHandle cursor;
+      TF_RETURN_IF_ERROR(c->WithRank(c->input(1), 1, &cursor));
+      DimensionHandle unused;
+      TF_RETURN_IF_ERROR(c->WithValue(c->Dim(cursor, 0), 3, &unused));
+      for (int i = 2; i < 5; ++i) {
+        ShapeHandle s;
+        TF_RETURN_IF_ERROR(c->WithRank(c->input(i), 0, &s));
+      }
+      c->set_output(0, c->Vector(InferenceContext::kUnknownDim));
+      c->set_output(1, c->Vector(InferenceContext::kUnknownDim));
+      c->set_output(2, c->Vector(3));
+      return Status::OK();
+    });
+
 REGISTER_OP("HashTableDeleteKeyOp")
     .Input("hashtable: resource")
     .Input("keys: int64")
@@ -385,6 +460,7 @@ REGISTER_OP("BloomFilterInitializeOp")
     .Attr("dtype: {uint8, uint16, uint32}")
     .Attr("shape: shape")
     .Attr("initialized: bool")
+    .Attr("blocked: bool = false")
     .SetIsStateful()
     .SetShapeFn(shape_inference::NoOutputs);
 
@@ -400,5 +476,15 @@ REGISTER_OP("BloomFilterAdmitOp")
       return Status::OK();
     }); 
 
+// Halves the counters of a BloomFilter once for every multiple of
+// `decay_steps` passed by `global_step` since the last decay. The first run
+// only records the step.
+REGISTER_OP("BloomFilterDecayOp")
+    .Input("admit_strategy: resource")
+    .Input("global_step: int64")
+    .Attr("decay_steps: int >= 1")
+    .SetIsStateful()
+    .SetShapeFn(shape_inference::NoOutputs);
+
 }  // namespace tensorflow
 
@@ -143,10 +143,16 @@ REGISTER_OP("InitializeKvVariableOp")
     .Attr("max_element_size: int  = 0")
     .Attr("counter_type: type")
     .Attr("false_positive_probability: float = -1.0")
+    .Attr("filter_decay_steps: int = 0")
     .Attr("l2_weight_threshold: float =-1.0")
     .Attr("layout: string = 'normal'")
     .Attr("storage_type: int = 1")
     .Attr("storage_path: string = '.'")
+    .Attr("storage_size: list(int) = []")
+    .Attr("max_keys: int = 0")
+    .Attr("evict_policy: string = 'lru'")
+    .Attr("storage_dtype: {float, half, bfloat16, int8} = DT_FLOAT")
+    .Attr("slot_storage_dtype: {float, half, bfloat16, int8} = DT_FLOAT")
     .Attr("default_value_dim: int = 4096")
     .SetShapeFn([](InferenceContext* c) { 
       return Status::OK();
@@ -314,6 +320,48 @@ Produces an output tensor with shape `indices.shape + params.shape[1:]` where:
 
 )doc");
 
+REGISTER_OP("KvResourceGroupGather")
+    .Input("resources: N * resource")
+    .Input("indices: N * Tkeys")
+    .Input("counts: N * int32")
+    .Output("outputs: N * dtype")
+    .Attr("N: int >= 1")
+    .Attr("dtype: type")
+    .Attr("Tkeys: {int64,int32}")
+    .SetShapeFn([](InferenceContext* c) {
+      int n;
+      TF_RETURN_IF_ERROR(c->GetAttr("N", &n));
+      DataType value_dtype;
+      TF_RETURN_IF_ERROR(c->GetAttr("dtype", &value_dtype));
+      for (int i = 0; i < n; ++i) {
+        ShapeHandle params_subshape = c->UnknownShape();
+        auto* handle_data = c->input_handle_shapes_and_types(i);
+        if (handle_data != nullptr && !handle_data->empty()) {
+          const ShapeAndType& shape_and_type = (*handle_data)[0];
+          if (shape_and_type.dtype != value_dtype) {
+            return errors::InvalidArgument(
+                "Trying to read variable with wrong dtype. "
+                "Expected ",
+                DataTypeString(shape_and_type.dtype), " got ",
+                DataTypeString(value_dtype));
+          }
+          params_subshape = shape_and_type.shape;
+        }
+        ShapeHandle out;
+        TF_RETURN_IF_ERROR(
+            c->Concatenate(c->input(n + i), params_subshape, &out));
+        c->set_output(i, out);
+      }
+      return Status::OK();
+    })
+    .Doc(R"doc(
+Gathers slices from N EmbeddingVariables in a single op, e.g. all the
+variables of a model placed on the same parameter server. `outputs[i]` is
+`KvResourceGatherV1(resources[i], indices[i], counts=counts[i])`; the
+variables may have different embedding dimensions. Lookups of all the
+variables are sharded together over the worker threads.
+)doc");
+
 REGISTER_OP("KvResourceScatterAdd")
     .Input("resource: resource")
     .Input("indices: Tkeys")
@@ -425,6 +473,11 @@ REGISTER_OP("KvResourceImportV2")
     .Attr("max_freq: int = 999999")
     .Attr("storage_type: int = 1")
     .Attr("storage_path: string = '.'")
+    .Attr("storage_size: list(int) = []")
+    .Attr("max_keys: int = 0")
+    .Attr("evict_policy: string = 'lru'")
+    .Attr("storage_dtype: {float, half, bfloat16, int8} = DT_FLOAT")
+    .Attr("slot_storage_dtype: {float, half, bfloat16, int8} = DT_FLOAT")
     .Attr("default_value_dim: int = 4096")
     .SetShapeFn([](InferenceContext* c) {
           ShapeHandle handle;
@@ -480,6 +533,73 @@ versions: Vector of all versions present in the table.
 freqs: Vector of all freqs present in the table.
 )doc");
 
+REGISTER_OP("KvResourceStatistics")
+    .Input("resource_handle: resource")
+    .Input("global_step: int64")
+    .Output("size: int64")
+    .Output("memory_bytes: int64")
+    .Output("freq_histogram: int64")
+    .Output("top_keys: Tkeys")
+    .Output("top_freqs: int64")
+    .Output("age_histogram: int64")
+    .Attr("Tkeys: {int64,int32}")
+    .Attr("dtype: type")
+    .Attr("top_k: int = 10")
+    .Attr("num_buckets: int = 32")
+    .SetShapeFn([](InferenceContext* c) {
+      ShapeHandle handle;
+      TF_RETURN_IF_ERROR(c->WithRank(c->input(0), 0, &handle));
+      TF_RETURN_IF_ERROR(c->WithRank(c->input(1), 0, &handle));
+      c->set_output(0, c->Scalar());
+      c->set_output(1, c->Scalar());
+      c->set_output(2, c->Vector(InferenceContext::kUnknownDim));
+      c->set_output(3, c->Vector(InferenceContext::kUnknownDim));
+      c->set_output(4, c->Vector(InferenceContext::kUnknownDim));
+      c->set_output(5, c->Vector(InferenceContext::kUnknownDim));
+      return Status::OK();
+    })
+    .Doc(R"doc(
+Outputs statistics of the keys in the kv resource, without their values.
+
+Bucket i of a histogram counts the values in [2^(i-1), 2^i), bucket 0 counts
+the zeros and the last bucket is open ended.
+
+resource_handle: Handle to the kvResource.
+global_step: Step the ages are relative to, the latest version if negative.
+size: Number of keys in the table.
+memory_bytes: Approximate bytes used by the keys held in memory, slots included.
+freq_histogram: Histogram of the key frequencies, empty unless a filter tracks
+  them.
+top_keys: Up to `top_k` keys of highest frequency.
+top_freqs: Frequencies of `top_keys`.
+age_histogram: Histogram of the steps since the keys were last updated, empty
+  unless steps_to_live tracks them.
+)doc");
+
+REGISTER_OP("KvResourceFilterDecay")
+    .Input("resource_handle: resource")
+    .Input("global_step: int64")
+    .Attr("Tkeys: {int64,int32}")
+    .Attr("dtype: type")
+    .Attr("decay_steps: int >= 1")
+    .SetShapeFn([](InferenceContext* c) {
+      ShapeHandle handle;
+      TF_RETURN_IF_ERROR(c->WithRank(c->input(0), 0, &handle));
+      TF_RETURN_IF_ERROR(c->WithRank(c->input(1), 0, &handle));
+      return Status::OK();
+    })
+    .Doc(R"doc(
+Halves the counters of the counting filter of the kv resource once every
+`decay_steps` steps.
+
+The counters are halved once for every multiple of `decay_steps` passed by
+`global_step` since the last decay, the first run only records the step. It
+does nothing if the kv resource has no counting filter.
+
+resource_handle: Handle to the kvResource.
+global_step: The current step.
+)doc");
+
 REGISTER_OP("KvResourceInsert")
     .Input("resource_handle: resource")
     .Input("keys: Tkeys")
@@ -495,4 +615,133 @@ REGISTER_OP("KvResourceInsert")
         })
     .Doc(R"doc(
 )doc");
+
+// Worker local hot key cache of an EmbeddingVariable.
+REGISTER_OP("KvHotCacheHandleOp")
+    .Attr("container: string = ''")
+    .Attr("shared_name: string = ''")
+    .Attr("Tkeys: {int64,int32}")
+    .Attr("dtype: type")
+    .Output("resource: resource")
+    .SetIsStateful()
+    .SetShapeFn(shape_inference::ScalarShape)
+    .Doc(R"doc(
+Creates a handle to a hot key cache.
+)doc");
+
+REGISTER_OP("KvHotCacheCreate")
+    .Input("resource: resource")
+    .Attr("capacity: int")
+    .Attr("value_len: int")
+    .Attr("max_staleness: int")
+    .Attr("Tkeys: {int64,int32}")
+    .Attr("dtype: type")
+    .SetShapeFn(shape_inference::NoOutputs)
+    .Doc(R"doc(
+Creates the hot key cache pointed to by `resource`.
+
+capacity: Max number of cached ids.
+value_len: Embedding dimension.
+max_staleness: Cached values older than this number of global steps are not
+  served.
+)doc");
+
+REGISTER_OP("KvHotCacheIsInitialized")
+    .Input("resource: resource")
+    .Output("is_initialized: bool")
+    .Attr("Tkeys: {int64,int32}")
+    .Attr("dtype: type")
+    .SetShapeFn(shape_inference::ScalarShape)
+    .Doc(R"doc(
+Checks whether the hot key cache has been created.
+)doc");
+
+REGISTER_OP("KvHotCacheLookup")
+    .Input("resource: resource")
+    .Input("ids: Tkeys")
+    .Input("global_step: int64")
+    .Output("hit_indices: int32")
+    .Output("hit_values: dtype")
+    .Output("miss_indices: int32")
+    .Attr("Tkeys: {int64,int32}")
+    .Attr("dtype: type")
+    .SetShapeFn([](InferenceContext* c) {
+      ShapeHandle unused;
+      TF_RETURN_IF_ERROR(c->WithRank(c->input(1), 1, &unused));
+      c->set_output(0, c->Vector(InferenceContext::kUnknownDim));
+      c->set_output(1, c->Matrix(InferenceContext::kUnknownDim,
+                                 InferenceContext::kUnknownDim));
+      c->set_output(2, c->Vector(InferenceContext::kUnknownDim));
+      return Status::OK();
+    })
+    .Doc(R"doc(
+Looks up `ids` in the hot key cache and records their access.
+
+hit_indices: Positions in `ids` found in the cache.
+hit_values: Cached values of `ids[hit_indices]`.
+miss_indices: Positions in `ids` that must be fetched from the variable.
+)doc");
+
+REGISTER_OP("KvHotCacheHotKeys")
+    .Input("resource: resource")
+    .Output("ids: Tkeys")
+    .Attr("Tkeys: {int64,int32}")
+    .Attr("dtype: type")
+    .SetShapeFn([](InferenceContext* c) {
+      c->set_output(0, c->Vector(InferenceContext::kUnknownDim));
+      return Status::OK();
+    })
+    .Doc(R"doc(
+Returns the most accessed ids, at most `capacity` of them.
+)doc");
+
+REGISTER_OP("KvHotCacheUpdate")
+    .Input("resource: resource")
+    .Input("ids: Tkeys")
+    .Input("values: dtype")
+    .Input("global_step: int64")
+    .Attr("Tkeys: {int64,int32}")
+    .Attr("dtype: type")
+    .SetShapeFn(shape_inference::NoOutputs)
+    .Doc(R"doc(
+Replaces the content of the hot key cache with `ids` and `values` read at
+`global_step`.
+)doc");
+
+REGISTER_OP("KvHotCacheStats")
+    .Input("resource: resource")
+    .Output("hits: int64")
+    .Output("misses: int64")
+    .Output("size: int64")
+    .Output("version: int64")
+    .Attr("Tkeys: {int64,int32}")
+    .Attr("dtype: type")
+    .SetShapeFn([](InferenceContext* c) {
+      for (int i = 0; i < 4; ++i) {
+        c->set_output(i, c->Scalar());
+      }
+      return Status::OK();
+    })
+    .Doc(R"doc(
+Returns the hit and miss counters, the number of cached ids and the global step
+of the cached values.
+)doc");
+
+REGISTER_OP("KvResourceCachedGather")
+    .Input("resource: resource")
+    .Input("indices: Tkeys")
+    .Input("values: dtype")
+    .Output("output: dtype")
+    .Attr("dtype: type")
+    .Attr("Tkeys: {int64,int32}")
+    .SetShapeFn([](InferenceContext* c) {
+      c->set_output(0, c->input(2));
+      return Status::OK();
+    })
+    .Doc(R"doc(
+Forwards `values`, the cached rows of `indices` in the variable pointed to by
+`resource`, without reading the variable. Its gradient is the same as the one
+of KvResourceGather, so that cached rows are still updated by the optimizer.
+The op isn't colocated with `resource`.
+)doc");
 }  // namespace tensorflow
@@ -109,6 +109,9 @@ REGISTER_OP("WorkQueueTake")
     .Input("handle: resource")
     .Output("work: string")
     .Attr("num_clients: int >= 1 = 1")
+    .Attr("client: string = ''")
+    .Attr("adaptive: bool = false")
+    .Attr("locality: list(string) = []")
     .SetShapeFn(shape_inference::ScalarShape)
     .SetIsStateful()
     .Doc(R"doc(
@@ -117,6 +120,59 @@ Take a work from the work queue.
 handle: Handle of a work queue.
 work: A tensor of taken work.
 num_clients:  Number of threads for taking works.
+client: Unique name of the client.
+adaptive: If true, contiguous slices are merged into one work, sized by the
+  remaining works and consumption rate of the client.
+locality: Locality hints of the client, e.g. host names, path prefixes or
+  names of locally cached files. Works local to the client are preferred.
+)doc");
+
+REGISTER_OP("WorkQueueTakeMany")
+    .Input("handle: resource")
+    .Input("num_consumed: int64")
+    .Output("works: string")
+    .Attr("client: string")
+    .Attr("num_works: int >= 1 = 1")
+    .Attr("num_clients: int >= 1 = 1")
+    .Attr("adaptive: bool = false")
+    .Attr("locality: list(string) = []")
+    .SetShapeFn([](InferenceContext* c) {
+      c->set_output(0, c->Vector(InferenceContext::kUnknownDim));
+      return Status::OK();
+    })
+    .SetIsStateful()
+    .Doc(R"doc(
+Take up to `num_works` works from the work queue at once.
+
+Taken works are leased to the client until they are acknowledged as consumed,
+and leased works are saved along with the work queue.
+
+handle: Handle of a work queue.
+num_consumed: Number of leased works consumed by the client since last
+  acknowledgement.
+works: A vector of taken works.
+client: Unique name of the client.
+num_works: Max number of works to take.
+num_clients:  Number of threads for taking works.
+adaptive: If true, contiguous slices are merged into one work, sized by the
+  remaining works and consumption rate of the client.
+locality: Locality hints of the client, e.g. host names, path prefixes or
+  names of locally cached files. Works local to the client are preferred.
+)doc");
+
+REGISTER_OP("WorkQueueGiveBack")
+    .Input("handle: resource")
+    .Input("num_consumed: int64")
+    .Attr("client: string")
+    .SetShapeFn(shape_inference::NoOutputs)
+    .SetIsStateful()
+    .Doc(R"doc(
+Gives unconsumed works leased to the client back to the work queue.
+
+handle: Handle of a work queue.
+num_consumed: Number of leased works consumed by the client since last
+  acknowledgement.
+client: Unique name of the client.
 )doc");
 
 REGISTER_OP("SaveLocalWork")
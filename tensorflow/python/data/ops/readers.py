@@ -492,6 +492,57 @@ class FixedLengthRecordDatasetV1(dataset_ops.DatasetV1Adapter):
     self._dataset._filenames = value  # pylint: disable=protected-access
 
 
+class _FileSliceDataset(dataset_ops.DatasetSource):
+  """A `Dataset` comprising records within a byte range of one file."""
+
+  def __init__(self, dataset_fn, filename, start=0, end=-1, buffer_size=None):
+    """Creates a `_FileSliceDataset`.
+
+    Args:
+      dataset_fn: Generated op function creating the variant tensor.
+      filename: A `tf.string` scalar containing an uncompressed file name.
+      start: (Optional.) A `tf.int64` scalar denoting the byte offset of the
+        first record to read, which must be aligned to a record.
+      end: (Optional.) A `tf.int64` scalar. Records starting before this byte
+        offset are read. A negative value reads until the end of the file.
+      buffer_size: (Optional.) A `tf.int64` scalar denoting the number of bytes
+        to buffer. A value of 0 results in the default buffering value.
+    """
+    self._filename = ops.convert_to_tensor(
+        filename, dtype=dtypes.string, name="filename")
+    self._start = ops.convert_to_tensor(start, dtype=dtypes.int64, name="start")
+    self._end = ops.convert_to_tensor(end, dtype=dtypes.int64, name="end")
+    self._buffer_size = convert.optional_param_to_tensor(
+        "buffer_size",
+        buffer_size,
+        argument_default=_DEFAULT_READER_BUFFER_SIZE_BYTES)
+    variant_tensor = dataset_fn(
+        self._filename, self._start, self._end, self._buffer_size)
+    super(_FileSliceDataset, self).__init__(variant_tensor)
+
+  @property
+  def element_spec(self):
+    return tensor_spec.TensorSpec([], dtypes.string)
+
+
+class TextLineSliceDataset(_FileSliceDataset):
+  """A `Dataset` comprising lines starting within a byte range of a text file."""
+
+  def __init__(self, filename, start=0, end=-1, buffer_size=None):
+    super(TextLineSliceDataset, self).__init__(
+        gen_dataset_ops.text_line_slice_dataset,
+        filename, start, end, buffer_size)
+
+
+class TFRecordSliceDataset(_FileSliceDataset):
+  """A `Dataset` comprising records within a byte range of one TFRecord file."""
+
+  def __init__(self, filename, start=0, end=-1, buffer_size=None):
+    super(TFRecordSliceDataset, self).__init__(
+        gen_dataset_ops.tf_record_slice_dataset,
+        filename, start, end, buffer_size)
+
+
 @tf_export(v1=["data.KafkaDataset"])
 class KafkaDataset(dataset_ops.Dataset):
     """A Kafka Dataset that consumes the message.
@@ -17,6 +17,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import threading
+
 from six.moves import xrange  # pylint: disable=redefined-builtin
 
 from tensorflow.python.framework import constant_op
@@ -27,16 +29,22 @@ from tensorflow.python.framework import tensor_shape
 from tensorflow.python.ops import array_ops
 from tensorflow.python.ops import check_ops
 from tensorflow.python.ops import clip_ops
+from tensorflow.python.ops import control_flow_ops
 # Imports gradient definitions.
 from tensorflow.python.ops import data_flow_grad  # pylint: disable=unused-import
 from tensorflow.python.ops import data_flow_ops
+from tensorflow.python.ops import gen_array_ops
+from tensorflow.python.ops import gen_kv_variable_ops
 from tensorflow.python.ops import kv_variable_ops
 from tensorflow.python.ops import math_ops
 from tensorflow.python.ops import resource_variable_ops
+from tensorflow.python.ops import resources
 from tensorflow.python.ops import sparse_ops
+from tensorflow.python.ops import state_ops
 from tensorflow.python.ops import variables
 from tensorflow.python.ops import fused_embedding_ops
 from tensorflow.python.platform import tf_logging as logging
+from tensorflow.python.training import session_run_hook
 from tensorflow.python.util.tf_export import tf_export
 
 
@@ -485,7 +493,8 @@ def embedding_lookup_sparse(params,
                             name=None,
                             combiner=None,
                             max_norm=None,
-                            blocknums=None):
+                            blocknums=None,
+                            hot_key_cache=None):
   """Computes embeddings for the given ids and weights.
 
   This op assumes that there is at least one id for each row in the dense tensor
@@ -517,6 +526,8 @@ def embedding_lookup_sparse(params,
       sum of the squares of the weights.
     max_norm: If not `None`, each embedding is clipped if its l2-norm is larger
       than this value, before combining.
+    hot_key_cache: An optional `HotKeyCache` of `params`. Ids found in the
+      cache are read on the worker instead of the PS.
 
   Returns:
     A dense tensor representing the combined embeddings for the
@@ -602,9 +613,12 @@ def embedding_lookup_sparse(params,
         raise ValueError("blocknums now require unqiue index to be generagted")
       else:
         uniqued_blocknums = math_ops.unsorted_segment_max(blocknums, idx, array_ops.squeeze(array_ops.shape(ids), 0))
-    embeddings = embedding_lookup(
-        params, ids, partition_strategy=partition_strategy, max_norm=max_norm,
-        blocknums=uniqued_blocknums, counts = counts)
+    if hot_key_cache is not None:
+      embeddings = hot_key_cache.lookup(ids, max_norm=max_norm)
+    else:
+      embeddings = embedding_lookup(
+          params, ids, partition_strategy=partition_strategy, max_norm=max_norm,
+          blocknums=uniqued_blocknums, counts = counts)
     if embeddings.dtype in (dtypes.float16, dtypes.bfloat16):
       embeddings = math_ops.cast(embeddings, dtypes.float32)
     if not ignore_weights:
@@ -675,6 +689,596 @@ def embedding_lookup_sparse(params,
 
     return embeddings
 
+
+_GROUP_COMBINERS = ("sum", "mean", "sqrtn")
+
+
+def _group_unique(ids_list):
+  """Deduplicates the ids of several columns with a single op.
+
+  An id found in several columns is kept once for each of them. Returns the
+  unique ids, their columns, or None for a single column, their counts and
+  the position of every id among them.
+  """
+  if len(ids_list) == 1:
+    unique_ids, idx, counts = array_ops.unique_with_counts(ids_list[0])
+    return unique_ids, None, idx, counts
+  ids = array_ops.concat(ids_list, 0)
+  columns = array_ops.repeat(
+      math_ops.range(len(ids_list), dtype=ids.dtype),
+      array_ops.stack([array_ops.size(i) for i in ids_list]))
+  unique_pairs, idx, counts = gen_array_ops.unique_with_counts_v2(
+      array_ops.stack([columns, ids], axis=1), axis=[0])
+  return (unique_pairs[:, 1], math_ops.cast(unique_pairs[:, 0], dtypes.int32),
+          idx, counts)
+
+
+def _group_combine(embeddings, idx, sp_ids, sp_weights, combiners):
+  """Combines the uniqued `embeddings` of several columns with single ops.
+
+  The rows of the columns are stacked, so that a single segment reduction
+  combines all of them. Returns the combined embeddings of every column.
+  """
+  num_rows = array_ops.stack([sp.dense_shape[0] for sp in sp_ids])
+  row_offsets = math_ops.cumsum(num_rows, exclusive=True)
+  segment_ids = math_ops.cast(array_ops.concat(
+      [sp.indices[:, 0] + row_offsets[i] for i, sp in enumerate(sp_ids)], 0),
+                              dtypes.int32)
+  num_segments = math_ops.reduce_sum(num_rows)
+  if all(w is None for w in sp_weights):
+    weights = None
+    embeddings = math_ops.sparse_segment_sum(
+        embeddings, idx, segment_ids, num_segments=num_segments)
+  else:
+    weights = array_ops.concat(
+        [array_ops.ones_like(sp.values, dtype=embeddings.dtype) if w is None
+         else math_ops.cast(w.values, embeddings.dtype)
+         for sp, w in zip(sp_ids, sp_weights)], 0)
+    embeddings = math_ops.unsorted_segment_sum(
+        array_ops.gather(embeddings, idx) * array_ops.expand_dims(weights, 1),
+        segment_ids, num_segments)
+  if any(c != "sum" for c in combiners):
+    if weights is None:
+      weights = array_ops.ones_like(segment_ids, dtype=embeddings.dtype)
+    row_combiners = array_ops.repeat(
+        constant_op.constant([_GROUP_COMBINERS.index(c) for c in combiners]),
+        math_ops.cast(num_rows, dtypes.int32))
+    denominators = array_ops.ones([num_segments], dtype=embeddings.dtype)
+    if "mean" in combiners:
+      denominators = array_ops.where(
+          math_ops.equal(row_combiners, _GROUP_COMBINERS.index("mean")),
+          math_ops.unsorted_segment_sum(weights, segment_ids, num_segments),
+          denominators)
+    if "sqrtn" in combiners:
+      denominators = array_ops.where(
+          math_ops.equal(row_combiners, _GROUP_COMBINERS.index("sqrtn")),
+          math_ops.sqrt(math_ops.unsorted_segment_sum(
+              weights * weights, segment_ids, num_segments)),
+          denominators)
+    # Empty rows stay zero.
+    embeddings = math_ops.div_no_nan(embeddings,
+                                     array_ops.expand_dims(denominators, 1))
+  return array_ops.split(embeddings, num_rows, num=len(sp_ids))
+
+
+@tf_export(v1=["nn.group_embedding_lookup_sparse"])
+def group_embedding_lookup_sparse(params,
+                                  sp_ids,
+                                  combiners,
+                                  sp_weights=None,
+                                  name=None):
+  """Computes embeddings of several columns with grouped lookups.
+
+  It returns the same results as calling `embedding_lookup_sparse` once for
+  every column, but the work is shared by the columns:
+
+  * The columns whose EmbeddingVariables have the same dtype and embedding
+    dimension, and whose ids have the same dtype, are fused. Their ids are
+    deduplicated, partitioned and stitched by single ops, and they are
+    combined by a single segment reduction, also in the backward pass.
+  * All the EmbeddingVariables placed on the same device are read by a
+    single `KvResourceGroupGather` op, whose gradient yields an
+    `IndexedSlices` for each of its variables.
+
+  Columns may have different embedding dimensions and combiners. The result
+  of a column has a row for every row of its `sp_ids`, rows without ids are
+  zero.
+
+  Args:
+    params: A list of `EmbeddingVariable`s, one per column. An element may
+      also be a list of EmbeddingVariables or a `PartitionedVariable` of
+      EmbeddingVariables.
+    sp_ids: A list of N x M `SparseTensor`s of ids, one per column.
+    combiners: A list of strings, one per column. Currently "mean", "sqrtn"
+      and "sum" are supported.
+    sp_weights: `None`, or a list with, for each column, either a
+      `SparseTensor` of weights or `None`. See `embedding_lookup_sparse`.
+    name: Optional name for the op.
+
+  Returns:
+    A list with a dense tensor of combined embeddings for each column.
+
+  Raises:
+    TypeError: If an element of `params` isn't an EmbeddingVariable, or if an
+      element of `sp_ids` isn't a `SparseTensor`.
+    ValueError: If the arguments don't have the same length, if a combiner
+      isn't one of {"mean", "sqrtn", "sum"}, or if an EmbeddingVariable has
+      blocknums or a dynamic dimension.
+  """
+  num_columns = len(params)
+  if sp_weights is None:
+    sp_weights = [None] * num_columns
+  if len(sp_ids) != num_columns or len(combiners) != num_columns or \
+      len(sp_weights) != num_columns:
+    raise ValueError("params, sp_ids, combiners and sp_weights must have the "
+                     "same length, got %d, %d, %d and %d" %
+                     (num_columns, len(sp_ids), len(combiners),
+                      len(sp_weights)))
+  params = [list(p) if isinstance(p, (list, variables.PartitionedVariable))
+            else [p] for p in params]
+  dims = []
+  for i in range(num_columns):
+    if combiners[i] not in _GROUP_COMBINERS:
+      raise ValueError("combiner must be one of 'mean', 'sqrtn' or 'sum'")
+    if not isinstance(sp_ids[i], sparse_tensor.SparseTensor):
+      raise TypeError("sp_ids must be SparseTensor")
+    if sp_weights[i] is not None and \
+        not isinstance(sp_weights[i], sparse_tensor.SparseTensor):
+      raise TypeError("sp_weights must be either None or SparseTensor")
+    column_dims = set()
+    for p in params[i]:
+      if isinstance(p, kv_variable_ops.DynamicEmbeddingVariable):
+        raise ValueError("group_embedding_lookup_sparse doesn't support "
+                         "DynamicEmbeddingVariable.")
+      if not isinstance(p, kv_variable_ops.EmbeddingVariable):
+        raise TypeError("params of group_embedding_lookup_sparse must be "
+                        "EmbeddingVariables, got %s" % type(p))
+      if p.block_num > 1:
+        raise ValueError("group_embedding_lookup_sparse doesn't support "
+                         "EmbeddingVariable with blocknums.")
+      column_dims.add(tensor_shape.dimension_value(p.get_shape()[-1]))
+    if None in column_dims or len(column_dims) != 1:
+      raise ValueError("group_embedding_lookup_sparse needs the same static "
+                       "embedding dimension for all partitions of a column, "
+                       "got %s" % column_dims)
+    dims.append(column_dims.pop())
+
+  with ops.name_scope(name, "group_embedding_lookup_sparse"):
+    fusions = {}
+    fusion_keys = []
+    for i in range(num_columns):
+      key = (params[i][0].dtype.base_dtype, dims[i], sp_ids[i].values.dtype)
+      if key not in fusions:
+        fusions[key] = []
+        fusion_keys.append(key)
+      fusions[key].append(i)
+    fusions = [fusions[key] for key in fusion_keys]
+
+    # Lookups of all the partitions, grouped by the device of the variable.
+    groups = {}
+    group_keys = []
+    uniqued = []
+    for f, columns in enumerate(fusions):
+      unique_ids, unique_columns, idx, counts = _group_unique(
+          [sp_ids[i].values for i in columns])
+      # The partitions of the fused columns are numbered one after another.
+      evs = [p for i in columns for p in params[i]]
+      np = len(evs)
+      if np == 1:
+        gather_ids, gather_counts, pindices = [unique_ids], [counts], None
+      else:
+        num_partitions = [len(params[i]) for i in columns]
+        if unique_columns is None:
+          p_assignments = math_ops.cast(
+              unique_ids % 1000 % num_partitions[0], dtypes.int32)
+        else:
+          first_partitions = [sum(num_partitions[:j])
+                              for j in range(len(columns))]
+          column_partitions = array_ops.gather(
+              constant_op.constant(num_partitions, dtype=unique_ids.dtype),
+              unique_columns)
+          p_assignments = array_ops.gather(
+              constant_op.constant(first_partitions, dtype=dtypes.int32),
+              unique_columns) + math_ops.cast(
+                  unique_ids % 1000 % column_partitions, dtypes.int32)
+        gather_ids = data_flow_ops.dynamic_partition(unique_ids,
+                                                     p_assignments, np)
+        gather_counts = data_flow_ops.dynamic_partition(counts,
+                                                        p_assignments, np)
+        pindices = data_flow_ops.dynamic_partition(
+            math_ops.range(array_ops.size(unique_ids)), p_assignments, np)
+      uniqued.append((idx, pindices))
+      for p, ev in enumerate(evs):
+        key = (ev.device, ev.dtype.base_dtype, gather_ids[p].dtype)
+        if key not in groups:
+          groups[key] = []
+          group_keys.append(key)
+        groups[key].append((f, p, ev, gather_ids[p], gather_counts[p]))
+
+    results = [[None] * sum(len(params[i]) for i in columns)
+               for columns in fusions]
+    for key in group_keys:
+      entries = groups[key]
+      # The counters of the filters are decayed before the keys are counted.
+      decay_ops = []
+      for e in entries:
+        decay_ops.extend(e[2]._filter_decay_ops())  # pylint: disable=protected-access
+      with ops.colocate_with(entries[0][2]), \
+          ops.control_dependencies(decay_ops):
+        outputs = gen_kv_variable_ops.kv_resource_group_gather(
+            [e[2].handle for e in entries], [e[3] for e in entries],
+            [e[4] for e in entries], dtype=key[1])
+      for e, output in zip(entries, outputs):
+        results[e[0]][e[1]] = output
+
+    embeddings_list = [None] * num_columns
+    for f, columns in enumerate(fusions):
+      idx, pindices = uniqued[f]
+      if pindices is None:
+        embeddings = results[f][0]
+      else:
+        embeddings = data_flow_ops.parallel_dynamic_stitch(pindices,
+                                                           results[f])
+      combined = _group_combine(embeddings, idx,
+                                [sp_ids[i] for i in columns],
+                                [sp_weights[i] for i in columns],
+                                [combiners[i] for i in columns])
+      for i, embeddings in zip(columns, combined):
+        embeddings_list[i] = embeddings
+    return embeddings_list
+
+_HOT_KEY_CACHES = "hot_key_caches"
+
+
+def _check_embedding_variables(params, cls_name):
+  """Returns `params` as a list of EmbeddingVariables without filters."""
+  if isinstance(params, variables.PartitionedVariable):
+    params = list(params)
+  if not isinstance(params, list):
+    params = [params]
+  for p in params:
+    if isinstance(p, kv_variable_ops.DynamicEmbeddingVariable):
+      raise ValueError("%s doesn't support DynamicEmbeddingVariable."
+                       % cls_name)
+    if not isinstance(p, kv_variable_ops.EmbeddingVariable):
+      raise TypeError("%s only supports EmbeddingVariable, got %s"
+                      % (cls_name, type(p)))
+    if p.block_num > 1:
+      raise ValueError("%s doesn't support EmbeddingVariable with blocknums."
+                       % cls_name)
+    if p._filter_freq != 0:  # pylint: disable=protected-access
+      raise ValueError("%s doesn't support feature filter." % cls_name)
+  return params
+
+
+def _cached_gather(params, ids, values):
+  """Forwards `values` of `ids` read before, with gradients to `params`."""
+  # Route the cached rows through the partition owning them, so that the
+  # gradients reach the right variable.
+  np = len(params)
+  if np == 1:
+    return gen_kv_variable_ops.kv_resource_cached_gather(
+        params[0].handle, ids, values)
+  p_assignments = math_ops.cast(ids % 1000 % np, dtypes.int32)
+  gather_ids = data_flow_ops.dynamic_partition(ids, p_assignments, np)
+  gather_values = data_flow_ops.dynamic_partition(values, p_assignments, np)
+  pindices = data_flow_ops.dynamic_partition(
+      math_ops.range(array_ops.size(ids)), p_assignments, np)
+  partitioned_result = []
+  for p in range(np):
+    partitioned_result.append(gen_kv_variable_ops.kv_resource_cached_gather(
+        params[p].handle, gather_ids[p], gather_values[p]))
+  return data_flow_ops.dynamic_stitch(pindices, partitioned_result)
+
+
+@tf_export(v1=["nn.HotKeyCache"])
+class HotKeyCache(object):
+  """Worker local cache of the hottest ids of a partitioned EmbeddingVariable.
+
+  Every lookup records the ids it sees. `refresh_op` fetches the values of the
+  `capacity` most frequent ids from the PS into the cache. Lookups of cached
+  ids don't read the PS, their gradients are still applied to the variable.
+  Cached values are only used while they are at most `max_staleness` global
+  steps old, after that every id is read from the PS until the next refresh.
+  Use `HotKeyCacheRefreshHook` to refresh the caches in the background. The
+  global step has to be created before the lookups.
+
+  Feature filters aren't supported: the filter has to see every access.
+  Neither are EmbeddingVariables with blocknums.
+  """
+
+  def __init__(self, params, capacity, max_staleness=100,
+               partition_strategy="mod", name=None):
+    params = _check_embedding_variables(params, "HotKeyCache")
+    if capacity <= 0:
+      raise ValueError("capacity must larger than 0")
+    if max_staleness < 0:
+      raise ValueError("max_staleness must not be negative")
+    self._params = params
+    self._partition_strategy = partition_strategy
+    self._key_dtype = params[0]._invalid_key_type  # pylint: disable=protected-access
+    self._value_dtype = params[0].dtype.base_dtype
+    self._refresh_op = None
+    value_len = tensor_shape.dimension_value(params[0].get_shape()[-1])
+    with ops.name_scope(name, "HotKeyCache") as name:
+      self._handle = gen_kv_variable_ops.kv_hot_cache_handle_op(
+          shared_name=name, Tkeys=self._key_dtype, dtype=self._value_dtype)
+      self._initializer = gen_kv_variable_ops.kv_hot_cache_create(
+          self._handle, capacity=capacity, value_len=value_len,
+          max_staleness=max_staleness, Tkeys=self._key_dtype,
+          dtype=self._value_dtype)
+      is_initialized = gen_kv_variable_ops.kv_hot_cache_is_initialized(
+          self._handle, Tkeys=self._key_dtype, dtype=self._value_dtype)
+    resources.register_resource(self._handle, self._initializer,
+                                is_initialized, is_shared=False)
+    ops.add_to_collection(_HOT_KEY_CACHES, self)
+
+  @property
+  def initializer(self):
+    return self._initializer
+
+  def _global_step(self):
+    from tensorflow.python.training import training_util
+    global_step = training_util.get_global_step()
+    if global_step is None:
+      raise ValueError("HotKeyCache needs a global step.")
+    return math_ops.cast(global_step, dtypes.int64)
+
+  def lookup(self, ids, max_norm=None, name=None):
+    """Looks up the unique 1-D `ids`, reading the PS only for cache misses.
+
+    Raises:
+      ValueError: If there is no global step.
+    """
+    with ops.name_scope(name, "hot_key_cache_lookup", [ids]):
+      ids = ops.convert_to_tensor(ids, dtype=self._key_dtype)
+      # Cache hits don't read the variables, the filters are decayed for
+      # every lookup.
+      decay_ops = []
+      for p in self._params:
+        decay_ops.extend(p._filter_decay_ops())  # pylint: disable=protected-access
+      with ops.control_dependencies(decay_ops):
+        hit_indices, hit_values, miss_indices = (
+            gen_kv_variable_ops.kv_hot_cache_lookup(
+                self._handle, ids, self._global_step(),
+                dtype=self._value_dtype))
+      miss_embeddings = embedding_lookup(
+          self._params, array_ops.gather(ids, miss_indices),
+          partition_strategy=self._partition_strategy, max_norm=max_norm)
+      hit_embeddings = _clip(
+          self._cached_gather(array_ops.gather(ids, hit_indices), hit_values),
+          hit_indices, max_norm)
+      return data_flow_ops.dynamic_stitch(
+          [hit_indices, miss_indices], [hit_embeddings, miss_embeddings])
+
+  def _cached_gather(self, ids, values):
+    return _cached_gather(self._params, ids, values)
+
+  @property
+  def refresh_op(self):
+    """Op that replaces the cache content with the current hottest ids."""
+    if self._refresh_op is None:
+      with ops.name_scope("hot_key_cache_refresh"):
+        hot_ids = gen_kv_variable_ops.kv_hot_cache_hot_keys(
+            self._handle, Tkeys=self._key_dtype, dtype=self._value_dtype)
+        global_step = self._global_step()
+        values = embedding_lookup(self._params, hot_ids,
+                                  partition_strategy=self._partition_strategy)
+        self._refresh_op = gen_kv_variable_ops.kv_hot_cache_update(
+            self._handle, hot_ids, values, global_step)
+    return self._refresh_op
+
+  def stats(self):
+    """Returns a dict of the hit, miss counters, cache size and version."""
+    hits, misses, size, version = gen_kv_variable_ops.kv_hot_cache_stats(
+        self._handle, Tkeys=self._key_dtype, dtype=self._value_dtype)
+    return {"hits": hits, "misses": misses, "size": size, "version": version}
+
+
+@tf_export(v1=["nn.HotKeyCacheRefreshHook"])
+class HotKeyCacheRefreshHook(session_run_hook.SessionRunHook):
+  """Refreshes the `HotKeyCache`s every `every_n_steps` global steps.
+
+  The refresh runs in a background thread, training steps don't wait for it.
+  A refresh requested while the previous one is running is skipped.
+  """
+
+  def __init__(self, caches=None, every_n_steps=50):
+    if every_n_steps <= 0:
+      raise ValueError("every_n_steps must larger than 0")
+    self._caches = caches
+    self._every_n_steps = every_n_steps
+    self._last_trigger_step = None
+    self._thread = None
+
+  def begin(self):
+    from tensorflow.python.training import training_util
+    if self._caches is None:
+      self._caches = ops.get_collection(_HOT_KEY_CACHES)
+    self._global_step = training_util.get_global_step()
+    if self._global_step is None:
+      raise RuntimeError(
+          "Global step should be created to use HotKeyCacheRefreshHook.")
+    self._refresh_op = control_flow_ops.group(
+        [cache.refresh_op for cache in self._caches])
+    self._trigger = threading.Event()
+    self._stop = threading.Event()
+
+  def after_create_session(self, session, coord):
+    self._thread = threading.Thread(target=self._run,
+                                    args=(session, coord))
+    self._thread.daemon = True
+    self._thread.start()
+    self._trigger.set()
+
+  def _run(self, session, coord):
+    while True:
+      self._trigger.wait()
+      if self._stop.is_set() or coord.should_stop():
+        return
+      try:
+        session.run(self._refresh_op)
+      except Exception as e:  # pylint: disable=broad-except
+        logging.warning("HotKeyCache refresh failed: %s", e)
+      self._trigger.clear()
+
+  def before_run(self, run_context):
+    return session_run_hook.SessionRunArgs(self._global_step)
+
+  def after_run(self, run_context, run_values):
+    global_step = run_values.results
+    if self._last_trigger_step is None:
+      self._last_trigger_step = global_step
+    if global_step - self._last_trigger_step >= self._every_n_steps:
+      self._last_trigger_step = global_step
+      self._trigger.set()
+
+  def end(self, session):
+    if self._thread is not None:
+      self._stop.set()
+      self._trigger.set()
+      self._thread.join()
+      self._thread = None
+
+
+@tf_export(v1=["nn.StagedEmbeddingLookup"])
+class StagedEmbeddingLookup(object):
+  """Looks up a partitioned EmbeddingVariable one batch ahead.
+
+  `stage` deduplicates the ids of a batch and reads their values from the PS.
+  Its outputs are meant to be prefetched together with the batch by
+  `tf.staged`, so that the PS round trips of batch N+1 overlap with the
+  training step of batch N. `lookup` then returns the embeddings of the
+  batch, whose gradients are still applied to the variable.
+
+  Staged values are read before the updates of the steps running while they
+  wait in the buffer. To keep reads after writes on this worker, `lookup`
+  reads again from the PS the ids it updated since the values were staged.
+  Staged values are not used at all once `max_staleness` lookups ran after
+  they were staged. Updates from other workers are only bounded by
+  `max_staleness`. Staleness is counted in lookups of this worker rather
+  than in global steps, which advance with every worker, so it doesn't
+  depend on the number of workers.
+
+  Feature filters aren't supported: the filter has to see every access.
+  """
+
+  def __init__(self, params, max_staleness=1, partition_strategy="mod",
+               name=None):
+    params = _check_embedding_variables(params, "StagedEmbeddingLookup")
+    if max_staleness < 1:
+      raise ValueError("max_staleness must larger than 0")
+    self._params = params
+    self._max_staleness = max_staleness
+    self._partition_strategy = partition_strategy
+    self._key_dtype = params[0]._invalid_key_type  # pylint: disable=protected-access
+    with ops.name_scope(name, "StagedEmbeddingLookup") as name:
+      self._name = name
+      # Ids updated by the lookups of this worker and their global steps,
+      # kept on the worker even under a replica device setter.
+      local_device = control_flow_ops.no_op().device
+      with ops.device(local_device):
+        # Number of lookups run by this worker.
+        self._local_step = variables.VariableV1(
+            constant_op.constant(0, dtype=dtypes.int64), trainable=False,
+            collections=[ops.GraphKeys.LOCAL_VARIABLES], name="local_step")
+        self._updated_ids = variables.VariableV1(
+            array_ops.zeros([0], dtype=self._key_dtype), trainable=False,
+            collections=[ops.GraphKeys.LOCAL_VARIABLES], validate_shape=False,
+            name="updated_ids")
+        self._updated_steps = variables.VariableV1(
+            array_ops.zeros([0], dtype=dtypes.int64), trainable=False,
+            collections=[ops.GraphKeys.LOCAL_VARIABLES], validate_shape=False,
+            name="updated_steps")
+
+  def stage(self, ids, name=None):
+    """Reads the values of `ids` to be prefetched by `tf.staged`.
+
+    Args:
+      ids: A `Tensor` of ids of the next batch.
+      name: (Optional.) Name of the operations.
+
+    Returns:
+      A dict of tensors to pass to `tf.staged`, and then the prefetched dict
+      to `lookup`.
+    """
+    with ops.name_scope(name, "staged_embedding_stage", [ids]):
+      ids = ops.convert_to_tensor(ids, dtype=self._key_dtype)
+      unique_ids, idx = array_ops.unique(array_ops.reshape(ids, [-1]))
+      local_step = self._local_step.read_value()
+      with ops.control_dependencies([local_step]):
+        values = embedding_lookup(
+            self._params, unique_ids,
+            partition_strategy=self._partition_strategy)
+      return {"ids": unique_ids, "idx": idx, "values": values,
+              "step": local_step, "shape": array_ops.shape(ids)}
+
+  def lookup(self, staged, name=None):
+    """Looks up the batch staged by `stage`.
+
+    Args:
+      staged: The dict returned by `stage`, after prefetching.
+      name: (Optional.) Name of the operations.
+
+    Returns:
+      The embeddings of the staged ids, in the shape of the ids plus the
+      embedding dimension.
+    """
+    with ops.name_scope(name, "staged_embedding_lookup",
+                        list(staged.values())):
+      unique_ids = staged["ids"]
+      values = staged["values"]
+      staged_step = staged["step"]
+      local_step = self._local_step.read_value()
+      updated_ids = array_ops.identity(self._updated_ids)
+      updated_steps = array_ops.identity(self._updated_steps)
+      # Staged values are kept unless their ids were updated after they were
+      # read, or they are too stale.
+      _, fresh_idx = array_ops.setdiff1d(
+          unique_ids,
+          array_ops.boolean_mask(updated_ids, updated_steps >= staged_step))
+      num_fresh = array_ops.where(
+          local_step - staged_step <= self._max_staleness,
+          array_ops.size(fresh_idx), 0)
+      fresh_idx = fresh_idx[:num_fresh]
+      stale_idx, _ = array_ops.setdiff1d(
+          math_ops.range(array_ops.size(unique_ids)), fresh_idx)
+      fresh_values = _cached_gather(
+          self._params, array_ops.gather(unique_ids, fresh_idx),
+          array_ops.gather(values, fresh_idx))
+      stale_values = embedding_lookup(
+          self._params, array_ops.gather(unique_ids, stale_idx),
+          partition_strategy=self._partition_strategy)
+      unique_embeddings = data_flow_ops.dynamic_stitch(
+          [fresh_idx, stale_idx], [fresh_values, stale_values])
+
+      # The ids of this step are updated at this local step. Older updates
+      # are forgotten once no staged value can be read before them.
+      keep = updated_steps > local_step - self._max_staleness
+      with ops.control_dependencies([fresh_idx]):
+        update = control_flow_ops.group(
+            state_ops.assign_add(self._local_step, 1),
+            state_ops.assign(
+                self._updated_ids,
+                array_ops.concat(
+                    [array_ops.boolean_mask(updated_ids, keep), unique_ids],
+                    0),
+                validate_shape=False),
+            state_ops.assign(
+                self._updated_steps,
+                array_ops.concat(
+                    [array_ops.boolean_mask(updated_steps, keep),
+                     array_ops.fill(array_ops.shape(unique_ids),
+                                    local_step)], 0),
+                validate_shape=False))
+      with ops.control_dependencies([update]):
+        embeddings = array_ops.gather(unique_embeddings, staged["idx"])
+      return array_ops.reshape(
+          embeddings,
+          array_ops.concat(
+              [staged["shape"], array_ops.shape(unique_embeddings)[1:]], 0))
+
+
 @tf_export(v1=["nn.adaptive_embedding_lookup_sparse"])
 def adaptive_embedding_lookup_sparse(hash_params,
                                      ev_params,
@@ -22,8 +22,10 @@ from tensorflow.python.ops import string_ops
 from tensorflow.python.platform import googletest
 from tensorflow.python.ops import array_ops
 from tensorflow.python.ops import embedding_ops
+from tensorflow.python.ops import fused_embedding_ops
 from tensorflow.python.ops import math_ops
 from tensorflow.python.ops import init_ops
+from tensorflow.python.ops import kv_variable_ops
 from tensorflow.python.ops import nn_ops
 from tensorflow.python.ops import partitioned_variables
 from tensorflow.python.ops import variable_scope
@@ -126,6 +128,106 @@ class EmbeddingVariableTest(test_util.TensorFlowTestCase):
       self.assertAllEqual([0, 0, 0, 0, 0, 0], fetches[2])
       self.assertAllEqual([1, 1, 1, 1, 1, 1], fetches[3])
 
+  def testEmbeddingVariableForStatistics(self):
+    print("testEmbeddingVariableForStatistics")
+    ev_config = variables.EmbeddingVariableOption(filter_option=variables.CounterFilter(filter_freq=100))
+    var = variable_scope.get_embedding_variable("var_1", embedding_dim=3,
+            initializer=init_ops.ones_initializer(dtypes.float32), steps_to_live=10000, ev_option=ev_config)
+    emb = embedding_ops.embedding_lookup(var, math_ops.cast([0,0,0,1,1,2], dtypes.int64))
+    stats = var.statistics(global_step=10, top_k=2, num_buckets=4)
+    latest_stats = var.statistics()
+    init = variables.global_variables_initializer()
+    with self.test_session() as sess:
+      sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_VAR_OPS))
+      sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_SLOT_OPS))
+      sess.run([init])
+      sess.run(emb)
+      result = sess.run(stats)
+      self.assertEqual(3, result["size"])
+      self.assertGreater(result["memory_bytes"], 0)
+      self.assertAllEqual([0, 1, 2, 0], result["freq_histogram"])
+      self.assertAllEqual([0, 1], result["top_keys"])
+      self.assertAllEqual([3, 2], result["top_freqs"])
+      self.assertAllEqual([0, 0, 0, 3], result["age_histogram"])
+      self.assertEqual(3, sess.run(latest_stats["age_histogram"])[0])
+
+  def testEmbeddingVariableForGroupLookup(self):
+    print("testEmbeddingVariableForGroupLookup")
+    with ops.Graph().as_default() as g:
+      var_a = variable_scope.get_embedding_variable("var_a", embedding_dim=3,
+              initializer=init_ops.ones_initializer(dtypes.float32),
+              partitioner=partitioned_variables.fixed_size_partitioner(num_shards=2))
+      var_b = variable_scope.get_embedding_variable("var_b", embedding_dim=4,
+              initializer=init_ops.ones_initializer(dtypes.float32))
+      var_c = variable_scope.get_embedding_variable("var_c", embedding_dim=3,
+              initializer=init_ops.ones_initializer(dtypes.float32))
+      sp_a = sparse_tensor.SparseTensor(indices=[[0,0],[0,1],[1,0]],
+              values=math_ops.cast([1,2,1], dtypes.int64), dense_shape=[2, 2])
+      sp_b = sparse_tensor.SparseTensor(indices=[[0,0],[1,0]],
+              values=math_ops.cast([3,5], dtypes.int64), dense_shape=[2, 1])
+      sp_w = sparse_tensor.SparseTensor(indices=[[0,0],[1,0]],
+              values=[2.0, 1.0], dense_shape=[2, 1])
+      sp_c = sparse_tensor.SparseTensor(indices=[[0,0],[0,1],[1,0]],
+              values=math_ops.cast([1,1,7], dtypes.int64), dense_shape=[2, 2])
+      emb_a, emb_b, emb_c = embedding_ops.group_embedding_lookup_sparse(
+              [var_a, var_b, var_c], [sp_a, sp_b, sp_c],
+              ["mean", "sum", "sqrtn"], [None, sp_w, None])
+      self.assertEqual(1, len([op for op in g.get_operations()
+                               if op.type == "KvResourceGroupGather"]))
+      # var_a and var_c have the same dimension, their ids are uniqued and
+      # combined together.
+      self.assertEqual(1, len([op for op in g.get_operations()
+                               if op.type == "UniqueWithCountsV2"]))
+      loss = math_ops.reduce_sum(emb_a) + math_ops.reduce_sum(emb_b) + \
+             math_ops.reduce_sum(emb_c)
+      opt = gradient_descent.GradientDescentOptimizer(0.1)
+      train_op = opt.minimize(loss)
+      read_a = embedding_ops.embedding_lookup(var_a, math_ops.cast([1,2], dtypes.int64))
+      read_b = embedding_ops.embedding_lookup(var_b, math_ops.cast([3,5], dtypes.int64))
+      read_c = embedding_ops.embedding_lookup(var_c, math_ops.cast([1,7], dtypes.int64))
+      init = variables.global_variables_initializer()
+      with self.test_session(graph=g) as sess:
+        sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_VAR_OPS))
+        sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_SLOT_OPS))
+        sess.run([init])
+        result_a, result_b, result_c = sess.run([emb_a, emb_b, emb_c])
+        self.assertAllEqual([[1.0] * 3] * 2, result_a)
+        self.assertAllEqual([[2.0] * 4, [1.0] * 4], result_b)
+        self.assertAllClose([[2.0 ** 0.5] * 3, [1.0] * 3], result_c)
+        sess.run(train_op)
+        result_a, result_b, result_c = sess.run([read_a, read_b, read_c])
+        self.assertAllClose([[0.85] * 3, [0.95] * 3], result_a)
+        self.assertAllClose([[0.8] * 4, [0.9] * 4], result_b)
+        self.assertAllClose([[1.0 - 0.1 * 2.0 ** 0.5] * 3, [0.9] * 3],
+                            result_c)
+
+  def testEmbeddingVariableForFusedLookupPartitioned(self):
+    print("testEmbeddingVariableForFusedLookupPartitioned")
+    with ops.Graph().as_default() as g, ops.device("/cpu:0"):
+      var = variable_scope.get_embedding_variable("var_1", embedding_dim=3,
+              initializer=init_ops.ones_initializer(dtypes.float32),
+              partitioner=partitioned_variables.fixed_size_partitioner(num_shards=2))
+      sp = sparse_tensor.SparseTensor(indices=[[0,0],[0,1],[1,0]],
+              values=math_ops.cast([1,2,1001], dtypes.int64), dense_shape=[3, 2])
+      sp_w = sparse_tensor.SparseTensor(indices=[[0,0],[0,1],[1,0]],
+              values=[1.0, 3.0, 2.0], dense_shape=[3, 2])
+      emb = fused_embedding_ops.fused_embedding_lookup_sparse(var, sp,
+              sparse_weights=sp_w, partition_strategy="div", combiner="mean")
+      loss = math_ops.reduce_sum(emb)
+      opt = gradient_descent.GradientDescentOptimizer(0.1)
+      train_op = opt.minimize(loss)
+      read = embedding_ops.embedding_lookup(var, math_ops.cast([1,2,1001,0], dtypes.int64))
+      init = variables.global_variables_initializer()
+      with self.test_session(graph=g) as sess:
+        sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_VAR_OPS))
+        sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_SLOT_OPS))
+        sess.run([init])
+        self.assertAllClose([[1.0] * 3] * 3, sess.run(emb))
+        sess.run(train_op)
+        # The empty row is filled with id 0.
+        self.assertAllClose([[0.975] * 3, [0.925] * 3, [0.9] * 3, [0.9] * 3],
+                            sess.run(read))
+
   def testEmbeddingVariableForGetShape(self):
     print("testEmbeddingVariableForGetShape")
     var = variable_scope.get_embedding_variable("var_1",
@@ -652,6 +754,52 @@ class EmbeddingVariableTest(test_util.TensorFlowTestCase):
       for val in emb1.tolist()[0]:
         self.assertNotEqual(val, 1.0)
 
+  def testEmbeddingVariableForBloomFilterDecay(self):
+    print("testEmbeddingVariableForBloomFilterDecay")
+    checkpoint_directory = self.get_temp_dir()
+    var = variable_scope.get_embedding_variable("var_1",
+            embedding_dim = 3,
+            initializer=init_ops.ones_initializer(dtypes.float32),
+            ev_option = variables.EmbeddingVariableOption(filter_option=variables.CBFFilter(
+                                      filter_freq=3,
+                                      max_element_size = 5,
+                                      false_positive_probability = 0.01,
+                                      decay_steps = 2)))
+    gs = training_util.get_or_create_global_step()
+    emb = embedding_ops.embedding_lookup(var, math_ops.cast([1], dtypes.int64))
+    with ops.control_dependencies([emb]):
+      step = gs.assign_add(1)
+    keys, _, _, _ = var.export()
+    saver = saver_module.Saver()
+    init = variables.global_variables_initializer()
+    with self.test_session() as sess:
+      sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_VAR_OPS))
+      sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_SLOT_OPS))
+      sess.run([init])
+      # the key is seen twice every 2 steps, but its count is halved every
+      # 2 steps, so that it never reaches filter_freq
+      for _ in range(8):
+        sess.run(step)
+      self.assertAllEqual([], sess.run(keys))
+      model_path = os.path.join(checkpoint_directory, "model.ckpt")
+      saver.save(sess, model_path)
+      names = [name for name, shape in
+               checkpoint_utils.list_variables(checkpoint_directory)]
+      self.assertIn("var_1-filter_counters", names)
+
+  def testEmbeddingVariableForBloomFilterDecayFromProto(self):
+    print("testEmbeddingVariableForBloomFilterDecayFromProto")
+    var = variable_scope.get_embedding_variable("var_1",
+            embedding_dim = 3,
+            initializer=init_ops.ones_initializer(dtypes.float32),
+            ev_option = variables.EmbeddingVariableOption(filter_option=variables.CBFFilter(
+                                      filter_freq=3,
+                                      max_element_size = 5,
+                                      false_positive_probability = 0.01,
+                                      decay_steps = 2)))
+    imported = kv_variable_ops.EmbeddingVariable(variable_def=var.to_proto())
+    self.assertEqual(2, imported._filter_decay_steps)
+
   def testEmbeddingVariableForAdagradDecayFilter(self):
     print("testEmbeddingVariableForAdagradDecayFilter")
     var = variable_scope.get_embedding_variable("var_1",
@@ -1386,6 +1534,232 @@ class EmbeddingVariableTest(test_util.TensorFlowTestCase):
         for j in range(0, 6):
           self.assertEqual(emb1.tolist()[i][j], emb2.tolist()[i][j])
 
+  def testEmbeddingVariableForCapacityEviction(self):
+    print("testEmbeddingVariableForCapacityEviction")
+    def runTestCapacity(policy):
+      with ops.Graph().as_default():
+        ev_option = variables.EmbeddingVariableOption(
+            evict_option=variables.CapacityEvict(max_keys=3, policy=policy))
+        var = variable_scope.get_embedding_variable("var_1", embedding_dim=3,
+                initializer=init_ops.ones_initializer(dtypes.float32), ev_option=ev_option)
+        emb1 = embedding_ops.embedding_lookup(var, math_ops.cast([0,1], dtypes.int64))
+        emb2 = embedding_ops.embedding_lookup(var, math_ops.cast([2], dtypes.int64))
+        emb3 = embedding_ops.embedding_lookup(var, math_ops.cast([3], dtypes.int64))
+        init = variables.global_variables_initializer()
+        keys, _, _, _ = var.export()
+        with self.test_session() as sess:
+          sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_VAR_OPS))
+          sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_SLOT_OPS))
+          sess.run([init])
+          for _ in range(3):
+            sess.run(emb1)
+          sess.run(emb2)
+          sess.run(emb3)
+          return sorted(sess.run(keys).tolist())
+    # The keys just looked up are never evicted, lru then evicts one of the
+    # keys accessed first, lfu the key accessed once.
+    lru_keys = runTestCapacity("lru")
+    self.assertEqual(3, len(lru_keys))
+    self.assertAllEqual([2, 3], lru_keys[1:])
+    self.assertAllEqual([0, 1, 3], runTestCapacity("lfu"))
+    with self.assertRaises(ValueError):
+      variables.CapacityEvict(max_keys=0)
+    with self.assertRaises(ValueError):
+      variables.CapacityEvict(max_keys=3, policy="fifo")
+
+  def testEmbeddingVariableForCompactStorage(self):
+    print("testEmbeddingVariableForCompactStorage")
+    def runTestAdagrad(storage_option):
+      with ops.Graph().as_default():
+        ev_option = variables.EmbeddingVariableOption(storage_option=storage_option)
+        var = variable_scope.get_embedding_variable("var_1", embedding_dim=3,
+                initializer=init_ops.ones_initializer(dtypes.float32), ev_option=ev_option)
+        emb = embedding_ops.embedding_lookup(var, math_ops.cast([0,1,2,5,6,7], dtypes.int64))
+        loss = math_ops.reduce_sum(math_ops.multiply(emb, 2.0))
+        gs = training_util.get_or_create_global_step()
+        opt = adagrad.AdagradOptimizer(0.1)
+        train_op = opt.minimize(loss, global_step=gs)
+        init = variables.global_variables_initializer()
+        with self.test_session() as sess:
+          sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_VAR_OPS))
+          sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_SLOT_OPS))
+          sess.run([init])
+          for _ in range(5):
+            sess.run(train_op)
+          return sess.run(emb)
+    emb_fp32 = runTestAdagrad(variables.StorageOption())
+    for dtype, slot_dtype in [(dtypes.float16, None),
+                              (dtypes.bfloat16, dtypes.bfloat16),
+                              (dtypes.int8, dtypes.float16)]:
+      emb = runTestAdagrad(variables.StorageOption(
+          storage_dtype=dtype, slot_storage_dtype=slot_dtype))
+      self.assertAllClose(emb_fp32, emb, atol=2e-2)
+    with self.assertRaises(ValueError):
+      variables.StorageOption(storage_dtype=dtypes.int32)
+
+  def testEmbeddingVariableForInt8SmallUpdates(self):
+    print("testEmbeddingVariableForInt8SmallUpdates")
+    def runTestSGD(storage_option):
+      with ops.Graph().as_default():
+        ev_option = variables.EmbeddingVariableOption(storage_option=storage_option)
+        var = variable_scope.get_embedding_variable("var_1", embedding_dim=3,
+                initializer=init_ops.random_uniform_initializer(-1.0, 1.0, seed=1),
+                ev_option=ev_option)
+        emb = embedding_ops.embedding_lookup(var, math_ops.cast([0,1,2,5,6,7], dtypes.int64))
+        loss = math_ops.reduce_sum(math_ops.multiply(emb, 2.0))
+        opt = gradient_descent.GradientDescentOptimizer(1e-3)
+        train_op = opt.minimize(loss)
+        init = variables.global_variables_initializer()
+        with self.test_session() as sess:
+          sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_VAR_OPS))
+          sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_SLOT_OPS))
+          sess.run([init])
+          emb_init = sess.run(emb)
+          for _ in range(50):
+            sess.run(train_op)
+          return emb_init, sess.run(emb)
+    init_fp32, emb_fp32 = runTestSGD(variables.StorageOption())
+    init_int8, emb_int8 = runTestSGD(
+        variables.StorageOption(storage_dtype=dtypes.int8))
+    # Rows are not uniform, so they are only close after quantization.
+    self.assertAllClose(init_fp32, init_int8, atol=1e-2)
+    self.assertAllClose(emb_fp32 - init_fp32, np.full([6, 3], -0.1), atol=1e-4)
+    # Every update is 2e-3, less than half the int8 quantization step.
+    self.assertNear(-0.1, np.mean(emb_int8 - init_int8), 3e-2)
+
+  def testEmbeddingVariableForMmapStorage(self):
+    print("testEmbeddingVariableForMmapStorage")
+    checkpoint_directory = self.get_temp_dir()
+    ids = math_ops.cast([0,1,2,5,6,7], dtypes.int64)
+    with ops.Graph().as_default():
+      var = variable_scope.get_embedding_variable("var_1", embedding_dim=3,
+              initializer=init_ops.ones_initializer(dtypes.float32))
+      emb = embedding_ops.embedding_lookup(var, math_ops.cast([0,1,2,5], dtypes.int64))
+      loss = math_ops.reduce_sum(math_ops.multiply(emb, 2.0))
+      opt = gradient_descent.GradientDescentOptimizer(0.1)
+      train_op = opt.minimize(loss)
+      saver = saver_module.Saver()
+      init = variables.global_variables_initializer()
+      with self.test_session() as sess:
+        sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_VAR_OPS))
+        sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_SLOT_OPS))
+        sess.run([init])
+        sess.run(train_op)
+        save_path = saver.save(sess, os.path.join(checkpoint_directory, "model.ckpt"))
+    storage_path = os.path.join(checkpoint_directory, "mmap")
+    os.makedirs(storage_path)
+    # The second restore reuses the table written by the first one.
+    for _ in range(2):
+      with ops.Graph().as_default():
+        storage_option = variables.StorageOption(
+            storage_type=config_pb2.StorageType.MMAP, storage_path=storage_path)
+        var = variable_scope.get_embedding_variable("var_1", embedding_dim=3,
+                initializer=init_ops.ones_initializer(dtypes.float32),
+                ev_option=variables.EmbeddingVariableOption(storage_option=storage_option))
+        emb = embedding_ops.embedding_lookup(var, ids)
+        saver = saver_module.Saver()
+        with self.test_session() as sess:
+          saver.restore(sess, save_path)
+          self.assertAllClose([[0.8]*3, [0.8]*3, [0.8]*3, [0.8]*3, [1.0]*3, [1.0]*3],
+                              sess.run(emb))
+    with self.assertRaises(ValueError):
+      variables.StorageOption(storage_type=config_pb2.StorageType.MMAP)
+
+  def testEmbeddingVariableForHotKeyCache(self):
+    print("testEmbeddingVariableForHotKeyCache")
+    with ops.Graph().as_default():
+      var = variable_scope.get_embedding_variable("var_1", embedding_dim=3,
+              initializer=init_ops.ones_initializer(dtypes.float32),
+              partitioner=partitioned_variables.fixed_size_partitioner(num_shards=2))
+      cache = embedding_ops.HotKeyCache(var, capacity=2, max_staleness=1)
+      # The cache versions follow the global step, which isn't created.
+      with self.assertRaises(ValueError):
+        cache.lookup(math_ops.cast([1,2], dtypes.int64))
+      gs = training_util.get_or_create_global_step()
+      sp = sparse_tensor.SparseTensor(indices=[[0,0],[1,0],[2,0],[3,0]],
+              values=math_ops.cast([1,1,2,3], dtypes.int64), dense_shape=[4, 1])
+      emb = embedding_ops.embedding_lookup_sparse(var, sp, None,
+              combiner="sum", hot_key_cache=cache)
+      loss = math_ops.reduce_sum(emb)
+      opt = gradient_descent.GradientDescentOptimizer(0.1)
+      train_op = opt.minimize(loss, global_step=gs)
+      warm_up = cache.lookup(math_ops.cast([1,2], dtypes.int64))
+      stats = cache.stats()
+      init = variables.global_variables_initializer()
+      with self.test_session() as sess:
+        sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_VAR_OPS))
+        sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_SLOT_OPS))
+        sess.run([init, cache.initializer])
+        sess.run(warm_up)
+        sess.run(train_op)
+        self.assertEqual(0, sess.run(stats["hits"]))
+        sess.run(cache.refresh_op)
+        self.assertEqual(2, sess.run(stats["size"]))
+        # Cached rows are served and still trained.
+        r, _ = sess.run([emb, train_op])
+        self.assertAllClose([[0.8]*3, [0.8]*3, [0.9]*3, [0.9]*3], r)
+        self.assertEqual(2, sess.run(stats["hits"]))
+        # Within max_staleness the cached rows may lag behind the PS.
+        r = sess.run(emb)
+        self.assertAllClose([[0.8]*3, [0.8]*3, [0.9]*3, [0.8]*3], r)
+        # The cache is too stale now, every id is read from the PS.
+        sess.run(train_op)
+        hits = sess.run(stats["hits"])
+        r = sess.run(emb)
+        self.assertEqual(hits, sess.run(stats["hits"]))
+        self.assertAllClose([[0.4]*3, [0.4]*3, [0.7]*3, [0.7]*3], r)
+    with self.assertRaises(TypeError):
+      embedding_ops.HotKeyCache(variables.Variable([1.0]), capacity=2)
+
+  def testEmbeddingVariableForStagedEmbeddingLookup(self):
+    print("testEmbeddingVariableForStagedEmbeddingLookup")
+    with ops.Graph().as_default():
+      var = variable_scope.get_embedding_variable("var_1", embedding_dim=3,
+              initializer=init_ops.ones_initializer(dtypes.float32),
+              partitioner=partitioned_variables.fixed_size_partitioner(num_shards=2))
+      lookup = embedding_ops.StagedEmbeddingLookup(var, max_staleness=1)
+      # Another worker training the same variable.
+      other = embedding_ops.StagedEmbeddingLookup(var, max_staleness=1)
+      ids = array_ops.placeholder(dtypes.int64, shape=[None])
+      stage = lookup.stage(ids)
+      staged = {k: array_ops.placeholder(v.dtype) for k, v in stage.items()}
+      emb = lookup.lookup(staged)
+      other_emb = other.lookup(other.stage(ids))
+      gs = training_util.get_or_create_global_step()
+      opt = gradient_descent.GradientDescentOptimizer(0.1)
+      train_op = opt.minimize(math_ops.reduce_sum(emb), global_step=gs)
+      other_train_op = opt.minimize(math_ops.reduce_sum(other_emb),
+                                    global_step=gs)
+      init = variables.global_variables_initializer()
+      local_init = variables.local_variables_initializer()
+      with self.test_session() as sess:
+        sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_VAR_OPS))
+        sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_SLOT_OPS))
+        sess.run([init, local_init])
+        values = sess.run(stage, {ids: [1, 1, 2, 3]})
+        feed = {staged[k]: v for k, v in values.items()}
+        r, _ = sess.run([emb, train_op], feed)
+        self.assertAllClose([[1.0]*3, [1.0]*3, [1.0]*3, [1.0]*3], r)
+        # Ids updated after they were staged are read again from the PS.
+        r = sess.run(emb, feed)
+        self.assertAllClose([[0.8]*3, [0.8]*3, [0.9]*3, [0.9]*3], r)
+        # Updates of other workers are only bounded by max_staleness, counted
+        # in lookups of this worker whatever the global step.
+        values = sess.run(stage, {ids: [4]})
+        feed = {staged[k]: v for k, v in values.items()}
+        for _ in range(3):
+          sess.run(other_train_op, {ids: [4]})
+        self.assertAllClose([[1.0]*3], sess.run(emb, feed))
+        values = sess.run(stage, {ids: [5]})
+        feed_5 = {staged[k]: v for k, v in values.items()}
+        sess.run(other_train_op, {ids: [5]})
+        sess.run(emb, feed)
+        self.assertAllClose([[1.0]*3], sess.run(emb, feed_5))
+        sess.run(emb, feed)
+        self.assertAllClose([[0.9]*3], sess.run(emb, feed_5))
+    with self.assertRaises(TypeError):
+      embedding_ops.StagedEmbeddingLookup(variables.Variable([1.0]))
+
   def testEmbeddingVariableForDRAM(self):
     print("testEmbeddingVariableForDRAM")
     def runTestAdagrad(self, var, g):
@@ -1461,6 +1835,55 @@ class EmbeddingVariableTest(test_util.TensorFlowTestCase):
         for j in range(0, 3):
           self.assertEqual(emb1.tolist()[i][j], emb2.tolist()[i][j])
 
+  def testEmbeddingVariableForDRAMSSD(self):
+    print("testEmbeddingVariableForDRAMSSD")
+    def runTestAdagrad(self, var, g):
+      emb = embedding_ops.embedding_lookup(var, math_ops.cast([0,1,2,5,6,7], dtypes.int64))
+      fun = math_ops.multiply(emb, 2.0, name='multiply')
+      loss = math_ops.reduce_sum(fun, name='reduce_sum')
+      gs = training_util.get_or_create_global_step()
+      opt = adagrad.AdagradOptimizer(0.1)
+      g_v = opt.compute_gradients(loss)
+      train_op = opt.apply_gradients(g_v)
+      init = variables.global_variables_initializer()
+      with self.test_session(graph=g) as sess:
+        sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_VAR_OPS))
+        sess.run(ops.get_collection(ops.GraphKeys.EV_INIT_SLOT_OPS))
+        sess.run([init])
+        r, _, _ = sess.run([emb, train_op,loss])
+        r, _, _ = sess.run([emb, train_op,loss])
+        r, _, _ = sess.run([emb, train_op,loss])
+        r, _, _ = sess.run([emb, train_op,loss])
+        r, _, _ = sess.run([emb, train_op,loss])
+        return r
+
+    with ops.device('/cpu:0'), ops.Graph().as_default() as g:
+      # DRAM holds 2 of the 6 keys (3 floats for the value and the adagrad
+      # accumulator each), the others are moved to SSD and back every step.
+      emb_var = variable_scope.get_embedding_variable("var_1",
+            embedding_dim = 3,
+            initializer=init_ops.ones_initializer(dtypes.float32),
+            partitioner=partitioned_variables.fixed_size_partitioner(num_shards=1),
+            ev_option = variables.EmbeddingVariableOption(storage_option=variables.StorageOption(storage_type=config_pb2.StorageType.DRAM_SSD,
+                                                                                                 storage_path=self.get_temp_dir(),
+                                                                                                 storage_size=[48])))
+      var = variable_scope.get_variable("var_2", shape=[100, 3], initializer=init_ops.ones_initializer(dtypes.float32))
+      emb1 = runTestAdagrad(self, emb_var, g)
+      emb2 = runTestAdagrad(self, var, g)
+
+      for i in range(0, 6):
+        for j in range(0, 3):
+          self.assertEqual(emb1.tolist()[i][j], emb2.tolist()[i][j])
+
+  def testEmbeddingVariableForDRAMSSDInvalidOption(self):
+    print("testEmbeddingVariableForDRAMSSDInvalidOption")
+    with self.assertRaises(ValueError):
+      variables.StorageOption(storage_type=config_pb2.StorageType.DRAM_SSD,
+                              storage_path=self.get_temp_dir())
+    with self.assertRaises(ValueError):
+      variables.StorageOption(storage_type=config_pb2.StorageType.DRAM_SSD,
+                              storage_size=[1024])
+
 
 if __name__ == "__main__":
   googletest.main()
@@ -7,6 +7,7 @@ from tensorflow.python.framework.constant_op import constant
 from tensorflow.python.framework import ops
 from tensorflow.python.ops import variables
 from tensorflow.python.ops import array_ops
+from tensorflow.python.ops import math_ops
 from tensorflow.python.framework import sparse_tensor
 from tensorflow.python.ops import gen_fused_embedding_ops
 from tensorflow.python.ops.kv_variable_ops import EmbeddingVariable
@@ -27,10 +28,11 @@ def fused_embedding_lookup_sparse(params,
                                   default_id=None,
                                   prune_invalid_ids=False,
                                   blocknums=None):
-  if sparse_weights is not None:
-    raise ValueError("sparse_weights is not supported yet")
+  if sparse_weights is not None and \
+      not isinstance(sparse_weights, sparse_tensor.SparseTensor):
+    raise TypeError("sparse_weights must be either None or SparseTensor")
 
-  valid_partition_strategy = ['div']
+  valid_partition_strategy = ['div', 'mod']
   if partition_strategy not in valid_partition_strategy:
     raise ValueError("{} is not supported yet. Currently only support {}".format(
       partition_strategy, valid_partition_strategy))
@@ -41,27 +43,37 @@ def fused_embedding_lookup_sparse(params,
   if blocknums is not None:
     raise ValueError("Using blocknums for DynamicEmbeddingVariable is not supported yet")
 
+  if isinstance(params, variables.PartitionedVariable):
+    params = list(params)
+  if not isinstance(params, list):
+    params = [params]
   partition_nums = len(params)
 
-  if type(params[0]) is EmbeddingVariable:
-    if partition_nums != 1:
-      raise ValueError("For EmbeddingVariable, do not support partition now")
-    # fake shape for now. TBD change in the future
-    partition_shapes = [constant([1, 1], dtype=tensorflow.int64)]
+  if isinstance(params[0], EmbeddingVariable):
+    # Partitions of EmbeddingVariable are assigned by id % 1000, as in
+    # embedding_lookup. Shapes are not used then.
+    partition_strategy = 'mod_ev'
+    partition_shapes = [constant([1, 1], dtype=tensorflow.int64)
+                        for _ in range(partition_nums)]
   else:
     partition_shapes = [w.shape for w in params]
 
   with ops.name_scope(name, "fused_embedding_lookup_sparse",
                       params + [sp_ids]) as name:
+    sp_weights_values = [] if sparse_weights is None else \
+        [math_ops.cast(sparse_weights.values, tensorflow.float32)]
     partitioned_values, partitioned_indices, \
-      row_empty_and_invalid_flags = fused_embedding_sparse_pre_look_up(
+      row_empty_and_invalid_flags, partitioned_weights = \
+        fused_embedding_sparse_pre_look_up(
           partition_shapes=partition_shapes,
           sp_values=sp_ids.values,
           sp_indices=sp_ids.indices,
           sp_dense_shape=sp_ids.dense_shape,
+          sp_weights_values=sp_weights_values,
           fill_empty_row=True,
           default_id=default_id,
-          prune_invalid_id=bool(prune_invalid_ids)
+          prune_invalid_id=bool(prune_invalid_ids),
+          partition_strategy=partition_strategy
       )
     emb_shards = []
     for i in range(partition_nums):
@@ -75,6 +87,7 @@ def fused_embedding_lookup_sparse(params,
       sp_dense_shape=sp_ids.dense_shape,
       row_empty_and_invalid_flags=row_empty_and_invalid_flags,
       partitioned_values=partitioned_values,
+      partitioned_weights=[] if sparse_weights is None else partitioned_weights,
       combiner=combiner, max_norm=max_norm, default_id=default_id
     )
   return emb_vectors
@@ -87,12 +100,14 @@ def fused_embedding_sparse_post_look_up_grad(op, top_grad_emb_vec, _):
   partitioned_indices = [op.inputs[i] for i in range(num_partitions, 2 * num_partitions)]
   feature_nums = op.outputs[1]
   row_empty_and_invalid_flags = op.inputs[2 * num_partitions + 1]
+  partitioned_weights = op.inputs[3 * num_partitions + 2:]
 
   grad_shards = gen_fused_embedding_ops.fused_embedding_sparse_post_look_up_grad(
     top_grad=top_grad_emb_vec, emb_shards=emb_shards,
     partitioned_indices=partitioned_indices,
     feature_nums=feature_nums, row_empty_and_invalid_flags=row_empty_and_invalid_flags,
+    partitioned_weights=partitioned_weights,
     combiner=op.get_attr("combiner"), max_norm=op.get_attr("max_norm"),
     default_id=op.get_attr("default_id")
   )
-  return grad_shards + [None for _ in range(0, 2 * num_partitions + 2)]
+  return grad_shards + [None for _ in range(0, len(op.inputs) - num_partitions)]
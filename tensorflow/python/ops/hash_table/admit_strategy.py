@@ -39,6 +39,7 @@ from tensorflow.python.ops import gen_hash_ops
 from tensorflow.python.ops import init_ops
 from tensorflow.python.ops import math_ops
 from tensorflow.python.ops import variable_scope
+from tensorflow.python.training import training_util
 from tensorflow.python.util import tf_contextlib
 from tensorflow.python.util.tf_export import tf_export
 
@@ -49,6 +50,7 @@ class BloomFilterAdmitStrategy(object):
   _DEFAULT_FALSE_POSITIVE_PROBABILITY = 0.01
   _DEFAULT_SLICE_OFFSET = 0
   _DEFAULT_SLICE_SIZE = 1
+  _BLOCK_BYTES = 64
   def __init__(self,
                minimum_frequency,
                max_element_size=None,
@@ -57,8 +59,26 @@ class BloomFilterAdmitStrategy(object):
                hash_table=None,
                distributed_name=None,
                collections=None,
-               name=None):
+               name=None,
+               blocked=False,
+               decay_steps=None):
+    """Creates a counting Bloom filter admitting frequent keys.
+
+    If `blocked`, all counters of a key are in one cache line, so that a
+    probe touches one cache line rather than one per hash function, at the
+    cost of a slightly higher false positive rate. The counters of a
+    checkpoint can only be restored into a filter with the same `blocked`.
+
+    If `decay_steps` is set, `decay()` halves the counters every
+    `decay_steps` global steps, so that keys no longer seen stop counting
+    towards admission in a long running training. The counters are saved
+    with the checkpoints, and the steps are counted from the global step.
+    """
+    if decay_steps is not None and decay_steps < 1:
+      raise ValueError("decay_steps must be positive, got %s" % decay_steps)
     self._minimum_frequency = minimum_frequency
+    self._blocked = blocked
+    self._decay_steps = decay_steps
     if max_element_size is None:
       max_element_size = BloomFilterAdmitStrategy._DEFAULT_ELEMENT_SIZE
     self._max_element_size = max_element_size
@@ -82,7 +102,7 @@ class BloomFilterAdmitStrategy(object):
 
     size_per_slice = (max_element_size + self._max_slice_size - 1) // self._max_slice_size
     self._bucket_size = self._calc_bucket_size(size_per_slice,
-        false_positive_probability)
+        false_positive_probability, blocked)
     self._shape = tensor_shape.TensorShape([self._slice_size, self._bucket_size])
     self._dtype = self._optimal_dtype(minimum_frequency)
 
@@ -99,12 +119,14 @@ class BloomFilterAdmitStrategy(object):
               self._handle, min_frequency=minimum_frequency,
               num_hash_func=self._num_hash_func, slice_offset=self._slice_offset,
               max_slice_size=self._max_slice_size, dtype=self._dtype,
-              shape=self._shape, initialized=True, name="Initializer")
+              shape=self._shape, initialized=True, blocked=blocked,
+              name="Initializer")
           self._false_initializer = gen_hash_ops.bloom_filter_initialize_op(
               self._handle, min_frequency=minimum_frequency,
               num_hash_func=self._num_hash_func, slice_offset=self._slice_offset,
               max_slice_size=self._max_slice_size, dtype=self._dtype,
-              shape=self._shape, initialized=False, name="FalseInitializer")
+              shape=self._shape, initialized=False, blocked=blocked,
+              name="FalseInitializer")
 
     if collections is None:
       collections = [ops.GraphKeys.GLOBAL_VARIABLES]
@@ -118,10 +140,15 @@ class BloomFilterAdmitStrategy(object):
     log_fpp = abs(math.log(false_positive_probability, 2))
     return int(math.ceil(log_fpp))
 
-  def _calc_bucket_size(self, max_element_size, false_positive_probability):
+  def _calc_bucket_size(self, max_element_size, false_positive_probability,
+                        blocked=False):
     log_fpp = abs(math.log(false_positive_probability))
     factor = math.log(2) ** 2
     bucket_size = int(math.ceil(log_fpp / factor * max_element_size))
+    if blocked:
+      # Blocks of a cache line hold 64 counters at most.
+      block = BloomFilterAdmitStrategy._BLOCK_BYTES
+      return (bucket_size + block - 1) // block * block
 
     def is_prime(n):
       if n < 2:
@@ -165,6 +192,14 @@ class BloomFilterAdmitStrategy(object):
   def minimum_frequency(self):
     return self._minimum_frequency
 
+  @property
+  def blocked(self):
+    return self._blocked
+
+  @property
+  def decay_steps(self):
+    return self._decay_steps
+
   @property
   def max_element_size(self):
     return self._max_element_size
@@ -224,6 +259,29 @@ class BloomFilterAdmitStrategy(object):
       return gen_hash_ops.bloom_filter_admit_op(
           self._handle, keys, frequency)
 
+  def decay(self, global_step=None):
+    """Halves the counters if `decay_steps` passed since the last decay.
+
+    The first run only records the step, so it is cheap to run before every
+    admission.
+
+    Args:
+      global_step: The current step. Defaults to the global step.
+
+    Returns:
+      The decay op, or a no-op if `decay_steps` is not set.
+    """
+    if self._decay_steps is None:
+      return control_flow_ops.no_op()
+    if global_step is None:
+      global_step = training_util.get_global_step()
+      if global_step is None:
+        raise ValueError("decay needs a global step")
+    with ops.device(self.device):
+      return gen_hash_ops.bloom_filter_decay_op(
+          self._handle, math_ops.cast(global_step, dtypes.int64),
+          decay_steps=self._decay_steps)
+
 
 @tf_export("hash_table.DistributedBloomFilterAdmitStrategy")
 class DistributedBloomFilterAdmitStrategy(object):
@@ -238,7 +296,9 @@ class DistributedBloomFilterAdmitStrategy(object):
                slicer=None,
                hash_tables=None,
                collections=None,
-               name=None):
+               name=None,
+               blocked=False,
+               decay_steps=None):
     if slice_size is None:
       slice_size = DistributedBloomFilterAdmitStrategy._DEFAULT_SLICE_SIZE
 
@@ -264,7 +324,8 @@ class DistributedBloomFilterAdmitStrategy(object):
         strategies.append(
           BloomFilterAdmitStrategy(minimum_frequency, element_size_per_slice,
             false_positive_probability, slicer[i], slice_size, hash_table,
-            distributed_name, collections, "BloomFilter_" + str(i)))
+            distributed_name, collections, "BloomFilter_" + str(i),
+            blocked=blocked, decay_steps=decay_steps))
 
     self._slice_size = slice_size
     self._slicer = slicer
@@ -296,3 +357,8 @@ class DistributedBloomFilterAdmitStrategy(object):
     freq_per_device = data_flow_ops.dynamic_partition(flat_freq, part_id, len(self._slicer))
     return [self._strategies[i].admit(keys_per_device[i], freq_per_device[i])
         for i in range(len(freq_per_device))]
+
+  def decay(self, global_step=None):
+    """Decays the counters of all partitions, see `BloomFilterAdmitStrategy`."""
+    return control_flow_ops.group(
+        *[i.decay(global_step) for i in self._strategies])
@@ -32,9 +32,20 @@ def admit_strategy_factory(hash_table):
   return admit_strategy.BloomFilterAdmitStrategy(
       10, slicer=hash_table.slicer, hash_table=hash_table).handle
 
+def blocked_admit_strategy_factory(hash_table):
+  return admit_strategy.BloomFilterAdmitStrategy(
+      10, slicer=hash_table.slicer, hash_table=hash_table,
+      blocked=True).handle
+
 
 class AdmitStrategyTest(test.TestCase):
   def testBloomFilterLookup(self):
+    self._testBloomFilterLookup(admit_strategy_factory)
+
+  def testBlockedBloomFilterLookup(self):
+    self._testBloomFilterLookup(blocked_admit_strategy_factory)
+
+  def _testBloomFilterLookup(self, admit_strategy_factory):
     with self.test_session(graph=ops_lib.Graph()) as sess:
       ht = hash_table.DistributedHashTable(
           [2], dtypes.float32,
@@ -58,5 +69,28 @@ class AdmitStrategyTest(test.TestCase):
       expect_result = np.array([[1.0, 1.0], [1.0, 1.0], [0.0, 0.0]], dtype='float32')
       self.assertTrue(np.allclose(result, expect_result))
 
+  def testBloomFilterDecay(self):
+    with self.test_session(graph=ops_lib.Graph()) as sess:
+      bf = admit_strategy.BloomFilterAdmitStrategy(4, decay_steps=10)
+      p_keys = array_ops.placeholder(dtypes.int64, shape=[None], name="keys")
+      p_counts = array_ops.placeholder(dtypes.uint8, shape=[None], name="counts")
+      p_step = array_ops.placeholder(dtypes.int64, shape=[], name="step")
+      admit = bf.admit(p_keys, p_counts)
+      decay = bf.decay(p_step)
+      sess.run(bf.initializer)
+
+      sess.run(decay, feed_dict={p_step: 0})
+      result = sess.run(admit, feed_dict={p_keys: [1, 2], p_counts: [3, 3]})
+      self.assertAllEqual([False, False], result)
+      sess.run(decay, feed_dict={p_step: 9})
+      result = sess.run(admit, feed_dict={p_keys: [1], p_counts: [1]})
+      self.assertAllEqual([True], result)
+      # two decays, 4 is quartered to 1 and 3 to 0
+      sess.run(decay, feed_dict={p_step: 25})
+      result = sess.run(admit, feed_dict={p_keys: [1, 2], p_counts: [2, 3]})
+      self.assertAllEqual([False, False], result)
+      result = sess.run(admit, feed_dict={p_keys: [1, 2], p_counts: [1, 1]})
+      self.assertAllEqual([True, True], result)
+
 if __name__ == '__main__':
   test.main()
@@ -132,28 +132,41 @@ class EmbeddingLookupHook(object):
 @tf_export("hash_table.BloomFilterLookupHook")
 class BloomFilterLookupHook(EmbeddingLookupHook):
   def __init__(self, minimum_frequency, max_element_size=None,
-      false_positive_probability=None, name=None):
+      false_positive_probability=None, name=None, blocked=False,
+      decay_steps=None):
     super(BloomFilterLookupHook, self).__init__()
     self._minimum_frequency = minimum_frequency
     self._max_element_size = max_element_size
     self._false_positive_probability = false_positive_probability
     self._name = name
+    self._blocked = blocked
+    self._decay_steps = decay_steps
 
   def get_config(self):
     return {
       'minimum_frequency': self._minimum_frequency,
       'max_element_size': self._max_element_size,
       'false_positive_probability': self._false_positive_probability,
-      'name': self._name
+      'name': self._name,
+      'blocked': self._blocked,
+      'decay_steps': self._decay_steps
       }
 
   def get_admit_strategy_factory(self, distributed_hash_table):
     def wrapper(hash_table):
-      return admit_strategy.BloomFilterAdmitStrategy(self._minimum_frequency,
+      strategy = admit_strategy.BloomFilterAdmitStrategy(
+          self._minimum_frequency,
           self._max_element_size, self._false_positive_probability,
           slicer=hash_table.slicer, hash_table=hash_table,
           distributed_name=hash_table.distributed_name + '_BloomFilter',
-          name=self._name).handle
+          name=self._name, blocked=self._blocked,
+          decay_steps=self._decay_steps)
+      if self._decay_steps is None:
+        return strategy.handle
+      # The counters are decayed before the keys are admitted.
+      with ops.colocate_with(strategy.handle):
+        with ops.control_dependencies([strategy.decay()]):
+          return array_ops.identity(strategy.handle)
     return wrapper
 
   def on_embedding_lookup(self, ctx):
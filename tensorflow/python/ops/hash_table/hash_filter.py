@@ -24,6 +24,7 @@ import sys
 import random
 import shutil
 import tempfile
+import threading
 import time
 
 import numpy as np
@@ -38,11 +39,14 @@ from tensorflow.python.ops import array_ops
 from tensorflow.python.ops import math_ops
 from tensorflow.python.framework import function
 from tensorflow.python.framework import dtypes
+from tensorflow.python.framework import errors
 from tensorflow.python.training import session_run_hook
 from tensorflow.python.training.session_run_hook import SessionRunArgs
 from tensorflow.python.ops import control_flow_ops
 from tensorflow.python.util.tf_export import tf_export
 from tensorflow.python.ops import logging_ops
+from tensorflow.python.ops import variable_scope
+from tensorflow.python.platform import tf_logging as logging
 from tensorflow.python.training.monitored_session import _RecoverableSession
 from tensorflow.python.client import session
 from tensorflow.python.util import tf_contextlib
@@ -67,20 +71,26 @@ class HashFilterBase(EmbeddingLookupHook):
   UPDATE_OPS_COLLECTION_KEY = '_hash_filter_update_ops'
   FILTER_OPS_COLLECTION_KEY = '_hash_filter_filter_ops'
   CHECK_OPS_COLLECTION_KEY = '_hash_filter_check_ops'
-  def __init__(self, block_size=1024*1024, parallel_num=4):
+  REMOVED_COUNTS_COLLECTION_KEY = '_hash_filter_removed_counts'
+  INCREMENTAL_FILTER_OPS_COLLECTION_KEY = '_hash_filter_incremental_filter_ops'
+  def __init__(self, block_size=1024*1024, parallel_num=4,
+               incremental_shards=1):
     del parallel_num
     self._block_size = block_size
+    self._incremental_shards = incremental_shards
     self._hash_table = None
     self._filter_set = set()
 
   def get_config(self):
     return {
       'block_size': self._block_size,
+      'incremental_shards': self._incremental_shards,
       }
 
   def on_embedding_lookup(self, ctx):
     update_ops_all = []
     filter_ops_all = []
+    incremental_filter_ops_all = []
     check_ops_all = []
     for i in range(len(ctx.partitions())):
       ht = ctx.partitions()[i]
@@ -98,6 +108,13 @@ class HashFilterBase(EmbeddingLookupHook):
         if not isinstance(filter_ops, (list, tuple)):
           filter_ops = [filter_ops]
         filter_ops_all.extend(filter_ops)
+        for f in filter_ops:
+          if isinstance(f, ops.Tensor):
+            ops.add_to_collection(
+                HashFilterBase.REMOVED_COUNTS_COLLECTION_KEY, f)
+        incremental_filter_op = self._incremental_filter(ht.device, ht)
+        if incremental_filter_op is not None:
+          incremental_filter_ops_all.append(incremental_filter_op)
         self._filter_set.add(ht)
       check_ops, check_fn = self._check()
       check_ops_all.append(check_ops)
@@ -107,12 +124,36 @@ class HashFilterBase(EmbeddingLookupHook):
     filter_op = control_flow_ops.group(filter_ops_all, name="hash_filter_filter_op")
     ops.add_to_collection(HashFilterBase.UPDATE_OPS_COLLECTION_KEY, update_op)
     ops.add_to_collection(HashFilterBase.FILTER_OPS_COLLECTION_KEY, filter_op)
+    for f in incremental_filter_ops_all:
+      ops.add_to_collection(
+          HashFilterBase.INCREMENTAL_FILTER_OPS_COLLECTION_KEY, f)
     _FILTER_CHECK_OPS.extend(check_ops_all)
 
   def _update(self, keys, ids):
     return self.update(keys, ids)
 
+  def _native_filter(self, hash_table, cursor, num_shards):
+    """Returns a native filter pass over `hash_table`.
+
+    Filters with a native pass override this to return the number of removed
+    keys and the next cursor. `num_shards` internal tables starting from
+    `cursor` are scanned, or the whole table if `num_shards` is not positive.
+    """
+    return None
+
   def _filter(self, device, hash_table):
+    """Returns ops filtering `hash_table`.
+
+    Returns the number of removed keys of the native pass if any, otherwise
+    `filter` is called on blocks of the hash table.
+    """
+    with ops.device(device):
+      native_filter = self._native_filter(
+          hash_table,
+          ops.convert_to_tensor(0, dtype=dtypes.int64),
+          ops.convert_to_tensor(-1, dtype=dtypes.int64))
+    if native_filter is not None:
+      return native_filter[0]
     @function.Defun(dtypes.int64, dtypes.int64)
     def _filter_func_wrapper(keys, ids):
       return self.filter(keys, ids)
@@ -122,6 +163,32 @@ class HashFilterBase(EmbeddingLookupHook):
       f=_filter_func_wrapper,
       block_size=self._block_size)
 
+  def _incremental_filter(self, device, hash_table):
+    """Returns the number of removed keys of an incremental native pass.
+
+    The cursor of the pass is kept in a local variable, so that every run
+    scans the next `incremental_shards` internal tables of `hash_table`.
+    Returns None if the filter has no native pass.
+    """
+    with ops.device(device):
+      cursor = variable_scope.variable(
+          0,
+          dtype=dtypes.int64,
+          name='hash_filter_cursor',
+          trainable=False,
+          collections=[ops.GraphKeys.LOCAL_VARIABLES],
+          use_resource=True)
+      native_filter = self._native_filter(
+          hash_table,
+          cursor.read_value(),
+          ops.convert_to_tensor(self._incremental_shards, dtype=dtypes.int64))
+      if native_filter is None:
+        return None
+      num_removed, next_cursor = native_filter
+      update_cursor = cursor.assign(next_cursor, read_value=False)
+      with ops.control_dependencies([update_cursor]):
+        return array_ops.identity(num_removed)
+
   def _check(self):
     keys, ids = self._hash_table.snapshot
     return self.check(keys, ids)
@@ -165,9 +232,31 @@ def filter_op():
 def check_op():
   return _FILTER_CHECK_OPS
 
+def removed_count_op():
+  return ops.get_collection(HashFilterBase.REMOVED_COUNTS_COLLECTION_KEY)
+
+def incremental_filter_op():
+  return ops.get_collection(
+      HashFilterBase.INCREMENTAL_FILTER_OPS_COLLECTION_KEY)
+
+def _run_filter(sess, filter_ops, removed_counts):
+  _, counts = _get_internal_sess(sess).run([filter_ops, removed_counts])
+  num_removed = int(np.sum(counts)) if counts else 0
+  logging.info('HashFilter removed %d keys', num_removed)
+  return num_removed
+
+def _run_incremental_filter(sess, incremental_filter_ops):
+  if not incremental_filter_ops:
+    return 0
+  counts = _get_internal_sess(sess).run(incremental_filter_ops)
+  num_removed = int(np.sum(counts))
+  logging.vlog(1, 'HashFilter removed %d keys incrementally', num_removed)
+  return num_removed
+
 class GlobalStepFilter(HashFilterBase):
-  def __init__(self, filter_interval_steps):
-    super(GlobalStepFilter, self).__init__()
+  def __init__(self, filter_interval_steps, incremental_shards=1):
+    super(GlobalStepFilter, self).__init__(
+        incremental_shards=incremental_shards)
     self._filter_interval_steps = filter_interval_steps
     self._filter_interval_steps_tensor = ops.convert_to_tensor(filter_interval_steps, dtype=dtypes.int64)
     self._global_step = get_or_create_global_step()
@@ -189,6 +278,16 @@ class GlobalStepFilter(HashFilterBase):
       ids,
       update_value)
 
+  def _native_filter(self, hash_table, cursor, num_shards):
+    step_slot = hash_table.get_slot('update_step')
+    return gen_hash_ops.hash_table_global_step_filter_op(
+        hash_table.hash_table.handle,
+        step_slot.handle,
+        self._global_step,
+        self._filter_interval_steps_tensor,
+        cursor,
+        num_shards)
+
   def filter(self, keys, ids):
     step_slot = self._hash_table.get_slot('update_step')
     default_value = ops.convert_to_tensor(0, dtype=dtypes.int64)
@@ -203,8 +302,9 @@ class GlobalStepFilter(HashFilterBase):
     return [slot_value, self._global_step], lambda x,y: (x >= y - self._filter_interval_steps).all()
 
 class L2WeightFilter(HashFilterBase):
-  def __init__(self, threshold):
-    super(L2WeightFilter, self).__init__()
+  def __init__(self, threshold, incremental_shards=1):
+    super(L2WeightFilter, self).__init__(
+        incremental_shards=incremental_shards)
     self._threshold = ops.convert_to_tensor(threshold, dtypes.float32)
 
   def get_config(self):
@@ -217,6 +317,14 @@ class L2WeightFilter(HashFilterBase):
   def update(self, keys, ids):
     return []
 
+  def _native_filter(self, hash_table, cursor, num_shards):
+    return gen_hash_ops.hash_table_l2_weight_filter_op(
+        hash_table.hash_table.handle,
+        hash_table.handle,
+        self._threshold,
+        cursor,
+        num_shards)
+
   def filter(self, keys, ids):
     default_value = ops.convert_to_tensor(0, dtype=dtypes.float32)
     weight = gen_hash_ops.tensible_variable_gather(self._hash_table.handle, ids, default_value)
@@ -231,41 +339,139 @@ class L2WeightFilter(HashFilterBase):
     l2_weight = math_ops.reduce_sum(math_ops.square(weight) * 0.5, axis=1)
     return [l2_weight, self._threshold], lambda x,y:(x >= y).all()
 
+class FrequencyFilter(HashFilterBase):
+  """Removes keys looked up fewer than `threshold` times."""
+  def __init__(self, threshold, incremental_shards=1):
+    super(FrequencyFilter, self).__init__(
+        incremental_shards=incremental_shards)
+    self._threshold = threshold
+    self._threshold_tensor = ops.convert_to_tensor(threshold, dtype=dtypes.int64)
+
+  def get_config(self):
+    attr_dict = super(FrequencyFilter, self).get_config()
+    attr_dict.update({
+      'threshold': self._threshold
+      })
+    return attr_dict
+
+  def update(self, keys, ids):
+    frequency_slot = self._hash_table.get_or_create_slot(
+        [1], dtypes.int64, 'frequency', initializer=Zeros(dtypes.int64))
+    unique_ids, _, counts = array_ops.unique_with_counts(ids, out_idx=dtypes.int64)
+    return gen_hash_ops.tensible_variable_scatter_add(
+      frequency_slot.handle,
+      unique_ids,
+      array_ops.reshape(counts, [-1, 1]))
+
+  def _native_filter(self, hash_table, cursor, num_shards):
+    frequency_slot = hash_table.get_slot('frequency')
+    return gen_hash_ops.hash_table_frequency_filter_op(
+        hash_table.hash_table.handle,
+        frequency_slot.handle,
+        self._threshold_tensor,
+        cursor,
+        num_shards)
+
+  def check(self, keys, ids):
+    frequency_slot = self._hash_table.get_slot('frequency')
+    default_value = ops.convert_to_tensor(0, dtype=dtypes.int64)
+    frequency = gen_hash_ops.tensible_variable_gather(frequency_slot.handle, ids, default_value)
+    return [frequency, self._threshold_tensor], lambda x,y: (x >= y).all()
+
 class HashFilterHook(session_run_hook.SessionRunHook):
-  def __init__(self, is_chief, interval=None, run_at_session_close=None):
+  def __init__(self, is_chief, interval=None, run_at_session_close=None,
+               incremental=False, background_interval_secs=None):
+    """Creates a hook running hash filters.
+
+    Args:
+      is_chief: Whether filters run on this worker.
+      interval: Filters whole hash tables every `interval` global steps. In
+        incremental mode, filters a slice of every hash table every
+        `interval` local steps, every step by default.
+      run_at_session_close: Filters whole hash tables when session closes.
+      incremental: If true, every pass only scans `incremental_shards`
+        internal tables of every hash table partition, from a cursor
+        persisting across passes, rather than whole hash tables.
+      background_interval_secs: In incremental mode, runs passes on a
+        background thread every `background_interval_secs` seconds rather
+        than along with training steps.
+    """
     self._global_step = get_or_create_global_step()
     self._interval = interval
     self._run_at_session_close = run_at_session_close
+    self._incremental = incremental
+    self._background_interval_secs = background_interval_secs
     self._last_trigger_step = 0
+    self._local_step = 0
     self._filter_ops = []
     self._update_ops = []
+    self._removed_counts = []
+    self._incremental_filter_ops = []
     self._is_chief = is_chief
+    self._thread = None
+    self._stop_event = None
 
   def after_create_session(self, sess, coord):
     self._filter_ops = filter_op()
     self._update_ops = update_op()
+    self._removed_counts = removed_count_op()
+    self._incremental_filter_ops = incremental_filter_op()
+    if (self._is_chief and self._incremental
+        and self._background_interval_secs is not None):
+      self._stop_background()
+      self._stop_event = threading.Event()
+      self._thread = threading.Thread(
+          target=self._run_background, args=(sess, self._stop_event))
+      self._thread.daemon = True
+      self._thread.start()
+
+  def _run_background(self, sess, stop_event):
+    while not stop_event.wait(self._background_interval_secs):
+      try:
+        _run_incremental_filter(sess, self._incremental_filter_ops)
+      except errors.OpError as e:
+        logging.warning('HashFilter background pass failed: %s', e)
+        return
+
+  def _stop_background(self):
+    if self._thread is not None:
+      self._stop_event.set()
+      self._thread.join()
+      self._thread = None
 
   def before_run(self, run_context):
-    if self._interval:
-      return SessionRunArgs([self._global_step] + self._update_ops)
-    else:
-      return SessionRunArgs(self._update_ops)
+    fetches = {'update_ops': self._update_ops}
+    if self._interval and not self._incremental:
+      fetches['global_step'] = self._global_step
+    if (self._is_chief and self._incremental
+        and self._background_interval_secs is None):
+      if self._local_step % (self._interval or 1) == 0:
+        fetches['incremental_filter_ops'] = self._incremental_filter_ops
+      self._local_step += 1
+    return SessionRunArgs(fetches)
 
   def after_run(self, run_context, run_values):
     if not self._is_chief:
       return
-    if self._interval:
-      global_step = run_values.results[0]
+    if 'incremental_filter_ops' in run_values.results:
+      logging.vlog(
+          1, 'HashFilter removed %d keys incrementally',
+          int(np.sum(run_values.results['incremental_filter_ops'])))
+    if self._interval and not self._incremental:
+      global_step = run_values.results['global_step']
       if global_step - self._last_trigger_step >= self._interval:
-        _get_internal_sess(run_context.session).run(self._filter_ops)
+        _run_filter(
+            run_context.session, self._filter_ops, self._removed_counts)
         self._last_trigger_step = global_step
 
   def end(self, sess):
+    self._stop_background()
     if self._run_at_session_close and self._is_chief:
-      _get_internal_sess(sess).run(self._filter_ops)
+      _run_filter(sess, self._filter_ops, self._removed_counts)
 
 def filter_once(sess):
-  _get_internal_sess(sess).run(filter_op())
+  """Runs all hash filters once, returns the number of removed keys."""
+  return _run_filter(sess, filter_op(), removed_count_op())
 
 def check(sess, verbose=True):
    values = _get_internal_sess(sess).run(check_op())
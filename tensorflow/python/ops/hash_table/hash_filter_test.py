@@ -144,5 +144,60 @@ class HashFilterTest(test.TestCase):
       ids, keys = sess.run(snapshot)
       self.assertTrue((np.sort(ids).tolist() == [2,3,4]))
 
+  def testFrequencyFilter(self):
+    input_ids = array_ops.placeholder(dtypes.int64, [None])
+    ht = hash_table.DistributedHashTable(
+      [4], dtypes.float32,
+      partitioner=hash_table.FixedSizeHashTablePartitioner(2),
+      initializer=init_ops.ones_initializer(dtypes.float32))
+
+    filter_hook = hash_filter.HashFilterHook(is_chief=True)
+
+    with hash_filter.FrequencyFilter(4):
+      emb = embedding_ops.embedding_lookup(ht, input_ids, 0)
+
+    snapshot = ht.snapshot
+    with MonitoredTrainingSession('', hooks=[filter_hook]) as sess:
+      internal_sess = hash_filter._get_internal_sess(sess)
+      for i in range(3):
+        sess.run(emb, feed_dict={input_ids: [1,2,3,4]})
+      for i in range(2):
+        sess.run(emb, feed_dict={input_ids: [1,2]})
+      self.assertEqual(2, hash_filter.filter_once(sess))
+      left_ids = internal_sess.run(snapshot)[0]
+      self.assertEqual([1,2], np.sort(left_ids).tolist())
+
+  def testIncrementalFilter(self):
+    input_ids = array_ops.placeholder(dtypes.int64, [None])
+    ht = hash_table.DistributedHashTable(
+      [4], dtypes.float32,
+      partitioner=hash_table.FixedSizeHashTablePartitioner(2),
+      initializer=init_ops.ones_initializer(dtypes.float32))
+
+    filter_hook = hash_filter.HashFilterHook(is_chief=True)
+
+    with hash_filter.FrequencyFilter(4, incremental_shards=1):
+      emb = embedding_ops.embedding_lookup(ht, input_ids, 0)
+
+    snapshot = ht.snapshot
+    with MonitoredTrainingSession('', hooks=[filter_hook]) as sess:
+      internal_sess = hash_filter._get_internal_sess(sess)
+      for i in range(3):
+        sess.run(emb, feed_dict={input_ids: [1,2,3,4]})
+      for i in range(2):
+        sess.run(emb, feed_dict={input_ids: [1,2]})
+      incremental_filter = hash_filter.incremental_filter_op()
+      self.assertEqual(2, len(incremental_filter))
+      # Every pass scans one internal table of each partition, the cursor
+      # moves on until all keys to remove are found.
+      num_removed = 0
+      for i in range(1024):
+        num_removed += np.sum(internal_sess.run(incremental_filter))
+        if num_removed >= 2:
+          break
+      self.assertEqual(2, num_removed)
+      left_ids = internal_sess.run(snapshot)[0]
+      self.assertEqual([1,2], np.sort(left_ids).tolist())
+
 if __name__ == "__main__":
   test.main()
@@ -42,14 +42,59 @@ from tensorflow.python.ops import math_ops
 from tensorflow.python.util import tf_contextlib
 from tensorflow.python.util.tf_export import tf_export
 
+SCAN_BEGIN = [0, 0, 0]
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+
+
+def _key_range(key_range):
+  if key_range is None:
+    return _INT64_MIN, _INT64_MAX
+  if len(key_range) != 2:
+    raise ValueError(
+        "key_range must be a pair of the minimum and maximum keys: %s" %
+        (key_range,))
+  return key_range
+
+
+def _scan_dataset(table, max_rows, key_range):
+  """Makes a dataset scanning the pages of a `HashTable` from the begin."""
+  # pylint: disable=g-import-not-at-top
+  from tensorflow.python.data.experimental.ops import scan_ops
+  from tensorflow.python.data.experimental.ops import take_while_ops
+  from tensorflow.python.data.ops import dataset_ops
+  # pylint: enable=g-import-not-at-top
+  if max_rows <= 0:
+    raise ValueError("max_rows must be positive: %s" % max_rows)
+  key_range = _key_range(key_range)
+
+  def scan_page(cursor, _):
+    keys, ids, next_cursor = table.hash_table.scan(
+        cursor, max_rows, key_range)
+    return next_cursor, (cursor, keys, ids)
+
+  def make_page(cursor, keys, ids):
+    del cursor
+    return {"keys": keys, "ids": ids, "values": table.lookup_by_id(ids)}
+
+  initial_cursor = constant_op.constant(SCAN_BEGIN, dtype=dtypes.int64)
+  return (dataset_ops.Dataset.from_tensors(0).repeat()
+          .apply(scan_ops.scan(initial_cursor, scan_page))
+          .apply(take_while_ops.take_while(
+              lambda cursor, keys, ids: cursor[0] >= 0))
+          .filter(lambda cursor, keys, ids: array_ops.size(keys) > 0)
+          .map(make_page))
+
+
 @tf_export("hash_table.SimpleHashTable")
 class SimpleHashTable(object):
   """TODO: Add DocString"""
   def __init__(
       self, distributed_name, concurrent_read, slicer=None,
-      children=None, name=None):
+      children=None, name=None, sharded_ids=False):
     self._distributed_name = distributed_name
     self._children = [] if children is None else children
+    self._sharded_ids = sharded_ids
     with ops.name_scope(name, "SimpleHashTable") as name:
       handle_name = ops.name_from_scope_name(name)
       self._name = handle_name
@@ -59,10 +104,10 @@ class SimpleHashTable(object):
         with ops.colocate_with(self._handle):
           self._initializer = gen_hash_ops.hash_table_initialize_op(
               self._handle, True, concurrent_read, self._children,
-              name="Initializer")
+              sharded_ids=sharded_ids, name="Initializer")
           self._false_initializer = gen_hash_ops.hash_table_initialize_op(
               self._handle, False, concurrent_read, self._children,
-              name="FalseInitializer")
+              sharded_ids=sharded_ids, name="FalseInitializer")
 
   @property
   def handle(self):
@@ -108,6 +153,10 @@ class SimpleHashTable(object):
   def children(self):
     return self._children
 
+  @property
+  def sharded_ids(self):
+    return self._sharded_ids
+
   def to_proto(v, export_scope=None):
     return None
 
@@ -138,16 +187,45 @@ class SimpleHashTable(object):
     with ops.colocate_with(self._handle):
       return gen_hash_ops.hash_table_size_op(self._handle, name=name)
 
+  def scan(self, cursor, max_rows, key_range=None, name=None):
+    """Scans the next page of keys and their ids from `cursor`.
+
+    Each page reads one internal table under its lock. Keys present during
+    the whole scan are scanned exactly once, unless their internal table is
+    resized by lookups inserting keys during the scan, which rescans that
+    table. Keys inserted or deleted during the scan may be missed. Small
+    key ranges are scanned by looking up each key of the range.
+
+    Args:
+      cursor: An int64 vector of 3 elements, `SCAN_BEGIN` for the first page,
+        and the `next_cursor` of the previous page for the others.
+      max_rows: The maximum number of keys of the page.
+      key_range: An optional pair of the minimum and the maximum keys
+        (inclusive) to scan.
+      name: A name for the operation (optional).
+
+    Returns:
+      A tuple of `keys`, `ids` and `next_cursor`, the first element of
+      `next_cursor` is negative when the whole table is scanned.
+    """
+    key_min, key_max = _key_range(key_range)
+    with ops.colocate_with(self._handle):
+      return gen_hash_ops.hash_table_scan_op(
+          self._handle, ops.convert_to_tensor(cursor, dtype=dtypes.int64),
+          max_rows, key_min, key_max, name=name)
+
 @tf_export("hash_table.HashTable")
 class HashTable(object):
   """TODO: Add DocString"""
   DEFAULT_SLICE_SIZE = 4096
+  DEFAULT_SCAN_ROWS = 65536
 
   def __init__(
       self, shape, dtype, distributed_name,
       initializer=None, init_func=None, segment_size=None,
       collections=None, trainable=True, slicer=None,
-      hash_table=None, concurrent_read=True, children=None, name=None):
+      hash_table=None, concurrent_read=True, children=None,
+      name=None, sharded_ids=False):
     self._distributed_name = distributed_name
     self._slots = {}
     self._concurrent_read = concurrent_read
@@ -157,7 +235,8 @@ class HashTable(object):
       self._name = handle_name
       if hash_table is None:
         hash_table = SimpleHashTable(
-            distributed_name, concurrent_read, slicer, self._children)
+            distributed_name, concurrent_read, slicer, self._children,
+            sharded_ids=sharded_ids)
       with ops.control_dependencies(None):
         with ops.colocate_with(hash_table.handle):
           if initializer == None and init_func == None:
@@ -266,6 +345,37 @@ class HashTable(object):
   def snapshot(self):
     return gen_hash_ops.hash_table_snapshot_op(self.hash_table.handle)
 
+  def scan(self, cursor, max_rows, key_range=None, name=None):
+    """Scans the next page of keys, ids and values from `cursor`.
+
+    See `SimpleHashTable.scan`, returns a tuple of `keys`, `ids`, `values`
+    and `next_cursor`.
+    """
+    with ops.name_scope(name, "HashTable_Scan") as name:
+      keys, ids, next_cursor = self._hash_table.scan(
+          cursor, max_rows, key_range)
+      values = self.lookup_by_id(ids)
+      return keys, ids, values, next_cursor
+
+  def scan_dataset(self, max_rows=DEFAULT_SCAN_ROWS, key_range=None):
+    """Makes a `tf.data.Dataset` of the pages of the hash table.
+
+    Every element is a dict of `keys`, `ids` and `values` of at most
+    `max_rows` keys, so that the hash table is exported with memory bounded
+    by a page rather than the whole table. The dataset reads the hash table
+    through its resource handle, so it should be iterated on the device of
+    the hash table.
+
+    Args:
+      max_rows: The maximum number of keys of a page.
+      key_range: An optional pair of the minimum and the maximum keys
+        (inclusive) to scan.
+
+    Returns:
+      A `tf.data.Dataset`.
+    """
+    return _scan_dataset(self, max_rows, key_range)
+
   @distributed_name.setter
   def distributed_name(self, distributed_name):
     self._distributed_name = distributed_name
@@ -326,7 +436,8 @@ class HashTable(object):
     slot = HashTable(
       shape, dtype, distributed_name,
       initializer, init_func, segment_size, collections, trainable,
-      None, self._hash_table, self._concurrent_read, self._children, name)
+      None, self._hash_table, self._concurrent_read, self._children,
+      name, sharded_ids=self._hash_table.sharded_ids)
     self._slots[distributed_name] = slot
     return slot
 
@@ -393,7 +504,7 @@ class DistributedHashTable(object):
       initializer=None, init_func=None, segment_size=None,
       collections=None, trainable=True, partitioner=None,
       slice_size=None, slicer=None, hash_tables=None, concurrent_read=True,
-      children=None, name=None):
+      children=None, name=None, sharded_ids=False):
     if slice_size is None:
       slice_size = DistributedHashTable._DEFAULT_SLICER_SIZE
 
@@ -413,7 +524,8 @@ class DistributedHashTable(object):
             HashTable(shape, dtype, distributed_name, initializer,
                       init_func, segment_size, collections, trainable,
                       [oslicer[i], oslicer[i + 1], slice_size], None,
-                      concurrent_read, children, "HashTable_" + str(i)))
+                      concurrent_read, children, "HashTable_" + str(i),
+                      sharded_ids=sharded_ids))
 
     if len(hash_tables) != len(slicer):
       raise RuntimeError("HashTable size should be equal to slicer size")
@@ -459,6 +571,33 @@ class DistributedHashTable(object):
       ids.append(id)
     return [array_ops.concat(keys, 0), array_ops.concat(ids, 0)]
 
+  def scan_dataset(self, max_rows=HashTable.DEFAULT_SCAN_ROWS,
+                   key_range=None, partitions=None):
+    """Makes a `tf.data.Dataset` of the pages of the partitions.
+
+    See `HashTable.scan_dataset`, the partitions are scanned one after
+    another.
+
+    Args:
+      max_rows: The maximum number of keys of a page.
+      key_range: An optional pair of the minimum and the maximum keys
+        (inclusive) to scan.
+      partitions: An optional list of the indices of the partitions to scan,
+        all partitions by default.
+
+    Returns:
+      A `tf.data.Dataset`.
+    """
+    if partitions is None:
+      partitions = range(len(self._hash_tables))
+    dataset = None
+    for i in partitions:
+      partition = _scan_dataset(self._hash_tables[i], max_rows, key_range)
+      dataset = partition if dataset is None else dataset.concatenate(partition)
+    if dataset is None:
+      raise ValueError("partitions to scan must not be empty")
+    return dataset
+
   def initializer_without_hashtable(self, name=None):
     with ops.name_scope(name, "DistributedHashTable_Initializer") as name:
       return [i.initializer_without_hashtable() for i in self._hash_tables]
@@ -256,5 +256,85 @@ class HashTableTest(test.TestCase):
           "not supported: " + str(PreservedKey+1)):
         sess.run(lookup3)
 
+  def testShardedIdsLookup(self):
+    with self.test_session(graph=ops_lib.Graph()) as sess:
+      table = hash_table.SimpleHashTable(
+          'sharded_table', True, sharded_ids=True)
+      self.assertTrue(table.sharded_ids)
+      keys = np.arange(10000, dtype=np.int64) * 7
+      lookup1 = table.lookup(keys)
+      lookup2 = table.lookup(keys[::-1])
+      size = table.size()
+      sess.run(table.initializer)
+      ids1 = sess.run(lookup1)
+      ids2 = sess.run(lookup2)
+      self.assertEqual(len(set(ids1)), len(keys))
+      self.assertAllEqual(ids1, ids2[::-1])
+      self.assertGreaterEqual(sess.run(size), np.max(ids1) + 1)
+
+  def testScan(self):
+    with self.test_session(graph=ops_lib.Graph()) as sess:
+      ht = hash_table.HashTable(
+          [2], dtypes.float32, 'scan_table', init_ops.ones_initializer())
+      keys = np.arange(100, dtype=np.int64) * 3
+      lookup = ht.lookup(keys)
+      cursor = array_ops.placeholder(dtypes.int64, [3])
+      page = ht.scan(cursor, 16)
+      ranged_page = ht.scan(cursor, 1000, key_range=[30, 59])
+      sess.run(variables.global_variables_initializer())
+      sess.run(lookup)
+      scanned = []
+      next_cursor = hash_table.SCAN_BEGIN
+      while True:
+        page_keys, page_ids, page_values, next_cursor = sess.run(
+            page, feed_dict={cursor: next_cursor})
+        self.assertLessEqual(len(page_keys), 16)
+        self.assertEqual(len(page_keys), len(page_ids))
+        self.assertAllEqual(page_values, np.ones([len(page_keys), 2]))
+        scanned.extend(page_keys)
+        if next_cursor[0] < 0:
+          break
+      self.assertAllEqual(sorted(scanned), keys)
+      ranged_keys = sess.run(
+          ranged_page, feed_dict={cursor: hash_table.SCAN_BEGIN})[0]
+      self.assertAllEqual(sorted(ranged_keys), np.arange(30, 60, 3))
+
+  def testScanDataset(self):
+    def scan_all(sess, dataset):
+      iterator = dataset_ops.make_initializable_iterator(dataset)
+      get_next = iterator.get_next()
+      sess.run(iterator.initializer)
+      pages = []
+      while True:
+        try:
+          pages.append(sess.run(get_next))
+        except errors.OutOfRangeError:
+          return pages
+
+    with self.test_session(graph=ops_lib.Graph()) as sess:
+      ht = hash_table.DistributedHashTable(
+          [2], dtypes.float32,
+          partitioner=hash_table.FixedSizeHashTablePartitioner(2),
+          initializer=init_ops.ones_initializer(dtypes.float32))
+      keys = np.arange(1000, dtype=np.int64)
+      lookup = ht.lookup(keys)
+      dataset = ht.scan_dataset(max_rows=64)
+      partition_datasets = [
+          ht.scan_dataset(max_rows=64, key_range=[100, 199], partitions=[i])
+          for i in range(2)]
+      sess.run(variables.global_variables_initializer())
+      sess.run(lookup)
+      scanned = []
+      for page in scan_all(sess, dataset):
+        self.assertLessEqual(len(page["keys"]), 64)
+        self.assertAllEqual(page["values"], np.ones([len(page["keys"]), 2]))
+        scanned.extend(page["keys"])
+      self.assertAllEqual(sorted(scanned), keys)
+      partition_scanned = []
+      for partition_dataset in partition_datasets:
+        for page in scan_all(sess, partition_dataset):
+          partition_scanned.extend(page["keys"])
+      self.assertAllEqual(sorted(partition_scanned), np.arange(100, 200))
+
 if __name__ == "__main__":
   test.main()
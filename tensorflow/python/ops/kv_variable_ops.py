@@ -267,20 +267,28 @@ class EmbeddingVariable(resource_variable_ops.ResourceVariable):
         self._max_element_size = 0
         self._false_positive_probability = -1.0
         self._counter_type = dtypes.uint64
+        self._filter_decay_steps = 0
       elif isinstance(evconfig.filter_strategy, variables.CBFFilter):
         self._filter_freq = evconfig.filter_strategy.filter_freq
         self._max_element_size = evconfig.filter_strategy.max_element_size
         self._false_positive_probability = evconfig.filter_strategy.false_positive_probability
         self._counter_type = evconfig.filter_strategy.counter_type
+        self._filter_decay_steps = evconfig.filter_strategy.decay_steps
     else:
       self._filter_freq = 0
       self._max_element_size = 0
       self._false_positive_probability = -1.0
       self._counter_type = dtypes.uint64
+      self._filter_decay_steps = 0
       
     self._l2_weight_threshold = evconfig.l2_weight_threshold
     self._storage_type = evconfig.storage_type
     self._storage_path = evconfig.storage_path
+    self._storage_size = evconfig.storage_size
+    self._max_keys = evconfig.max_keys
+    self._evict_policy = evconfig.evict_policy
+    self._storage_dtype = evconfig.storage_dtype
+    self._slot_storage_dtype = evconfig.slot_storage_dtype
     self._default_value_dim = evconfig.default_value_dim
     if self._steps_to_live is 0 and self._filter_freq is 0 and self._l2_weight_threshold == -1.0:
       self._layout = "light"
@@ -386,11 +394,17 @@ class EmbeddingVariable(resource_variable_ops.ResourceVariable):
                     l2_weight_threshold = self._l2_weight_threshold,
                     max_element_size = self._max_element_size,
                     false_positive_probability = self._false_positive_probability,
+                    filter_decay_steps = self._filter_decay_steps,
                     counter_type = self._counter_type,
                     max_freq = 99999,
                     layout = self._layout,
                     storage_type = self._storage_type,
                     storage_path = self._storage_path,
+                    storage_size = self._storage_size,
+                    max_keys = self._max_keys,
+                    evict_policy = self._evict_policy,
+                    storage_dtype = self._storage_dtype,
+                    slot_storage_dtype = self._slot_storage_dtype,
                     default_value_dim = self._default_value_dim,
                     name=n))
         self._graph_element = self._handle
@@ -449,6 +463,8 @@ class EmbeddingVariable(resource_variable_ops.ResourceVariable):
     self._graph_element = self._handle
     self._constraint = None
     self._is_sparse=False
+    self._filter_decay_steps = self._initializer_op.get_attr(
+        "filter_decay_steps")
   # LINT.ThenChange(//tensorflow/python/eager/graph_callable.py)
 
   def set_init_data_source_initializer(self, init_data_source):
@@ -557,6 +573,42 @@ class EmbeddingVariable(resource_variable_ops.ResourceVariable):
     return gen_kv_variable_ops.kv_resource_export(self._handle,
 		    self._invalid_key_type, self.dtype)
 
+  def statistics(self, global_step=None, top_k=10, num_buckets=32):
+    """Returns a dict of statistics of the keys in this variable.
+
+    Only the per key metadata is read, so it is cheap enough to be run every
+    few steps, e.g. from a `SessionRunHook`. For a partitioned variable call
+    it on each partition.
+
+    Args:
+      global_step: The step the ages are relative to. Defaults to the latest
+        version in the variable.
+      top_k: Number of most frequent keys to return.
+      num_buckets: Number of buckets of the histograms. Bucket `i` counts the
+        values in `[2^(i-1), 2^i)`, bucket 0 the zeros and the last bucket is
+        open ended.
+
+    Returns:
+      A dict of tensors: `size` and `memory_bytes` of the variable, slots
+      included, `freq_histogram`, `top_keys` and `top_freqs` when a filter
+      tracks the frequency, and `age_histogram` of the steps since the keys
+      were last updated when `steps_to_live` tracks it. The untracked ones
+      are empty.
+    """
+    if global_step is None:
+      global_step = -1
+    (size, memory_bytes, freq_histogram, top_keys, top_freqs,
+     age_histogram) = gen_kv_variable_ops.kv_resource_statistics(
+         self._handle, math_ops.cast(global_step, dtypes.int64),
+         Tkeys=self._invalid_key_type, dtype=self.dtype,
+         top_k=top_k, num_buckets=num_buckets)
+    return {"size": size,
+            "memory_bytes": memory_bytes,
+            "freq_histogram": freq_histogram,
+            "top_keys": top_keys,
+            "top_freqs": top_freqs,
+            "age_histogram": age_histogram}
+
   @property
   def steps_to_live(self):
     return self._steps_to_live
@@ -565,6 +617,22 @@ class EmbeddingVariable(resource_variable_ops.ResourceVariable):
   def storage_type(self):
     return self._storage_type
 
+  @property
+  def storage_path(self):
+    return self._storage_path
+
+  @property
+  def storage_size(self):
+    return self._storage_size
+
+  @property
+  def storage_dtype(self):
+    return self._storage_dtype
+
+  @property
+  def slot_storage_dtype(self):
+    return self._slot_storage_dtype
+
   @property
   def block_num(self):
     if self._block_num is None:
@@ -665,19 +733,62 @@ class EmbeddingVariable(resource_variable_ops.ResourceVariable):
       else:
         default_value = ops.convert_to_tensor(1.0)
         is_use_default_value_tensor = False
-      if counts != None:
-        value = gen_kv_variable_ops.kv_resource_gather_v1(self._handle,
-              indices,
-              default_value,
-              counts, name=name)
-      else:
-        value = gen_kv_variable_ops.kv_resource_gather(self._handle,
-              indices,
-              default_value,
-              is_use_default_value_tensor,
-              name=name)
+      # The counters of the filter are decayed before the keys are counted.
+      with ops.control_dependencies(self._filter_decay_ops()):
+        if counts != None:
+          value = gen_kv_variable_ops.kv_resource_gather_v1(self._handle,
+                indices,
+                default_value,
+                counts, name=name)
+        else:
+          value = gen_kv_variable_ops.kv_resource_gather(self._handle,
+                indices,
+                default_value,
+                is_use_default_value_tensor,
+                name=name)
     return array_ops.identity(value)
 
+  def _filter_decay_ops(self):
+    if self._filter_decay_steps <= 0:
+      return []
+    # pylint: disable=g-import-not-at-top
+    from tensorflow.python.training import training_util
+    global_step = training_util.get_global_step()
+    if global_step is None:
+      return []
+    return [self.decay_filter(global_step)]
+
+  def decay_filter(self, global_step=None):
+    """Decays the counters of the counting filter of this variable.
+
+    The counters are halved once every `decay_steps` of the `CBFFilter`, the
+    first run only records the step. It is run before every `sparse_read`,
+    `group_embedding_lookup_sparse` and `HotKeyCache` lookup when there is a
+    global step, other lookups of the variable may run it explicitly.
+
+    Args:
+      global_step: The current step. Defaults to the global step.
+
+    Returns:
+      The decay op.
+
+    Raises:
+      ValueError: If the filter does not decay or there is no global step.
+    """
+    if self._filter_decay_steps <= 0:
+      raise ValueError("The filter of %s does not decay." % self.name)
+    if global_step is None:
+      # pylint: disable=g-import-not-at-top
+      from tensorflow.python.training import training_util
+      global_step = training_util.get_global_step()
+      if global_step is None:
+        raise ValueError("decay_filter needs a global step.")
+    with ops.colocate_with(self._handle):
+      return gen_kv_variable_ops.kv_resource_filter_decay(
+          self._handle, math_ops.cast(global_step, dtypes.int64),
+          Tkeys=self._invalid_key_type, dtype=self.dtype,
+          decay_steps=self._filter_decay_steps)
+
   def to_proto(self, export_scope=None):
     """Converts a `EmbeddingVariable` to a `VariableDef` protocol buffer.
 
@@ -872,6 +983,40 @@ def _GatherGrad(op, grad):
   indices = array_ops.reshape(indices, size)
   return [ops.IndexedSlices(values, indices, params_shape), None, None]
 
+@ops.RegisterGradient("KvResourceCachedGather")
+def _CachedGatherGrad(op, grad):
+  """Gradient for gather of rows read from a HotKeyCache."""
+  handle = op.inputs[0]
+  while handle.op.type != "KvVarHandleOp":
+    handle = handle.op.inputs[0]
+  params_shape = ops.convert_to_tensor(
+      tensor_shape.TensorShape(handle.op.get_attr("shape")))
+  indices = op.inputs[1]
+  size = array_ops.expand_dims(array_ops.size(indices), 0)
+  values_shape = array_ops.concat([size, params_shape[0:]], 0)
+  values = array_ops.reshape(grad, values_shape)
+  indices = array_ops.reshape(indices, size)
+  return [ops.IndexedSlices(values, indices, params_shape), None, None]
+
+@ops.RegisterGradient("KvResourceGroupGather")
+def _GroupGatherGrad(op, *grads):
+  """Gradient for group gather op, one IndexedSlices per variable."""
+  num_tables = op.get_attr("N")
+  resource_grads = []
+  for i in range(num_tables):
+    handle = op.inputs[i]
+    while handle.op.type != "KvVarHandleOp":
+      handle = handle.op.inputs[0]
+    params_shape = ops.convert_to_tensor(
+        tensor_shape.TensorShape(handle.op.get_attr("shape")))
+    indices = op.inputs[num_tables + i]
+    size = array_ops.expand_dims(array_ops.size(indices), 0)
+    values_shape = array_ops.concat([size, params_shape[0:]], 0)
+    values = array_ops.reshape(grads[i], values_shape)
+    indices = array_ops.reshape(indices, size)
+    resource_grads.append(ops.IndexedSlices(values, indices, params_shape))
+  return resource_grads + [None] * (2 * num_tables)
+
 @ops.RegisterGradient("KvResourceGatherV1")
 def _GatherV1Grad(op, grad):
   """Gradient for gather op."""
@@ -20,6 +20,7 @@ from __future__ import print_function
 
 import collections
 
+from tensorflow.python.framework import dtypes
 from tensorflow.python.framework import sparse_tensor
 from tensorflow.python.framework import ops
 from tensorflow.python.ops import array_ops
@@ -29,11 +30,15 @@ from tensorflow.python.util.tf_export import tf_export
 
 
 from tensorflow.python.ops import gen_data_buffer_ops
+from tensorflow.python.ops.prefetch_runner import PrefetchAutotuner
 from tensorflow.python.ops.prefetch_runner import PrefetchRunner
+from tensorflow.python.ops.prefetch_runner import PrefetchStats
 
 ops.NotDifferentiable('DataBufferPut')
 ops.NotDifferentiable('DataBufferTake')
 ops.NotDifferentiable('DataBufferCancel')
+ops.NotDifferentiable('DataBufferSetCapacity')
+ops.NotDifferentiable('DataBufferStats')
 
 PREFETCH = "prefetch"
 
@@ -51,6 +56,35 @@ def make_prefetch_hook(daemon=True, start=True):
   """
   return PrefetchRunner.Hook(PREFETCH, daemon=daemon, start=start)
 
+@tf_export(v1=["add_prefetch_summaries"])
+def add_prefetch_summaries():
+  """Add summaries of the data buffers of all prefetching.
+
+  For every `staged` or `prefetch_join` call, the fraction of the buffer that
+  is full, the average occupancy, the fractions of time producer threads and
+  clients stalled, and the samples taken per second are added as scalar
+  summaries named after the prefetching.
+  """
+  for runner in ops.get_collection(PREFETCH):
+    if runner.stats_op is not None:
+      runner.add_summary()
+
+@tf_export(v1=["get_prefetch_stats"])
+def get_prefetch_stats(sess):
+  """Get statistics of the data buffers of all prefetching.
+
+  Args:
+    sess: `Session` running the prefetching.
+
+  Returns:
+    A dict from names of prefetching to their `PrefetchStats`, see
+    `PrefetchStats.delta` for statistics of an interval.
+  """
+  return {
+      runner.name: runner.stats(sess)
+      for runner in ops.get_collection(PREFETCH)
+      if runner.stats_op is not None}
+
 @tf_export(v1=["staged"])
 def staged(
     features,
@@ -62,6 +96,11 @@ def staged(
     timeout_millis=300000,
     closed_exception_types=None,
     ignored_exception_types=None,
+    autotune=False,
+    max_num_threads=None,
+    max_capacity=None,
+    memory_budget=None,
+    num_processes=None,
     name=None):
   """Prefetch samples.
 
@@ -83,6 +122,20 @@ def staged(
       `(tf.errors.OutOfRangeError, StopIteration)`.
     ignored_exception_types: (Optional.) Exception types indicating that the
       prefetching can continue. Defaults to `()`.
+    autotune: (Optional.) If `True`, `num_threads` and `capacity` are only
+      initial values, the number of threads and the capacity are tuned from
+      the time the prefetching and the clients wait for each other. See
+      `PrefetchAutotuner` for details. `False` by default.
+    max_num_threads: (Optional.) Max number of threads when `autotune` is
+      `True`. 8 by default.
+    max_capacity: (Optional.) Max capacity when `autotune` is `True`. 64 by
+      default.
+    memory_budget: (Optional.) Max bytes of samples in the buffer when
+      `autotune` is `True`. 1GB by default.
+    num_processes: (Optional.) If positive, `feed_generator` runs in this
+      number of worker processes instead of the prefetching threads, and is
+      called with `None` instead of the session. NumPy arrays yielded are
+      passed back through shared memory. See `PrefetchProcessPool`.
     name: (Optional.) Name of prefetching operations.
 
   Returns:
@@ -90,6 +143,12 @@ def staged(
   """
   if num_threads < 1:
     raise ValueError('num_threads must >= 1')
+  if max_num_threads is not None and max_num_threads < num_threads:
+    raise ValueError('max_num_threads must >= num_threads')
+  if max_capacity is not None and max_capacity < capacity:
+    raise ValueError('max_capacity must >= capacity')
+  if num_processes and feed_generator is None:
+    raise ValueError('num_processes requires feed_generator')
 
   if name is None:
     name = ops.get_default_graph().unique_name(PREFETCH)
@@ -141,6 +200,28 @@ def staged(
       if not isinstance(next_tensors, (tuple, list)):
         next_tensors = [next_tensors]
       next_tensors = [array_ops.identity(t) for t in next_tensors]
+      buffer_stats = gen_data_buffer_ops.data_buffer_stats(
+          shared_name=name,
+          shared_capacity=capacity)
+      autotuner = None
+      if autotune:
+        capacity_to_set = array_ops.placeholder(
+            dtypes.int64, shape=[], name='autotune_capacity')
+        set_capacity = gen_data_buffer_ops.data_buffer_set_capacity(
+            capacity_to_set,
+            shared_name=name,
+            shared_capacity=capacity)
+        autotuner = PrefetchAutotuner(
+            buffer_stats,
+            capacity_to_set,
+            set_capacity,
+            num_threads,
+            capacity,
+            num_clients=num_clients,
+            max_num_threads=max_num_threads,
+            max_capacity=max_capacity,
+            memory_budget=memory_budget)
+        num_threads = autotuner.max_num_threads
     for i, t in enumerate(next_tensors):
       t.set_shape(tensor_shapes[i])
     next_tensor_or_nones = [None] * len(tensor_or_nones)
@@ -171,7 +252,12 @@ def staged(
       feed_list=feed_list,
       feed_generator=feed_generator,
       closed_exception_types=closed_exception_types,
-      ignored_exception_types=ignored_exception_types)
+      ignored_exception_types=ignored_exception_types,
+      autotuner=autotuner,
+      stats_op=buffer_stats,
+      num_clients=num_clients,
+      num_processes=num_processes,
+      name=name)
   ops.add_to_collection(PREFETCH, runner)
   return prefetched
 
@@ -185,6 +271,7 @@ def prefetch_join(
     timeout_millis=300000,
     closed_exception_types=None,
     ignored_exception_types=None,
+    num_processes=None,
     name=None):
   """Prefetch samples from thread_to_features list.
 
@@ -207,6 +294,9 @@ def prefetch_join(
       `(tf.errors.OutOfRangeError, StopIteration)`.
     ignored_exception_types: (Optional.) Exception types indicating that the
       prefetching can continue. Defaults to `()`.
+    num_processes: (Optional.) If positive, `feed_generator` runs in this
+      number of worker processes instead of the prefetching threads, see
+      `staged`.
     name: (Optional.) Name of prefetching operations.
 
   Returns:
@@ -214,6 +304,8 @@ def prefetch_join(
   """
   if len(thread_to_features) < 1:
     raise ValueError('thread_to_features must has at least one element')
+  if num_processes and feed_generator is None:
+    raise ValueError('num_processes requires feed_generator')
 
   if name is None:
     name = ops.get_default_graph().unique_name(PREFETCH)
@@ -230,6 +322,9 @@ def prefetch_join(
       close_fetching = gen_data_buffer_ops.data_buffer_close(
           shared_name=name,
           shared_capacity=capacity)
+      buffer_stats = gen_data_buffer_ops.data_buffer_stats(
+          shared_name=name,
+          shared_capacity=capacity)
 
   thread_to_tensor_dtypes = []
   thread_to_tensor_shapes = []
@@ -313,6 +408,10 @@ def prefetch_join(
       feed_list=feed_list,
       feed_generator=feed_generator,
       closed_exception_types=closed_exception_types,
-      ignored_exception_types=ignored_exception_types)
+      ignored_exception_types=ignored_exception_types,
+      stats_op=buffer_stats,
+      num_clients=num_clients,
+      num_processes=num_processes,
+      name=name)
   ops.add_to_collection(PREFETCH, runner)
   return prefetched
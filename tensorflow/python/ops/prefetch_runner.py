@@ -19,19 +19,521 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import collections
 import itertools
+import multiprocessing
+import pickle
 import threading
+import time
 import weakref
 
+import numpy as np
+from six.moves import queue
 from six.moves import xrange
 
 from tensorflow.python.client import session as session_lib
 from tensorflow.python.eager import context
+from tensorflow.python.framework import dtypes
 from tensorflow.python.framework import errors
 from tensorflow.python.framework import ops
+from tensorflow.python.ops import math_ops
+from tensorflow.python.ops import script_ops
 from tensorflow.python.platform import tf_logging as logging
+from tensorflow.python.summary import summary
 from tensorflow.python.training import session_run_hook
 
+class PrefetchStats(collections.namedtuple(
+    "PrefetchStats",
+    ["capacity", "size", "put_wait_micros", "take_wait_micros", "num_puts",
+     "num_takes", "num_full_puts", "num_empty_takes", "bytes_put",
+     "size_micros", "elapsed_micros"])):
+  """Statistics of the data buffer of a prefetch runner.
+
+  The fields are the outputs of the `DataBufferStats` op: the current capacity
+  and size of the buffer, and the statistics accumulated since the buffer was
+  created, i.e. the microseconds producers waited for a full buffer and
+  consumers waited for an empty buffer, the numbers of samples put and taken,
+  the numbers of puts finding a full buffer and takes finding an empty buffer,
+  the bytes of samples put, the integral of the size over microseconds and
+  the elapsed microseconds. Use `delta` to get the statistics of an interval.
+  """
+  __slots__ = ()
+
+  def delta(self, previous):
+    """Statistics accumulated since `previous` stats of the same buffer."""
+    return PrefetchStats(
+        self.capacity, self.size,
+        *[a - b for a, b in zip(self[2:], previous[2:])])
+
+  @property
+  def average_size(self):
+    """Time-weighted average number of samples in the buffer."""
+    if self.elapsed_micros <= 0:
+      return 0.
+    return float(self.size_micros) / self.elapsed_micros
+
+  @property
+  def occupancy(self):
+    """Time-weighted average fraction of the buffer that is full."""
+    return self.average_size / max(self.capacity, 1)
+
+  @property
+  def producer_stall_secs_per_sec(self):
+    """Seconds producers waited for a full buffer per second."""
+    if self.elapsed_micros <= 0:
+      return 0.
+    return float(self.put_wait_micros) / self.elapsed_micros
+
+  @property
+  def consumer_stall_secs_per_sec(self):
+    """Seconds consumers waited for an empty buffer per second."""
+    if self.elapsed_micros <= 0:
+      return 0.
+    return float(self.take_wait_micros) / self.elapsed_micros
+
+  @property
+  def items_per_sec(self):
+    """Samples taken from the buffer per second."""
+    if self.elapsed_micros <= 0:
+      return 0.
+    return self.num_takes * 1e6 / self.elapsed_micros
+
+  @property
+  def bytes_per_item(self):
+    """Average bytes of a sample put into the buffer."""
+    if self.num_puts <= 0:
+      return 0.
+    return float(self.bytes_put) / self.num_puts
+
+
+class PrefetchAutotuner(object): # pylint: disable=useless-object-inheritance
+  """Tunes the number of threads and the capacity of a prefetch runner.
+
+  Every `interval_secs`, the autotuner compares the time consumers waited for
+  an empty data buffer, i.e. the input is the bottleneck, with the time
+  producers waited for a full one, i.e. the computation is the bottleneck:
+
+  * When consumers stall, one more producer thread is activated, or the
+    capacity is doubled if all threads are active or producers stall too.
+  * When producers are blocked most of the time, one producer thread is
+    deactivated, or the capacity is halved if only one thread is active.
+
+  The capacity never exceeds `max_capacity` or the number of records fitting
+  in `memory_budget` bytes.
+  """
+
+  STALL_RATIO = 0.05
+  IDLE_RATIO = 0.5
+  DEFAULT_MAX_NUM_THREADS = 8
+  DEFAULT_MAX_CAPACITY = 64
+  DEFAULT_MEMORY_BUDGET = 1 << 30
+  DEFAULT_INTERVAL_SECS = 10
+
+  def __init__(
+      self,
+      stats_op,
+      capacity_placeholder,
+      set_capacity_op,
+      num_threads,
+      capacity,
+      num_clients=1,
+      max_num_threads=None,
+      max_capacity=None,
+      memory_budget=None,
+      interval_secs=None):
+    """Create a PrefetchAutotuner.
+
+    Args:
+      stats_op: `DataBufferStats` op of the data buffer.
+      capacity_placeholder: Placeholder of the capacity fed to
+        `set_capacity_op`.
+      set_capacity_op: `DataBufferSetCapacity` op of the data buffer.
+      num_threads: Initial number of active threads.
+      capacity: Initial capacity of the data buffer.
+      num_clients: (Optional.) Number of clients taking from the buffer.
+      max_num_threads: (Optional.) Max number of active threads.
+      max_capacity: (Optional.) Max capacity of the data buffer.
+      memory_budget: (Optional.) Max bytes of records in the data buffer.
+      interval_secs: (Optional.) Seconds between two tunings.
+    """
+    self._stats_op = stats_op
+    self._capacity_placeholder = capacity_placeholder
+    self._set_capacity_op = set_capacity_op
+    self._num_clients = max(num_clients, 1)
+    self._max_num_threads = max(
+        max_num_threads or self.DEFAULT_MAX_NUM_THREADS, num_threads)
+    self._max_capacity = max(
+        max_capacity or self.DEFAULT_MAX_CAPACITY, capacity)
+    self._memory_budget = memory_budget or self.DEFAULT_MEMORY_BUDGET
+    self._interval_secs = interval_secs or self.DEFAULT_INTERVAL_SECS
+    self._initial_num_threads = num_threads
+    self._initial_capacity = capacity
+    self._cond = threading.Condition()
+    self.reset()
+
+  @property
+  def max_num_threads(self):
+    """Max number of active threads."""
+    return self._max_num_threads
+
+  @property
+  def num_threads(self):
+    """Current number of active threads."""
+    return self._num_threads
+
+  @property
+  def capacity(self):
+    """Current capacity of the data buffer."""
+    return self._capacity
+
+  def reset(self):
+    """Restarts tuning from the initial number of threads and capacity."""
+    with self._cond:
+      self._num_threads = self._initial_num_threads
+      self._capacity = self._initial_capacity
+      self._last_stats = None
+      self._thread_micros = 0
+      self._tuned_micros = 0
+      self._finished = False
+      self._cond.notify_all()
+
+  def active_thread_micros(self, elapsed_micros):
+    """Integral of the number of active threads over microseconds.
+
+    Args:
+      elapsed_micros: Elapsed microseconds of the data buffer.
+
+    Returns:
+      The integral since the buffer was created, or since `reset` for
+      buffer stats tuned since then.
+    """
+    with self._cond:
+      return self._thread_micros + self._num_threads * max(
+          elapsed_micros - self._tuned_micros, 0)
+
+  def finish(self):
+    """Wakes up inactive threads since prefetching is finished."""
+    with self._cond:
+      self._finished = True
+      self._cond.notify_all()
+
+  def wait_until_active(self, index, coord=None):
+    """Blocks thread `index` until it is active.
+
+    Returns:
+      `False` if prefetching is finished or stopped before the thread is
+      active, `True` otherwise.
+    """
+    with self._cond:
+      while index >= self._num_threads:
+        if self._finished or (coord and coord.should_stop()):
+          return False
+        self._cond.wait(1.0)
+      return True
+
+  def tune(self, stats):
+    """Updates the number of threads and the capacity from buffer stats.
+
+    Args:
+      stats: `PrefetchStats` of the data buffer.
+
+    Returns:
+      `True` if the capacity is changed.
+    """
+    stats = PrefetchStats(*[int(v) for v in stats])
+    with self._cond:
+      self._thread_micros += self._num_threads * max(
+          stats.elapsed_micros - self._tuned_micros, 0)
+      self._tuned_micros = stats.elapsed_micros
+    last_stats, self._last_stats = self._last_stats, stats
+    if last_stats is None:
+      return False
+    interval = stats.delta(last_stats)
+    if interval.elapsed_micros <= 0:
+      return False
+    take_stall = interval.consumer_stall_secs_per_sec / self._num_clients
+    put_stall = interval.producer_stall_secs_per_sec / self._num_threads
+    num_puts = stats.num_puts
+    bytes_put = stats.bytes_put
+
+    num_threads = self._num_threads
+    capacity = self._capacity
+    if take_stall > self.STALL_RATIO:
+      if put_stall <= self.STALL_RATIO and num_threads < self._max_num_threads:
+        num_threads += 1
+      else:
+        capacity *= 2
+    elif put_stall > self.IDLE_RATIO:
+      if num_threads > 1:
+        num_threads -= 1
+      else:
+        capacity //= 2
+    max_capacity = self._max_capacity
+    if num_puts > 0 and bytes_put > 0:
+      max_capacity = min(
+          max_capacity, self._memory_budget * num_puts // bytes_put)
+    capacity = max(min(capacity, max_capacity), 1)
+
+    if num_threads != self._num_threads or capacity != self._capacity:
+      logging.info(
+          "Prefetching autotuned: consumers stalled %.1f%%, producers "
+          "stalled %.1f%%, threads %d -> %d, capacity %d -> %d.",
+          take_stall * 100, put_stall * 100, self._num_threads, num_threads,
+          self._capacity, capacity)
+    with self._cond:
+      self._num_threads = num_threads
+      self._cond.notify_all()
+    capacity_changed = capacity != self._capacity
+    self._capacity = capacity
+    return capacity_changed
+
+  # pylint: disable=broad-except
+  def run(self, sess, coord=None):
+    """Tunes prefetching periodically until it is finished or stopped.
+
+    Args:
+      sess: A `Session`.
+      coord: (Optional.) A `Coordinator` object for checking stop conditions.
+    """
+    try:
+      get_stats = sess.make_callable(self._stats_op)
+      set_capacity = sess.make_callable(
+          self._set_capacity_op, [self._capacity_placeholder])
+      while not self._finished:
+        if coord:
+          if coord.wait_for_stop(self._interval_secs):
+            return
+        else:
+          time.sleep(self._interval_secs)
+        if self._finished:
+          return
+        if self.tune(PrefetchStats(*get_stats())):
+          set_capacity(self._capacity)
+    except Exception as e:
+      logging.warning("Prefetching autotuning was stopped: %s", e)
+  # pylint: enable=broad-except
+
+
+_SharedArray = collections.namedtuple(
+    "_SharedArray", ["dtype", "shape", "offset"])
+
+
+# pylint: disable=broad-except
+def _run_feed_process(feed_generator, index, outputs, free_slots, num_slots):
+  """Runs `feed_generator` and sends its feeds through shared memory."""
+  # pylint: disable=g-import-not-at-top
+  from multiprocessing import shared_memory
+  # pylint: enable=g-import-not-at-top
+  segments = [None] * num_slots
+  slot = None
+  try:
+    for feed in feed_generator(None):
+      if not isinstance(feed, (list, tuple)):
+        outputs.put(("feed", index, None, None, feed))
+        continue
+      slot = free_slots.get()
+      values = []
+      size = 0
+      for v in feed:
+        if isinstance(v, np.ndarray) and v.dtype.kind in "biufc":
+          values.append(_SharedArray(v.dtype.str, v.shape, size))
+          size += (v.nbytes + 63) // 64 * 64
+        else:
+          values.append(v)
+      if segments[slot] is None or segments[slot].size < size:
+        if segments[slot] is not None:
+          segments[slot].close()
+          segments[slot].unlink()
+        segments[slot] = shared_memory.SharedMemory(
+            create=True, size=max(size, 1))
+      buf = segments[slot].buf
+      for v, meta in zip(feed, values):
+        if isinstance(meta, _SharedArray):
+          np.ndarray(v.shape, v.dtype, buffer=buf, offset=meta.offset)[...] = v
+      outputs.put(("feed", index, slot, segments[slot].name, values))
+      slot = None
+  except Exception as e:
+    try:
+      pickle.dumps(e)
+    except Exception:
+      e = RuntimeError("{}: {}".format(type(e).__name__, e))
+    outputs.put(("error", index, e))
+  finally:
+    if slot is not None:
+      free_slots.put(slot)
+    # Feeds are copied out of a slot before it is freed.
+    for _ in xrange(num_slots):
+      free_slots.get()
+    for segment in segments:
+      if segment is not None:
+        segment.close()
+        segment.unlink()
+    outputs.put(("end", index))
+# pylint: enable=broad-except
+
+
+class PrefetchProcessPool(object): # pylint: disable=useless-object-inheritance
+  """Runs the feed generator of a prefetch runner in worker processes.
+
+  Python preprocessing in `feed_generator` holds the GIL, so prefetching
+  threads cannot run it in parallel. Instead, every worker process runs its
+  own iterator of `feed_generator(None)`, just like every prefetching thread
+  runs its own iterator of `feed_generator(sess)`. The session is not
+  available in worker processes.
+
+  Numeric NumPy arrays of the feeds are written into shared memory slots of
+  the worker and copied out once by the prefetching threads, since fed
+  tensors may stay in the data buffer after the run. Other values are
+  pickled. Exceptions raised by `feed_generator` are reraised in the
+  prefetching threads, and the pool raises `StopIteration` once all workers
+  are finished.
+  """
+
+  NUM_SLOTS = 2
+  POLL_SECS = 1.0
+
+  def __init__(self, feed_generator, num_processes):
+    """Create a PrefetchProcessPool.
+
+    Args:
+      feed_generator: A generator function lambda sess: iterator that yields
+        a list of `feed_dict` values. Called with `None` in worker processes.
+      num_processes: Number of worker processes.
+    """
+    if num_processes < 1:
+      raise ValueError("num_processes must >= 1")
+    self._feed_generator = feed_generator
+    self._num_processes = num_processes
+    self._lock = threading.Lock()
+    self._processes = []
+    self._segments = {}
+    self._finished = set()
+    self._closed = False
+
+  def start(self):
+    """Starts the worker processes."""
+    # pylint: disable=g-import-not-at-top,unused-import
+    try:
+      from multiprocessing import resource_tracker
+      from multiprocessing import shared_memory
+    except ImportError:
+      raise RuntimeError("Feeding from processes requires Python 3.8+")
+    # pylint: enable=g-import-not-at-top,unused-import
+    # Worker processes share the resource tracker, which then unregisters
+    # shared memory attached here once it is unlinked by the worker.
+    resource_tracker.ensure_running()
+    self._outputs = multiprocessing.Queue()
+    self._free_slots = []
+    for i in xrange(self._num_processes):
+      free_slots = multiprocessing.Queue()
+      for slot in xrange(self.NUM_SLOTS):
+        free_slots.put(slot)
+      self._free_slots.append(free_slots)
+      process = multiprocessing.Process(
+          target=_run_feed_process,
+          args=(self._feed_generator, i, self._outputs, free_slots,
+                self.NUM_SLOTS),
+          name="PrefetchFeedProcess-%s" % i)
+      process.daemon = True
+      process.start()
+      self._processes.append(process)
+
+  def __iter__(self):
+    return self
+
+  def __next__(self):
+    """Gets the next feed from any worker process."""
+    while True:
+      with self._lock:
+        if self._closed:
+          raise errors.CancelledError(
+              None, None, "Feed processes were closed")
+        if len(self._finished) == self._num_processes:
+          raise StopIteration
+      try:
+        output = self._outputs.get(timeout=self.POLL_SECS)
+      except queue.Empty:
+        self._check_processes()
+        continue
+      if output[0] == "end":
+        self._finish(output[1])
+        continue
+      if output[0] == "error":
+        raise output[2]
+      _, index, slot, name, values = output
+      if slot is None:
+        return values
+      try:
+        return self._read(index, slot, name, values)
+      finally:
+        self._free_slots[index].put(slot)
+
+  next = __next__
+
+  def _read(self, index, slot, name, values):
+    """Copies a feed out of the shared memory of a slot."""
+    # pylint: disable=g-import-not-at-top
+    from multiprocessing import shared_memory
+    # pylint: enable=g-import-not-at-top
+    with self._lock:
+      if self._closed:
+        raise errors.CancelledError(None, None, "Feed processes were closed")
+      # The shared memory of a slot is reallocated for larger feeds.
+      segment = self._segments.get((index, slot))
+      if segment is None or segment.name != name:
+        if segment is not None:
+          segment.close()
+        segment = shared_memory.SharedMemory(name=name)
+        self._segments[(index, slot)] = segment
+      return [
+          np.ndarray(v.shape, v.dtype, buffer=segment.buf,
+                     offset=v.offset).copy()
+          if isinstance(v, _SharedArray) else v
+          for v in values]
+
+  def _finish(self, index):
+    """Releases the shared memory of a finished worker."""
+    with self._lock:
+      self._finished.add(index)
+      for slot in xrange(self.NUM_SLOTS):
+        segment = self._segments.pop((index, slot), None)
+        if segment is not None:
+          segment.close()
+
+  def _check_processes(self):
+    """Raises if a worker process exited without finishing."""
+    for i, process in enumerate(self._processes):
+      with self._lock:
+        if self._closed:
+          return
+        if i in self._finished or process.exitcode is None:
+          continue
+      if self._outputs.empty():
+        raise RuntimeError(
+            "Feed process {} exited unexpectedly with code {}".format(
+                i, process.exitcode))
+
+  def close(self):
+    """Stops the worker processes."""
+    with self._lock:
+      if self._closed:
+        return
+      self._closed = True
+      for process in self._processes:
+        if process.is_alive():
+          process.terminate()
+      for process in self._processes:
+        process.join()
+      # Terminated workers no longer unlink their shared memory.
+      for segment in self._segments.values():
+        segment.close()
+        try:
+          segment.unlink()
+        except OSError:
+          pass
+      self._segments.clear()
+
+
 class PrefetchRunner(object): # pylint: disable=useless-object-inheritance
   """Prefetch tensors by repeating running given ops.
 
@@ -106,7 +608,12 @@ class PrefetchRunner(object): # pylint: disable=useless-object-inheritance
       feed_list=None,
       feed_generator=None,
       closed_exception_types=None,
-      ignored_exception_types=None):
+      ignored_exception_types=None,
+      autotuner=None,
+      stats_op=None,
+      num_clients=1,
+      num_processes=None,
+      name=None):
     """Create a PrefetchRunner.
 
     When you later call the `create_threads()` method, the `PrefetchRunner` will
@@ -127,6 +634,14 @@ class PrefetchRunner(object): # pylint: disable=useless-object-inheritance
         `(tf.errors.OutOfRangeError, StopIteration)`.
       ignored_exception_types: (Optional.) Exception types indicating that the
         prefetching can continue. Defaults to `()`.
+      autotuner: (Optional.) A `PrefetchAutotuner` activating a part of the
+        threads for `fetch_ops`.
+      stats_op: (Optional.) `DataBufferStats` op of the data buffer.
+      num_clients: (Optional.) Number of clients taking from the buffer.
+      num_processes: (Optional.) If positive, `feed_generator` runs in this
+        number of worker processes instead of the threads, see
+        `PrefetchProcessPool`.
+      name: (Optional.) Name of this runner.
     """
     try:
       executing_eagerly = context.executing_eagerly()
@@ -134,7 +649,9 @@ class PrefetchRunner(object): # pylint: disable=useless-object-inheritance
       executing_eagerly = context.in_eager_mode()
     else:
       executing_eagerly = False
-    if not executing_eagerly:
+    if name:
+      self._name = name
+    elif not executing_eagerly:
       self._name = ops.get_default_graph().unique_name(self.__class__.__name__)
     else:
       self._name = context.context().scope_name
@@ -146,6 +663,9 @@ class PrefetchRunner(object): # pylint: disable=useless-object-inheritance
       raise ValueError("feed_list and feed_generator must both exits")
     self._feed_list = list(feed_list) if feed_list else None
     self._feed_generator = feed_generator
+    if num_processes and feed_generator is None:
+      raise ValueError("num_processes requires feed_generator")
+    self._num_processes = num_processes
     if not closed_exception_types:
       self._closed_exception_types = (errors.OutOfRangeError, StopIteration)
     else:
@@ -154,8 +674,12 @@ class PrefetchRunner(object): # pylint: disable=useless-object-inheritance
       self._ignored_exception_types = ()
     else:
       self._ignored_exception_types = tuple(ignored_exception_types)
+    self._autotuner = autotuner
+    self._stats_op = stats_op
+    self._num_clients = max(num_clients, 1)
     self._lock = threading.Lock()
     self._runs_per_session = weakref.WeakKeyDictionary()
+    self._process_pools = weakref.WeakKeyDictionary()
     self._exceptions_raised = []
 
   @property
@@ -173,6 +697,16 @@ class PrefetchRunner(object): # pylint: disable=useless-object-inheritance
     """The number of running threads."""
     return len(self._fetch_ops)
 
+  @property
+  def autotuner(self):
+    """The `PrefetchAutotuner` of this runner, or `None`."""
+    return self._autotuner
+
+  @property
+  def stats_op(self):
+    """The `DataBufferStats` op of this runner, or `None`."""
+    return self._stats_op
+
   @property
   def closed_exception_types(self):
     """Exception types indicating that prefetching is normally finished."""
@@ -197,6 +731,63 @@ class PrefetchRunner(object): # pylint: disable=useless-object-inheritance
     """
     return self._exceptions_raised
 
+  def stats(self, sess):
+    """Gets statistics of the data buffer.
+
+    Args:
+      sess: A `Session`.
+
+    Raises:
+      ValueError: If this runner has no stats op.
+
+    Returns:
+      `PrefetchStats` of the data buffer.
+    """
+    if self._stats_op is None:
+      raise ValueError("PrefetchRunner {} has no stats op".format(self.name))
+    return PrefetchStats(*sess.run(self._stats_op))
+
+  def add_summary(self):
+    """Adds summaries of the data buffer.
+
+    The fraction of the buffer that is full is the current value, the others
+    are averaged since the buffer was created: the occupancy, the fractions of
+    time a producer thread or a client stalled, and the samples taken per
+    second. With an autotuner, the producer stall fraction is relative to the
+    threads active over time rather than all threads.
+
+    Raises:
+      ValueError: If this runner has no stats op.
+    """
+    if self._stats_op is None:
+      raise ValueError("PrefetchRunner {} has no stats op".format(self.name))
+    stats = PrefetchStats(*[math_ops.to_float(t) for t in self._stats_op])
+    elapsed_micros = math_ops.maximum(stats.elapsed_micros, 1.)
+    if self._autotuner:
+      autotuner = self._autotuner
+      thread_micros = script_ops.py_func(
+          lambda micros: np.float32(autotuner.active_thread_micros(micros)),
+          [PrefetchStats(*self._stats_op).elapsed_micros], dtypes.float32,
+          stateful=True)
+      thread_micros = math_ops.maximum(thread_micros, 1.)
+    else:
+      thread_micros = elapsed_micros * self.num_threads
+    capacity = math_ops.maximum(stats.capacity, 1.)
+    summary.scalar(
+        "{}/fraction_full".format(self.name), stats.size / capacity)
+    summary.scalar(
+        "{}/occupancy".format(self.name),
+        stats.size_micros / elapsed_micros / capacity)
+    summary.scalar(
+        "{}/producer_stall_fraction".format(self.name),
+        stats.put_wait_micros / thread_micros)
+    summary.scalar(
+        "{}/consumer_stall_fraction".format(self.name),
+        stats.take_wait_micros / elapsed_micros / self._num_clients)
+    summary.scalar(
+        "{}/items_per_sec".format(self.name),
+        stats.num_takes * 1e6 / elapsed_micros)
+
   # pylint: disable=broad-except
   def run(self, sess, coord, index):
     """Run prefetching in thread.
@@ -214,12 +805,24 @@ class PrefetchRunner(object): # pylint: disable=useless-object-inheritance
           self._fetch_ops[index], self._feed_list)
       close = sess.make_callable(self._close_op)
       feed_list = self._feed_list if self._feed_list else []
-      if self._feed_generator:
+      with self._lock:
+        process_pool = self._process_pools.get(sess)
+      if process_pool:
+        feed_iterator = process_pool
+      elif self._feed_generator:
         feed_iterator = self._feed_generator(sess)
       else:
         feed_iterator = itertools.repeat([])
       while True:
         try:
+          if self._autotuner and \
+             not self._autotuner.wait_until_active(index, coord):
+            if coord and coord.should_stop():
+              break
+            logging.info("Prefetching was closed.")
+            self._close(sess, close)
+            decremented = True
+            return
           # Use `next` instead of `for .. in` to reraise exception in generator.
           feed = next(feed_iterator)
           if coord and coord.should_stop():
@@ -239,15 +842,11 @@ class PrefetchRunner(object): # pylint: disable=useless-object-inheritance
           return
         except self._closed_exception_types as e:  # pylint: disable=catching-non-exception
           logging.info("Prefetching was closed.")
-          with self._lock:
-            self._runs_per_session[sess] -= 1
-            decremented = True
-            if self._runs_per_session[sess] == 0:
-              try:
-                close()
-              except Exception:
-                pass
-            return
+          if self._autotuner:
+            self._autotuner.finish()
+          self._close(sess, close)
+          decremented = True
+          return
         except self._ignored_exception_types as e:  # pylint: disable=catching-non-exception
           logging.warning(
               "Corrupted inputs were ignored in prefetching:\n\n%s", e)
@@ -266,9 +865,21 @@ class PrefetchRunner(object): # pylint: disable=useless-object-inheritance
           self._exceptions_raised.append(e)
         raise
     finally:
-      if not decremented:
-        with self._lock:
+      with self._lock:
+        if not decremented:
           self._runs_per_session[sess] -= 1
+        if self._runs_per_session[sess] == 0 and sess in self._process_pools:
+          self._process_pools.pop(sess).close()
+
+  def _close(self, sess, close):
+    """Closes the data buffer once all threads are closed."""
+    with self._lock:
+      self._runs_per_session[sess] -= 1
+      if self._runs_per_session[sess] == 0:
+        try:
+          close()
+        except Exception:
+          pass
 
   def cancel_on_stop(self, sess, coord):
     """Clean up resources on stop.
@@ -279,6 +890,10 @@ class PrefetchRunner(object): # pylint: disable=useless-object-inheritance
         conditions.
     """
     coord.wait_for_stop()
+    with self._lock:
+      process_pool = self._process_pools.pop(sess, None)
+    if process_pool:
+      process_pool.close()
     try:
       cancel = sess.make_callable(self._cancel_op)
       cancel()
@@ -320,6 +935,13 @@ class PrefetchRunner(object): # pylint: disable=useless-object-inheritance
         pass
       self._runs_per_session[sess] = self.num_threads
       self._exceptions_raised = []
+      if self._num_processes:
+        process_pool = PrefetchProcessPool(
+            self._feed_generator, self._num_processes)
+        process_pool.start()
+        self._process_pools[sess] = process_pool
+    if self._autotuner:
+      self._autotuner.reset()
 
     ret_threads = []
     for i in xrange(self.num_threads):
@@ -327,6 +949,11 @@ class PrefetchRunner(object): # pylint: disable=useless-object-inheritance
           target=self.run,
           args=(sess, coord, i),
           name="PrefetchThread-%s-%s" % (self.name, i)))
+    if self._autotuner:
+      ret_threads.append(threading.Thread(
+          target=self._autotuner.run,
+          args=(sess, coord),
+          name="PrefetchAutotuneThread-%s" % self.name))
     if coord:
       name = "CancelOnStopThread-%s" % self.name
       ret_threads.append(threading.Thread(
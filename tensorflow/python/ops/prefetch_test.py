@@ -18,6 +18,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import numpy as np
 from six.moves import xrange # pylint: disable=redefined-builtin
 
 from tensorflow.python.framework import dtypes
@@ -309,6 +310,151 @@ class PrefetchTest(test.TestCase):
       sess.run(y)
       sess.close()
 
+  def test_feed_processes(self):
+    def array_generator(_):
+      for i in xrange(3):
+        yield [np.full([2], i, dtype=np.int64), 'sample']
+      raise ValueError('corrupted file')
+
+    with ops.Graph().as_default() as graph:
+      with ops.device('/cpu:0'):
+        x1 = array_ops.placeholder(dtypes.int64, shape=[2])
+        x2 = array_ops.placeholder(dtypes.string, shape=[])
+        y = prefetch.staged(
+            [x1, x2],
+            feed_list=[x1, x2],
+            feed_generator=array_generator,
+            num_threads=2,
+            ignored_exception_types=(ValueError,),
+            timeout_millis=1000,
+            num_processes=2)
+
+    graph.finalize()
+
+    with self.test_session(graph=graph) as sess:
+      coord = coordinator.Coordinator()
+      prefetch.make_prefetch_hook().create_threads(sess, coord)
+      prefetched = []
+      while True:
+        try:
+          y1, y2 = sess.run(y)
+        except errors.OutOfRangeError:
+          break
+        self.assertEqual(y1[0], y1[1])
+        self.assertEqual(b'sample', y2)
+        prefetched.append(y1[0])
+      self.assertEqual([0, 0, 1, 1, 2, 2], sorted(prefetched))
+      coord.request_stop()
+
+  def test_autotune(self):
+    capacity = 2
+    value = 42.0
+    with ops.Graph().as_default() as graph:
+      with ops.device('/cpu:0'):
+        x = array_ops.constant(value, dtype=dtypes.float32, shape=[])
+        y = prefetch.staged(
+            x, capacity=capacity, num_threads=1, timeout_millis=1000,
+            autotune=True, max_num_threads=4, max_capacity=8)
+      runner = ops.get_collection(prefetch.PREFETCH)[0]
+      self.assertEqual(4, runner.num_threads)
+      self.assertEqual(1, runner.autotuner.num_threads)
+
+    graph.finalize()
+
+    with self.test_session(graph=graph) as sess:
+      coord = coordinator.Coordinator()
+      prefetch.make_prefetch_hook().create_threads(sess, coord)
+      for _ in xrange(capacity * 3):
+        self.assertAllClose(value, sess.run(y), rtol=1e-6)
+      coord.request_stop()
+
+  def test_autotune_decisions(self):
+    def stats(capacity, put_wait, take_wait, num_puts, bytes_put, elapsed):
+      return prefetch.PrefetchStats(
+          capacity, 0, put_wait, take_wait, num_puts, num_puts, 0, 0,
+          bytes_put, 0, elapsed)
+    tuner = prefetch.PrefetchAutotuner(
+        None, None, None, num_threads=1, capacity=2,
+        max_num_threads=2, max_capacity=8, memory_budget=1000)
+    # The first stats are only recorded.
+    self.assertFalse(tuner.tune(stats(2, 0, 0, 0, 0, 0)))
+    # Consumers stall while producers do not: one more thread.
+    self.assertFalse(tuner.tune(stats(2, 0, 500000, 10, 100, 1000000)))
+    self.assertEqual(2, tuner.num_threads)
+    # Consumers still stall with all threads active: double capacity.
+    self.assertTrue(tuner.tune(stats(2, 0, 1000000, 20, 200, 2000000)))
+    self.assertEqual(2, tuner.num_threads)
+    self.assertEqual(4, tuner.capacity)
+    # Capacity is limited by the memory budget to 1 sample of 1000 bytes.
+    self.assertTrue(tuner.tune(stats(4, 0, 1500000, 20, 20000, 3000000)))
+    self.assertEqual(1, tuner.capacity)
+    # Producers are blocked: one less thread, then half capacity.
+    tuner.tune(stats(1, 1800000, 1500000, 30, 30000, 4000000))
+    self.assertEqual(1, tuner.num_threads)
+    tuner.reset()
+    self.assertEqual(1, tuner.num_threads)
+    self.assertEqual(2, tuner.capacity)
+
+  def test_autotune_active_thread_micros(self):
+    def stats(elapsed):
+      return prefetch.PrefetchStats(2, 0, 0, 500000, 0, 0, 0, 0, 0, 0, elapsed)
+    tuner = prefetch.PrefetchAutotuner(
+        None, None, None, num_threads=1, capacity=2, max_num_threads=4)
+    tuner.tune(stats(1000000))
+    # Consumers stall: one more thread after 1 second with one thread.
+    tuner.tune(stats(2000000))
+    self.assertEqual(2, tuner.num_threads)
+    self.assertEqual(2000000, tuner.active_thread_micros(2000000))
+    self.assertEqual(3000000, tuner.active_thread_micros(2500000))
+
+  def test_stats(self):
+    capacity = 2
+    value = 42.0
+    with ops.Graph().as_default() as graph:
+      with ops.device('/cpu:0'):
+        x = array_ops.constant(value, dtype=dtypes.float32, shape=[])
+        y = prefetch.staged(
+            x, capacity=capacity, num_threads=1, timeout_millis=1000,
+            name='stats_prefetch')
+      prefetch.add_prefetch_summaries()
+      summaries = ops.get_collection(ops.GraphKeys.SUMMARIES)
+      self.assertEqual(5, len(summaries))
+
+    graph.finalize()
+
+    with self.test_session(graph=graph) as sess:
+      coord = coordinator.Coordinator()
+      prefetch.make_prefetch_hook().create_threads(sess, coord)
+      for _ in xrange(capacity * 3):
+        self.assertAllClose(value, sess.run(y), rtol=1e-6)
+      stats = prefetch.get_prefetch_stats(sess)['stats_prefetch']
+      self.assertEqual(capacity, stats.capacity)
+      self.assertEqual(capacity * 3, stats.num_takes)
+      self.assertGreaterEqual(stats.num_puts, stats.num_takes)
+      self.assertEqual(4 * stats.num_puts, stats.bytes_put)
+      self.assertGreater(stats.elapsed_micros, 0)
+      self.assertGreater(stats.items_per_sec, 0)
+      self.assertLessEqual(stats.occupancy, 1.)
+      later = prefetch.get_prefetch_stats(sess)['stats_prefetch']
+      self.assertEqual(0, later.delta(stats).num_takes)
+      sess.run(summaries)
+      coord.request_stop()
+
+  def test_stats_delta(self):
+    previous = prefetch.PrefetchStats(4, 1, 100, 200, 10, 9, 2, 3, 40, 0, 0)
+    current = prefetch.PrefetchStats(
+        8, 2, 600, 1200, 30, 29, 4, 5, 120, 4000000, 1000000)
+    interval = current.delta(previous)
+    self.assertEqual(8, interval.capacity)
+    self.assertEqual(2, interval.size)
+    self.assertEqual(20, interval.num_takes)
+    self.assertAllClose(4., interval.average_size)
+    self.assertAllClose(0.5, interval.occupancy)
+    self.assertAllClose(0.0005, interval.producer_stall_secs_per_sec)
+    self.assertAllClose(0.001, interval.consumer_stall_secs_per_sec)
+    self.assertAllClose(20., interval.items_per_sec)
+    self.assertAllClose(4., interval.bytes_per_item)
+
 # pylint: enable=missing-docstring
 
 if __name__ == '__main__':
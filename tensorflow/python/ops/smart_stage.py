@@ -0,0 +1,388 @@
+# Copyright 2022 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Reports of the stage boundary chosen by Smart Stage."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import os
+
+import six
+
+from tensorflow.python.framework import op_def_registry
+from tensorflow.python.util import nest
+from tensorflow.python.util.tf_export import tf_export
+
+# Node types that Smart Stage never pulls into a stage, nor anything
+# depending on them. Keep in sync with GetStagingEdges in graph_constructor.cc.
+_VARIABLE_OPS = ("Variable", "VariableV2")
+_EMBEDDING_VARIABLE_OPS = ("KvVarHandleOp",)
+_PLACEHOLDER_OPS = ("Placeholder",)
+_CONTROL_FLOW_OPS = (
+    "Switch", "RefSwitch", "_SwitchN", "Merge", "RefMerge", "_XlaMerge",
+    "Enter", "RefEnter", "Exit", "RefExit", "NextIteration",
+    "RefNextIteration")
+_STAGE_OP = "DataBufferPut"
+_UNSTAGE_OP = "DataBufferTake"
+_CONTROL_SLOT = -1
+
+_Edge = collections.namedtuple(
+    "_Edge", ["src", "src_output", "dst", "dst_input"])
+
+
+def _tensor_name(node, output):
+  return "{}:{}".format(node, output)
+
+
+def _parse_input(name):
+  """Parses an input of a NodeDef into a node name and an output."""
+  if name.startswith("^"):
+    return name[1:], _CONTROL_SLOT
+  if ":" in name:
+    node, output = name.rsplit(":", 1)
+    return node, int(output)
+  return name, 0
+
+
+class _Graph(object): # pylint: disable=useless-object-inheritance
+  """Edges of a `GraphDef`, rewritten as the Smart Stage pass does."""
+
+  def __init__(self, graph_def):
+    self.nodes = {n.name: n for n in graph_def.node}
+    self.out_edges = collections.defaultdict(list)
+    self.in_edges = collections.defaultdict(list)
+    for n in graph_def.node:
+      data_input = 0
+      for name in n.input:
+        src, output = _parse_input(name)
+        if output == _CONTROL_SLOT:
+          self.add_edge(_Edge(src, _CONTROL_SLOT, n.name, _CONTROL_SLOT))
+        else:
+          self.add_edge(_Edge(src, output, n.name, data_input))
+          data_input += 1
+
+  def add_edge(self, e):
+    self.out_edges[e.src].append(e)
+    self.in_edges[e.dst].append(e)
+
+  def remove_edge(self, e):
+    self.out_edges[e.src].remove(e)
+    self.in_edges[e.dst].remove(e)
+
+  def op(self, name):
+    node = self.nodes.get(name)
+    return node.op if node is not None else None
+
+  def shared_name(self, name):
+    return self.nodes[name].attr["shared_name"].s
+
+
+class SmartStageReport(object): # pylint: disable=useless-object-inheritance
+  """Stage boundary chosen by Smart Stage for a graph.
+
+  Attributes:
+    staged_tensors: Names of the tensors put into the data buffers after the
+      rewrite.
+    pulled_nodes: Names of the nodes moved from the training step into the
+      stage by the rewrite.
+    stage_nodes: Names of all nodes computed by the prefetching threads after
+      the rewrite, including the ones staged by the user.
+    stateful_nodes: Names of the pulled nodes with stateful ops, which now
+      run ahead of the training step.
+    blocking_nodes: A dict from names of the nodes stopping the stage to the
+      list of reasons why they can't be staged.
+    node_micros: A dict from node names to microseconds they took in the
+      `RunMetadata`, empty without it.
+    moved_micros: Estimated microseconds moved off the training step, i.e.
+      the time of the pulled nodes.
+  """
+
+  def __init__(self, graph_def, staged=None, target_nodes=None,
+               run_metadata=None, independent_nodes=None):
+    self._graph_def = graph_def
+    self._staged = staged
+    self._target_nodes = [
+        _parse_input(t if isinstance(t, six.string_types) else t.name)[0]
+        for t in target_nodes or []]
+    self._run_metadata = run_metadata
+    self._independent_nodes = set(independent_nodes or [])
+    self.node_micros = collections.defaultdict(int)
+    if run_metadata is not None:
+      for dev_stats in run_metadata.step_stats.dev_stats:
+        for node_stats in dev_stats.node_stats:
+          self.node_micros[node_stats.node_name] += (
+              node_stats.all_end_rel_micros)
+    self.node_micros = dict(self.node_micros)
+    self.staged_tensors = []
+    self.pulled_nodes = []
+    self.stage_nodes = []
+    self.stateful_nodes = []
+    self.blocking_nodes = collections.OrderedDict()
+    self._analyze()
+
+  def what_if(self, independent_nodes):
+    """Reports the stage boundary if some nodes didn't block the stage.
+
+    Args:
+      independent_nodes: Names of nodes assumed to neither depend on
+        variables, placeholders or target nodes, nor to be control flow,
+        e.g. a variable whose reads would be moved out of the input pipeline.
+
+    Returns:
+      A new `SmartStageReport`.
+    """
+    return SmartStageReport(
+        self._graph_def, staged=self._staged, target_nodes=self._target_nodes,
+        run_metadata=self._run_metadata,
+        independent_nodes=self._independent_nodes | set(independent_nodes))
+
+  def _cost(self, names):
+    return sum(self.node_micros.get(n, 0) for n in names)
+
+  @property
+  def moved_micros(self):
+    return self._cost(self.pulled_nodes)
+
+  def _source_reason(self, graph, name):
+    """Why a node is a source of nodes that can't be staged, or None."""
+    if name in self._independent_nodes:
+      return None
+    op = graph.op(name)
+    if op in _VARIABLE_OPS:
+      return "variable {}".format(name)
+    if op in _EMBEDDING_VARIABLE_OPS:
+      return "embedding variable {}".format(name)
+    if op in _PLACEHOLDER_OPS:
+      return "placeholder {}".format(name)
+    if name in self._target_nodes:
+      return "target node {}".format(name)
+    return None
+
+  def _var_related(self, graph):
+    """Maps nodes depending on the sources to the first source reaching it."""
+    origins = {}
+    queue = collections.deque()
+    for name in sorted(graph.nodes):
+      if self._source_reason(graph, name) is not None:
+        origins[name] = name
+        queue.append(name)
+    while queue:
+      name = queue.popleft()
+      for e in graph.out_edges[name]:
+        if e.dst not in origins and e.dst not in self._independent_nodes:
+          origins[e.dst] = origins[name]
+          queue.append(e.dst)
+    return origins
+
+  def _block_reasons(self, graph, origins, e):
+    """Reasons why edge `e` stops the stage."""
+    reasons = []
+    if e.dst in self._independent_nodes:
+      return reasons
+    if e.dst in origins:
+      source = origins[e.dst]
+      reasons.append("{} {}".format(
+          "is" if source == e.dst else "depends on",
+          self._source_reason(graph, source)))
+    if e.src_output == _CONTROL_SLOT:
+      reasons.append("has a control dependency on {}".format(e.src))
+    if graph.op(e.dst) in _CONTROL_FLOW_OPS:
+      reasons.append("is control flow")
+    return reasons
+
+  def _stage(self, graph, put, take, report):
+    """Mirrors StageGraph for one pair of stage and unstage nodes."""
+    put_inputs = sorted(
+        [e for e in graph.in_edges[put] if e.src_output != _CONTROL_SLOT],
+        key=lambda e: e.dst_input)
+    source_edges = []
+    for out_edge in list(graph.out_edges[take]):
+      if out_edge.src_output == _CONTROL_SLOT:
+        continue
+      in_edge = put_inputs[out_edge.src_output]
+      graph.remove_edge(out_edge)
+      e = _Edge(in_edge.src, in_edge.src_output,
+                out_edge.dst, out_edge.dst_input)
+      graph.add_edge(e)
+      source_edges.append(e)
+    for e in list(graph.in_edges[put]):
+      graph.remove_edge(e)
+
+    origins = self._var_related(graph)
+    boundary = []
+    pulled = set()
+    blocking = collections.OrderedDict()
+    visited = set()
+    queue = collections.deque()
+
+    def push(edges):
+      groups = collections.OrderedDict()
+      for e in edges:
+        groups.setdefault((e.src, e.src_output), []).append(e)
+      for key, group in sorted(groups.items()):
+        if key not in visited:
+          visited.add(key)
+          queue.append(group)
+
+    push(source_edges)
+    while queue:
+      edges = queue.popleft()
+      stop = False
+      for e in edges:
+        reasons = self._block_reasons(graph, origins, e)
+        if reasons:
+          stop = True
+          for reason in reasons:
+            if reason not in blocking.setdefault(e.dst, []):
+              blocking[e.dst].append(reason)
+      if stop:
+        for e in edges:
+          if e.src_output != _CONTROL_SLOT and e not in boundary:
+            boundary.append(e)
+      else:
+        for e in edges:
+          pulled.add(e.dst)
+          push(graph.out_edges[e.dst])
+
+    # The rewritten stage and unstage nodes keep the original names.
+    staged_tensors = []
+    for e in boundary:
+      tensor = (e.src, e.src_output)
+      if tensor not in staged_tensors:
+        staged_tensors.append(tensor)
+      graph.remove_edge(e)
+      graph.add_edge(_Edge(take, staged_tensors.index(tensor),
+                           e.dst, e.dst_input))
+    for i, (src, output) in enumerate(staged_tensors):
+      graph.add_edge(_Edge(src, output, put, i))
+
+    if report:
+      self.staged_tensors.extend(
+          _tensor_name(src, output) for src, output in staged_tensors)
+      self.pulled_nodes.extend(sorted(pulled))
+      for name, reasons in blocking.items():
+        self.blocking_nodes.setdefault(name, []).extend(
+            r for r in reasons if r not in self.blocking_nodes.get(name, []))
+      self._stage_puts.append(put)
+
+  def _staged_shared_names(self):
+    """Shared names of the data buffers of the `staged` tensors."""
+    if self._staged is None:
+      return None
+    shared_names = set()
+    for t in nest.flatten(self._staged):
+      if hasattr(t, "dense_shape"):
+        names = [t.values.name, t.indices.name, t.dense_shape.name]
+      elif isinstance(t, six.string_types):
+        names = [t]
+      else:
+        names = [t.name]
+      for name in names:
+        node = _parse_input(name)[0]
+        # Walk back from the identity added by `tf.staged` to the unstage.
+        while node in self._nodes and self._nodes[node].op != _UNSTAGE_OP:
+          inputs = [i for i in self._nodes[node].input
+                    if not i.startswith("^")]
+          if not inputs:
+            break
+          node = _parse_input(inputs[0])[0]
+        if node not in self._nodes or self._nodes[node].op != _UNSTAGE_OP:
+          raise ValueError("{} is not prefetched by tf.staged".format(name))
+        shared_names.add(self._nodes[node].attr["shared_name"].s)
+    return shared_names
+
+  def _analyze(self):
+    graph = _Graph(self._graph_def)
+    self._nodes = graph.nodes
+    selected = self._staged_shared_names()
+    puts = {}
+    takes = {}
+    for name, node in graph.nodes.items():
+      if node.op == _STAGE_OP:
+        puts[graph.shared_name(name)] = name
+      elif node.op == _UNSTAGE_OP:
+        takes[graph.shared_name(name)] = name
+    self._stage_puts = []
+    # Stages are rewritten one after another in the order of shared names.
+    for shared_name in sorted(puts):
+      if shared_name in takes:
+        self._stage(graph, puts[shared_name], takes[shared_name],
+                    selected is None or shared_name in selected)
+
+    stage_nodes = set()
+    queue = collections.deque(self._stage_puts)
+    while queue:
+      name = queue.popleft()
+      for e in graph.in_edges[name]:
+        if e.src not in stage_nodes and e.src in graph.nodes:
+          stage_nodes.add(e.src)
+          queue.append(e.src)
+    self.stage_nodes = sorted(stage_nodes)
+    registered_ops = op_def_registry.get_registered_ops()
+    self.stateful_nodes = [
+        n for n in self.pulled_nodes
+        if graph.op(n) in registered_ops and
+        registered_ops[graph.op(n)].is_stateful]
+
+  def __str__(self):
+    lines = ["Staged tensors:"]
+    lines.extend("  {}".format(t) for t in self.staged_tensors)
+    lines.append("Nodes pulled into the stage ({} micros):".format(
+        self.moved_micros))
+    lines.extend("  {}".format(n) for n in self.pulled_nodes)
+    if self.stateful_nodes:
+      lines.append("Stateful nodes pulled into the stage:")
+      lines.extend("  {}".format(n) for n in self.stateful_nodes)
+    lines.append("Nodes blocking the stage:")
+    for name, reasons in sorted(
+        self.blocking_nodes.items(),
+        key=lambda item: -self.node_micros.get(item[0], 0)):
+      lines.append("  {} ({} micros): {}".format(
+          name, self.node_micros.get(name, 0), "; ".join(reasons)))
+    return "\n".join(lines)
+
+
+@tf_export(v1=["smart_stage_report"])
+def smart_stage_report(graph_def, staged=None, target_nodes=None,
+                       run_metadata=None):
+  """Reports the stage boundary Smart Stage chooses for a graph.
+
+  With `do_smart_stage`, the nodes consuming tensors prefetched by
+  `tf.staged` are pulled into the stage until they depend on a variable, an
+  embedding variable, a placeholder or a target node, or are control flow.
+  This function mirrors the rewrite on a `GraphDef` to show what is staged
+  and why the rest is not. `SmartStageReport.what_if` shows how the boundary
+  would move if some nodes didn't block the stage.
+
+  Args:
+    graph_def: A `GraphDef`, e.g. `tf.get_default_graph().as_graph_def()`.
+    staged: (Optional.) Tensors returned by `tf.staged`, or their names. All
+      stages of the graph are reported by default.
+    target_nodes: (Optional.) Names of the target nodes. Defaults to the nodes
+      marked by `tf.train.mark_target_node`, like the rewrite.
+    run_metadata: (Optional.) A `RunMetadata` with step stats of a training
+      step, to estimate the time moved off the step.
+
+  Returns:
+    A `SmartStageReport`.
+  """
+  if target_nodes is None:
+    target_nodes = [
+        t for t in os.environ.get("TARGET_NODES_NAME", "").split(";") if t]
+  return SmartStageReport(
+      graph_def, staged=staged, target_nodes=target_nodes,
+      run_metadata=run_metadata)
@@ -0,0 +1,113 @@
+# Copyright 2022 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for Smart Stage reports."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+from tensorflow.core.protobuf import config_pb2
+from tensorflow.python.framework import constant_op
+from tensorflow.python.framework import ops
+from tensorflow.python.ops import math_ops
+from tensorflow.python.ops import prefetch
+from tensorflow.python.ops import smart_stage
+from tensorflow.python.ops import variables
+from tensorflow.python.platform import test
+
+
+def _run_metadata(node_micros):
+  run_metadata = config_pb2.RunMetadata()
+  dev_stats = run_metadata.step_stats.dev_stats.add()
+  for name, micros in node_micros.items():
+    node_stats = dev_stats.node_stats.add()
+    node_stats.node_name = name
+    node_stats.all_end_rel_micros = micros
+  return run_metadata
+
+
+# pylint: disable=missing-docstring
+class SmartStageReportTest(test.TestCase):
+  def _build(self):
+    v = variables.Variable(2.0, name='v')
+    x = constant_op.constant(3.0, name='x')
+    y = prefetch.staged(x)
+    a = math_ops.square(y, name='a')
+    b = math_ops.add(a, 1.0, name='b')
+    c = math_ops.multiply(b, v, name='c')
+    return y, c
+
+  def test_report(self):
+    with ops.Graph().as_default() as graph:
+      y, _ = self._build()
+      report = smart_stage.smart_stage_report(
+          graph.as_graph_def(), staged=[y],
+          run_metadata=_run_metadata({'a': 100, 'b': 50, 'c': 300}))
+      self.assertIn('a', report.pulled_nodes)
+      self.assertIn('b', report.pulled_nodes)
+      self.assertNotIn('c', report.pulled_nodes)
+      self.assertIn('a', report.stage_nodes)
+      self.assertIn('x', report.stage_nodes)
+      self.assertEqual(['b:0'], report.staged_tensors)
+      self.assertIn('c', report.blocking_nodes)
+      self.assertTrue(any(
+          'variable v' in r for r in report.blocking_nodes['c']))
+      self.assertEqual(150, report.moved_micros)
+      self.assertIn('c (300 micros)', str(report))
+
+  def test_what_if(self):
+    with ops.Graph().as_default() as graph:
+      y, _ = self._build()
+      report = smart_stage.smart_stage_report(
+          graph.as_graph_def(), staged=[y],
+          run_metadata=_run_metadata({'a': 100, 'b': 50, 'c': 300}))
+      what_if = report.what_if(['v'])
+      self.assertIn('c', what_if.pulled_nodes)
+      self.assertNotIn('c', what_if.blocking_nodes)
+      self.assertEqual(450, what_if.moved_micros)
+      self.assertNotIn('c', report.pulled_nodes)
+
+  def test_target_nodes(self):
+    with ops.Graph().as_default() as graph:
+      y, _ = self._build()
+      report = smart_stage.smart_stage_report(
+          graph.as_graph_def(), staged=[y], target_nodes=['b:0'])
+      self.assertIn('a', report.pulled_nodes)
+      self.assertNotIn('b', report.pulled_nodes)
+      self.assertTrue(any(
+          'target node b' in r for r in report.blocking_nodes['b']))
+
+  def test_marked_target_nodes(self):
+    with ops.Graph().as_default() as graph:
+      y, _ = self._build()
+      os.environ['TARGET_NODES_NAME'] = 'b:0'
+      try:
+        report = smart_stage.smart_stage_report(
+            graph.as_graph_def(), staged=[y])
+      finally:
+        del os.environ['TARGET_NODES_NAME']
+      self.assertIn('a', report.pulled_nodes)
+      self.assertNotIn('b', report.pulled_nodes)
+
+  def test_not_staged(self):
+    with ops.Graph().as_default() as graph:
+      _, c = self._build()
+      with self.assertRaises(ValueError):
+        smart_stage.smart_stage_report(graph.as_graph_def(), staged=[c])
+
+if __name__ == '__main__':
+  test.main()
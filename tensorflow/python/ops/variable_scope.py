@@ -2169,6 +2169,8 @@ def get_embedding_variable(name,
   else:
     raise ValueError("Not support key_dtype: %s, only support int64/int32/string" % key_dtype)
   l2_weight_threshold = -1.0
+  max_keys = 0
+  evict_policy = "lru"
   if initializer is None and ev_option.init.initializer is None:
     initializer = init_ops.truncated_normal_initializer()
   elif ev_option.init.initializer is not None:
@@ -2185,6 +2187,9 @@ def get_embedding_variable(name,
       steps_to_live = ev_option.evict.steps_to_live
     elif isinstance(ev_option.evict, variables.L2WeightEvict):
       l2_weight_threshold = ev_option.evict.l2_weight_threshold
+    elif isinstance(ev_option.evict, variables.CapacityEvict):
+      max_keys = ev_option.evict.max_keys
+      evict_policy = ev_option.evict.policy
   else:
     l2_weight_threshold = -1.0
   if steps_to_live != None and l2_weight_threshold > 0:
@@ -2202,7 +2207,12 @@ def get_embedding_variable(name,
         filter_strategy=ev_option.filter_strategy,
         storage_type = ev_option.storage_option.storage_type,
         storage_path = ev_option.storage_option.storage_path,
-        default_value_dim=ev_option.init.default_value_dim),
+        storage_size = ev_option.storage_option.storage_size,
+        default_value_dim=ev_option.init.default_value_dim,
+        max_keys=max_keys,
+        evict_policy=evict_policy,
+        storage_dtype=ev_option.storage_option.storage_dtype,
+        slot_storage_dtype=ev_option.storage_option.slot_storage_dtype),
       ht_partition_num=ev_option.ht_partition_num)
 
 
@@ -2234,6 +2244,8 @@ def get_embedding_variable_internal(name,
   else:
     raise ValueError("Not support key_dtype: %s, only support int64/int32/string" % key_dtype)
   l2_weight_threshold = -1.0
+  max_keys = 0
+  evict_policy = "lru"
   if initializer is None:
     initializer = init_ops.truncated_normal_initializer()
   if ev_option.evict != None:
@@ -2243,6 +2255,9 @@ def get_embedding_variable_internal(name,
       steps_to_live = ev_option.evict.steps_to_live
     elif isinstance(ev_option.evict, variables.L2WeightEvict):
       l2_weight_threshold = ev_option.evict.l2_weight_threshold
+    elif isinstance(ev_option.evict, variables.CapacityEvict):
+      max_keys = ev_option.evict.max_keys
+      evict_policy = ev_option.evict.policy
   else:
     l2_weight_threshold = -1.0
   if steps_to_live != None and l2_weight_threshold > 0:
@@ -2260,7 +2275,12 @@ def get_embedding_variable_internal(name,
         l2_weight_threshold=l2_weight_threshold,
         filter_strategy=ev_option.filter_strategy,
         storage_type=ev_option.storage_option.storage_type,
-        storage_path=ev_option.storage_option.storage_path),
+        storage_path=ev_option.storage_option.storage_path,
+        storage_size=ev_option.storage_option.storage_size,
+        max_keys=max_keys,
+        evict_policy=evict_policy,
+        storage_dtype=ev_option.storage_option.storage_dtype,
+        slot_storage_dtype=ev_option.storage_option.slot_storage_dtype),
       ht_partition_num=ev_option.ht_partition_num)
 
 
@@ -227,6 +227,18 @@ class L2WeightEvict(object):
     if l2_weight_threshold <= 0 and l2_weight_threshold != -1.0:
       logging.warning("l2_weight_threshold is invalid, l2_weight-based eviction is disabled")
 
+@tf_export(v1=["CapacityEvict"])
+class CapacityEvict(object):
+  def __init__(self,
+               max_keys = 0,
+               policy = "lru"):
+    if max_keys <= 0:
+      raise ValueError("max_keys must larger than 0")
+    if policy not in ("lru", "lfu"):
+      raise ValueError("Unsupport evict policy: %s, only support lru/lfu" % policy)
+    self.max_keys = max_keys
+    self.policy = policy
+
 @tf_export(v1=["CheckpointOption"])
 class CheckpointOption(object):
   def __init__(self,
@@ -243,9 +255,34 @@ class CheckpointOption(object):
 class StorageOption(object):
   def __init__(self,
                storage_type=None,
-               storage_path=None):
+               storage_path=None,
+               storage_size=None,
+               storage_dtype=None,
+               slot_storage_dtype=None):
+    if storage_type == config_pb2.StorageType.DRAM_SSD:
+      if not storage_path:
+        raise ValueError("storage_path must be set when storage_type is DRAM_SSD")
+      if not storage_size:
+        raise ValueError("storage_size must be set when storage_type is DRAM_SSD")
+    if storage_type == config_pb2.StorageType.MMAP and not storage_path:
+      raise ValueError("storage_path must be set when storage_type is MMAP")
+    if storage_size is not None:
+      if any(size <= 0 for size in storage_size):
+        raise ValueError("storage_size must be larger than 0")
     self.storage_type = storage_type
     self.storage_path = storage_path
+    self.storage_size = storage_size
+    self.storage_dtype = _storage_dtype(storage_dtype)
+    self.slot_storage_dtype = _storage_dtype(slot_storage_dtype)
+
+def _storage_dtype(dtype):
+  if dtype is None:
+    return dtypes.float32
+  dtype = dtypes.as_dtype(dtype)
+  if dtype not in (dtypes.float32, dtypes.float16, dtypes.bfloat16, dtypes.int8):
+    raise ValueError("storage_dtype must be one of float32, float16, bfloat16 "
+                     "and int8, got %s" % dtype.name)
+  return dtype
 
 @tf_export(v1=["EmbeddingVariableOption"])
 class EmbeddingVariableOption(object):
@@ -276,7 +313,17 @@ class CBFFilter(object):
                filter_freq = 0,
                max_element_size = 0,
                false_positive_probability = -1.0,
-               counter_type = dtypes.uint64):
+               counter_type = dtypes.uint64,
+               decay_steps = 0):
+    """Counting Bloom filter admitting the keys seen `filter_freq` times.
+
+    If `decay_steps` is positive, the counters are halved every `decay_steps`
+    global steps, so that the keys no longer seen stop counting towards the
+    admission in a long running training. The counters are saved with the
+    EmbeddingVariable.
+    """
+    if decay_steps < 0:
+      raise ValueError("decay_steps must not be negative")
     if false_positive_probability != -1.0:
       if false_positive_probability <= 0.0:
         raise ValueError("false_positive_probablity must larger than 0")
@@ -290,6 +337,7 @@ class CBFFilter(object):
     self.false_positive_probability = false_positive_probability
     self.counter_type = counter_type
     self.filter_freq = filter_freq
+    self.decay_steps = decay_steps
 
 class EmbeddingVariableConfig(object):
   def __init__(self,
@@ -310,7 +358,12 @@ class EmbeddingVariableConfig(object):
                primary_slotnum_op=None,
                storage_type=config_pb2.StorageType.DRAM,
                storage_path=None,
-               default_value_dim=4096):
+               storage_size=None,
+               default_value_dim=4096,
+               max_keys=0,
+               evict_policy="lru",
+               storage_dtype=dtypes.float32,
+               slot_storage_dtype=dtypes.float32):
     self.steps_to_live = steps_to_live
     self.steps_to_live_l2reg = steps_to_live_l2reg
     self.l2reg_theta = l2reg_theta
@@ -330,7 +383,12 @@ class EmbeddingVariableConfig(object):
     self.filter_strategy = filter_strategy
     self.storage_type = storage_type
     self.storage_path = storage_path
+    self.storage_size = storage_size
     self.default_value_dim = default_value_dim
+    self.max_keys = max_keys
+    self.evict_policy = evict_policy
+    self.storage_dtype = storage_dtype
+    self.slot_storage_dtype = slot_storage_dtype
 
   def reveal(self):
     if self.steps_to_live is None:
@@ -18,15 +18,23 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import abc
 import os
 import re
+import socket
+import struct
+import threading
+import uuid
+import six
 from six import string_types
 from six.moves import xrange
 
 from tensorflow.python.eager import context
 from tensorflow.python.framework import constant_op
 from tensorflow.python.data.ops import dataset_ops
+from tensorflow.python.data.ops import readers
 from tensorflow.python.framework import dtypes
+from tensorflow.python.framework import errors
 from tensorflow.python.framework import ops
 from tensorflow.python.framework import tensor_shape
 from tensorflow.python.ops import control_flow_ops
@@ -54,6 +62,8 @@ ops.NotDifferentiable('WorkQueueRestore')
 ops.NotDifferentiable('WorkQueueIsInitialized')
 ops.NotDifferentiable('WorkQueuePut')
 ops.NotDifferentiable('WorkQueueTake')
+ops.NotDifferentiable('WorkQueueTakeMany')
+ops.NotDifferentiable('WorkQueueGiveBack')
 ops.NotDifferentiable('WorkQueueSize')
 ops.NotDifferentiable('WorkQueueClose')
 ops.NotDifferentiable('SaveLocalWork')
@@ -62,17 +72,24 @@ ops.NotDifferentiable('SaveLocalWork')
 class Work(object): # pylint: disable=useless-object-inheritance
   """Work with an URL."""
   @classmethod
-  def from_url(cls, prefix, url):
+  def from_url(cls, prefix, url, slice_files=False):
     """Creates Work from url.
 
     Args:
       prefix: Prefix of all works.
       url: Work path.
+      slice_files: (Optional.) Boolean. If true, uncompressed text and
+        TFRecord files are created as works which could be sliced.
     """
     if isinstance(url, bytes):
       url = str(url.decode())
     prefix = prefix or ''
     fullpath = str(prefix) + str(url)
+    if slice_files:
+      if fullpath.endswith(TFRecordWork.EXTENSIONS):
+        return TFRecordWork(prefix, url)
+      if fullpath.endswith(TextLineWork.EXTENSIONS):
+        return TextLineWork(prefix, url)
     return Work(prefix, url)
 
   def __init__(self, prefix, url):
@@ -110,6 +127,251 @@ class Work(object): # pylint: disable=useless-object-inheritance
     return None
   # pylint: enable=unused-argument
 
+
+@six.add_metaclass(abc.ABCMeta)
+class FileWork(Work):
+  """Work of an uncompressed file which could be sliced by bytes.
+
+  Records of the file are counted in bytes, and each slice is the byte range
+  `url?start=<offset>&end=<offset>` holding the records starting within it,
+  so adjacent slices cover the file exactly once. A slice holding no record
+  start is empty. Works taken from the work queue can be read by `dataset`,
+  e.g.
+
+    dataset = work_queue.input_dataset().flat_map(TextLineWork.dataset)
+  """
+  EXTENSIONS = ()
+
+  def __init__(self, prefix, url):
+    """Initializes the work.
+
+    Args:
+      prefix: Prefix of all works.
+      url: Work path.
+    """
+    super(FileWork, self).__init__(prefix, url)
+    self._size = None
+
+  @property
+  def path(self):
+    """Full path of the file."""
+    return str(self._prefix or '') + str(self._url)
+
+  @property
+  def size(self):
+    """Size of the file in bytes, or None if it can't be read."""
+    if self._size is None:
+      try:
+        self._size = gfile.Stat(self.path).length
+      except errors.OpError as e:
+        logging.warning("Failed to slice work %s: %s", self.path, e)
+    return self._size
+
+  def count_records(self):
+    """Count total number of bytes."""
+    return self.size
+
+  @abc.abstractmethod
+  def _align(self, offset):
+    """Returns the offset a slice starting at `offset` starts at."""
+
+  def get_slice(self, start, end):
+    """Get URL of the slice.
+
+    Args:
+      start: start byte offset.
+      end: end byte offset.
+
+    Returns:
+      URL of the byte range, or None if it holds no record.
+    """
+    if self.size is None:
+      return None
+    start_offset = self._align(start)
+    end_offset = self._align(end)
+    if start_offset >= end_offset:
+      return None
+    return '{}?start={}&end={}'.format(self._url, start_offset, end_offset)
+
+  @classmethod
+  @abc.abstractmethod
+  def _slice_dataset(cls, filename, start, end, buffer_size):
+    """Creates a dataset of records starting in `[start, end)` of a file."""
+
+  @classmethod
+  def dataset(cls, work, buffer_size=None):
+    """Creates a dataset of records in the work.
+
+    Args:
+      work: A `tf.string` scalar of a file, or a slice of it.
+      buffer_size: (Optional.) A `tf.int64` scalar denoting the number of
+        bytes to buffer.
+
+    Returns:
+      A dataset of records.
+    """
+    # A whole-file range is appended, so that the first range in `ranged` is
+    # the slice of the work if it has one.
+    ranged = string_ops.string_join([work, '?start=0&end=-1'])
+    pattern = r'^(.*?)\?start=(\d+)&end=(-?\d+).*$'
+    filename = string_ops.regex_replace(ranged, pattern, r'\1')
+    start = string_ops.string_to_number(
+        string_ops.regex_replace(ranged, pattern, r'\2'), dtypes.int64)
+    end = string_ops.string_to_number(
+        string_ops.regex_replace(ranged, pattern, r'\3'), dtypes.int64)
+    return cls._slice_dataset(filename, start, end, buffer_size)
+
+
+class TextLineWork(FileWork):
+  """Work of a text file with one record per line.
+
+  Slices are not aligned to lines when created, thus the file is never read
+  then. The dataset of a slice skips the line across its start, which
+  belongs to the previous slice.
+  """
+  EXTENSIONS = ('.csv', '.txt')
+
+  def _align(self, offset):
+    return min(offset, self.size)
+
+  @classmethod
+  def _slice_dataset(cls, filename, start, end, buffer_size):
+    return readers.TextLineSliceDataset(filename, start, end, buffer_size)
+
+
+class TFRecordWork(FileWork):
+  """Work of a TFRecord file.
+
+  Slices are aligned to records by reading the record headers up to the end
+  of the last slice once, payloads are skipped.
+  """
+  EXTENSIONS = ('.tfrecord', '.tfrecords')
+  _HEADER_SIZE = 12
+  _FOOTER_SIZE = 4
+
+  def __init__(self, prefix, url):
+    """Initializes the work.
+
+    Args:
+      prefix: Prefix of all works.
+      url: Work path.
+    """
+    super(TFRecordWork, self).__init__(prefix, url)
+    self._records = None
+    self._record_offset = None
+
+  def _scan(self):
+    """Yields byte offset of every record in the file."""
+    offset = 0
+    with gfile.GFile(self.path, 'rb') as fobj:
+      while offset < self.size:
+        header = fobj.read(self._HEADER_SIZE)
+        if len(header) < self._HEADER_SIZE:
+          logging.warning(
+              "Truncated record at %s of work %s.", offset, self.path)
+          break
+        yield offset
+        length = struct.unpack('<Q', header[:8])[0]
+        offset += self._HEADER_SIZE + length + self._FOOTER_SIZE
+        fobj.seek(offset)
+
+  def _align(self, offset):
+    """Returns offset of the first record starting at or after `offset`.
+
+    Slices are got in order, so the headers are read from the previous
+    offset on.
+    """
+    if offset >= self.size:
+      if self._records is not None:
+        self._records.close()
+        self._records = None
+      return self.size
+    if self._records is None or offset < self._record_offset:
+      self._records = self._scan()
+      self._record_offset = next(self._records, self.size)
+    while self._record_offset < offset:
+      self._record_offset = next(self._records, self.size)
+    return self._record_offset
+
+  @classmethod
+  def _slice_dataset(cls, filename, start, end, buffer_size):
+    return readers.TFRecordSliceDataset(filename, start, end, buffer_size)
+
+
+def locality_hints(cache_dir=None):
+  """Returns locality hints of this host.
+
+  Args:
+    cache_dir: (Optional.) A directory of locally cached input files.
+
+  Returns:
+    A list of the host name and names of files in `cache_dir`.
+  """
+  hints = [socket.gethostname()]
+  if cache_dir is not None and gfile.IsDirectory(cache_dir):
+    hints.extend(sorted(gfile.ListDirectory(cache_dir)))
+  return hints
+
+
+def _locality_list(locality):
+  """Returns locality hints as a list of strings for work queue ops."""
+  if not locality:
+    return []
+  return [h.decode() if isinstance(h, bytes) else h for h in locality]
+
+
+class _GiveBackQueueRunner(queue_runner.QueueRunner):
+  """Queue runner giving unconsumed works back on stop.
+
+  With a coordinator, one more thread is created and registered to it. When
+  the coordinator requests stop, it waits for the threads of the queue
+  runner to exit, which cancel pending enqueues of the local queue. Then it
+  drains the local queue, and gives works leased from the work queue back
+  except consumed ones.
+  """
+  def __init__(self, queue, enqueue_op, cancel_op, drain_op, give_back_op,
+               num_drained):
+    super(_GiveBackQueueRunner, self).__init__(
+        queue, [enqueue_op], cancel_op=cancel_op)
+    self._drain_op = drain_op
+    self._give_back_op = give_back_op
+    self._num_drained = num_drained
+
+  def create_threads(self, sess, coord=None, daemon=False, start=False):
+    """Create threads to run the enqueue ops and to give works back.
+
+    See `QueueRunner.create_threads`.
+    """
+    threads = super(_GiveBackQueueRunner, self).create_threads(
+        sess, coord=coord, daemon=daemon, start=start)
+    if not threads or coord is None:
+      return threads
+    give_back = threading.Thread(
+        target=self._give_back_on_stop, args=(sess, coord, list(threads)),
+        name="QueueRunnerThread-{}-give_back".format(self.name))
+    if daemon:
+      give_back.daemon = True
+    if start:
+      give_back.start()
+    return threads + [give_back]
+
+  # pylint: disable=broad-except
+  def _give_back_on_stop(self, sess, coord, threads):
+    coord.register_thread(threading.current_thread())
+    coord.wait_for_stop()
+    for thread in threads:
+      thread.join()
+    try:
+      try:
+        num_drained = sess.run(self._drain_op)
+      except errors.OutOfRangeError:
+        num_drained = 0
+      sess.run(self._give_back_op, feed_dict={self._num_drained: num_drained})
+    except Exception as e:
+      logging.warning("Failed to give works back: %s", e)
+  # pylint: enable=broad-except
+
+
 class WorkQueue(saver.BaseSaverBuilder.SaveableObject):
   """A queue of works shared by all workers.
 
@@ -154,7 +416,9 @@ class WorkQueue(saver.BaseSaverBuilder.SaveableObject):
       num_slices=None,
       num_clients=1,
       name=None,
-      local_work_mgr=None):
+      local_work_mgr=None,
+      adaptive=False,
+      slice_files=False):
     """Constructs a work queue.
 
     Args:
@@ -169,9 +433,25 @@ class WorkQueue(saver.BaseSaverBuilder.SaveableObject):
       num_slices: (Optional.) Total number of slices on all workers.
       num_clients: (Optional.) Number of threads for taking works.
       name: (Optional.) Name of the work queue.
+      local_work_mgr: (Optional.) A `LocalWorkMgr` restoring works for
+        inference job.
+      adaptive: (Optional.) Boolean. If true, `num_slices` decides the finest
+        slices, and contiguous slices of a work are merged when taken. Each
+        take gets about half of the remaining slices divided by the number of
+        clients, scaled by the consumption rate of the client, so slices are
+        large early in an epoch and shrink as the queue drains. Slices of
+        a work are kept in order when shuffling. Only byte ranges
+        `path?start=<offset>&end=<offset>` are merged, so it requires
+        `slice_files`.
+      slice_files: (Optional.) Boolean. If true, uncompressed text (`.csv`,
+        `.txt`) and TFRecord (`.tfrecord`, `.tfrecords`) files are sliced
+        into `num_slices` byte ranges `path?start=<offset>&end=<offset>`,
+        which must be read by `TextLineWork.dataset` or
+        `TFRecordWork.dataset`. Otherwise files are never sliced.
 
     Raises:
-      ValueError: If one of the arguments is invalid.
+      ValueError: If one of the arguments is invalid, or `adaptive` is true
+        but no work is sliced.
     """
     try:
       executing_eagerly = context.executing_eagerly()
@@ -201,6 +481,11 @@ class WorkQueue(saver.BaseSaverBuilder.SaveableObject):
 
     if num_epochs <= 0:
       raise ValueError("num_epochs must be > 0 not {}.".format(num_epochs))
+    if adaptive and num_slices is None:
+      raise ValueError("adaptive WorkQueue requires num_slices.")
+    if slice_files and num_slices is None:
+      raise ValueError("slice_files requires num_slices.")
+    self._adaptive = adaptive
 
     with ops.name_scope(name):
       self._remote_device = vs.variable(
@@ -221,31 +506,44 @@ class WorkQueue(saver.BaseSaverBuilder.SaveableObject):
             saver.BaseSaverBuilder.SaveSpec(
                 self._save, "", name + "_works")]
         slices = []
+        work_slices = []
+        sliced = False
         if num_slices is not None:
           for work in self._works:
-            work_item = Work.from_url(self._prefix, work)
+            work_item = Work.from_url(
+                self._prefix, work, slice_files=slice_files)
             num_records = work_item.count_records()
             if num_records is None:
               logging.info("[%s] Add work %s .", name, work)
               slices.append(work)
+              work_slices.append([work])
               continue
-            if num_slices < 1:
-              num_slices = 1
-            slice_size = int(num_records / num_slices)
+            slice_size = int(num_records / max(num_slices, 1))
             if slice_size < 1:
               slice_size = 1
-            num_slices = int(num_records / slice_size)
-            if num_records > num_slices * slice_size:
-              num_slices += 1
+            num_work_slices = int(num_records / slice_size)
+            if num_records > num_work_slices * slice_size:
+              num_work_slices += 1
             logging.info(
                 "[%s] Add work %s with %s slices of %s records.",
-                name, work, num_slices, num_records)
-            for slice_index in xrange(num_slices):
+                name, work, num_work_slices, num_records)
+            work_slices.append([])
+            for slice_index in xrange(num_work_slices):
               start = slice_index * slice_size
               end = start + slice_size
               if end > num_records:
                 end = num_records
-              slices.append(work_item.get_slice(start, end))
+              work_slice = work_item.get_slice(start, end)
+              if work_slice is None:
+                continue
+              if isinstance(work_slice, string_types):
+                work_slice = work_slice.encode()
+              slices.append(work_slice)
+              work_slices[-1].append(work_slice)
+              sliced = True
+        if adaptive and not sliced:
+          raise ValueError(
+              "adaptive WorkQueue requires works sliced by slice_files.")
         self._capacity = len(slices) if slices else len(self._works)
         works_tensor = ops.convert_to_tensor(
             slices or self._works, dtype=dtypes.string)
@@ -255,7 +553,9 @@ class WorkQueue(saver.BaseSaverBuilder.SaveableObject):
           with ops.control_dependencies([self._create]):
             with ops.name_scope('epochs/{}'.format(epoch_index)):
               epoch = works_tensor
-              if shuffle:
+              if shuffle and adaptive and slices:
+                epoch = self._shuffle_works_in_order(work_slices, seed)
+              elif shuffle:
                 epoch = random_ops.random_shuffle(epoch, seed=seed)
               with ops.control_dependencies(
                   [logging_ops.print_v2(
@@ -280,6 +580,21 @@ class WorkQueue(saver.BaseSaverBuilder.SaveableObject):
     logging.info("%s placed at %s.", name, self._remote_device)
     super(WorkQueue, self).__init__(self, specs, name)
 
+  def _shuffle_works_in_order(self, work_slices, seed):
+    """Shuffles works but keeps slices of each work contiguous."""
+    max_num_slices = max([len(w) for w in work_slices])
+    padded_slices = ops.convert_to_tensor(
+        [w + [b''] * (max_num_slices - len(w)) for w in work_slices],
+        dtype=dtypes.string)
+    slice_mask = ops.convert_to_tensor(
+        [[i < len(w) for i in xrange(max_num_slices)] for w in work_slices],
+        dtype=dtypes.bool)
+    order = random_ops.random_shuffle(
+        math_ops.range(len(work_slices)), seed=seed)
+    return array_ops.boolean_mask(
+        array_ops.gather(padded_slices, order),
+        array_ops.gather(slice_mask, order))
+
   def __len__(self):
     """Number of elements in the work queue."""
     return self._capacity
@@ -357,15 +672,29 @@ class WorkQueue(saver.BaseSaverBuilder.SaveableObject):
           lambda: gen_work_queue_ops.work_queue_restore(self._handle, works),
           lambda: create_with_prompt)
 
-  def take(self):
-    """Take work from the work queue."""
+  def take(self, locality=None):
+    """Take work from the work queue.
+
+    Args:
+      locality: (Optional.) A list of locality hints of this client, e.g. from
+        `locality_hints`. Works local to this client are preferred.
+
+    Returns:
+      A work taken from the work queue.
+    """
+    client = '{}/{}'.format(self.name, uuid.uuid4().hex)
+    locality = _locality_list(locality)
+
     def remote_take():
       """Take work from remote worker."""
       with ops.name_scope(self.name):
         with ops.device(self._remote_device):
           taken = gen_work_queue_ops.work_queue_take(
               self._handle,
-              num_clients=self.num_clients)
+              num_clients=self.num_clients,
+              client=client,
+              adaptive=self._adaptive,
+              locality=locality)
 
           work_bak = control_flow_ops.no_op()
           if self._local_work_mgr:
@@ -398,14 +727,44 @@ class WorkQueue(saver.BaseSaverBuilder.SaveableObject):
       return local_work
     return string_ops.string_join([self._prefix, local_work])
 
-  def input_producer(self):
+  def input_producer(
+      self, num_works_per_take=1, prefetch_depth=1, locality=None):
     """Returns a FIFOQueue as input producer.
 
+    Args:
+      num_works_per_take: (Optional.) Max number of works taken from the work
+        queue in one request.
+      prefetch_depth: (Optional.) Capacity of the local queue.
+      locality: (Optional.) A list of locality hints of this client, e.g. from
+        `locality_hints`. Works local to this client are preferred.
+
+    If `num_works_per_take` or `prefetch_depth` is greater than 1, taken works
+    are leased from the work queue until they are dequeued from the local
+    queue. Leased works are saved along with the work queue, and given back to
+    it when the session stops, or after 30 minutes without requests from this
+    client, e.g. if it crashed. Dequeued works are acknowledged with the next
+    request, so works dequeued since the last request are taken again after
+    restoring the work queue: works are consumed at least once.
+
     Returns:
       A local queue of work items.  A `QueueRunner` for the Queue
       is added to the current `Graph`'s `QUEUE_RUNNER` collection.
+
+    Raises:
+      ValueError: If one of the arguments is invalid.
     """
-    work = self.take()
+    if num_works_per_take < 1 or prefetch_depth < 1:
+      raise ValueError(
+          "num_works_per_take and prefetch_depth must be >= 1 not {}, {}"
+          .format(num_works_per_take, prefetch_depth))
+    if num_works_per_take > 1 or prefetch_depth > 1:
+      if self._local_work_mgr:
+        raise ValueError(
+            "Taking works in batches is not supported with local_work_mgr")
+      return self._batched_input_producer(
+          num_works_per_take, prefetch_depth, locality)
+
+    work = self.take(locality=locality)
     with ops.name_scope(self.name):
       with ops.device(self._local_device):
         proxy = data_flow_ops.FIFOQueue(
@@ -423,13 +782,89 @@ class WorkQueue(saver.BaseSaverBuilder.SaveableObject):
         queue_runner.add_queue_runner(proxy_runner)
         return proxy
 
-  def input_dataset(self):
+  def _batched_input_producer(
+      self, num_works_per_take, prefetch_depth, locality):
+    """Returns a FIFOQueue fed by works taken in batches."""
+    client = '{}/{}'.format(self.name, uuid.uuid4().hex)
+    locality = _locality_list(locality)
+    with ops.name_scope(self.name):
+      with ops.device(self._local_device):
+        proxy = data_flow_ops.FIFOQueue(
+            capacity=prefetch_depth,
+            dtypes=[dtypes.string],
+            shapes=[tensor_shape.TensorShape([1])],
+            name='proxy')
+        num_enqueued = vs.variable(
+            constant_op.constant(0, dtype=dtypes.int64),
+            name="num_enqueued",
+            trainable=False,
+            collections=[ops.GraphKeys.LOCAL_VARIABLES],
+            use_resource=True)
+        num_acked = vs.variable(
+            constant_op.constant(0, dtype=dtypes.int64),
+            name="num_acked",
+            trainable=False,
+            collections=[ops.GraphKeys.LOCAL_VARIABLES],
+            use_resource=True)
+        # Works dequeued from the local queue are consumed.
+        num_consumed = (
+            num_enqueued.read_value()
+            - math_ops.to_int64(proxy.size())
+            - num_acked.read_value())
+      with ops.device(self._remote_device):
+        works = gen_work_queue_ops.work_queue_take_many(
+            self._handle,
+            num_consumed,
+            client=client,
+            num_works=num_works_per_take,
+            num_clients=self.num_clients,
+            adaptive=self._adaptive,
+            locality=locality)
+      with ops.device(self._local_device):
+        with ops.control_dependencies([works]):
+          ack = num_acked.assign_add(num_consumed, read_value=False)
+        if self._prefix is not None:
+          works = string_ops.string_join([self._prefix, works])
+        with ops.control_dependencies(
+            [ack, logging_ops.print_v2("Take works:", works)]):
+          enqueue_proxy = proxy.enqueue_many(
+              [array_ops.reshape(works, (-1, 1))])
+        with ops.control_dependencies([enqueue_proxy]):
+          enqueue_proxy = num_enqueued.assign_add(
+              math_ops.to_int64(array_ops.size(works)), read_value=False)
+
+        cancel_proxy = proxy.close(cancel_pending_enqueues=True)
+        drain_proxy = array_ops.size(proxy.dequeue_up_to(proxy.size()))
+        num_drained = array_ops.placeholder(dtypes.int64, [])
+        num_unacked = (
+            num_enqueued.read_value() - num_drained - num_acked.read_value())
+      with ops.device(self._remote_device):
+        give_back = gen_work_queue_ops.work_queue_give_back(
+            self._handle, num_unacked, client=client)
+      proxy_runner = _GiveBackQueueRunner(
+          proxy, enqueue_proxy, cancel_proxy, drain_proxy, give_back,
+          num_drained)
+      queue_runner.add_queue_runner(proxy_runner)
+      return proxy
+
+  def input_dataset(
+      self, num_works_per_take=1, prefetch_depth=1, locality=None):
     """Returns a dataset as input dataset
 
+    Args:
+      num_works_per_take: (Optional.) Max number of works taken from the work
+        queue in one request.
+      prefetch_depth: (Optional.) Number of works prefetched locally.
+      locality: (Optional.) A list of locality hints of this client, e.g. from
+        `locality_hints`. Works local to this client are preferred.
+
     Returns:
       A local dataset of work items.
     """
-    proxy = self.input_producer()
+    proxy = self.input_producer(
+        num_works_per_take=num_works_per_take,
+        prefetch_depth=prefetch_depth,
+        locality=locality)
     next_work = lambda _: array_ops.reshape(proxy.dequeue(), [])
     with ops.name_scope(self.name):
       with ops.device(self._local_device):
@@ -25,6 +25,7 @@ from six import string_types
 import portpicker
 
 from tensorflow.core.protobuf import config_pb2
+from tensorflow.python.framework import constant_op
 from tensorflow.python.framework import errors_impl
 from tensorflow.python.framework import ops
 from tensorflow.python.framework import test_util
@@ -32,8 +33,10 @@ from tensorflow.python.ops import array_ops
 from tensorflow.python.ops import resources
 from tensorflow.python.ops import variables
 from tensorflow.python.ops import variable_scope as vs
+from tensorflow.python.lib.io import tf_record
 from tensorflow.python.platform import test as test_lib
 from tensorflow.python.platform import tf_logging as logging
+from tensorflow.python.training import coordinator
 from tensorflow.python.training import device_setter
 from tensorflow.python.training import monitored_session
 from tensorflow.python.training import queue_runner_impl
@@ -41,6 +44,9 @@ from tensorflow.python.training import saver
 from tensorflow.python.training import server_lib
 from tensorflow.python.training import training_util
 
+from tensorflow.python.ops.work_queue import TextLineWork
+from tensorflow.python.ops.work_queue import TFRecordWork
+from tensorflow.python.ops.work_queue import Work
 from tensorflow.python.ops.work_queue import WorkQueue
 from tensorflow.python.ops.work_queue import LocalWorkMgr
 from tensorflow.python.training import saver
@@ -140,6 +146,101 @@ class WorkQueueTest(test_lib.TestCase):
       for thread in threads:
         thread.join()
 
+  def _read_slices(self, work_cls, work, slice_size):
+    size = work.count_records()
+    slices = [work.get_slice(start, min(start + slice_size, size))
+              for start in range(0, size, slice_size)]
+    slices = [work_slice for work_slice in slices if work_slice]
+    records = []
+    with self.test_session() as sess:
+      for work_slice in slices:
+        iterator = work_cls.dataset(
+            constant_op.constant(work_slice)).make_one_shot_iterator()
+        data = iterator.get_next()
+        while True:
+          try:
+            records.append(sess.run(data))
+          except errors_impl.OutOfRangeError:
+            break
+    return slices, records
+
+  def test_files_not_sliced_by_default(self):
+    path = os.path.join(self.get_temp_dir(), 'whole.csv')
+    with open(path, 'wb') as wfile:
+      wfile.write(b'a\nb\n')
+    self.assertNotIsInstance(Work.from_url(None, path), TextLineWork)
+    with self.test_session():
+      work_queue = WorkQueue([path], shuffle=False, num_slices=3)
+      self.assertEqual(1, len(work_queue))
+      with self.assertRaises(ValueError):
+        WorkQueue([path], slice_files=True)
+
+  def test_text_line_slices(self):
+    path = os.path.join(self.get_temp_dir(), 'lines.csv')
+    lines = [('line%d' % i).encode() for i in range(3000)]
+    data = b'\n'.join(lines) + b'\n'
+    with open(path, 'wb') as wfile:
+      wfile.write(data)
+    work = Work.from_url(None, path, slice_files=True)
+    self.assertIsInstance(work, TextLineWork)
+    self.assertEqual(len(data), work.count_records())
+    slices, records = self._read_slices(TextLineWork, work, 1000)
+    self.assertEqual((len(data) + 999) // 1000, len(slices))
+    self.assertTrue(all(['?start=' in work_slice for work_slice in slices]))
+    self.assertEqual(lines, records)
+
+  def test_text_line_slices_shorter_than_lines(self):
+    path = os.path.join(self.get_temp_dir(), 'long_lines.txt')
+    lines = [('long line %d' % i).encode() * 3 for i in range(20)]
+    with open(path, 'wb') as wfile:
+      wfile.write(b'\n'.join(lines))
+    work = Work.from_url(None, path, slice_files=True)
+    _, records = self._read_slices(TextLineWork, work, 7)
+    self.assertEqual(lines, records)
+
+  def test_tf_record_slices(self):
+    path = os.path.join(self.get_temp_dir(), 'records.tfrecord')
+    records = [('record%d' % i).encode() * (i % 7 + 1) for i in range(2500)]
+    with tf_record.TFRecordWriter(path) as writer:
+      for record in records:
+        writer.write(record)
+    work = Work.from_url(None, path, slice_files=True)
+    self.assertIsInstance(work, TFRecordWork)
+    self.assertEqual(os.path.getsize(path), work.count_records())
+    slices, read_records = self._read_slices(TFRecordWork, work, 10000)
+    self.assertEqual(
+        (os.path.getsize(path) + 9999) // 10000, len(slices))
+    self.assertEqual(records, read_records)
+
+  def test_file_slices_dataset(self):
+    path = os.path.join(self.get_temp_dir(), 'queued_lines.csv')
+    lines = [('line%d' % i).encode() for i in range(3000)]
+    with open(path, 'wb') as wfile:
+      wfile.write(b'\n'.join(lines))
+    with self.test_session() as sess:
+      work_queue = WorkQueue(
+          [path], shuffle=False, num_slices=3, slice_files=True)
+      self.assertEqual(3, len(work_queue))
+      dataset = work_queue.input_dataset().flat_map(TextLineWork.dataset)
+      iterator = dataset.make_initializable_iterator()
+      data = iterator.get_next()
+
+      sess.run(iterator.initializer)
+      resources.initialize_resources(resources.shared_resources()).run()
+      variables.global_variables_initializer().run()
+      variables.local_variables_initializer().run()
+      threads = queue_runner_impl.start_queue_runners()
+
+      local_lines = []
+      while True:
+        try:
+          local_lines.append(sess.run(data))
+        except errors_impl.OutOfRangeError:
+          break
+      self.assertEqual(lines, local_lines)
+      for thread in threads:
+        thread.join()
+
   def test_monitored_session(self):
     ps_hosts = ["localhost:{}".format(portpicker.pick_unused_port())]
     worker_hosts = ["localhost:{}".format(portpicker.pick_unused_port())]
@@ -294,6 +395,122 @@ class WorkQueueTest(test_lib.TestCase):
       for thread in threads:
         thread.join()
 
+  def test_adaptive_slices(self):
+    path = os.path.join(self.get_temp_dir(), 'adaptive_lines.csv')
+    lines = [('line%d' % i).encode() for i in range(30000)]
+    with open(path, 'wb') as wfile:
+      wfile.write(b'\n'.join(lines) + b'\n')
+    with self.test_session() as sess:
+      work_queue = WorkQueue(
+          [path], shuffle=False, num_slices=30, adaptive=True,
+          slice_files=True)
+      local_queue = work_queue.input_producer()
+      dequeue = local_queue.dequeue()
+
+      resources.initialize_resources(resources.shared_resources()).run()
+      variables.global_variables_initializer().run()
+      variables.local_variables_initializer().run()
+      threads = queue_runner_impl.start_queue_runners()
+
+      taken_works = []
+      while True:
+        try:
+          taken_works.append(sess.run(dequeue)[0])
+        except errors_impl.OutOfRangeError:
+          break
+      for thread in threads:
+        thread.join()
+      # Contiguous slices are merged early, and split as the queue drains.
+      self.assertLess(len(taken_works), len(work_queue))
+      self.assertGreater(len(taken_works), 1)
+
+      local_lines = []
+      for work in taken_works:
+        iterator = TextLineWork.dataset(
+            constant_op.constant(work)).make_one_shot_iterator()
+        data = iterator.get_next()
+        while True:
+          try:
+            local_lines.append(sess.run(data))
+          except errors_impl.OutOfRangeError:
+            break
+      self.assertEqual(lines, local_lines)
+      # Plain works have no byte ranges to merge.
+      with self.assertRaises(ValueError):
+        WorkQueue([path], num_slices=30, adaptive=True)
+
+  def test_take_local_works_first(self):
+    with self.test_session():
+      works = [
+          b"hdfs://host0:9000/a", b"hdfs://host1:9000/b",
+          b"/cache/c", b"hdfs://host0:9000/d", b"hdfs://host1:9000/e"]
+      work_queue = WorkQueue(works, shuffle=False)
+      take_host1 = work_queue.take(locality=["host1"])
+      take_cache = work_queue.take(locality=["/cache/"])
+      take_any = work_queue.take()
+
+      resources.initialize_resources(resources.shared_resources()).run()
+      variables.global_variables_initializer().run()
+      variables.local_variables_initializer().run()
+
+      self.assertEqual(b"hdfs://host1:9000/b", take_host1.eval())
+      self.assertEqual(b"/cache/c", take_cache.eval())
+      self.assertEqual(b"hdfs://host1:9000/e", take_host1.eval())
+      # Falls back to the first work if no work is local.
+      self.assertEqual(b"hdfs://host0:9000/a", take_host1.eval())
+      self.assertEqual(b"hdfs://host0:9000/d", take_any.eval())
+
+  def test_batched_take_dataset(self):
+    with self.test_session() as sess:
+      works = [b"to", b"be", b"or", b"not", b"to", b"be"]
+      num_epochs = 3
+      work_queue = WorkQueue(works, num_epochs=num_epochs, shuffle=False)
+      dataset = work_queue.input_dataset(
+          num_works_per_take=4, prefetch_depth=8)
+      iterator = dataset.make_initializable_iterator()
+      data = iterator.get_next()
+
+      sess.run(iterator.initializer)
+      resources.initialize_resources(resources.shared_resources()).run()
+      variables.global_variables_initializer().run()
+      variables.local_variables_initializer().run()
+
+      threads = queue_runner_impl.start_queue_runners()
+
+      local_works = []
+      for _ in range(len(works)*num_epochs):
+        local_works.append(sess.run(data))
+
+      self.assertEqual(works * num_epochs, local_works)
+
+      with self.assertRaises(errors_impl.OutOfRangeError):
+        sess.run(data)
+
+      for thread in threads:
+        thread.join()
+
+  def test_batched_take_give_back(self):
+    with self.test_session() as sess:
+      works = [b"fast", b"fox", b"jumps", b"over", b"lazy", b"dog"]
+      work_queue = WorkQueue(works, shuffle=False)
+      local_queue = work_queue.input_producer(
+          num_works_per_take=4, prefetch_depth=4)
+      dequeue = local_queue.dequeue()
+
+      resources.initialize_resources(resources.shared_resources()).run()
+      variables.global_variables_initializer().run()
+      variables.local_variables_initializer().run()
+      coord = coordinator.Coordinator()
+      threads = queue_runner_impl.start_queue_runners(sess=sess, coord=coord)
+
+      self.assertEqual([works[0]], sess.run(dequeue).tolist())
+      coord.request_stop()
+      coord.join(threads)
+
+      # Only the consumed work is gone, others are given back in order.
+      saved_works = sess.run(work_queue._save)  # pylint: disable=protected-access
+      self.assertEqual(works[1:], saved_works.tolist())
+
   def _get_workers(
       self, num_workers, workers,
       works, num_epochs=1, shuffle=True,
@@ -210,6 +210,13 @@ class EmbeddingVariableSaveable(saveable_object.SaveableObject):
               false_positive_probability = self.var._false_positive_probability,
               counter_type = self.var._counter_type,
               partition_id=self.partition_id, partition_num=self.partition_num,
+              storage_type=self.var._storage_type,
+              storage_path=self.var._storage_path,
+              storage_size=self.var._storage_size,
+              max_keys=self.var._max_keys,
+              evict_policy=self.var._evict_policy,
+              storage_dtype=self.var._storage_dtype,
+              slot_storage_dtype=self.var._slot_storage_dtype,
               default_value_dim=self.var._default_value_dim)
 
   def incr_restore(self, restored_tensors, unused_restored_shapes):
@@ -39,6 +39,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from tensorflow.core.framework.embedding import config_pb2
 from tensorflow.python.distribute import distribution_strategy_context
 from tensorflow.python.eager import context
 from tensorflow.python.ops import array_ops
@@ -80,6 +81,9 @@ def _create_slot_var(primary, val, scope, validate_shape, shape, dtype, slot_con
   else:
     use_resource = None
   if isinstance(primary, kv_variable_ops.EmbeddingVariable):
+    if primary.storage_type == config_pb2.StorageType.MMAP:
+      raise ValueError("EmbeddingVariable %s of MMAP storage is read only, "
+                       "it can't be trained." % primary.name)
     if slot_config is None:
       slot = variable_scope.get_embedding_variable_internal(
         scope,
@@ -114,6 +118,10 @@ def _create_slot_var(primary, val, scope, validate_shape, shape, dtype, slot_con
           primary=primary._primary,
           primary_slotnum_op=slotnum_op,
           storage_type=primary.storage_type,
+          storage_path=primary.storage_path,
+          storage_size=primary.storage_size,
+          storage_dtype=primary.storage_dtype,
+          slot_storage_dtype=primary.slot_storage_dtype,
           l2_weight_threshold=primary._l2_weight_threshold,
           filter_strategy=filter_strategy)
           )